@@ -9,6 +9,7 @@ from rdr_service.app_util import auth_required
 from rdr_service.dao.biobank_specimen_dao import BiobankSpecimenDao, BiobankSpecimenAttributeDao, BiobankAliquotDao,\
     BiobankAliquotDatasetDao
 from rdr_service.model.biobank_order import BiobankAliquot
+from rdr_service.model.config_utils import from_client_biobank_id
 
 
 class BiobankApiBase(UpdatableApi):
@@ -36,10 +37,6 @@ class BiobankSpecimenApi(BiobankApiBase):
                 else:
                     return super(BiobankSpecimenApi, self).post()
         else:
-            success_count = 0
-            total_count = 0
-            errors = []
-
             for specimen_json in resource:
                 try:
                     self.dao.ready_preloader(specimen_json)
@@ -53,54 +50,145 @@ class BiobankSpecimenApi(BiobankApiBase):
 
                 self.dao.preloader.hydrate(session)
 
-                for specimen_json in resource:
-                    rlims_id = specimen_json.get('rlimsID', '')
-
-                    try:
-                        self._check_required_specimen_fields(specimen_json)
-
-                        m = self.dao.from_client_json(specimen_json, session=session)
-                        if m.id is not None:
-                            self.dao.update_with_session(session, m)
-                        else:
-                            self.dao.insert_with_session(session, m)
-                        for obj in session.deleted:
-                            logging.info(f'removing {obj} {getattr(obj, "rlimsId", "NA")}')
-                        for obj in session.dirty:
-                            logging.info(f'updating {obj} {getattr(obj, "rlimsId", "NA")}')
-                        session.commit()
-                    except BadRequest as e:
-                        logging.error('RLIMS Migration: BadRequest encountered', exc_info=True)
-                        errors.append({
-                            'rlimsID': rlims_id,
-                            'error': e.description
-                        })
-                        session.rollback()
-                    except Exception: # pylint: disable=broad-except
-                        logging.error('RLIMS Migration: Server error encountered', exc_info=True)
-                        errors.append({
-                            'rlimsID': rlims_id,
-                            'error': 'Unknown error'
-                        })
-                        session.rollback()
-                    else:
-                        success_count += 1
-                    finally:
-                        total_count += 1
+                try:
+                    result, updated_biobank_ids = self._put_specimens_in_bulk(resource, session)
+                except Exception:  # pylint: disable=broad-except
+                    logging.error(
+                        'RLIMS Migration: bulk processing failed, processing specimens individually',
+                        exc_info=True
+                    )
+                    session.rollback()
+                    result = self._put_specimens_individually(resource, session)
+                else:
+                    # Only done once the specimens are committed, since the participant data updates commit.
+                    # The specimens are stored by this point, so a failure here is logged rather than failing the
+                    # request (the recent stored sample sync will update the participants' data later).
+                    if updated_biobank_ids:
+                        try:
+                            self.dao.update_participant_sample_data(session, updated_biobank_ids)
+                        except Exception:  # pylint: disable=broad-except
+                            logging.error(
+                                'RLIMS Migration: unable to update participant data for migrated specimens',
+                                exc_info=True
+                            )
+                            session.rollback()
 
             self.dao.preloader.clear()
 
             log_api_request(log=request.log_record)
-            result = {
-                'summary': {
-                    'total_received': total_count,
-                    'success_count': success_count
-                }
-            }
-            if errors:
-                result['errors'] = errors
             return result
 
+    def _put_specimens_in_bulk(self, resource, session):
+        """
+        Stages each specimen in its own savepoint (so that any errors are reported per specimen) and then
+        processes the stored samples for all the successful specimens together, committing them in one transaction.
+        Returns the migration result and the biobank ids of the participants whose sample data needs updating.
+        """
+        errors = []
+        staged_specimens = []
+
+        biobank_ids = []
+        for specimen_json in resource:
+            try:
+                biobank_ids.append(from_client_biobank_id(specimen_json['participantID']))
+            except (KeyError, BadRequest):
+                # The error will be reported for the specimen when it's processed below
+                pass
+        participant_id_map = self.dao.get_participant_id_map(session, biobank_ids)
+
+        for specimen_json in resource:
+            rlims_id = specimen_json.get('rlimsID', '')
+
+            try:
+                self._check_required_specimen_fields(specimen_json)
+
+                with session.begin_nested():
+                    m = self.dao.from_client_json(specimen_json, session=session)
+                    self.dao.stage_with_session(session, m, participant_id_map)
+                    self._log_session_changes(session)
+                    session.flush()
+            except BadRequest as e:
+                logging.error('RLIMS Migration: BadRequest encountered', exc_info=True)
+                errors.append({
+                    'rlimsID': rlims_id,
+                    'error': e.description
+                })
+            except Exception:  # pylint: disable=broad-except
+                logging.error('RLIMS Migration: Server error encountered', exc_info=True)
+                errors.append({
+                    'rlimsID': rlims_id,
+                    'error': 'Unknown error'
+                })
+            else:
+                staged_specimens.append(m)
+
+        updated_biobank_ids = set()
+        if staged_specimens:
+            updated_biobank_ids = self.dao.upsert_stored_samples_with_session(
+                session, staged_specimens, participant_id_map
+            )
+        session.commit()
+
+        return self._make_migration_result(len(resource), len(staged_specimens), errors), updated_biobank_ids
+
+    def _put_specimens_individually(self, resource, session):
+        success_count = 0
+        total_count = 0
+        errors = []
+
+        for specimen_json in resource:
+            rlims_id = specimen_json.get('rlimsID', '')
+
+            try:
+                self._check_required_specimen_fields(specimen_json)
+
+                m = self.dao.from_client_json(specimen_json, session=session)
+                if m.id is not None:
+                    self.dao.update_with_session(session, m)
+                else:
+                    self.dao.insert_with_session(session, m)
+                self._log_session_changes(session)
+                session.commit()
+            except BadRequest as e:
+                logging.error('RLIMS Migration: BadRequest encountered', exc_info=True)
+                errors.append({
+                    'rlimsID': rlims_id,
+                    'error': e.description
+                })
+                session.rollback()
+            except Exception: # pylint: disable=broad-except
+                logging.error('RLIMS Migration: Server error encountered', exc_info=True)
+                errors.append({
+                    'rlimsID': rlims_id,
+                    'error': 'Unknown error'
+                })
+                session.rollback()
+            else:
+                success_count += 1
+            finally:
+                total_count += 1
+
+        return self._make_migration_result(total_count, success_count, errors)
+
+    @staticmethod
+    def _log_session_changes(session):
+        for obj in session.deleted:
+            logging.info(f'removing {obj} {getattr(obj, "rlimsId", "NA")}')
+        for obj in session.dirty:
+            logging.info(f'updating {obj} {getattr(obj, "rlimsId", "NA")}')
+
+    @staticmethod
+    def _make_migration_result(total_count, success_count, errors):
+        result = {
+            'summary': {
+                'total_received': total_count,
+                'success_count': success_count
+            }
+        }
+        if errors:
+            result['errors'] = errors
+        return result
+
     @staticmethod
     def _check_required_specimen_fields(specimen_json):
         missing_fields = [required_field for required_field in ['rlimsID', 'orderID', 'testcode', 'participantID']
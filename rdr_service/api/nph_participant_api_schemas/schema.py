@@ -15,8 +15,9 @@ from rdr_service.model.study_nph import (
 from rdr_service.model.site import Site
 from rdr_service.model.rex import ParticipantMapping
 from rdr_service.model.participant_summary import ParticipantSummary
-from rdr_service.api.nph_participant_api_schemas.util import QueryBuilder, NphParticipantData
-from rdr_service import config
+from rdr_service.api.nph_participant_api_schemas.util import QueryBuilder, NphParticipantData, KeysetCursor,\
+    TotalCountCache
+from rdr_service import config, singletons
 
 NPH_BIOBANK_PREFIX = NPH_PROD_BIOBANK_PREFIX if config.GAE_PROJECT == "all-of-us-rdr-prod" else NPH_TEST_BIOBANK_PREFIX
 
@@ -26,6 +27,7 @@ MAX_LIMIT = 1000
 
 DEFAULT_OFFSET = 0
 MIN_OFFSET = 0
+TOTAL_COUNT_CACHE_TTL_SECONDS = 60
 
 
 class SortableField(Field):
@@ -366,18 +368,40 @@ class ParticipantConnection(relay.Connection):
 
     total_count = Int()
     result_count = Int()
+    next_cursor = String()
+
+    @staticmethod
+    def _get_total_count_cache() -> TotalCountCache:
+        return singletons.get(
+            singletons.NPH_PARTICIPANT_COUNT_CACHE_INDEX,
+            lambda: TotalCountCache(ttl_seconds=TOTAL_COUNT_CACHE_TTL_SECONDS)
+        )
 
     @staticmethod
     def resolve_total_count(_, info):
+        count_key = info.context.get('participant_count_key')
+        if count_key is not None:
+            cached_count = ParticipantConnection._get_total_count_cache().get(count_key)
+            if cached_count is not None:
+                return cached_count
+
         with NphParticipantDao().session() as session:
-            participant_query = info.context.get('participant_query')
+            participant_query = info.context.get('participant_count_query', info.context.get('participant_query'))
             if participant_query is None:
                 logging.error('graphql context is missing participant_query for resolving total count')
                 return 0
 
             full_query = participant_query.offset(0).limit(None)
             full_query.session = session
-            return full_query.count()
+            count = full_query.count()
+
+        if count_key is not None:
+            ParticipantConnection._get_total_count_cache().set(count_key, count)
+        return count
+
+    @staticmethod
+    def resolve_next_cursor(_, info):
+        return info.context.get('next_cursor')
 
     @staticmethod
     def resolve_result_count(root, _):
@@ -395,6 +419,7 @@ class ParticipantQuery(ObjectType):
         sort_by=String(required=False),
         limit=Int(required=False, default_value=DEFAULT_LIMIT),
         off_set=Int(required=False, default_value=DEFAULT_OFFSET),
+        page_cursor=String(required=False),
         **_build_filter_parameters(ParticipantField)
     )
 
@@ -406,8 +431,13 @@ class ParticipantQuery(ObjectType):
         sort_by=None,
         limit=None,
         off_set=None,
+        page_cursor=None,
         **filter_kwargs
     ):
+        """
+        Gives a page of participants. Pages can be requested with an offset, or by passing the nextCursor
+        value from the previous page as the pageCursor (which avoids scanning past all the earlier pages).
+        """
         pm2 = aliased(PairingEvent)
         participant_dob = aliased(ParticipantOpsDataElement)
 
@@ -520,13 +550,26 @@ class ParticipantQuery(ObjectType):
                         raise NotImplementedError(f'Filtering by {field_name} is not yet implemented.')
                     field_def.filter_modifier(query_builder, value)
 
+                info.context['participant_count_key'] = TotalCountCache.make_key(nph_id=nph_id, **filter_kwargs)
                 if not nph_id:
-                    query = query_builder.get_resulting_query()
-                    query = query.limit(limit).offset(off_set)
+                    info.context['participant_count_query'] = query_builder.get_resulting_query()
+
+                    cursor = KeysetCursor.decode(page_cursor) if page_cursor else None
+                    query = query_builder.get_keyset_query(tiebreaker=Participant.id, cursor=cursor)
+                    query = query.limit(limit)
+                    if cursor is None:
+                        query = query.offset(off_set)
                     info.context['participant_query'] = query
 
                     logging.info(query)
-                    return NphParticipantData.load_nph_participant_data(query, NPH_BIOBANK_PREFIX)
+                    records = query.all()
+                    if len(records) == limit:
+                        last_record = records[-1]
+                        info.context['next_cursor'] = KeysetCursor(
+                            sort_value=last_record.keyset_sort_value,
+                            last_id=last_record.Participant.id
+                        ).encode()
+                    return NphParticipantData.load_nph_participant_records(records, NPH_BIOBANK_PREFIX)
 
                 logging.info('Fetch NPH ID: %d', nph_id)
                 query = query.filter(ParticipantMapping.ancillary_participant_id == int(nph_id))
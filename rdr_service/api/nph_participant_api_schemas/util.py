@@ -1,14 +1,22 @@
+import base64
+import binascii
+import json
+import threading
 from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
 from enum import Enum
-from typing import Dict, List, Optional, Union
+from typing import Dict, Hashable, List, Optional, Tuple, Union
 
 import sqlalchemy
 from graphene import List as GrapheneList
+from protorpc import messages
 
+from sqlalchemy import and_, or_
 from sqlalchemy.orm import Query, aliased
 
 from rdr_service.ancillary_study_resources.nph.enums import ParticipantOpsElementTypes, ConsentOptInTypes, \
     DietType, DietStatus, ModuleTypes
+from rdr_service import clock
 from rdr_service.api_util import parse_date
 from rdr_service.dao.study_nph_dao import NphOrderDao
 from rdr_service.model.participant_summary import ParticipantSummary as ParticipantSummaryModel
@@ -53,6 +61,112 @@ class QueryBuilder:
             resulting_query = resulting_query.filter(expr)
         return resulting_query.order_by(self.order_expression)
 
+    def get_keyset_query(self, tiebreaker, cursor: 'KeysetCursor' = None):
+        """
+        Gives the resulting query ordered by the sort expression and then the tiebreaker column, with the
+        sort value of each row added as the last column. If a cursor is given, the query only returns the
+        rows that come after the cursor's position.
+        """
+        resulting_query = self.get_resulting_query().order_by(None)
+        sort_expression = self.order_expression
+        if sort_expression is None:
+            sort_expression = tiebreaker
+        resulting_query = resulting_query.add_columns(sort_expression.label('keyset_sort_value'))
+
+        if cursor is not None:
+            if cursor.sort_value is None:
+                resulting_query = resulting_query.filter(or_(
+                    sort_expression.isnot(None),
+                    and_(sort_expression.is_(None), tiebreaker > cursor.last_id)
+                ))
+            else:
+                resulting_query = resulting_query.filter(or_(
+                    sort_expression > cursor.sort_value,
+                    and_(sort_expression == cursor.sort_value, tiebreaker > cursor.last_id)
+                ))
+
+        return resulting_query.order_by(sort_expression, tiebreaker)
+
+
+@dataclass
+class KeysetCursor:
+    """
+    Position in a list of participants, given by the sort value and id of the last participant of a page.
+    Clients receive it as an opaque string.
+    """
+    sort_value: Union[str, int, float, bool, date, datetime, None]
+    last_id: int
+
+    def encode(self) -> str:
+        sort_value = self.sort_value
+        if isinstance(sort_value, datetime):
+            encoded_value = {'datetime': sort_value.isoformat()}
+        elif isinstance(sort_value, date):
+            encoded_value = {'date': sort_value.isoformat()}
+        elif isinstance(sort_value, messages.Enum):
+            encoded_value = sort_value.number
+        elif isinstance(sort_value, Enum):
+            encoded_value = sort_value.value
+        else:
+            encoded_value = sort_value
+
+        cursor_json = json.dumps({'sort': encoded_value, 'id': self.last_id})
+        return base64.urlsafe_b64encode(cursor_json.encode('utf-8')).decode('utf-8')
+
+    @classmethod
+    def decode(cls, cursor_str: str) -> 'KeysetCursor':
+        try:
+            cursor_json = json.loads(base64.urlsafe_b64decode(cursor_str.encode('utf-8')))
+            sort_value = cursor_json['sort']
+            if isinstance(sort_value, dict):
+                if 'datetime' in sort_value:
+                    sort_value = datetime.fromisoformat(sort_value['datetime'])
+                else:
+                    sort_value = date.fromisoformat(sort_value['date'])
+            return KeysetCursor(sort_value=sort_value, last_id=int(cursor_json['id']))
+        except (binascii.Error, ValueError, KeyError, TypeError):
+            raise ValueError(f'Invalid cursor: {cursor_str}')
+
+
+class TotalCountCache:
+    """Keeps recently calculated participant counts for a short time, keyed by the filters that were used"""
+
+    def __init__(self, ttl_seconds=60, max_size=1000):
+        self.ttl = timedelta(seconds=ttl_seconds)
+        self.max_size = max_size
+        self._counts: Dict[Hashable, Tuple[int, datetime]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(nph_id=None, **filter_kwargs) -> Tuple:
+        """Normalized key for a set of filters, the order they were given in doesn't change the key"""
+        return (
+            str(nph_id) if nph_id is not None else None,
+            tuple(sorted((name, str(value)) for name, value in filter_kwargs.items() if value is not None))
+        )
+
+    def get(self, key) -> Optional[int]:
+        with self._lock:
+            cached = self._counts.get(key)
+            if cached is None:
+                return None
+            count, expiration = cached
+            if expiration < clock.CLOCK.now():
+                del self._counts[key]
+                return None
+            return count
+
+    def set(self, key, count: int):
+        now = clock.CLOCK.now()
+        with self._lock:
+            if len(self._counts) >= self.max_size:
+                self._counts = {
+                    cached_key: cached for cached_key, cached in self._counts.items() if cached[1] >= now
+                }
+                if len(self._counts) >= self.max_size:
+                    self._counts.clear()
+            self._counts[key] = (count, now + self.ttl)
+
 
 class NphParticipantData:
 
@@ -185,9 +299,15 @@ class NphParticipantData:
 
     @classmethod
     def load_nph_participant_data(cls, query: sqlalchemy.orm.Query, biobank_prefix: str) -> List[dict]:
-        results, records = [], query.all()
-        for (summary, site, nph_site, mapping, nph_participant, enrollments, consents, diets, deactivated, withdrawn,
-             ops_data) in records:
+        return cls.load_nph_participant_records(query.all(), biobank_prefix)
+
+    @classmethod
+    def load_nph_participant_records(cls, records, biobank_prefix: str) -> List[dict]:
+        results = []
+        for record in records:
+            # Any columns after the participant data (such as a keyset sort value) are ignored
+            (summary, site, nph_site, mapping, nph_participant, enrollments, consents, diets, deactivated, withdrawn,
+             ops_data) = record[:11]
             participant_obj = {
                 'participantNphId': mapping.ancillary_participant_id,
                 'lastModified': summary.lastModified,
@@ -27,7 +27,8 @@ class ResearchProjectsDirectoryApi(Resource):
             'workspace_like': request.args.get('workspaceLike'),
             'project_purpose': request.args.get('projectPurpose'),
             'page': request.args.get('page'),
-            'page_size': request.args.get('pageSize')
+            'page_size': request.args.get('pageSize'),
+            'cursor': request.args.get('cursor')
         }
 
         filters = self.validate_params(params)
@@ -90,6 +91,8 @@ class ResearchProjectsDirectoryApi(Resource):
         else:
             filters['page_size'] = MAX_PAGE_SIZE
 
+        filters['cursor'] = params['cursor']
+
         filters['given_name'] = params['given_name'].lower() if params['given_name'] else None
         filters['family_name'] = params['family_name'].lower() if params['family_name'] else None
         filters['owner_name'] = params['owner_name'].lower() if params['owner_name'] else None
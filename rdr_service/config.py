@@ -181,6 +181,7 @@ CE_MEDIATED_HPO_ID = 'ce_mediated_hpo_id'
 EXPOSOMICS_MO_MANIFEST_SUBFOLDER = 'm0_manifests'
 EXPOSOMICS_M1_MANIFEST_SUBFOLDER = 'm1_manifests'
 HHEAR_BUCKET_NAME = 'hhear_bucket_name'
+MESSAGE_BROKER_QUEUED_DESTINATIONS = 'message_broker_queued_destinations'
 
 CVL_SITES_DATA_BUCKETS = {
     "bcm": "prod-genomics-data-baylor",
@@ -1,7 +1,8 @@
+from typing import Collection, Dict, List, Set
 
 from sqlalchemy import or_, and_
 
-from rdr_service import config
+from rdr_service import clock, config
 from rdr_service.api_util import dispatch_task, format_json_date
 from rdr_service.model.config_utils import from_client_biobank_id, to_client_biobank_id
 from rdr_service.model.participant import Participant
@@ -16,8 +17,11 @@ from rdr_service.model.biobank_order import BiobankSpecimen, BiobankSpecimenAttr
     BiobankAliquotDataset, BiobankAliquotDatasetItem
 from rdr_service.model.biobank_stored_sample import BiobankStoredSample, SampleStatus
 from rdr_service.offline.bigquery_sync import dispatch_participant_rebuild_tasks
+from rdr_service.services.system_utils import list_chunks
 from werkzeug.exceptions import BadRequest, NotFound, ServiceUnavailable
 
+BULK_QUERY_BATCH_SIZE = 1000
+
 
 class RlimsIdLoadingStrategy(LoadingStrategy):
 
@@ -298,9 +302,13 @@ class BiobankSpecimenDao(BiobankDaoBase):
             return None
 
     @staticmethod
-    def _check_participant_exists(session, biobank_id):
-        participant_query = session.query(Participant).filter(Participant.biobankId == biobank_id)
-        if not session.query(participant_query.exists()).scalar():
+    def _check_participant_exists(session, biobank_id, participant_id_map: Dict[int, int] = None):
+        if participant_id_map is not None:
+            participant_exists = biobank_id in participant_id_map
+        else:
+            participant_query = session.query(Participant).filter(Participant.biobankId == biobank_id)
+            participant_exists = session.query(participant_query.exists()).scalar()
+        if not participant_exists:
             raise BadRequest(f'Biobank id {to_client_biobank_id(biobank_id)} does not exist')
 
     @classmethod
@@ -326,6 +334,45 @@ class BiobankSpecimenDao(BiobankDaoBase):
 
         return SampleStatus.UNKNOWN
 
+    def _new_stored_sample(self, specimen: BiobankSpecimen) -> BiobankStoredSample:
+        return BiobankStoredSample(
+            biobankStoredSampleId=specimen.rlimsId,
+            biobankId=specimen.biobankId,
+            biobankOrderIdentifier=specimen.orderId,
+            test=specimen.testCode,
+            confirmed=specimen.confirmedDate,
+            created=specimen.confirmedDate,
+            status=self._get_stored_status(
+                status_str=specimen.status,
+                disposal_reason_str=specimen.disposalReason
+            ),
+            disposed=specimen.disposalDate
+        )
+
+    def _update_stored_sample_fields(self, stored_sample: BiobankStoredSample, specimen: BiobankSpecimen):
+        if specimen.biobankId is not None:
+            stored_sample.biobankId = specimen.biobankId
+        if specimen.orderId is not None:
+            stored_sample.biobankOrderIdentifier = specimen.orderId
+        if specimen.testCode is not None:
+            stored_sample.test = specimen.testCode
+        if specimen.confirmedDate is not None:
+            stored_sample.confirmed = specimen.confirmedDate
+        if specimen.confirmedDate is not None:
+            stored_sample.created = specimen.confirmedDate
+        if specimen.disposalDate is not None:
+            stored_sample.disposed = specimen.disposalDate
+        if specimen.status is not None:
+            stored_sample.status = self._get_stored_status(
+                status_str=specimen.status,
+                disposal_reason_str=specimen.disposalReason
+            )
+
+    @staticmethod
+    def _is_received_dna_sample(specimen: BiobankSpecimen):
+        dna_sample_test_codes = config.getSettingList(config.DNA_SAMPLE_TEST_CODES)
+        return specimen.testCode in dna_sample_test_codes and specimen.confirmedDate
+
     def _upsert_stored_sample(self, session, specimen: BiobankSpecimen):
         # update
         stored_sample: BiobankStoredSample = session.query(BiobankStoredSample).filter(
@@ -333,22 +380,9 @@ class BiobankSpecimenDao(BiobankDaoBase):
         ).one_or_none()
 
         if stored_sample is None:
-            stored_sample = BiobankStoredSample(
-                biobankStoredSampleId=specimen.rlimsId,
-                biobankId=specimen.biobankId,
-                biobankOrderIdentifier=specimen.orderId,
-                test=specimen.testCode,
-                confirmed=specimen.confirmedDate,
-                created=specimen.confirmedDate,
-                status=self._get_stored_status(
-                    status_str=specimen.status,
-                    disposal_reason_str=specimen.disposalReason
-                ),
-                disposed=specimen.disposalDate
-            )
+            stored_sample = self._new_stored_sample(specimen)
             session.add(stored_sample)
-            dna_sample_test_codes = config.getSettingList(config.DNA_SAMPLE_TEST_CODES)
-            if specimen.testCode in dna_sample_test_codes and specimen.confirmedDate:
+            if self._is_received_dna_sample(specimen):
                 participant_id = session.query(Participant.participantId).filter(
                     Participant.biobankId == specimen.biobankId
                 ).scalar()
@@ -356,26 +390,111 @@ class BiobankSpecimenDao(BiobankDaoBase):
                     specimen.confirmedDate, participant_id, session
                 )
         else:
-            if specimen.biobankId is not None:
-                stored_sample.biobankId = specimen.biobankId
-            if specimen.orderId is not None:
-                stored_sample.biobankOrderIdentifier = specimen.orderId
-            if specimen.testCode is not None:
-                stored_sample.test = specimen.testCode
-            if specimen.confirmedDate is not None:
-                stored_sample.confirmed = specimen.confirmedDate
-            if specimen.confirmedDate is not None:
-                stored_sample.created = specimen.confirmedDate
-            if specimen.disposalDate is not None:
-                stored_sample.disposed = specimen.disposalDate
-            if specimen.status is not None:
-                stored_sample.status = self._get_stored_status(
-                    status_str=specimen.status,
-                    disposal_reason_str=specimen.disposalReason
-                )
+            self._update_stored_sample_fields(stored_sample, specimen)
 
         return stored_sample
 
+    @staticmethod
+    def get_participant_id_map(session, biobank_ids: Collection[int]) -> Dict[int, int]:
+        """Maps each of the given biobank ids that belong to a participant to the id of that participant"""
+        participant_id_map = {}
+        for biobank_id_batch in list_chunks(list(set(biobank_ids)), BULK_QUERY_BATCH_SIZE):
+            participant_id_map.update(
+                session.query(Participant.biobankId, Participant.participantId).filter(
+                    Participant.biobankId.in_(biobank_id_batch)
+                ).all()
+            )
+        return participant_id_map
+
+    @staticmethod
+    def get_stored_sample_map(session, rlims_ids: Collection[str]) -> Dict[str, BiobankStoredSample]:
+        """Loads any stored samples that exist for the given rlims ids, keyed by rlims id"""
+        stored_sample_map = {}
+        for rlims_id_batch in list_chunks(list(set(rlims_ids)), BULK_QUERY_BATCH_SIZE):
+            for stored_sample in session.query(BiobankStoredSample).filter(
+                BiobankStoredSample.biobankStoredSampleId.in_(rlims_id_batch)
+            ).all():
+                stored_sample_map[stored_sample.biobankStoredSampleId] = stored_sample
+        return stored_sample_map
+
+    def stage_with_session(self, session, obj: BiobankSpecimen, participant_id_map: Dict[int, int]):
+        """
+        Inserts or updates the specimen (using a participant id map from get_participant_id_map
+        to check that the participant exists) without updating the stored sample or participant data.
+        Use upsert_stored_samples_with_session to finish processing a group of staged specimens.
+        """
+        self._check_participant_exists(session, obj.biobankId, participant_id_map=participant_id_map)
+        if obj.id is not None:
+            super(BiobankSpecimenDao, self).update_with_session(session, obj)
+        else:
+            super(BiobankSpecimenDao, self).insert_with_session(session, obj)
+
+    def upsert_stored_samples_with_session(self, session, specimens: List[BiobankSpecimen],
+                                           participant_id_map: Dict[int, int]) -> Set[int]:
+        """
+        Creates or updates the stored samples for a group of staged specimens. New stored samples are inserted
+        together and any existing ones are loaded with a single query. Nothing is committed, so the
+        specimens and samples can be rolled back together.
+        Returns the biobank ids of the participants to pass to update_participant_sample_data once committed.
+        """
+        stored_sample_map = self.get_stored_sample_map(session, [specimen.rlimsId for specimen in specimens])
+        new_samples: Dict[str, BiobankStoredSample] = {}
+        stored_samples = []
+        for specimen in specimens:
+            stored_sample = stored_sample_map.get(specimen.rlimsId)
+            if stored_sample is None:
+                stored_sample = self._new_stored_sample(specimen)
+                stored_sample_map[specimen.rlimsId] = stored_sample
+                new_samples[specimen.rlimsId] = stored_sample
+                if self._is_received_dna_sample(specimen):
+                    EnrollmentDependenciesDao.set_biobank_received_dna_time(
+                        specimen.confirmedDate, participant_id_map[specimen.biobankId], session
+                    )
+            else:
+                self._update_stored_sample_fields(stored_sample, specimen)
+            stored_samples.append(stored_sample)
+
+        if new_samples:
+            now = clock.CLOCK.now()
+            session.bulk_insert_mappings(BiobankStoredSample, [
+                {
+                    'biobankStoredSampleId': sample.biobankStoredSampleId,
+                    'biobankId': sample.biobankId,
+                    'biobankOrderIdentifier': sample.biobankOrderIdentifier,
+                    'test': sample.test,
+                    'confirmed': sample.confirmed,
+                    'created': sample.created,
+                    'status': sample.status,
+                    'disposed': sample.disposed,
+                    'rdrCreated': now,
+                    'modified': now
+                }
+                for sample in new_samples.values()
+            ])
+        session.flush()
+
+        for stored_sample in stored_samples:
+            SampleSummaryDao.refresh_receipt_data(
+                participant_id=participant_id_map[stored_sample.biobankId],
+                new_sample=stored_sample,
+                session=session
+            )
+
+        return {stored_sample.biobankId for stored_sample in stored_samples}
+
+    def update_participant_sample_data(self, session, biobank_ids: Collection[int]):
+        """
+        Updates the sample data for each of the participants once, after a group of stored samples has been
+        committed. The summary updates commit as they go, so this can't be part of the stored sample transaction.
+        """
+        ParticipantSummaryDao().update_from_biobank_stored_samples_for_biobank_ids(biobank_ids, session=session)
+
+        participant_id_map = self.get_participant_id_map(session, biobank_ids)
+        participant_ids = [participant_id_map[biobank_id] for biobank_id in biobank_ids]
+        dispatch_participant_rebuild_tasks(participant_ids)
+        for participant_id in participant_ids:
+            dispatch_task(endpoint='update_retention_status', payload={'participant_id': participant_id})
+
     def insert_with_session(self, session, obj: BiobankSpecimen):
         self._check_participant_exists(session, obj.biobankId)
         insert_result = super(BiobankSpecimenDao, self).insert_with_session(session, obj)
@@ -1,16 +1,18 @@
 from collections import defaultdict
 import logging
-from typing import Dict, List, Optional, Set
+from typing import Collection, Dict, FrozenSet, Iterable, List, Optional, Set
 from werkzeug.exceptions import BadRequest
 
+from sqlalchemy import select
 from sqlalchemy.orm import joinedload, Session
 
-from rdr_service import clock
+from rdr_service import clock, singletons
 from rdr_service.dao.base_dao import BaseDao
 from rdr_service.dao.cache_all_dao import CacheAllDao
-from rdr_service.model.code import Code, CodeBook, CodeHistory, CodeType
+from rdr_service.model.code import Code, CodeBook, CodeClosure, CodeHistory, CodeType
 from rdr_service.model.survey import Survey, SurveyQuestion, SurveyQuestionOption
-from rdr_service.singletons import CODE_CACHE_INDEX
+from rdr_service.services.system_utils import list_chunks
+from rdr_service.singletons import CODE_CACHE_INDEX, CODE_HIERARCHY_CACHE_INDEX
 
 _CODE_TYPE_MAP = {
     "Module Name": CodeType.MODULE,
@@ -36,6 +38,68 @@ class CodeMap(object):
         return len(self.codes)
 
 
+class CodeHierarchy:
+    """
+    The full set of ancestors and descendants of every code. Codes are related either by their parent ids
+    (for codes imported from the old codebook) or by how they're used in surveys: modules are the parents of
+    their questions, and questions are the parents of their answer options.
+    Nothing outside of the tests looks codes up through the hierarchy yet.
+    """
+
+    def __init__(self, code_ids: Iterable[int], parent_ids_map: Dict[int, Set[int]]):
+        """
+        :param code_ids: Every code id in the hierarchy
+        :param parent_ids_map: The ids of the direct parents of each code
+        """
+        self._ancestor_depths: Dict[int, Dict[int, int]] = {}
+        descendant_ids_map: Dict[int, Set[int]] = defaultdict(set)
+        for code_id in code_ids:
+            ancestor_depths = self._find_ancestor_depths(code_id, parent_ids_map)
+            self._ancestor_depths[code_id] = ancestor_depths
+            for ancestor_id in ancestor_depths:
+                descendant_ids_map[ancestor_id].add(code_id)
+
+        self._ancestor_ids: Dict[int, FrozenSet[int]] = {
+            code_id: frozenset(ancestor_depths) for code_id, ancestor_depths in self._ancestor_depths.items()
+        }
+        self._descendant_ids: Dict[int, FrozenSet[int]] = {
+            code_id: frozenset(descendant_ids) for code_id, descendant_ids in descendant_ids_map.items()
+        }
+
+    @staticmethod
+    def _find_ancestor_depths(code_id, parent_ids_map) -> Dict[int, int]:
+        # Walk up one level at a time so that each ancestor gets the depth of its closest path
+        ancestor_depths = {}
+        current_level = [code_id]
+        depth = 0
+        while current_level:
+            depth += 1
+            next_level = []
+            for current_id in current_level:
+                for parent_id in parent_ids_map.get(current_id, ()):
+                    if parent_id != code_id and parent_id not in ancestor_depths:
+                        ancestor_depths[parent_id] = depth
+                        next_level.append(parent_id)
+            current_level = next_level
+        return ancestor_depths
+
+    def get_ancestor_ids(self, code_id: int) -> FrozenSet[int]:
+        return self._ancestor_ids.get(code_id, frozenset())
+
+    def get_descendant_ids(self, code_id: int) -> FrozenSet[int]:
+        return self._descendant_ids.get(code_id, frozenset())
+
+    def is_descendant(self, code_id: int, ancestor_code_id: int) -> bool:
+        return ancestor_code_id in self.get_ancestor_ids(code_id)
+
+    def get_closure_rows(self):
+        """Yields the rows of the code_closure table, including a row pairing each code with itself"""
+        for code_id, ancestor_depths in self._ancestor_depths.items():
+            yield {'ancestor_code_id': code_id, 'descendant_code_id': code_id, 'depth': 0}
+            for ancestor_id, depth in ancestor_depths.items():
+                yield {'ancestor_code_id': ancestor_id, 'descendant_code_id': code_id, 'depth': depth}
+
+
 class CodeBookDao(BaseDao):
     def __init__(self):
         super(CodeBookDao, self).__init__(CodeBook)
@@ -123,6 +187,8 @@ class CodeBookDao(BaseDao):
             for i, concept in enumerate(codebook_json["concept"], start=1):
                 logging.info(f"Importing root concept {i} of {num_concepts} ({concept.get('display')}).")
                 code_count += self._import_concept(session, existing_codes, concept, system, codebook.codeBookId, None)
+            session.flush()
+            self.code_dao.rebuild_closure_with_session(session)
         logging.info(f"Finished, {code_count} codes imported.")
         return codebook, code_count
 
@@ -152,6 +218,10 @@ class CodeDao(CacheAllDao):
                     code.parent = parent
         return result
 
+    def _invalidate_cache(self):
+        super(CodeDao, self)._invalidate_cache()
+        singletons.invalidate(CODE_HIERARCHY_CACHE_INDEX)
+
     def _add_history(self, session, obj):
         history = CodeHistory()
         history.fromdict(obj.asdict(), allow_pk=True)
@@ -203,6 +273,71 @@ class CodeDao(CacheAllDao):
             return self.find_ancestor_of_type(code.parent, code_type)
         return None
 
+    def get_hierarchy(self) -> CodeHierarchy:
+        return singletons.get(
+            CODE_HIERARCHY_CACHE_INDEX,
+            self._load_hierarchy,
+            cache_ttl_seconds=self.cache_ttl_seconds
+        )
+
+    def get_ancestor_ids(self, code_id: int) -> FrozenSet[int]:
+        """Returns the ids of every code above the given code in the hierarchy"""
+        return self.get_hierarchy().get_ancestor_ids(code_id)
+
+    def get_descendant_ids(self, code_id: int) -> FrozenSet[int]:
+        """Returns the ids of every code below the given code in the hierarchy"""
+        return self.get_hierarchy().get_descendant_ids(code_id)
+
+    @staticmethod
+    def get_descendant_filter(code_id_column, ancestor_code_ids: Collection[int]):
+        """
+        Filter for a query that limits the code id column to the given codes and any of their descendants,
+        using the code_closure table. The table is empty until the first codebook import or Redcap code sync
+        after it's created, so this shouldn't be used before then.
+        """
+        return code_id_column.in_(
+            select([CodeClosure.descendantCodeId]).where(CodeClosure.ancestorCodeId.in_(ancestor_code_ids))
+        )
+
+    def _load_hierarchy(self) -> CodeHierarchy:
+        with self.session() as session:
+            return self._load_hierarchy_with_session(session)
+
+    @staticmethod
+    def _load_hierarchy_with_session(session) -> CodeHierarchy:
+        code_ids = []
+        parent_ids_map: Dict[int, Set[int]] = defaultdict(set)
+        for code_id, parent_id in session.query(Code.codeId, Code.parentId):
+            code_ids.append(code_id)
+            if parent_id is not None:
+                parent_ids_map[code_id].add(parent_id)
+
+        survey_edges = session.query(Survey.codeId, SurveyQuestion.codeId).join(
+            SurveyQuestion,
+            SurveyQuestion.surveyId == Survey.id
+        ).distinct().union(
+            session.query(SurveyQuestion.codeId, SurveyQuestionOption.codeId).join(
+                SurveyQuestionOption,
+                SurveyQuestionOption.questionId == SurveyQuestion.id
+            ).distinct()
+        )
+        for parent_id, code_id in survey_edges:
+            if parent_id is not None and code_id is not None:
+                parent_ids_map[code_id].add(parent_id)
+
+        return CodeHierarchy(code_ids, parent_ids_map)
+
+    def rebuild_closure_with_session(self, session, batch_size=1000):
+        """Replaces the contents of the code_closure table with the current code hierarchy"""
+        hierarchy = self._load_hierarchy_with_session(session)
+        session.query(CodeClosure).delete(synchronize_session=False)
+        row_count = 0
+        for row_batch in list_chunks(list(hierarchy.get_closure_rows()), batch_size):
+            session.execute(CodeClosure.__table__.insert(), row_batch)
+            row_count += len(row_batch)
+        self._invalidate_cache()
+        return row_count
+
     def get_internal_id_code_map(self, code_map):
         """Accepts a map of (system, value) -> (display, code_type, parent_id) for codes found in a
     questionnaire or questionnaire response.
@@ -1,5 +1,6 @@
 from datetime import date
 import pytz
+from typing import Set
 from sqlalchemy import and_, desc, func, or_
 from sqlalchemy.orm.exc import DetachedInstanceError
 from werkzeug.exceptions import BadRequest, NotFound, Conflict, InternalServerError
@@ -170,18 +171,22 @@ class DeceasedReportDao(UpdatableDao):
             ParticipantSummary.participantId == report.participantId
         ).one_or_none()
         if participant_summary:
-            if report.status == DeceasedReportStatus.DENIED:
-                participant_summary.deceasedStatus = DeceasedStatus.UNSET
-                participant_summary.deceasedAuthored = None
-                participant_summary.dateOfDeath = None
-            else:
-                participant_summary.deceasedStatus = DeceasedStatus(str(report.status))
-                participant_summary.dateOfDeath = report.dateOfDeath
+            DeceasedReportDao.set_participant_summary_deceased_fields(participant_summary, report)
 
-                if report.status == DeceasedReportStatus.APPROVED:
-                    participant_summary.deceasedAuthored = report.reviewed
-                else:
-                    participant_summary.deceasedAuthored = report.authored
+    @staticmethod
+    def set_participant_summary_deceased_fields(participant_summary: ParticipantSummary, report: DeceasedReport):
+        if report.status == DeceasedReportStatus.DENIED:
+            participant_summary.deceasedStatus = DeceasedStatus.UNSET
+            participant_summary.deceasedAuthored = None
+            participant_summary.dateOfDeath = None
+        else:
+            participant_summary.deceasedStatus = DeceasedStatus(str(report.status))
+            participant_summary.dateOfDeath = report.dateOfDeath
+
+            if report.status == DeceasedReportStatus.APPROVED:
+                participant_summary.deceasedAuthored = report.reviewed
+            else:
+                participant_summary.deceasedAuthored = report.authored
 
     def load_model(self, id_):
         with self.session() as session:
@@ -550,6 +555,14 @@ class DeceasedReportDao(UpdatableDao):
     def _deceased_report_lock_name(participant_id):
         return f'rdr.deceased_report.p{participant_id}'
 
+    def get_report_creation_lock(self, session, participant_id) -> NamedLock:
+        """Lock held while checking that a participant doesn't have an active report and creating a new one"""
+        return NamedLock(
+            name=self._deceased_report_lock_name(participant_id),
+            session=session,
+            lock_failure_exception=InternalServerError('Unable to create deceased report')
+        )
+
     @staticmethod
     def except_on_active_reports(session, participant_id):
         has_active_reports_query = session.query(DeceasedReport).filter(
@@ -560,6 +573,26 @@ class DeceasedReportDao(UpdatableDao):
         if session.query(has_active_reports_query.exists()).scalar():
             raise Conflict(f'Participant P{participant_id} already has a preliminary or final deceased report')
 
+    @staticmethod
+    def get_participant_ids_with_active_reports(session, participant_ids) -> Set[int]:
+        """Finds which of the given participants have a preliminary or final deceased report"""
+        if not participant_ids:
+            return set()
+
+        query = session.query(DeceasedReport.participantId).filter(
+            DeceasedReport.participantId.in_(participant_ids),
+            DeceasedReport.status != DeceasedReportStatus.DENIED
+        ).distinct()
+        return {participant_id for participant_id, in query}
+
+    @staticmethod
+    def auto_approve_if_unpaired(report: DeceasedReport, participant_hpo_id):
+        """Reports for unpaired participants don't need to be reviewed"""
+        if participant_hpo_id == 0:
+            report.status = DeceasedReportStatus.APPROVED
+            report.reviewer = report.author
+            report.reviewed = report.authored
+
     def except_if_invalid(self, report: DeceasedReport):
         if self._is_future_datetime(report.authored):
             raise BadRequest(f'Report issued date can not be a future date, received {report.authored}')
@@ -571,18 +604,11 @@ class DeceasedReportDao(UpdatableDao):
     def insert_with_session(self, session, obj: DeceasedReport):
         # Should auto-approve reports for unpaired participants
         participant = self._load_participant(obj.participantId)
-        if participant.hpoId == 0:
-            obj.status = DeceasedReportStatus.APPROVED
-            obj.reviewer = obj.author
-            obj.reviewed = obj.authored
+        self.auto_approve_if_unpaired(obj, participant.hpoId)
 
         self.except_if_invalid(obj)
 
-        with NamedLock(
-            name=self._deceased_report_lock_name(obj.participantId),
-            session=session,
-            lock_failure_exception=InternalServerError('Unable to create deceased report')
-        ):
+        with self.get_report_creation_lock(session, obj.participantId):
             self.except_on_active_reports(session, obj.participantId)
 
             self._update_participant_summary(session, obj)
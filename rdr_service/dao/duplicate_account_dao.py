@@ -1,13 +1,19 @@
 from datetime import datetime
-from typing import Iterable, Optional
+from hashlib import sha256
+from typing import Collection, Dict, Iterable, List, Optional, Tuple
 
 import sqlalchemy as sa
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import aliased, Session
 
+from rdr_service.clock import CLOCK
 from rdr_service.model.duplicate_account import (
-    DuplicateAccount, DuplicationSource, DuplicationStatus, PrimaryParticipantIndication
+    BlockingKeyType, DuplicateAccount, DuplicateAccountBlockingKey, DuplicationSource, DuplicationStatus,
+    PrimaryParticipantIndication
 )
 from rdr_service.model.participant_summary import ParticipantSummary
+from rdr_service.services.system_utils import list_chunks
+
+DUPLICATE_DETECTION_BATCH_SIZE = 1000
 
 
 class DuplicateExistsException(Exception):
@@ -84,8 +90,10 @@ class DuplicateAccountDao:
             existing_record.primary_participant = kwargs['primary_account']
 
     @classmethod
-    def query_participant_duplication_data(cls, session) -> Iterable[ParticipantSummary]:
-        """Load participant summary data used for finding duplicate accounts"""
+    def query_participant_duplication_data(
+        cls, session, after_participant_id: int = 0, limit: int = DUPLICATE_DETECTION_BATCH_SIZE
+    ) -> List[ParticipantSummary]:
+        """Load a page of the participant summary data used for finding duplicate accounts"""
         return session.query(
             ParticipantSummary.participantId,
             ParticipantSummary.firstName,
@@ -93,7 +101,9 @@ class DuplicateAccountDao:
             ParticipantSummary.dateOfBirth,
             ParticipantSummary.email,
             ParticipantSummary.loginPhoneNumber
-        ).yield_per(1000)
+        ).filter(
+            ParticipantSummary.participantId > after_participant_id
+        ).order_by(ParticipantSummary.participantId).limit(limit).all()
 
     @classmethod
     def query_participants_to_check(cls, since: datetime, session: Session) -> Iterable[ParticipantSummary]:
@@ -109,6 +119,121 @@ class DuplicateAccountDao:
             ParticipantSummary.lastModified > since
         ).all()
 
+    @classmethod
+    def get_blocking_keys(cls, summary: ParticipantSummary) -> Dict[BlockingKeyType, str]:
+        """
+        Hash the normalized values that the participant's account can be matched to another on,
+        so that formatting differences don't keep a duplicate from being found.
+        """
+        values = {}
+        if summary.firstName and summary.lastName and summary.dateOfBirth:
+            values[BlockingKeyType.NAME_DOB] = '|'.join([
+                ' '.join(summary.firstName.lower().split()),
+                ' '.join(summary.lastName.lower().split()),
+                summary.dateOfBirth.isoformat()
+            ])
+        if summary.email and summary.email.strip():
+            values[BlockingKeyType.EMAIL] = summary.email.strip().lower()
+        if summary.loginPhoneNumber:
+            phone_digits = ''.join(char for char in summary.loginPhoneNumber if char.isdigit())
+            if phone_digits:
+                values[BlockingKeyType.PHONE] = phone_digits
+
+        return {key_type: sha256(value.encode('utf-8')).hexdigest() for key_type, value in values.items()}
+
+    @classmethod
+    def update_blocking_keys(cls, summaries: Iterable[ParticipantSummary], session: Session):
+        """Replace any blocking keys stored for the participants with ones generated from their current data"""
+        for summary_batch in list_chunks(list(summaries), DUPLICATE_DETECTION_BATCH_SIZE):
+            session.query(DuplicateAccountBlockingKey).filter(
+                DuplicateAccountBlockingKey.participant_id.in_([summary.participantId for summary in summary_batch])
+            ).delete(synchronize_session=False)
+
+            key_values = [
+                {'participant_id': summary.participantId, 'key_type': key_type, 'key_hash': key_hash}
+                for summary in summary_batch
+                for key_type, key_hash in cls.get_blocking_keys(summary).items()
+            ]
+            if key_values:
+                session.execute(DuplicateAccountBlockingKey.__table__.insert(), key_values)
+
+    @classmethod
+    def query_candidate_pairs(cls, participant_ids: Collection[int], session: Session) -> List[Tuple[int, int]]:
+        """
+        Find the participants that share a blocking key with any of the given participants.
+        :return: pairs of ids, with the given participant first and the account matching it second
+        """
+        other_key = aliased(DuplicateAccountBlockingKey)
+        result = []
+        for id_batch in list_chunks(sorted(set(participant_ids)), DUPLICATE_DETECTION_BATCH_SIZE):
+            result.extend(
+                session.query(
+                    DuplicateAccountBlockingKey.participant_id,
+                    other_key.participant_id
+                ).join(
+                    other_key,
+                    sa.and_(
+                        other_key.key_type == DuplicateAccountBlockingKey.key_type,
+                        other_key.key_hash == DuplicateAccountBlockingKey.key_hash,
+                        other_key.participant_id != DuplicateAccountBlockingKey.participant_id
+                    )
+                ).filter(
+                    DuplicateAccountBlockingKey.participant_id.in_(id_batch)
+                ).distinct().order_by(
+                    DuplicateAccountBlockingKey.participant_id,
+                    other_key.participant_id
+                ).all()
+            )
+        return [(participant_a_id, participant_b_id) for participant_a_id, participant_b_id in result]
+
+    @classmethod
+    def store_potential_duplications(
+        cls, participant_pairs: Iterable[Tuple[int, int]], session: Session, authored: datetime,
+        source: DuplicationSource
+    ) -> int:
+        """
+        Record each of the pairs as potential duplicates, skipping any that are already recorded
+        (in either order) rather than raising a DuplicateExistsException for them.
+        :return: the number of new duplicate records
+        """
+        new_pairs = {}
+        for participant_a_id, participant_b_id in participant_pairs:
+            new_pairs.setdefault(frozenset((participant_a_id, participant_b_id)), (participant_a_id, participant_b_id))
+        if not new_pairs:
+            return 0
+
+        participant_ids = sorted(set().union(*new_pairs.keys()))
+        for id_batch in list_chunks(participant_ids, DUPLICATE_DETECTION_BATCH_SIZE):
+            for existing_a_id, existing_b_id in session.query(
+                DuplicateAccount.participant_a_id,
+                DuplicateAccount.participant_b_id
+            ).filter(
+                sa.or_(
+                    DuplicateAccount.participant_a_id.in_(id_batch),
+                    DuplicateAccount.participant_b_id.in_(id_batch)
+                )
+            ):
+                new_pairs.pop(frozenset((existing_a_id, existing_b_id)), None)
+
+        # Inserting with the table directly skips the model listeners, so the timestamps are set here
+        now = CLOCK.now()
+        record_values = [
+            {
+                'created': now,
+                'modified': now,
+                'participant_a_id': participant_a_id,
+                'participant_b_id': participant_b_id,
+                'authored': authored,
+                'status': DuplicationStatus.POTENTIAL,
+                'source': source
+            }
+            for participant_a_id, participant_b_id in new_pairs.values()
+        ]
+        for value_batch in list_chunks(record_values, DUPLICATE_DETECTION_BATCH_SIZE):
+            session.execute(DuplicateAccount.__table__.insert(), value_batch)
+
+        return len(record_values)
+
     @classmethod
     def _any_pairs_with_participant_as_primary(cls, participant_id, session) -> DuplicateAccount:
         result = session.query(DuplicateAccount).filter(
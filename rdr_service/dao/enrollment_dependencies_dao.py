@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import Optional
+from typing import Collection, Optional
 
 from sqlalchemy.orm import Session
 
@@ -29,6 +29,27 @@ class EnrollmentDependenciesDao:
             cache[participant_id] = result
         return result
 
+    @classmethod
+    def load_enrollment_dependencies(cls, participant_ids: Collection[int], session: Session):
+        """
+        Loads the dependency records for a group of participants into the cache with a single query,
+        so that later calls for any of the participants don't need to go to the database.
+        """
+        ids_to_load = [participant_id for participant_id in participant_ids if participant_id not in cache]
+        if not ids_to_load:
+            return
+
+        results = session.query(EnrollmentDependencies).filter(
+            EnrollmentDependencies.participant_id.in_(ids_to_load)
+        ).all()
+        for result in results:
+            cache[result.participant_id] = result
+
+    @classmethod
+    def clear_cached(cls, participant_ids: Collection[int]):
+        for participant_id in participant_ids:
+            cache.pop(participant_id, None)
+
     @classmethod
     def _set_field(cls, field_name: str, value, participant_id: int, session: Session):
         obj = cls.get_enrollment_dependencies(participant_id=participant_id, session=session)
@@ -66,6 +66,7 @@ from rdr_service.model.biobank_stored_sample import BiobankStoredSample
 from rdr_service.model.participant import Participant
 from rdr_service.model.participant_summary import ParticipantSummary
 from rdr_service.query import FieldFilter, Operator, OrderBy, Query
+from rdr_service.services.system_utils import list_chunks
 from rdr_service.genomic.genomic_mappings import genome_type_to_aw1_aw2_file_prefix as genome_type_map, \
     cvl_result_reconciliation_modules, message_broker_report_ready_event_state_mappings, \
     message_broker_report_viewed_event_state_mappings
@@ -871,24 +872,40 @@ class GenomicSetMemberDao(UpdatableDao, GenomicDaoMixin):
         member.genomicWorkflowStateModifiedTime = clock.CLOCK.now()
         self.update(member)
 
-    def get_blocklist_members_from_date(self, *, attributes, from_days=1):
+    def get_blocklist_member_ids(self, *filters, from_days=1) -> List[int]:
+        """
+        Find the ids of newly added/modified members that match the given filters
+        :param filters: SqlAlchemy filter expressions that the members need to match
+        :param from_days: how many days back to look for added/modified members
+        """
         from_date = (clock.CLOCK.now() - timedelta(days=from_days)).replace(microsecond=0)
-        attributes.update({'GenomicSetMember.id', 'GenomicSetMember.genomeType'})
-        eval_attrs = [eval(obj) for obj in attributes]
-        members = sqlalchemy.orm.Query(eval_attrs)
 
         with self.session() as session:
-            members = members.filter(
+            member_ids = session.query(GenomicSetMember.id).filter(
                 or_(
                     and_(
                         GenomicSetMember.created >= from_date,
                         GenomicSetMember.genomicWorkflowState == GenomicWorkflowState.AW0,
                     ),
                     GenomicSetMember.modified >= from_date
-                )
-            )
+                ),
+                *filters
+            ).all()
 
-            return members.with_session(session).all()
+            return [member_id for member_id, in member_ids]
+
+    def update_members_by_ids(self, member_ids: List[int], update_values: dict, batch_size=1000):
+        """
+        Apply the same update to the given members, a batch of ids at a time
+        :param update_values: dictionary of GenomicSetMember attributes to the values (or SqlAlchemy
+            expressions) that they should be set to
+        """
+        with self.session() as session:
+            for id_batch in list_chunks(member_ids, batch_size):
+                session.query(GenomicSetMember).filter(
+                    GenomicSetMember.id.in_(id_batch)
+                ).update(update_values, synchronize_session=False)
+                session.commit()
 
     def get_members_for_cvl_reconciliation(self):
         """
@@ -1371,6 +1388,24 @@ class GenomicSetMemberDao(UpdatableDao, GenomicDaoMixin):
 
         return None
 
+    @classmethod
+    def get_wgs_pass_dates(cls, session, biobank_ids) -> Dict[int, datetime]:
+        """Finds the earliest passing WGS AW4 record for each of the given biobank ids"""
+        if not biobank_ids:
+            return {}
+
+        prefix = get_biobank_id_prefix()
+        results = session.query(
+            GenomicAW4Raw.biobank_id,
+            functions.min(GenomicAW4Raw.created).label('created')
+        ).filter(
+            GenomicAW4Raw.biobank_id.in_([f'{prefix}{biobank_id}' for biobank_id in biobank_ids]),
+            GenomicAW4Raw.genome_type == config.GENOME_TYPE_WGS,
+            GenomicAW4Raw.qc_status.ilike('pass')
+        ).group_by(GenomicAW4Raw.biobank_id).all()
+
+        return {int(row.biobank_id[len(prefix):]): row.created for row in results}
+
 
 class GenomicJobRunDao(UpdatableDao, GenomicDaoMixin):
     """ Stub for GenomicJobRun model """
@@ -0,0 +1,43 @@
+from typing import Collection, Dict
+
+from rdr_service.dao.base_dao import BaseDao
+from rdr_service.model.geocoded_address import GeocodedAddress
+from rdr_service.services.system_utils import list_chunks
+
+LOOKUP_BATCH_SIZE = 500
+
+
+class GeocodedAddressDao(BaseDao):
+    def __init__(self):
+        super().__init__(GeocodedAddress)
+
+    def get_id(self, obj):
+        return obj.id
+
+    def get_by_address_keys(self, address_keys: Collection[str]) -> Dict[str, GeocodedAddress]:
+        result = {}
+        with self.session() as session:
+            for key_batch in list_chunks(list(set(address_keys)), LOOKUP_BATCH_SIZE):
+                for geocoded_address in session.query(GeocodedAddress).filter(
+                    GeocodedAddress.addressKey.in_(key_batch)
+                ).all():
+                    result[geocoded_address.addressKey] = geocoded_address
+        return result
+
+    def upsert_all(self, geocoded_addresses: Collection[GeocodedAddress]):
+        """Store the locations, replacing any that are already cached for the same addresses"""
+        with self.session() as session:
+            existing_map = {
+                geocoded_address.addressKey: geocoded_address
+                for geocoded_address in session.query(GeocodedAddress).filter(
+                    GeocodedAddress.addressKey.in_([obj.addressKey for obj in geocoded_addresses])
+                ).all()
+            }
+            for obj in geocoded_addresses:
+                existing = existing_map.get(obj.addressKey)
+                if existing:
+                    existing.latitude = obj.latitude
+                    existing.longitude = obj.longitude
+                    existing.timeZoneId = obj.timeZoneId
+                else:
+                    session.add(obj)
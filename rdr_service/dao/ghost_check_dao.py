@@ -1,5 +1,5 @@
 from datetime import date, datetime
-from typing import Optional
+from typing import List, Optional, Tuple
 
 from sqlalchemy.orm import Session
 
@@ -39,13 +39,32 @@ class GhostCheckDao(BaseDao):
         return query.all()
 
     @classmethod
-    def record_ghost_check(cls, session: Session, participant_id: int,
-                           modification_performed: Optional[GhostFlagModification]):
-        session.add(GhostApiCheck(
-            participant_id=participant_id,
-            modification_performed=modification_performed,
-            timestamp=CLOCK.now(),
-        ))
+    def record_ghost_checks(cls, session: Session,
+                            check_results: List[Tuple[int, Optional[GhostFlagModification]]]):
+        """
+        Records that the participants were checked, along with any change made to their ghost flag.
+        :param check_results: participant ids paired with the modification performed for each
+        """
+        if not check_results:
+            return
+
+        timestamp = CLOCK.now()
+        session.bulk_insert_mappings(GhostApiCheck, [
+            {
+                'participant_id': participant_id,
+                'modification_performed': modification_performed,
+                'timestamp': timestamp
+            }
+            for participant_id, modification_performed in check_results
+        ])
+
+    @classmethod
+    def get_checks_since(cls, session: Session,
+                         timestamp: datetime) -> List[Tuple[int, Optional[GhostFlagModification]]]:
+        """Loads the participant ids and modifications of the ghost checks recorded since the given time"""
+        return session.query(GhostApiCheck.participant_id, GhostApiCheck.modification_performed).filter(
+            GhostApiCheck.timestamp >= timestamp
+        ).all()
 
     def get_id(self, obj):
         ...
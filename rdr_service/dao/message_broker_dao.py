@@ -1,15 +1,22 @@
-from rdr_service import clock
+from datetime import timedelta
+from typing import List
+
+from rdr_service import clock, config
 from werkzeug.exceptions import BadRequest
 
-from rdr_service.config import GAE_PROJECT
+from rdr_service.config import GAE_PROJECT, MESSAGE_BROKER_QUEUED_DESTINATIONS
 from rdr_service.cloud_utils.gcp_cloud_tasks import GCPCloudTask
 from rdr_service.dao.database_utils import parse_datetime, format_datetime
 from rdr_service.model.utils import from_client_participant_id, to_client_participant_id
 from rdr_service.dao.base_dao import BaseDao
 from rdr_service.dao.participant_dao import ParticipantDao
-from rdr_service.model.message_broker import MessageBrokerRecord, MessageBrokerEventData
+from rdr_service.model.message_broker import MessageBrokerDeliveryStatus, MessageBrokerRecord, \
+    MessageBrokerEventData
 from rdr_service.message_broker.message_broker import MessageBrokerFactory
 
+# How long a dispatcher has to send the messages it claims before they can be claimed again
+DELIVERY_CLAIM_TIMEOUT = timedelta(minutes=15)
+
 
 class MessageBrokerDao(BaseDao):
     def __init__(self):
@@ -49,11 +56,18 @@ class MessageBrokerDao(BaseDao):
         return participant.participantOrigin
 
     def insert(self, message):
-        response_code, response_body, response_error = self.send_message(message)
-        message.responseCode = response_code
-        message.responseBody = response_body
-        message.responseError = response_error
-        message.responseTime = clock.CLOCK.now()
+        if self._is_queued_destination(message.messageDest):
+            # the message is stored for the dispatcher to send, so the requester doesn't wait on the destination,
+            # but anything that would stop it from being sent is still reported to the requester
+            MessageBrokerFactory.create(message).validate_request()
+            message.deliveryStatus = MessageBrokerDeliveryStatus.PENDING
+            message.nextAttemptTime = message.requestTime
+        else:
+            response_code, response_body, response_error = self.send_message(message)
+            message.responseCode = response_code
+            message.responseBody = response_body
+            message.responseError = response_error
+            message.responseTime = clock.CLOCK.now()
         super(MessageBrokerDao, self).insert(message)
         # store the data to RDR table asynchronous
         if GAE_PROJECT != 'localhost':
@@ -79,6 +93,8 @@ class MessageBrokerDao(BaseDao):
             "responseBody": message.responseBody,
             "errorMessage": message.responseError
         }
+        if message.deliveryStatus is not None:
+            response_json["deliveryStatus"] = str(message.deliveryStatus)
         return response_json
 
     @staticmethod
@@ -86,6 +102,40 @@ class MessageBrokerDao(BaseDao):
         message_broker = MessageBrokerFactory.create(message)
         return message_broker.send_request()
 
+    @staticmethod
+    def _is_queued_destination(dest_name):
+        queued_destinations = config.getSettingJson(MESSAGE_BROKER_QUEUED_DESTINATIONS, default=[])
+        return dest_name is not None and dest_name.lower() in queued_destinations
+
+    def claim_queued_messages(self, limit) -> List[MessageBrokerRecord]:
+        """
+        Find queued messages that are due to be sent, marking them as being sent so that they aren't picked
+        up by another dispatcher. Messages that are claimed but never resolved become due again once the
+        claim times out.
+        """
+        now = clock.CLOCK.now()
+        with self.session() as session:
+            messages = session.query(MessageBrokerRecord).filter(
+                MessageBrokerRecord.deliveryStatus.in_([
+                    MessageBrokerDeliveryStatus.PENDING,
+                    MessageBrokerDeliveryStatus.SENDING
+                ]),
+                MessageBrokerRecord.nextAttemptTime <= now
+            ).order_by(
+                MessageBrokerRecord.nextAttemptTime
+            ).limit(limit).with_for_update().all()
+
+            for message in messages:
+                message.deliveryStatus = MessageBrokerDeliveryStatus.SENDING
+                message.nextAttemptTime = now + DELIVERY_CLAIM_TIMEOUT
+
+            return messages
+
+    def update_delivered_messages(self, messages: List[MessageBrokerRecord]):
+        with self.session() as session:
+            for message in messages:
+                session.merge(message)
+
 
 class MessageBrokenEventDataDao(BaseDao):
     def __init__(self):
@@ -2,6 +2,17 @@ from rdr_service.dao.base_dao import BaseDao
 from rdr_service.model.metadata import Metadata
 
 WORKBENCH_LAST_SYNC_KEY = 'WORKBENCH_LAST_SYNC'
+WORKBENCH_SEARCH_INDEX_BUILT_KEY = 'WORKBENCH_SEARCH_INDEX_BUILT'
+BIOBANK_STORED_SAMPLE_SYNC_KEY = 'BIOBANK_STORED_SAMPLE_SUMMARY_SYNC'
+PDR_CHANGE_FEED_PARTICIPANT_SUMMARY_KEY = 'PDR_CHANGE_FEED_PARTICIPANT_SUMMARY'
+PDR_CHANGE_FEED_QUESTIONNAIRE_RESPONSE_KEY = 'PDR_CHANGE_FEED_QUESTIONNAIRE_RESPONSE'
+PDR_CHANGE_FEED_BIOBANK_STORED_SAMPLE_KEY = 'PDR_CHANGE_FEED_BIOBANK_STORED_SAMPLE'
+RESPONSE_DUPLICATION_WATERMARK_KEY = 'RESPONSE_DUPLICATION_WATERMARK'
+GHOST_CHECK_CHECKPOINT_KEY = 'GHOST_CHECK_CHECKPOINT'
+ETM_RESPONSE_DUPLICATION_WATERMARK_KEY = 'ETM_RESPONSE_DUPLICATION_WATERMARK'
+MEASUREMENT_CATALOG_BUILT_KEY = 'MEASUREMENT_CATALOG_BUILT'
+DUPLICATE_BLOCKING_KEYS_BUILT_KEY = 'DUPLICATE_BLOCKING_KEYS_BUILT'
+DUPLICATE_BLOCKING_KEYS_BUILD_PROGRESS_KEY = 'DUPLICATE_BLOCKING_KEYS_BUILD_PROGRESS'
 
 
 class MetadataDao(BaseDao):
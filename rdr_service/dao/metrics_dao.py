@@ -2,6 +2,7 @@ import json
 import logging
 from datetime import timedelta
 
+from sqlalchemy.dialects.mysql import insert
 from sqlalchemy.orm import subqueryload
 from werkzeug.exceptions import PreconditionFailed
 
@@ -96,6 +97,21 @@ class MetricsBucketDao(UpsertableDao):
     def get_id(self, obj):
         return [obj.metricsVersionId, obj.date, obj.hpoId]
 
+    def upsert_all_with_session(self, session, buckets):
+        """Upserts the buckets with a single statement, replacing the metrics of any that already exist"""
+        if not buckets:
+            return
+        query = insert(MetricsBucket.__table__).values([
+            {
+                'metrics_version_id': bucket.metricsVersionId,
+                'date': bucket.date,
+                'hpo_id': bucket.hpoId,
+                'metrics': bucket.metrics
+            }
+            for bucket in buckets
+        ])
+        session.execute(query.on_duplicate_key_update(metrics=query.inserted.metrics))
+
     def get_active_buckets(self, start_date=None, end_date=None):
         with self.session() as session:
             version = MetricsVersionDao().get_serving_version_with_session(session)
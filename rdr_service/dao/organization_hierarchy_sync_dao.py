@@ -1,7 +1,6 @@
 import logging
 import time
 
-import googlemaps
 import rdr_service.lib_fhir.fhirclient_3_0_0.models.organization
 
 from rdr_service.lib_fhir.fhirclient_3_0_0.models.fhirabstractbase import FHIRValidationError
@@ -27,16 +26,19 @@ from dateutil.parser import parse
 from rdr_service.api_util import HIERARCHY_CONTENT_SYSTEM_PREFIX
 from rdr_service.tools.import_participants import _setup_questionnaires, import_participant
 from rdr_service.data_gen.in_process_client import InProcessClient
+from rdr_service.services.geocoding import GeocodeCache, Geocoder, GoogleMapsGeocoder, SiteAddress
 
 
 class OrganizationHierarchySyncDao(BaseDao):
 
-    def __init__(self):
+    def __init__(self, geocoder: Geocoder = None):
         super(OrganizationHierarchySyncDao, self).__init__(HPO)
         self.hpo_dao = HPODao()
         self.organization_dao = OrganizationDao()
         self.site_dao = SiteDao()
         self.code_dao = CodeDao()
+        self.geocoder = geocoder or GoogleMapsGeocoder()
+        self.geocode_cache = GeocodeCache(self.geocoder.geocode)
 
     def from_client_json(self, resource_json, id_=None, expected_version=None, client_id=None):  # pylint: disable=unused-argument
         try:
@@ -576,55 +578,11 @@ class OrganizationHierarchySyncDao(BaseDao):
                     site.longitude = existing_site.longitude
                     site.timeZoneId = existing_site.timeZoneId
                     return
-            latitude, longitude = self._get_lat_long_for_site(site.address1, site.city, site.state)
-            site.latitude = latitude
-            site.longitude = longitude
-            if latitude and longitude:
-                site.timeZoneId = self._get_time_zone(latitude, longitude)
+            address = SiteAddress(site.address1, site.city, site.state)
+            location = self.geocode_cache.get_locations([address])[address]
+            site.latitude = location.latitude
+            site.longitude = location.longitude
+            site.timeZoneId = location.time_zone_id
         else:
             if site.siteStatus == SiteStatus.ACTIVE:
                 logging.warning(f'Active site must have valid address. Site:{site.siteName}, Group:{site.googleGroup}')
-
-    def _get_lat_long_for_site(self, address_1, city, state):
-        self.full_address = address_1 + ' ' + city + ' ' + state
-        try:
-            self.api_key = config.getSetting('geocode_api_key', None)
-            if not self.api_key:
-                logging.error('Geocode key not set')
-                return None, None
-
-            self.gmaps = googlemaps.Client(key=self.api_key)
-            try:
-                geocode_result = self.gmaps.geocode(address_1 + '' + city + ' ' + state)[0]
-            except IndexError:
-                logging.warning(f'Bad address for {self.full_address}, could not geocode.')
-                return None, None
-            if geocode_result:
-                geometry = geocode_result.get('geometry')
-                if geometry:
-                    location = geometry.get('location')
-                if location:
-                    latitude = location.get('lat')
-                    longitude = location.get('lng')
-                    return latitude, longitude
-                else:
-                    logging.warning(f'Can not find lat/long for {self.full_address}')
-                    return None, None
-            else:
-                logging.warning(f'Geocode results failed for {self.full_address}.')
-                return None, None
-        except ValueError as e:
-            logging.exception(f'Invalid geocode key: {self.api_key}. ERROR: {e}')
-            return None, None
-        except IndexError as e:
-            logging.exception(f'Geocoding failure Check that address is correct. ERROR: {e}')
-            return None, None
-
-    def _get_time_zone(self, latitude, longitude):
-        time_zone = self.gmaps.timezone(location=(latitude, longitude))
-        if time_zone['status'] == 'OK':
-            time_zone_id = time_zone['timeZoneId']
-            return time_zone_id
-        else:
-            logging.info(f'can not retrieve time zone from {self.full_address}')
-            return None
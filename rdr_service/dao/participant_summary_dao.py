@@ -1,3 +1,4 @@
+import dataclasses
 import datetime
 import logging
 
@@ -5,6 +6,7 @@ from dateutil.relativedelta import relativedelta
 import faker
 import re
 import threading
+import time
 
 import sqlalchemy
 import sqlalchemy.orm
@@ -12,7 +14,7 @@ import sqlalchemy.orm
 from sqlalchemy import or_, and_, func, text
 from sqlalchemy.orm import Query, joinedload
 from sqlalchemy.sql import expression
-from typing import Collection, List
+from typing import Collection, List, Optional, Set
 
 # Note: leaving for future use if we go back to using a relationship to PatientStatus table.
 # from sqlalchemy.orm import selectinload
@@ -28,7 +30,7 @@ from rdr_service.api_util import (
     format_json_site,
     parse_json_enum
 )
-from rdr_service.app_util import is_care_evo_and_not_prod
+from rdr_service.app_util import datetime_as_naive_utc, is_care_evo_and_not_prod
 from rdr_service.cloud_utils.gcp_google_pubsub import submit_pipeline_pubsub_msg_from_model
 from rdr_service.code_constants import BIOBANK_TESTS, ORIGINATING_SOURCES,\
     PMI_SKIP_CODE, PPI_SYSTEM, UNSET
@@ -38,6 +40,7 @@ from rdr_service.dao.database_utils import get_sql_and_params_for_array, replace
 from rdr_service.dao.enrollment_dependencies_dao import EnrollmentDependenciesDao
 from rdr_service.dao.genomics_dao import GenomicSetMemberDao
 from rdr_service.dao.hpo_dao import HPODao
+from rdr_service.dao.metadata_dao import BIOBANK_STORED_SAMPLE_SYNC_KEY, MetadataDao
 from rdr_service.dao.organization_dao import OrganizationDao
 from rdr_service.dao.participant_dao import ParticipantDao
 from rdr_service.dao.participant_incentives_dao import ParticipantIncentivesDao
@@ -46,6 +49,7 @@ from rdr_service.dao.site_dao import SiteDao
 from rdr_service.domain_model.ehr import ParticipantEhrFile
 from rdr_service.logic.enrollment_info import EnrollmentCalculation, EnrollmentDependencies
 from rdr_service.model.account_link import AccountLink
+from rdr_service.model.biobank_stored_sample import BiobankStoredSample
 from rdr_service.model.config_utils import from_client_biobank_id, to_client_biobank_id
 from rdr_service.model.consent_file import ConsentType
 from rdr_service.model.enrollment_status_history import EnrollmentStatusHistory
@@ -87,13 +91,16 @@ from rdr_service.model.code import Code
 from rdr_service.query import FieldFilter, FieldJsonContainsFilter, Operator, OrderBy, PropertyType, QueryMutatingFilter
 from rdr_service.repository.obfuscation_repository import ObfuscationRepository
 from rdr_service.services.retention_calculation import RetentionEligibility
-from rdr_service.services.system_utils import min_or_none
+from rdr_service.services.system_utils import list_chunks, min_or_none
 
 
 # By default / secondarily order by last name, first name, DOB, and participant ID
 _ORDER_BY_ENDING = ("lastName", "firstName", "dateOfBirth", "participantId")
 # The default ordering of results for queries for withdrawn participants.
 _WITHDRAWN_ORDER_BY_ENDING = ("withdrawalTime", "participantId")
+# Stored samples are re-scanned for this long before the last sync, since their modified times are set by the
+# application before the transaction commits and a sample can become visible after a later sync has started
+_STORED_SAMPLE_SYNC_LOOKBACK = datetime.timedelta(minutes=30)
 _CODE_FILTER_FIELDS = ("organization", "site", "awardee")
 _SITE_FIELDS = (
     "clinicPhysicalMeasurementsCreatedSite",
@@ -106,6 +113,14 @@ _SITE_FIELDS = (
     "enrollmentSite",
 )
 
+
+@dataclasses.dataclass
+class EnrollmentPreloadData:
+    """Data for the enrollment status calculation that was loaded ahead of time for a group of participants"""
+    core_measurements: list = dataclasses.field(default_factory=list)
+    wgs_sequencing_time: Optional[datetime.datetime] = None
+
+
 # Lazy caches of property names for client JSON conversion.
 _DATE_FIELDS = set()
 _ENUM_FIELDS = set()
@@ -729,10 +744,8 @@ class ParticipantSummaryDao(UpdatableDao):
     def _make_updated_since_filter(self, updated_since_value):
         return FieldFilter('lastModified', Operator.GREATER_THAN_OR_EQUALS, updated_since_value)
 
-    def update_from_biobank_stored_samples(self, participant_id=None, biobank_ids=None, session=None):
-        """Rewrites sample-related summary data. Call this after updating BiobankStoredSamples.
-    If participant_id is provided, only that participant will have their summary updated."""
-        now = clock.CLOCK.now()
+    @classmethod
+    def _get_stored_sample_update_sql_and_params(cls, now):
         sample_sql, sample_params = _get_sample_sql_and_params(now)
 
         baseline_tests_sql, baseline_tests_params = _get_baseline_sql_and_params()
@@ -757,6 +770,14 @@ class ParticipantSummaryDao(UpdatableDao):
         counts_params.update(baseline_tests_params)
         counts_params.update(dna_tests_params)
 
+        return sample_sql, sample_params, counts_sql, counts_params
+
+    def update_from_biobank_stored_samples(self, participant_id=None, biobank_ids=None, session=None):
+        """Rewrites sample-related summary data. Call this after updating BiobankStoredSamples.
+    If participant_id is provided, only that participant will have their summary updated."""
+        now = clock.CLOCK.now()
+        sample_sql, sample_params, counts_sql, counts_params = self._get_stored_sample_update_sql_and_params(now)
+
         # If participant_id is provided, add the participant ID filter to all update statements.
         if participant_id:
             sample_sql += " AND participant_id = :participant_id"
@@ -773,6 +794,74 @@ class ParticipantSummaryDao(UpdatableDao):
         else:
             self._run_sql_updates(sample_sql, sample_params, counts_sql, counts_params, biobank_ids, session)
 
+    def update_from_recent_biobank_stored_samples(self, batch_size=500, session=None) -> int:
+        """
+        Rewrites sample-related summary data for the participants that have had stored samples created or
+        modified since the last time this ran (with some overlap, to catch samples that were committed late).
+        Participants are updated in batches, committing after each one.
+        If there is no record of a previous run then every participant summary is updated.
+        Returns the number of participants that were updated.
+        """
+        if not session:
+            with self.session() as session:
+                return self.update_from_recent_biobank_stored_samples(batch_size=batch_size, session=session)
+
+        metadata_dao = MetadataDao()
+        run_start_time = clock.CLOCK.now()
+        last_run = metadata_dao.get_by_key_with_session(session, BIOBANK_STORED_SAMPLE_SYNC_KEY)
+        if last_run is None or last_run.dateValue is None:
+            logging.info('No previous stored sample sync found, updating all participant summaries')
+            self.update_from_biobank_stored_samples(session=session)
+            metadata_dao.upsert_with_session(session, BIOBANK_STORED_SAMPLE_SYNC_KEY, date_value=run_start_time)
+            session.commit()
+            return 0
+
+        scan_start_time = last_run.dateValue - _STORED_SAMPLE_SYNC_LOOKBACK
+        biobank_ids = [
+            row.biobankId for row in session.query(BiobankStoredSample.biobankId).filter(
+                BiobankStoredSample.modified >= scan_start_time,
+                BiobankStoredSample.biobankId.isnot(None)
+            ).distinct().all()
+        ]
+        logging.info(f'Found {len(biobank_ids)} participants with stored samples modified since {scan_start_time}')
+        updated_count = self.update_from_biobank_stored_samples_for_biobank_ids(
+            biobank_ids, session=session, batch_size=batch_size
+        )
+
+        # Samples modified while this ran will be picked up again next time
+        metadata_dao.upsert_with_session(session, BIOBANK_STORED_SAMPLE_SYNC_KEY, date_value=run_start_time)
+        session.commit()
+        return updated_count
+
+    def update_from_biobank_stored_samples_for_biobank_ids(self, biobank_ids: Collection[int], session,
+                                                           batch_size=500) -> int:
+        """
+        Rewrites sample-related summary data for the participants with the given biobank ids, running the
+        updates for a batch of participants at a time and committing after each one.
+        Returns the number of participants that were updated.
+        """
+        biobank_ids = list(biobank_ids)
+        updated_count = 0
+        for biobank_id_batch in list_chunks(biobank_ids, batch_size):
+            batch_start_time = time.perf_counter()
+
+            now = clock.CLOCK.now()
+            sample_sql, sample_params, counts_sql, counts_params = self._get_stored_sample_update_sql_and_params(now)
+            ids_sql, ids_params = get_sql_and_params_for_array(biobank_id_batch, 'biobank_id')
+            sample_sql = replace_null_safe_equals(sample_sql + f" AND ps.biobank_id IN {ids_sql}")
+            counts_sql = replace_null_safe_equals(counts_sql + f" AND biobank_id IN {ids_sql}")
+            sample_params.update(ids_params)
+            counts_params.update(ids_params)
+
+            self._run_sql_updates(sample_sql, sample_params, counts_sql, counts_params, biobank_id_batch, session)
+            updated_count += len(biobank_id_batch)
+            logging.info(
+                f'Updated stored sample data for {updated_count} of {len(biobank_ids)} participants '
+                f'(batch took {time.perf_counter() - batch_start_time:.2f}s)'
+            )
+
+        return updated_count
+
     def _run_sql_updates(self, sample_sql, sample_params, counts_sql, counts_params, biobank_ids, session):
         session.execute(sample_sql, sample_params)
         session.execute(counts_sql, counts_params)
@@ -783,13 +872,7 @@ class ParticipantSummaryDao(UpdatableDao):
                 ParticipantSummary.biobankId.in_(biobank_ids)
             )
             participant_id_list = [summary.participantId for summary in query.all()]
-            for participant_id in participant_id_list:
-                summary = ParticipantSummaryDao.get_for_update_with_linked_data(
-                    session=session,
-                    participant_id=participant_id
-                )
-                self.update_enrollment_status(summary=summary, session=session)
-                session.commit()
+            self.update_enrollment_status_for_participants(participant_id_list, session=session)
 
     def _get_num_baseline_ppi_modules(self):
         return len(config.getSettingList(config.BASELINE_PPI_QUESTIONNAIRE_FIELDS))
@@ -804,8 +887,67 @@ class ParticipantSummaryDao(UpdatableDao):
         if getattr(summary, field_name) is not None:
             setattr(summary, field_name, None)
 
+    def update_enrollment_status_for_participants(self, participant_ids: Collection[int], session,
+                                                  allow_downgrade=False, pdr_pubsub=True,
+                                                  batch_size=500) -> List[int]:
+        """
+        Recalculates the enrollment status for a group of participants. The data needed for the calculation is
+        loaded in bulk for each batch of participants and only summaries that changed are written back.
+        Returns the ids of the participants that had their summary changed.
+        """
+        from rdr_service.dao.physical_measurements_dao import PhysicalMeasurementsDao
+
+        changed_participant_ids = []
+        for participant_id_batch in list_chunks(list(participant_ids), batch_size):
+            summaries = session.query(ParticipantSummary).options(
+                joinedload(ParticipantSummary.guardianParticipants).load_only(),
+                joinedload(ParticipantSummary.pediatricData)
+            ).filter(
+                ParticipantSummary.participantId.in_(participant_id_batch)
+            ).with_for_update().all()
+
+            batch_participant_ids = [summary.participantId for summary in summaries]
+            EnrollmentDependenciesDao.load_enrollment_dependencies(batch_participant_ids, session)
+            core_measurement_map = PhysicalMeasurementsDao.get_core_measurements_for_participants(
+                session=session,
+                participant_ids=batch_participant_ids
+            )
+            wgs_time_map = GenomicSetMemberDao.get_wgs_pass_dates(
+                session=session,
+                biobank_ids=[summary.biobankId for summary in summaries]
+            )
+
+            changed_summaries = []
+            for summary in summaries:
+                self.update_enrollment_status(
+                    summary=summary,
+                    session=session,
+                    allow_downgrade=allow_downgrade,
+                    pdr_pubsub=False,
+                    preloaded_data=EnrollmentPreloadData(
+                        core_measurements=core_measurement_map[summary.participantId],
+                        wgs_sequencing_time=wgs_time_map.get(summary.biobankId)
+                    )
+                )
+                if session.is_modified(summary):
+                    changed_summaries.append(summary)
+
+            if pdr_pubsub:
+                # Capture any enrollment status history records that have been added to the session.
+                models_ = list(session.new)
+                models_.extend(changed_summaries)
+                if models_:
+                    submit_pipeline_pubsub_msg_from_model(models_, self.get_connection_database_name())
+
+            session.commit()
+            EnrollmentDependenciesDao.clear_cached(batch_participant_ids)
+            changed_participant_ids.extend(summary.participantId for summary in changed_summaries)
+
+        return changed_participant_ids
+
     def update_enrollment_status(self, summary: ParticipantSummary, session,
-                                 allow_downgrade=False, pdr_pubsub=True):
+                                 allow_downgrade=False, pdr_pubsub=True,
+                                 preloaded_data: EnrollmentPreloadData = None):
         """
         Updates the enrollment status field on the provided participant summary to the correct value.
         If allow_downgrade flag is set (e.g., when called by backfill tool), V3.* statuses will be recalculated
@@ -813,10 +955,13 @@ class ParticipantSummaryDao(UpdatableDao):
         """
         from rdr_service.dao.physical_measurements_dao import PhysicalMeasurementsDao
 
-        core_measurements = PhysicalMeasurementsDao.get_core_measurements_for_participant(
-            session=session,
-            participant_id=summary.participantId
-        )
+        if preloaded_data:
+            core_measurements = preloaded_data.core_measurements
+        else:
+            core_measurements = PhysicalMeasurementsDao.get_core_measurements_for_participant(
+                session=session,
+                participant_id=summary.participantId
+            )
         EnrollmentDependenciesDao.set_physical_measurements_time(
             value=min_or_none([
                 summary.clinicPhysicalMeasurementsFinalizedTime,
@@ -842,10 +987,13 @@ class ParticipantSummaryDao(UpdatableDao):
         )
 
 
-        wgs_sequencing_time = GenomicSetMemberDao.get_wgs_pass_date(
-            session=session,
-            biobank_id=summary.biobankId
-        )
+        if preloaded_data:
+            wgs_sequencing_time = preloaded_data.wgs_sequencing_time
+        else:
+            wgs_sequencing_time = GenomicSetMemberDao.get_wgs_pass_date(
+                session=session,
+                biobank_id=summary.biobankId
+            )
         EnrollmentDependenciesDao.set_wgs_sequencing_time(wgs_sequencing_time, summary.participantId, session)
         EnrollmentDependenciesDao.set_first_ehr_file_received_time(
             value=min_or_none([summary.ehrReceiptTime, summary.firstParticipantMediatedEhrReceiptTime]),
@@ -1661,72 +1809,110 @@ class ParticipantSummaryDao(UpdatableDao):
             ).all()
             return {row.participantId for row in result}
 
-    def prepare_for_ehr_status_update(self):
+    def clear_ehr_data_available(self, participant_ids: Collection[int], mediated_participant_ids: Collection[int],
+                                 batch_size=1000):
+        """Unset the current EHR flags of participants that no longer have files in the EHR status view"""
         with self.session() as session:
-            query = (
-                sqlalchemy.update(ParticipantSummary).values({
-                    ParticipantSummary.isEhrDataAvailable: False,
-                    ParticipantSummary.isParticipantMediatedEhrDataAvailable: False
-                })
-            )
-            return session.execute(query)
+            for field, id_list in [
+                (ParticipantSummary.isEhrDataAvailable, participant_ids),
+                (ParticipantSummary.isParticipantMediatedEhrDataAvailable, mediated_participant_ids)
+            ]:
+                for id_batch in list_chunks(list(id_list), batch_size):
+                    session.execute(
+                        sqlalchemy.update(ParticipantSummary)
+                        .where(ParticipantSummary.participantId.in_(id_batch))
+                        .values({field: False})
+                    )
 
     @classmethod
-    def _bulk_update_ehr_fields(cls, session, record_list: List[ParticipantEhrFile], values_to_update) -> int:
+    def _bulk_update_changed_ehr_fields(cls, session, record_list: List[ParticipantEhrFile], fields,
+                                        apply_file) -> Set[int]:
+        """
+        Works out what the given fields should be for each participant once the files are recorded,
+        and only updates the participants that end up with different values.
+
+        :param fields: ParticipantSummary fields that the files are recorded in
+        :param apply_file: function giving the values of the fields after a file is recorded (given the values
+            the fields had before the file and the file itself)
+        :return: ids of the participants that were updated
+        """
         if not record_list:
-            return 0
+            return set()
 
-        query = (
-            sqlalchemy.update(ParticipantSummary)
-            .where(ParticipantSummary.participantId == sqlalchemy.bindparam('pid'))
-            .values(values_to_update)
-        )
-        query_result = session.execute(query, [
-            {
-                'pid': record.participant_id,
-                'receipt_time': record.receipt_time
-            }
-            for record in record_list
-        ])
-        return query_result.rowcount
+        current_values = {
+            participant_id: tuple(values)
+            for participant_id, *values in session.query(ParticipantSummary.participantId, *fields).filter(
+                ParticipantSummary.participantId.in_({record.participant_id for record in record_list})
+            ).all()
+        }
+        new_values = dict(current_values)
+        for record in record_list:
+            if record.participant_id in new_values:
+                new_values[record.participant_id] = apply_file(new_values[record.participant_id], record)
+
+        changed_values = {
+            participant_id: values
+            for participant_id, values in new_values.items()
+            if values != current_values[participant_id]
+        }
+        if changed_values:
+            query = (
+                sqlalchemy.update(ParticipantSummary)
+                .where(ParticipantSummary.participantId == sqlalchemy.bindparam('pid'))
+                .values({field: sqlalchemy.bindparam(f'value_{index}') for index, field in enumerate(fields)})
+            )
+            session.execute(query, [
+                {
+                    'pid': participant_id,
+                    **{f'value_{index}': value for index, value in enumerate(values)}
+                }
+                for participant_id, values in changed_values.items()
+            ])
+        return set(changed_values)
+
+    @classmethod
+    def _get_ehr_file_receipt_time(cls, record: ParticipantEhrFile):
+        if isinstance(record.receipt_time, datetime.datetime):
+            # Comparing with the values from the database, which are stored without microseconds
+            return datetime_as_naive_utc(record.receipt_time).replace(microsecond=0)
+        return record.receipt_time
 
     @classmethod
-    def bulk_update_hpo_ehr_status_with_session(cls, session, record_list: List[ParticipantEhrFile]):
-        return cls._bulk_update_ehr_fields(
+    def bulk_update_hpo_ehr_status_with_session(cls, session, record_list: List[ParticipantEhrFile]) -> Set[int]:
+        def apply_file(values, record):
+            _, _, _, receipt_time = values
+            file_time = cls._get_ehr_file_receipt_time(record)
+            return EhrStatus.PRESENT, True, file_time, receipt_time if receipt_time is not None else file_time
+
+        return cls._bulk_update_changed_ehr_fields(
             session=session,
             record_list=record_list,
-            values_to_update={
-                ParticipantSummary.ehrStatus.name: EhrStatus.PRESENT,
-                ParticipantSummary.isEhrDataAvailable: True,
-                ParticipantSummary.ehrUpdateTime: sqlalchemy.bindparam("receipt_time"),
-                ParticipantSummary.ehrReceiptTime: sqlalchemy.case(
-                    [
-                        (ParticipantSummary.ehrReceiptTime.is_(None), sqlalchemy.bindparam("receipt_time"))
-                    ],
-                    else_=ParticipantSummary.ehrReceiptTime,
-                )
-            }
+            fields=[
+                ParticipantSummary.ehrStatus,
+                ParticipantSummary.isEhrDataAvailable,
+                ParticipantSummary.ehrUpdateTime,
+                ParticipantSummary.ehrReceiptTime
+            ],
+            apply_file=apply_file
         )
 
     @classmethod
-    def bulk_update_mediated_ehr_status_with_session(cls, session, record_list: List[ParticipantEhrFile]):
-        return cls._bulk_update_ehr_fields(
+    def bulk_update_mediated_ehr_status_with_session(cls, session, record_list: List[ParticipantEhrFile]) -> Set[int]:
+        def apply_file(values, record):
+            _, _, _, first_receipt_time = values
+            file_time = cls._get_ehr_file_receipt_time(record)
+            return True, True, file_time, first_receipt_time if first_receipt_time is not None else file_time
+
+        return cls._bulk_update_changed_ehr_fields(
             session=session,
             record_list=record_list,
-            values_to_update={
-                ParticipantSummary.wasParticipantMediatedEhrAvailable: True,
-                ParticipantSummary.isParticipantMediatedEhrDataAvailable: True,
-                ParticipantSummary.latestParticipantMediatedEhrReceiptTime: sqlalchemy.bindparam("receipt_time"),
-                ParticipantSummary.firstParticipantMediatedEhrReceiptTime: sqlalchemy.case(
-                    [
-                        (
-                            ParticipantSummary.firstParticipantMediatedEhrReceiptTime.is_(None),
-                            sqlalchemy.bindparam("receipt_time")
-                        )
-                    ],
-                    else_=ParticipantSummary.firstParticipantMediatedEhrReceiptTime,
-                )
-            }
+            fields=[
+                ParticipantSummary.wasParticipantMediatedEhrAvailable,
+                ParticipantSummary.isParticipantMediatedEhrDataAvailable,
+                ParticipantSummary.latestParticipantMediatedEhrReceiptTime,
+                ParticipantSummary.firstParticipantMediatedEhrReceiptTime
+            ],
+            apply_file=apply_file
         )
 
     def bulk_update_retention_eligible_flags(self, upload_date):
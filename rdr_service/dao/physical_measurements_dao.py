@@ -1,25 +1,30 @@
+from collections import defaultdict
 import json
 import logging
-from typing import List
+import threading
+from typing import Collection, Dict, List
 
 from rdr_service.lib_fhir.fhirclient_1_0_6.models import observation as fhir_observation
 from rdr_service.lib_fhir.fhirclient_1_0_6.models.fhirabstractbase import FHIRValidationError
-from sqlalchemy import or_
+from sqlalchemy import or_, tuple_
 from sqlalchemy.orm import subqueryload
 from sqlalchemy.orm.attributes import flag_modified
 from werkzeug.exceptions import BadRequest
 
-from rdr_service import clock, config
+from rdr_service import clock, config, singletons
 from rdr_service.api_util import parse_date
 from rdr_service.concepts import Concept
 from rdr_service.dao.base_dao import UpdatableDao
+from rdr_service.dao.metadata_dao import MetadataDao, MEASUREMENT_CATALOG_BUILT_KEY
 from rdr_service.dao.participant_dao import ParticipantDao, raise_if_withdrawn
 from rdr_service.dao.participant_summary_dao import ParticipantSummaryDao
 from rdr_service.dao.site_dao import SiteDao
 from rdr_service.model.log_position import LogPosition
-from rdr_service.model.measurements import Measurement, PhysicalMeasurements
+from rdr_service.model.measurements import Measurement, MeasurementConcept, PhysicalMeasurements
 from rdr_service.participant_enums import PhysicalMeasurementsStatus, PhysicalMeasurementsCollectType, \
     OriginMeasurementUnit, SelfReportedPhysicalMeasurementsStatus
+from rdr_service.services.physical_measurements_parser import parse_observation, UnsupportedLayoutError
+from rdr_service.singletons import MEASUREMENT_CATALOG_CACHE_INDEX
 
 _AMENDMENT_URL = "http://terminology.pmi-ops.org/StructureDefinition/amends"
 _OBSERVATION_RESOURCE_TYPE = "Observation"
@@ -36,6 +41,32 @@ _PPSC_REMOTE_CODE = "REMOTE"
 _QUALIFIED_BY_RELATED_TYPE = "qualified-by"
 _ALL_EXTENSIONS = set([_AMENDMENT_URL, _CREATED_LOC_EXTENSION, _FINALIZED_LOC_EXTENSION])
 _BYTE_LIMIT = 65535  # 65535 chars, 64KB
+_MEASUREMENT_DATA_CONCEPT_KEYS = {"bodySites", "codes", "submeasurements", "qualifiers"}
+_MEASUREMENT_DATA_SET_KEYS = ["bodySites", "types", "units", "codes", "submeasurements", "qualifiers"]
+
+
+class _MeasurementCatalogCache:
+    """
+    The measurement data this process has seen in the catalog. The catalog only grows, so anything
+    covered by what's been seen doesn't need to be checked against the database again.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._known_data = {}
+
+    def get_unknown_concepts(self, measurement_map) -> set:
+        with self._lock:
+            return {
+                concept for concept, measurement_data in measurement_map.items()
+                if concept not in self._known_data or PhysicalMeasurementsDao.merge_measurement_data(
+                    self._known_data[concept], measurement_data
+                ) != self._known_data[concept]
+            }
+
+    def add(self, concept, measurement_data):
+        with self._lock:
+            self._known_data[concept] = measurement_data
 
 
 class PhysicalMeasurementsDao(UpdatableDao):
@@ -135,16 +166,135 @@ class PhysicalMeasurementsDao(UpdatableDao):
     def get_distinct_measurements(self):
         """Returns metadata about all the distinct physical measurements in use for participants."""
         with self.session() as session:
-            measurement_map = {}
-            for pms in session.query(PhysicalMeasurements).yield_per(100):
-                try:
-                    doc, composition = self.load_record_fhir_doc(pms)  # pylint: disable=unused-variable
-                    parsed_pms = PhysicalMeasurementsDao.from_client_json(doc, pms.participantId)
-                    for measurement in parsed_pms.measurements:
-                        PhysicalMeasurementsDao.handle_measurement(measurement_map, measurement)
-                except FHIRValidationError as e:
-                    logging.error(f"Could not parse measurements as FHIR: {pms.resource}; exception = {e}")
-            return measurement_map
+            catalog_built = MetadataDao().get_by_key_with_session(session, MEASUREMENT_CATALOG_BUILT_KEY)
+            if catalog_built is None or catalog_built.dateValue is None:
+                # Measurements are only added to the catalog as they're inserted,
+                # so it's missing older ones until rebuild_measurement_catalog has run
+                logging.warning('Measurement catalog has not been built, reading every physical measurements resource')
+                return self._get_measurement_map_from_resources(session)
+
+            return {
+                Concept(concept.codeSystem, concept.codeValue): self._measurement_data_from_json(concept.details)
+                for concept in session.query(MeasurementConcept).all()
+            }
+
+    def rebuild_measurement_catalog(self):
+        """
+        Adds every physical measurements resource to the catalog of distinct measurements, and records that the
+        catalog is complete so that get_distinct_measurements can use it.
+        :return: The number of distinct measurement codes found
+        """
+        with self.session() as session:
+            measurement_map = self._get_measurement_map_from_resources(session)
+
+        with self.session() as session:
+            # Merged in with anything already there, so measurements inserted while this ran aren't lost
+            self._merge_into_measurement_catalog_with_session(session, measurement_map)
+            MetadataDao().upsert_with_session(session, MEASUREMENT_CATALOG_BUILT_KEY, date_value=clock.CLOCK.now())
+        return len(measurement_map)
+
+    def _get_measurement_map_from_resources(self, session):
+        measurement_map = {}
+        for pms in session.query(PhysicalMeasurements).yield_per(100):
+            try:
+                doc, composition = self.load_record_fhir_doc(pms)  # pylint: disable=unused-variable
+                for measurement in self.parse_measurements(doc):
+                    PhysicalMeasurementsDao.handle_measurement(measurement_map, measurement)
+            except FHIRValidationError as e:
+                logging.error(f"Could not parse measurements as FHIR: {pms.resource}; exception = {e}")
+        return measurement_map
+
+    def _update_measurement_catalog_with_session(self, session, measurements):
+        """Adds anything new in the given measurements to the catalog of distinct measurements"""
+        measurement_map = {}
+        for measurement in measurements:
+            PhysicalMeasurementsDao.handle_measurement(measurement_map, measurement)
+        self._merge_into_measurement_catalog_with_session(session, measurement_map)
+
+    def _merge_into_measurement_catalog_with_session(self, session, measurement_map):
+        # Most measurements don't have anything that this process hasn't already seen in the catalog,
+        # so those don't need any queries at all
+        catalog_cache = singletons.get(MEASUREMENT_CATALOG_CACHE_INDEX, _MeasurementCatalogCache)
+        changed_concepts = catalog_cache.get_unknown_concepts(measurement_map)
+        if not changed_concepts:
+            return
+
+        # Of the rest, the rows are only locked if there's something to change
+        for catalog_concept in self._get_catalog_concepts(session, changed_concepts):
+            concept = Concept(catalog_concept.codeSystem, catalog_concept.codeValue)
+            catalog_data = self._measurement_data_from_json(catalog_concept.details)
+            catalog_cache.add(concept, catalog_data)
+            if self.merge_measurement_data(catalog_data, measurement_map[concept]) == catalog_data:
+                changed_concepts.remove(concept)
+        if not changed_concepts:
+            return
+
+        now = clock.CLOCK.now()
+        # Another request may be adding the same codes, so new rows are inserted ignoring any conflicts
+        # before all the rows are locked and updated
+        session.execute(
+            MeasurementConcept.__table__.insert().prefix_with('IGNORE'),
+            [
+                {'created': now, 'modified': now, 'code_system': concept.system, 'code_value': concept.code,
+                 'details': self._measurement_data_to_json(measurement_map[concept])}
+                for concept in changed_concepts
+            ]
+        )
+        for catalog_concept in self._get_catalog_concepts(session, changed_concepts, for_update=True):
+            concept = Concept(catalog_concept.codeSystem, catalog_concept.codeValue)
+            catalog_data = self.merge_measurement_data(
+                self._measurement_data_from_json(catalog_concept.details),
+                measurement_map[concept]
+            )
+            catalog_concept.details = self._measurement_data_to_json(catalog_data)
+            catalog_concept.modified = now
+
+    @staticmethod
+    def _get_catalog_concepts(session, concepts, for_update=False) -> List[MeasurementConcept]:
+        query = session.query(MeasurementConcept).filter(
+            tuple_(MeasurementConcept.codeSystem, MeasurementConcept.codeValue).in_(list(concepts))
+        ).order_by(MeasurementConcept.codeSystem, MeasurementConcept.codeValue)
+        if for_update:
+            query = query.with_for_update()
+        return query.all()
+
+    @staticmethod
+    def merge_measurement_data(measurement_data, new_data):
+        """Returns a copy of measurement_data that also has everything from new_data"""
+        result = {key: measurement_data[key] | new_data[key] for key in _MEASUREMENT_DATA_SET_KEYS}
+        min_values = [data["min"] for data in (measurement_data, new_data) if data.get("min") is not None]
+        if min_values:
+            result["min"] = min(min_values)
+        max_values = [data["max"] for data in (measurement_data, new_data) if data.get("max") is not None]
+        if max_values:
+            result["max"] = max(max_values)
+        return result
+
+    @staticmethod
+    def _measurement_data_to_json(measurement_data):
+        result = {}
+        for key in _MEASUREMENT_DATA_SET_KEYS:
+            if key in _MEASUREMENT_DATA_CONCEPT_KEYS:
+                result[key] = sorted([list(concept) for concept in measurement_data[key]], key=str)
+            else:
+                result[key] = sorted(measurement_data[key], key=str)
+        for key in ["min", "max"]:
+            if measurement_data.get(key) is not None:
+                result[key] = measurement_data[key]
+        return result
+
+    @staticmethod
+    def _measurement_data_from_json(details):
+        result = {}
+        for key in _MEASUREMENT_DATA_SET_KEYS:
+            if key in _MEASUREMENT_DATA_CONCEPT_KEYS:
+                result[key] = {Concept(*concept) for concept in details.get(key, [])}
+            else:
+                result[key] = set(details.get(key, []))
+        for key in ["min", "max"]:
+            if details.get(key) is not None:
+                result[key] = details[key]
+        return result
 
     @staticmethod
     def concept_json(concept):
@@ -255,7 +405,9 @@ class PhysicalMeasurementsDao(UpdatableDao):
         self.set_self_reported_pm_resource_json(obj)
         self.update_measurement_core_data_flags(obj)
         self._update_participant_summary(session, obj, is_amendment=False, is_self_reported=True)
-        return super(PhysicalMeasurementsDao, self).insert_with_session(session, obj)
+        inserted_obj = super(PhysicalMeasurementsDao, self).insert_with_session(session, obj)
+        self._update_measurement_catalog_with_session(session, inserted_obj.measurements)
+        return inserted_obj
 
     def insert_with_session(self, session, obj):
         is_amendment = False
@@ -297,6 +449,7 @@ class PhysicalMeasurementsDao(UpdatableDao):
         PhysicalMeasurementsDao.set_measurement_ids(obj)
 
         inserted_obj = super(PhysicalMeasurementsDao, self).insert_with_session(session, obj)
+        self._update_measurement_catalog_with_session(session, inserted_obj.measurements)
         if not is_amendment:  # Amendments aren't expected to have site ID extensions.
             if participant_summary.biospecimenCollectedSiteId is None:
                 ParticipantDao().add_missing_hpo_from_site(
@@ -675,11 +828,40 @@ class PhysicalMeasurementsDao(UpdatableDao):
 
         return doc
 
-    def from_client_json(self, resource_json, participant_id=None, **unused_kwargs):
-        # pylint: disable=unused-argument
+    @staticmethod
+    def parse_observation(resource):
+        """
+        Parse an Observation resource, using the fhirclient model for anything the
+        lightweight parser doesn't recognize.
+        """
+        try:
+            return parse_observation(resource)
+        except UnsupportedLayoutError:
+            return fhir_observation.Observation(resource)
+
+    @staticmethod
+    def parse_measurements(resource_json) -> List[Measurement]:
+        """Parse the Measurements from the Observations in a physical measurements document"""
+        observations = [
+            (entry["fullUrl"], PhysicalMeasurementsDao.parse_observation(entry["resource"]))
+            for entry in resource_json["entry"]
+            if entry.get("resource") and entry["resource"].get("resourceType") == _OBSERVATION_RESOURCE_TYPE
+        ]
+
+        # Take two passes over the observations; once to find all the qualifiers and observations
+        # without related qualifiers, and a second time to find all observations with related
+        # qualifiers.
         measurements = []
-        observations = []
         qualifier_map = {}
+        for first_pass in [True, False]:
+            for fullUrl, observation in observations:
+                measurement = PhysicalMeasurementsDao.from_observation(observation, fullUrl, qualifier_map, first_pass)
+                if measurement:
+                    measurements.append(measurement)
+        return measurements
+
+    def from_client_json(self, resource_json, participant_id=None, **unused_kwargs):
+        # pylint: disable=unused-argument
         created_site_id = None
         created_username = None
         finalized_site_id = None
@@ -689,7 +871,8 @@ class PhysicalMeasurementsDao(UpdatableDao):
             if resource:
                 resource_type = resource.get("resourceType")
                 if resource_type == _OBSERVATION_RESOURCE_TYPE:
-                    observations.append((entry["fullUrl"], fhir_observation.Observation(resource)))
+                    # Observations are parsed into measurements below
+                    continue
                 elif resource_type == _COMPOSITION_RESOURCE_TYPE:
                     extensions = resource.get("extension", [])
                     if not extensions:
@@ -733,14 +916,7 @@ class PhysicalMeasurementsDao(UpdatableDao):
                         or {_COMPOSITION_RESOURCE_TYPE}), skipping: {resource_type}"
                     )
 
-        # Take two passes over the observations; once to find all the qualifiers and observations
-        # without related qualifiers, and a second time to find all observations with related
-        # qualifiers.
-        for first_pass in [True, False]:
-            for fullUrl, observation in observations:
-                measurement = PhysicalMeasurementsDao.from_observation(observation, fullUrl, qualifier_map, first_pass)
-                if measurement:
-                    measurements.append(measurement)
+        measurements = self.parse_measurements(resource_json)
         if created_username == _PPSC_REMOTE_CODE:
             collect_type = PhysicalMeasurementsCollectType.SELF_REPORTED
         else:
@@ -1035,6 +1211,26 @@ class PhysicalMeasurementsDao(UpdatableDao):
         measurement_collection.satisfiesHeightRequirements = has_height
         measurement_collection.satisfiesWeightRequirements = has_weight
 
+    @classmethod
+    def get_core_measurements_for_participants(
+        cls, session, participant_ids: Collection[int]
+    ) -> Dict[int, List[PhysicalMeasurements]]:
+        """Loads the core measurements for a group of participants, keyed by participant id"""
+        measurement_map = defaultdict(list)
+        if not participant_ids:
+            return measurement_map
+
+        measurements = session.query(PhysicalMeasurements).filter(
+            PhysicalMeasurements.participantId.in_(participant_ids),
+            or_(
+                PhysicalMeasurements.satisfiesHeightRequirements,
+                PhysicalMeasurements.satisfiesWeightRequirements
+            )
+        ).all()
+        for measurement in measurements:
+            measurement_map[measurement.participantId].append(measurement)
+        return measurement_map
+
     @classmethod
     def get_core_measurements_for_participant(cls, session, participant_id) -> List[PhysicalMeasurements]:
         return session.query(PhysicalMeasurements).filter(
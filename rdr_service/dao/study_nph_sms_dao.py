@@ -12,7 +12,10 @@ from rdr_service.model.study_nph_sms import SmsSample, SmsBlocklist, SmsN0, SmsJ
 class SmsManifestMixin:
     def insert_bulk(self, batch: List[Dict]) -> None:
         with self.session() as session:
-            session.bulk_insert_mappings(self.model_type, batch)
+            self.insert_bulk_with_session(session, batch)
+
+    def insert_bulk_with_session(self, session, batch: List[Dict]) -> None:
+        session.bulk_insert_mappings(self.model_type, batch)
 
     def get_from_filepath(self, filepath) -> List:
         if not hasattr(self.model_type, 'file_path'):
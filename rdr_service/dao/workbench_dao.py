@@ -1,3 +1,4 @@
+import base64
 import json
 
 from werkzeug.exceptions import BadRequest
@@ -9,6 +10,7 @@ from rdr_service.dao.base_dao import UpdatableDao
 from rdr_service import clock
 from datetime import datetime
 from rdr_service.dao.metadata_dao import MetadataDao, WORKBENCH_LAST_SYNC_KEY
+from rdr_service.dao.workbench_search_dao import WorkbenchWorkspaceSearchIndexDao
 from rdr_service.model.workbench_workspace import (
     WorkbenchWorkspaceApproved,
     WorkbenchWorkspaceSnapshot,
@@ -32,13 +34,14 @@ from rdr_service.participant_enums import WorkbenchWorkspaceStatus, WorkbenchWor
     WorkbenchAuditWorkspaceDisplayDecision, WorkbenchAuditReviewType, WorkbenchWorkspaceAccessTier, \
     WorkbenchResearcherAccessTierShortName, WorkbenchResearcherEthnicCategory, WorkbenchResearcherSexualOrientationV2, \
     WorkbenchResearcherGenderIdentity, WorkbenchResearcherYesNoPreferNot, WorkbenchResearcherSexAtBirthV2,\
-    WorkbenchResearcherEducationV2
+    WorkbenchResearcherEducationV2, WorkbenchWorkspaceSearchField
 
 class WorkbenchWorkspaceDao(UpdatableDao):
     def __init__(self):
         super().__init__(WorkbenchWorkspaceApproved, order_by_ending=["id"])
         self.is_backfill = False
         self.workspace_snapshot_dao = WorkbenchWorkspaceHistoryDao()
+        self.search_backend = WorkbenchWorkspaceSearchIndexDao()
 
     def get_id(self, obj):
         return obj.id
@@ -289,6 +292,10 @@ class WorkbenchWorkspaceDao(UpdatableDao):
                 if workspace.excludeFromPublicDirectory is not True:
                     self.add_approved_workspace_with_session(session, workspace)
 
+        self.search_backend.reindex_workspaces_with_session(
+            session,
+            [workspace.workspaceSourceId for workspace in workspaces]
+        )
         return new_workspaces
 
     def to_client_json(self, obj):
@@ -479,10 +486,18 @@ class WorkbenchWorkspaceDao(UpdatableDao):
         project_purpose = kwargs.get('project_purpose')
         page = kwargs.get('page')
         page_size = kwargs.get('page_size')
+        cursor = kwargs.get('cursor')
         if page and page_size:
             offset = (page - 1) * page_size
         if offset < 0:
             raise BadRequest("invalid parameter: page")
+        is_user_search = owner_name or given_name or family_name or (user_source_id and user_role)
+
+        cursor_values = None
+        if cursor:
+            # A cursor continues from the last workspace of the previous page, replacing the page offset
+            cursor_values = self._decode_directory_cursor(cursor)
+            offset = 0
 
         workspace_dict = {}
         with self.session() as session:
@@ -526,7 +541,8 @@ class WorkbenchWorkspaceDao(UpdatableDao):
                     WorkbenchWorkspaceApproved.workspaceSourceId == snapshot_subquery.c.workspace_source_id,
                     WorkbenchWorkspaceApproved.creationTime > start_date
                 ).order_by(
-                    desc(WorkbenchWorkspaceApproved.modifiedTime)
+                    desc(WorkbenchWorkspaceApproved.modifiedTime),
+                    desc(WorkbenchWorkspaceApproved.workspaceSourceId)
                 )
             )
 
@@ -571,6 +587,26 @@ class WorkbenchWorkspaceDao(UpdatableDao):
                     query = query.filter(getattr(WorkbenchWorkspaceApproved, purpose) == 1)
                     match_count_query = match_count_query.filter(getattr(WorkbenchWorkspaceApproved, purpose) == 1)
 
+            # Narrow the workspaces down with the search index before the LIKE and name filters are applied
+            search_filters = self._get_search_filters(
+                workspace_like=workspace_like,
+                workspace_name_like=workspace_name_like,
+                intend_to_study_like=intend_to_study_like,
+                name_terms=(
+                    [] if user_source_id and user_role
+                    else [owner_name] if owner_name
+                    else [term for term in (given_name, family_name) if term]
+                )
+            )
+            for search_filter in search_filters:
+                query = query.filter(search_filter)
+                match_count_query = match_count_query.filter(search_filter)
+
+            # Searches on researchers are matched below, so the number of matches is only known after
+            # reading every workspace and the cursor is applied to the results instead
+            if cursor_values and not is_user_search:
+                query = query.filter(self._get_directory_cursor_filter(*cursor_values))
+
             match_number = match_count_query.count()
             items = query.all()
 
@@ -696,11 +732,11 @@ class WorkbenchWorkspaceDao(UpdatableDao):
 
                 # once get enough items for the request page, break the loop
                 if not owner_name and not given_name and not family_name and not (user_source_id or user_role) \
-                    and len(verified_workspace_ids) > page * page_size:
+                    and len(verified_workspace_ids) > (page_size if cursor_values else page * page_size):
                     break
 
         results = workspace_dict.values()
-        if owner_name or given_name or family_name or (user_source_id and user_role):
+        if is_user_search:
             expected_result = [ws for ws in results if ws.get('hitSearch') is True
                                and ws.get('hasVerifiedInstitution') is True]
             match_number = len(expected_result)
@@ -710,11 +746,19 @@ class WorkbenchWorkspaceDao(UpdatableDao):
         for er in expected_result:
             er.pop('hitSearch', None)
 
-        if offset >= match_number:
+        if cursor_values:
+            if is_user_search:
+                expected_result = [ws for ws in expected_result if self._is_after_directory_cursor(ws, *cursor_values)]
+            expected_result = expected_result[:page_size]
+        elif offset >= match_number:
             expected_result = []
         else:
             page_end = offset + page_size if offset + page_size < match_number else match_number
             expected_result = expected_result[offset:page_end]
+
+        next_cursor = None
+        if expected_result and len(expected_result) == page_size:
+            next_cursor = self._encode_directory_cursor(expected_result[-1])
         metadata_dao = MetadataDao()
         metadata = metadata_dao.get_by_key(WORKBENCH_LAST_SYNC_KEY)
         if metadata:
@@ -728,9 +772,90 @@ class WorkbenchWorkspaceDao(UpdatableDao):
             "page": page,
             "pageSize": page_size,
             "last_sync_date": last_sync_date,
+            "nextCursor": next_cursor,
             "data": expected_result
         }
 
+    def _get_search_filters(self, workspace_like, workspace_name_like, intend_to_study_like, name_terms):
+        search_filters = []
+        if workspace_like:
+            search_filters.append(self.search_backend.get_candidate_filter(
+                self._get_like_term(workspace_like),
+                [WorkbenchWorkspaceSearchField.NAME, WorkbenchWorkspaceSearchField.INTEND_TO_STUDY]
+            ))
+        else:
+            if workspace_name_like:
+                search_filters.append(self.search_backend.get_candidate_filter(
+                    self._get_like_term(workspace_name_like), [WorkbenchWorkspaceSearchField.NAME]
+                ))
+            if intend_to_study_like:
+                search_filters.append(self.search_backend.get_candidate_filter(
+                    self._get_like_term(intend_to_study_like), [WorkbenchWorkspaceSearchField.INTEND_TO_STUDY]
+                ))
+
+        if name_terms:
+            # A workspace matches if any of the names match, so all of them need to narrow the search
+            name_filters = [
+                self.search_backend.get_candidate_filter(term, [WorkbenchWorkspaceSearchField.OWNER_NAME])
+                for term in name_terms
+            ]
+            if all(name_filter is not None for name_filter in name_filters):
+                search_filters.append(or_(*name_filters))
+
+        return [search_filter for search_filter in search_filters if search_filter is not None]
+
+    @staticmethod
+    def _get_like_term(like_pattern):
+        if like_pattern.startswith('%') and like_pattern.endswith('%'):
+            return like_pattern[1:-1]
+        return None
+
+    @staticmethod
+    def _encode_directory_cursor(record):
+        modified_time = record['modifiedTime']
+        cursor_json = json.dumps({
+            'modifiedTime': modified_time.isoformat() if modified_time else None,
+            'workspaceId': record['workspaceId']
+        })
+        return base64.urlsafe_b64encode(cursor_json.encode('utf-8')).decode('utf-8')
+
+    @staticmethod
+    def _decode_directory_cursor(cursor):
+        try:
+            cursor_json = json.loads(base64.urlsafe_b64decode(cursor.encode('utf-8')))
+            modified_time = cursor_json['modifiedTime']
+            return (
+                datetime.fromisoformat(modified_time) if modified_time else None,
+                int(cursor_json['workspaceId'])
+            )
+        except (ValueError, TypeError, KeyError):
+            raise BadRequest("invalid parameter: cursor")
+
+    @staticmethod
+    def _get_directory_cursor_filter(modified_time, workspace_source_id):
+        # Workspaces are listed by most recently modified, with the ones missing a modified time last
+        if modified_time is None:
+            return and_(
+                WorkbenchWorkspaceApproved.modifiedTime.is_(None),
+                WorkbenchWorkspaceApproved.workspaceSourceId < workspace_source_id
+            )
+        return or_(
+            WorkbenchWorkspaceApproved.modifiedTime < modified_time,
+            WorkbenchWorkspaceApproved.modifiedTime.is_(None),
+            and_(
+                WorkbenchWorkspaceApproved.modifiedTime == modified_time,
+                WorkbenchWorkspaceApproved.workspaceSourceId < workspace_source_id
+            )
+        )
+
+    @staticmethod
+    def _is_after_directory_cursor(record, modified_time, workspace_source_id):
+        if record['modifiedTime'] == modified_time:
+            return record['workspaceId'] < workspace_source_id
+        if modified_time is None:
+            return False
+        return record['modifiedTime'] is None or record['modifiedTime'] < modified_time
+
     def backfill_workspace_with_session(self, session, backfilled_workspace):
         exist_approved = self.get_workspace_by_workspace_id_with_session(session,
                                                                          backfilled_workspace.workspaceSourceId)
@@ -1119,8 +1244,29 @@ class WorkbenchResearcherDao(UpdatableDao):
             new_researchers.append(new_researchers_map[source_id])
 
         self._insert_history(session, new_researchers)
+        self._reindex_owned_workspaces(session, new_researchers)
         return new_researchers
 
+    @staticmethod
+    def _reindex_owned_workspaces(session, researchers):
+        """Owner names are searchable in the research directory, so their workspaces need to be reindexed"""
+        researcher_ids = [researcher.id for researcher in researchers]
+        if not researcher_ids:
+            return
+        owned_workspace_ids = session.query(
+            distinct(WorkbenchWorkspaceApproved.workspaceSourceId)
+        ).join(
+            WorkbenchWorkspaceUser,
+            WorkbenchWorkspaceUser.workspaceId == WorkbenchWorkspaceApproved.id
+        ).filter(
+            WorkbenchWorkspaceUser.researcherId.in_(researcher_ids),
+            WorkbenchWorkspaceUser.role == WorkbenchWorkspaceUserRole.OWNER
+        ).all()
+        WorkbenchWorkspaceSearchIndexDao().reindex_workspaces_with_session(
+            session,
+            [workspace_id for workspace_id, in owned_workspace_ids]
+        )
+
     def to_client_json(self, obj):
         if isinstance(obj, WorkbenchResearcher):
             return json.loads(obj.resource)
@@ -1350,9 +1496,15 @@ class WorkbenchWorkspaceAuditDao(UpdatableDao):
         workspace_snapshot.excludeFromPublicDirectory = True
         workspace_snapshot.isReviewed = True
         self.workspace_dao.remove_workspace_by_workspace_id_with_session(session, workspace_snapshot.workspaceSourceId)
+        self.workspace_dao.search_backend.reindex_workspaces_with_session(
+            session, [workspace_snapshot.workspaceSourceId]
+        )
 
     def add_approved_workspace_with_session(self, session, workspace_snapshot_id):
         workspace_snapshot = self.workspace_snapshot_dao.get_snapshot_by_id_with_session(session, workspace_snapshot_id)
         workspace_snapshot.excludeFromPublicDirectory = False
         workspace_snapshot.isReviewed = True
         self.workspace_dao.add_approved_workspace_with_session(session, workspace_snapshot, is_reviewed=True)
+        self.workspace_dao.search_backend.reindex_workspaces_with_session(
+            session, [workspace_snapshot.workspaceSourceId]
+        )
@@ -0,0 +1,181 @@
+from abc import ABC, abstractmethod
+from typing import Collection, Dict, List, Optional, Set
+
+from sqlalchemy import and_, select
+
+from rdr_service import clock
+from rdr_service.dao.base_dao import BaseDao
+from rdr_service.dao.metadata_dao import MetadataDao, WORKBENCH_SEARCH_INDEX_BUILT_KEY
+from rdr_service.model.workbench_researcher import WorkbenchResearcher
+from rdr_service.model.workbench_workspace import WorkbenchWorkspaceApproved, WorkbenchWorkspaceSearchIndex, \
+    WorkbenchWorkspaceUser
+from rdr_service.participant_enums import WorkbenchWorkspaceSearchField, WorkbenchWorkspaceUserRole
+from rdr_service.services.system_utils import list_chunks
+
+GRAM_LENGTH = 3
+# Long search terms only need a sample of their trigrams to narrow the candidates down,
+# the directory's own LIKE filters remove anything that matched by chance
+MAX_SEARCH_GRAMS = 8
+REINDEX_BATCH_SIZE = 500
+
+
+def get_search_grams(text: Optional[str]) -> Set[str]:
+    """Lowercase trigrams of the text that the index stores and searches by"""
+    if not text:
+        return set()
+    text = text.lower()
+    return {text[index:index + GRAM_LENGTH] for index in range(len(text) - GRAM_LENGTH + 1)}
+
+
+class WorkspaceSearchBackend(ABC):
+    """
+    Narrows the research projects directory down to the workspaces that could match a keyword search.
+    A backend may return workspaces that don't contain the search term (the directory still applies its
+    own filters), but it must never leave out a workspace that does.
+    """
+
+    @abstractmethod
+    def reindex_workspaces_with_session(self, session, workspace_source_ids: Collection[int]):
+        """Refresh the searchable text of the given workspaces after they're changed"""
+        ...
+
+    @abstractmethod
+    def get_candidate_filter(self, search_term: str, fields: Collection[WorkbenchWorkspaceSearchField]):
+        """
+        Filter that limits WorkbenchWorkspaceApproved to workspaces that could contain the search term
+        in one of the given fields, or None if the backend can't narrow the search for the term.
+        """
+        ...
+
+
+class WorkbenchWorkspaceSearchIndexDao(BaseDao, WorkspaceSearchBackend):
+    """
+    Search backend using a trigram index stored in MySQL. Trigrams (rather than words) are indexed so that
+    the index supports the same substring matching that the directory's LIKE filters provide.
+    Workspaces are only indexed as they change, so the index isn't used for searching until rebuild_index
+    has indexed all of the existing workspaces (the directory uses its LIKE filters alone until then).
+    """
+
+    def __init__(self):
+        super().__init__(WorkbenchWorkspaceSearchIndex)
+        self._is_index_built = None
+
+    def get_id(self, obj):
+        return obj.id
+
+    def reindex_workspaces_with_session(self, session, workspace_source_ids: Collection[int]):
+        session.flush()
+        for id_batch in list_chunks(sorted(set(workspace_source_ids)), REINDEX_BATCH_SIZE):
+            session.query(WorkbenchWorkspaceSearchIndex).filter(
+                WorkbenchWorkspaceSearchIndex.workspaceSourceId.in_(id_batch)
+            ).delete(synchronize_session=False)
+
+            index_rows = []
+            for workspace_source_id, field_text_map in self._get_searchable_text(session, id_batch).items():
+                for field, texts in field_text_map.items():
+                    grams = set()
+                    for text in texts:
+                        grams.update(get_search_grams(text))
+                    index_rows.extend([
+                        {
+                            'workspace_source_id': workspace_source_id,
+                            'field': int(field),
+                            'gram': gram
+                        }
+                        for gram in sorted(grams)
+                    ])
+            if index_rows:
+                session.execute(WorkbenchWorkspaceSearchIndex.__table__.insert(), index_rows)
+
+    def rebuild_index(self):
+        """Index every approved workspace, replacing anything already in the index"""
+        metadata_dao = MetadataDao()
+        with self.session() as session:
+            # Stop searches from using the index while it's incomplete
+            metadata_dao.upsert_with_session(session, WORKBENCH_SEARCH_INDEX_BUILT_KEY, date_value=None)
+            session.query(WorkbenchWorkspaceSearchIndex).delete(synchronize_session=False)
+            workspace_source_ids = [
+                workspace_source_id for workspace_source_id, in
+                session.query(WorkbenchWorkspaceApproved.workspaceSourceId).all()
+            ]
+        for id_batch in list_chunks(workspace_source_ids, REINDEX_BATCH_SIZE):
+            with self.session() as session:
+                self.reindex_workspaces_with_session(session, id_batch)
+        with self.session() as session:
+            metadata_dao.upsert_with_session(session, WORKBENCH_SEARCH_INDEX_BUILT_KEY, date_value=clock.CLOCK.now())
+        self._is_index_built = None
+        return len(workspace_source_ids)
+
+    def is_index_built(self) -> bool:
+        if self._is_index_built is None:
+            with self.session() as session:
+                built_record = MetadataDao().get_by_key_with_session(session, WORKBENCH_SEARCH_INDEX_BUILT_KEY)
+                self._is_index_built = built_record is not None and built_record.dateValue is not None
+        return self._is_index_built
+
+    def get_candidate_filter(self, search_term: str, fields: Collection[WorkbenchWorkspaceSearchField]):
+        if not search_term or '%' in search_term or '_' in search_term:
+            # LIKE wildcards in the term itself can't be matched by trigrams
+            return None
+        if not self.is_index_built():
+            return None
+        grams = sorted(get_search_grams(search_term))[:MAX_SEARCH_GRAMS]
+        if not grams:
+            return None
+
+        # Each trigram is checked separately (rather than counting the matches of a workspace) since the
+        # index's collation can treat different trigrams as equal, the same way the LIKE filters do
+        field_values = [int(field) for field in fields]
+        return and_(*[
+            WorkbenchWorkspaceApproved.workspaceSourceId.in_(
+                select([WorkbenchWorkspaceSearchIndex.workspaceSourceId]).where(
+                    and_(
+                        WorkbenchWorkspaceSearchIndex.gram == gram,
+                        WorkbenchWorkspaceSearchIndex.field.in_(field_values)
+                    )
+                )
+            )
+            for gram in grams
+        ])
+
+    @staticmethod
+    def _get_searchable_text(session, workspace_source_ids: List[int]) \
+            -> Dict[int, Dict[WorkbenchWorkspaceSearchField, List[str]]]:
+        text_map = {}
+        workspaces = session.query(
+            WorkbenchWorkspaceApproved.workspaceSourceId,
+            WorkbenchWorkspaceApproved.name,
+            WorkbenchWorkspaceApproved.intendToStudy
+        ).filter(
+            WorkbenchWorkspaceApproved.workspaceSourceId.in_(workspace_source_ids)
+        ).all()
+        for workspace_source_id, name, intend_to_study in workspaces:
+            text_map[workspace_source_id] = {
+                WorkbenchWorkspaceSearchField.NAME: [name],
+                WorkbenchWorkspaceSearchField.INTEND_TO_STUDY: [intend_to_study],
+                WorkbenchWorkspaceSearchField.OWNER_NAME: []
+            }
+
+        owners = session.query(
+            WorkbenchWorkspaceApproved.workspaceSourceId,
+            WorkbenchResearcher.givenName,
+            WorkbenchResearcher.familyName
+        ).join(
+            WorkbenchWorkspaceUser,
+            WorkbenchWorkspaceUser.workspaceId == WorkbenchWorkspaceApproved.id
+        ).join(
+            WorkbenchResearcher,
+            and_(
+                WorkbenchResearcher.id == WorkbenchWorkspaceUser.researcherId,
+                WorkbenchWorkspaceUser.role == WorkbenchWorkspaceUserRole.OWNER
+            )
+        ).filter(
+            WorkbenchWorkspaceApproved.workspaceSourceId.in_(workspace_source_ids)
+        ).all()
+        for workspace_source_id, given_name, family_name in owners:
+            # The directory matches owner names against "<given name> <family name>"
+            text_map[workspace_source_id][WorkbenchWorkspaceSearchField.OWNER_NAME].append(
+                f'{given_name} {family_name}'
+            )
+
+        return text_map
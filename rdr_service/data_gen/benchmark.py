@@ -0,0 +1,328 @@
+"""
+In-process benchmarking of the API, for measuring performance changes on a developer machine.
+
+A seeded synthetic cohort is generated into the local database, and then a weighted mix of API calls is
+replayed against it (optionally from several threads) through the InProcessClient. The latency, number of
+SQL statements and rows used by each kind of call are recorded, and can be saved as a baseline that later
+runs are compared against.
+"""
+
+from collections import defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import datetime
+import json
+import logging
+import random
+import threading
+import time
+from typing import Dict, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from rdr_service.clock import FakeClock
+from rdr_service.dao.hpo_dao import HPODao
+from rdr_service.dao.participant_dao import ParticipantDao
+from rdr_service.data_gen.fake_participant_generator import FakeParticipantGenerator
+from rdr_service.data_gen.in_process_client import InProcessClient
+from rdr_service.model.participant import Participant
+from rdr_service.model.utils import from_client_participant_id, to_client_participant_id
+from rdr_service.resource.generators.participant import rebuild_participant_summary_resource
+
+# Cohort data is generated relative to a fixed time so that the same seed always gives the same cohort
+COHORT_REFERENCE_TIME = datetime.datetime(2022, 1, 1)
+
+DEFAULT_WORKLOAD_WEIGHTS = {
+    'participant': 2,
+    'questionnaire_response': 4,
+    'biobank_order': 2,
+    'summary_search': 10,
+    'pdr_rebuild': 2
+}
+PERCENTILES = (50, 90, 95, 99)
+
+# Metrics compared against a baseline, and whether they are a latency (otherwise they are a count)
+_COMPARED_METRICS = [
+    ('p50_ms', True),
+    ('p95_ms', True),
+    ('sql_statements_per_call', False),
+    ('rows_per_call', False),
+    ('rows_examined_per_call', False)
+]
+
+BenchmarkRegression = namedtuple('BenchmarkRegression', ['operation', 'metric', 'baseline', 'current'])
+
+
+def percentile(sorted_values: List[float], pct: float) -> Optional[float]:
+    """Percentile of the (already sorted) values, interpolating between the closest ranks"""
+    if not sorted_values:
+        return None
+    rank = (len(sorted_values) - 1) * pct / 100
+    lower_index = int(rank)
+    upper_index = min(lower_index + 1, len(sorted_values) - 1)
+    fraction = rank - lower_index
+    return sorted_values[lower_index] + (sorted_values[upper_index] - sorted_values[lower_index]) * fraction
+
+
+class _CallMetrics:
+    def __init__(self):
+        self.sql_statements = 0
+        self.rows = 0
+        self.rows_examined = 0
+
+
+class SqlStatementTracker:
+    """
+    Counts the SQL statements (and the rows they returned or changed) run by each call being benchmarked.
+    Optionally the rows examined by MySQL are found from the session's Handler_read counters, but that
+    runs extra queries around each statement so it shouldn't be used when looking at latencies.
+    """
+
+    def __init__(self, measure_rows_examined=False):
+        self._measure_rows_examined = measure_rows_examined
+        self._local = threading.local()
+
+    def __enter__(self):
+        event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+        return self
+
+    def __exit__(self, *_):
+        event.remove(Engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.remove(Engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    def start_call(self) -> _CallMetrics:
+        self._local.metrics = _CallMetrics()
+        return self._local.metrics
+
+    def end_call(self):
+        self._local.metrics = None
+
+    @staticmethod
+    def _get_rows_examined(connection) -> Optional[int]:
+        if connection.dialect.name != 'mysql':
+            return None
+        try:
+            # Uses the DBAPI connection directly so that the query isn't counted
+            cursor = connection.connection.cursor()
+            cursor.execute("SHOW SESSION STATUS LIKE 'Handler_read%'")
+            total = sum(int(value) for _, value in cursor.fetchall())
+            cursor.close()
+            return total
+        # pylint: disable=broad-except
+        except Exception:
+            # Statements that are streaming their results can't be interrupted, they just aren't measured
+            return None
+
+    def _before_cursor_execute(self, connection, *_):
+        metrics = getattr(self._local, 'metrics', None)
+        if metrics is not None and self._measure_rows_examined:
+            self._local.rows_read_before = self._get_rows_examined(connection)
+
+    def _after_cursor_execute(self, connection, cursor, *_):
+        metrics = getattr(self._local, 'metrics', None)
+        if metrics is None:
+            return
+
+        metrics.sql_statements += 1
+        if cursor.rowcount and cursor.rowcount > 0:
+            metrics.rows += cursor.rowcount
+        if self._measure_rows_examined and self._local.rows_read_before is not None:
+            rows_read_after = self._get_rows_examined(connection)
+            if rows_read_after is not None:
+                metrics.rows_examined += rows_read_after - self._local.rows_read_before
+
+
+class BenchmarkResults:
+    """Collects the measurements of each call made, grouped by operation"""
+
+    def __init__(self, measure_rows_examined=False):
+        self.measure_rows_examined = measure_rows_examined
+        self.elapsed_seconds = None
+        self._lock = threading.Lock()
+        self._latencies = defaultdict(list)
+        self._errors = defaultdict(int)
+        self._totals = defaultdict(_CallMetrics)
+
+    def record(self, operation: str, seconds: float, metrics: _CallMetrics, error=False):
+        with self._lock:
+            self._latencies[operation].append(seconds * 1000)
+            if error:
+                self._errors[operation] += 1
+            totals = self._totals[operation]
+            totals.sql_statements += metrics.sql_statements
+            totals.rows += metrics.rows
+            totals.rows_examined += metrics.rows_examined
+
+    def summary(self) -> Dict[str, dict]:
+        result = {}
+        for operation in sorted(self._latencies):
+            latencies = sorted(self._latencies[operation])
+            totals = self._totals[operation]
+            count = len(latencies)
+            operation_summary = {
+                'count': count,
+                'errors': self._errors[operation],
+                'mean_ms': sum(latencies) / count
+            }
+            for pct in PERCENTILES:
+                operation_summary[f'p{pct}_ms'] = percentile(latencies, pct)
+            operation_summary['sql_statements_per_call'] = totals.sql_statements / count
+            operation_summary['rows_per_call'] = totals.rows / count
+            if self.measure_rows_examined:
+                operation_summary['rows_examined_per_call'] = totals.rows_examined / count
+            result[operation] = operation_summary
+        return result
+
+
+def compare_to_baseline(summary: Dict[str, dict], baseline: Dict[str, dict], latency_tolerance=0.25,
+                        count_tolerance=0.1) -> List[BenchmarkRegression]:
+    """
+    Finds the metrics that are worse than the baseline by more than the tolerated fraction.
+    Operations or metrics missing from either set of results are skipped.
+    """
+    regressions = []
+    for operation, operation_summary in summary.items():
+        baseline_summary = baseline.get(operation)
+        if not baseline_summary:
+            continue
+        for metric, is_latency in _COMPARED_METRICS:
+            current_value = operation_summary.get(metric)
+            baseline_value = baseline_summary.get(metric)
+            if current_value is None or baseline_value is None:
+                continue
+            tolerance = latency_tolerance if is_latency else count_tolerance
+            if current_value > baseline_value * (1 + tolerance):
+                regressions.append(BenchmarkRegression(operation, metric, baseline_value, current_value))
+    return regressions
+
+
+def save_results(path: str, summary: Dict[str, dict], settings: dict):
+    with open(path, 'w') as file:
+        json.dump({'settings': settings, 'operations': summary}, file, indent=2, sort_keys=True)
+
+
+def load_results(path: str) -> dict:
+    with open(path) as file:
+        return json.load(file)
+
+
+def generate_cohort(size: int, seed: int, include_physical_measurements=True, include_biobank_orders=True,
+                    client=None) -> List[str]:
+    """
+    Creates a synthetic cohort in the database, using the API so that all the usual data is created for them.
+    :return: the client ids of the participants created
+    """
+    random.seed(seed)
+    with FakeClock(COHORT_REFERENCE_TIME):
+        generator = FakeParticipantGenerator(client or InProcessClient(), use_local_files=True)
+
+    participant_ids = []
+    for index in range(size):
+        participant_ids.append(generator.generate_participant(include_physical_measurements, include_biobank_orders))
+        if (index + 1) % 100 == 0:
+            logging.info(f'Generated {index + 1} of {size} participants')
+    return participant_ids
+
+
+def get_cohort_participant_ids(limit: int) -> List[str]:
+    """Finds participants that have already been created, for benchmarking against an existing database"""
+    with ParticipantDao().session() as session:
+        participant_ids = session.query(Participant.participantId).order_by(Participant.participantId).limit(limit)
+        return [to_client_participant_id(participant_id) for participant_id, in participant_ids]
+
+
+class _BenchmarkClient(InProcessClient):
+    """
+    Sends requests at the current time. The clock is shared by all threads, so pretending requests
+    happen at other times would change the time seen by requests running at the same time.
+    """
+
+    def request_json(self, local_path, method="GET", body=None, headers=None, pretend_date=None):
+        return super(_BenchmarkClient, self).request_json(local_path, method=method, body=body, headers=headers)
+
+
+class BenchmarkWorkload:
+    """Replays a seeded, weighted mix of API operations against the participants of a cohort"""
+
+    def __init__(self, participant_ids: List[str], weights: Dict[str, int] = None, seed=1,
+                 measure_rows_examined=False):
+        if not participant_ids:
+            raise ValueError('A cohort of participants is needed to run a workload')
+
+        self.participant_ids = sorted(participant_ids)
+        self.weights = weights or DEFAULT_WORKLOAD_WEIGHTS
+        self.seed = seed
+        self.measure_rows_examined = measure_rows_examined
+        self._client = _BenchmarkClient()
+        self._generator = FakeParticipantGenerator(
+            self._client, use_local_files=True, withdrawn_percent=0, suspended_percent=0
+        )
+        self._hpo_names = sorted(hpo.name for hpo in HPODao().get_all())
+        self._operations = {
+            'participant': self.create_participant,
+            'questionnaire_response': self._generator.submit_questionnaire_response,
+            'biobank_order': self._generator.submit_biobank_order,
+            'summary_search': self.search_summaries,
+            'pdr_rebuild': self.rebuild_pdr_participant
+        }
+        unknown_operations = set(self.weights) - set(self._operations)
+        if unknown_operations:
+            raise ValueError(f'Unknown benchmark operations: {", ".join(sorted(unknown_operations))}')
+
+    def create_participant(self, _):
+        self._client.request_json('Participant', method='POST', body={})
+
+    def search_summaries(self, _):
+        # Similar to the work queue requests made by HealthPro
+        hpo_name = random.choice(self._hpo_names)
+        self._client.request_json(
+            f'ParticipantSummary?_count=100&_sort:desc=consentForStudyEnrollmentTime&hpoId={hpo_name}'
+        )
+
+    @staticmethod
+    def rebuild_pdr_participant(participant_id):
+        rebuild_participant_summary_resource(from_client_participant_id(participant_id))
+
+    def get_schedule(self, request_count: int):
+        """The calls to make, chosen from the seed so that every run with the same seed makes the same calls"""
+        rng = random.Random(self.seed)
+        operations = sorted(self.weights)
+        weights = [self.weights[operation] for operation in operations]
+        return [
+            (rng.choices(operations, weights=weights)[0], rng.choice(self.participant_ids))
+            for _ in range(request_count)
+        ]
+
+    def run(self, request_count: int, threads=1) -> BenchmarkResults:
+        results = BenchmarkResults(measure_rows_examined=self.measure_rows_examined)
+        schedule = self.get_schedule(request_count)
+        random.seed(self.seed)
+
+        with SqlStatementTracker(measure_rows_examined=self.measure_rows_examined) as tracker:
+            def make_call(call):
+                operation, participant_id = call
+                metrics = tracker.start_call()
+                error = False
+                start_time = time.perf_counter()
+                try:
+                    self._operations[operation](participant_id)
+                # pylint: disable=broad-except
+                except Exception as e:
+                    logging.warning(f'Benchmark {operation} call failed for {participant_id}: {e}')
+                    error = True
+                finally:
+                    seconds = time.perf_counter() - start_time
+                    tracker.end_call()
+                results.record(operation, seconds, metrics, error=error)
+
+            start_time = time.perf_counter()
+            if threads > 1:
+                with ThreadPoolExecutor(max_workers=threads) as executor:
+                    list(executor.map(make_call, schedule))
+            else:
+                for call in schedule:
+                    make_call(call)
+            results.elapsed_seconds = time.perf_counter() - start_time
+
+        return results
@@ -754,6 +754,23 @@ class FakeParticipantGenerator(object):
             session.add(rec)
             session.commit()
 
+        return participant_id
+
+    def submit_questionnaire_response(self, participant_id, submission_time=None):
+        """Submits a response to one of the questionnaires, chosen at random, for an existing participant."""
+        questionnaire_id_and_version = random.choice(sorted(self._questionnaire_to_questions.keys()))
+        self._submit_questionnaire_response(
+            participant_id,
+            questionnaire_id_and_version,
+            self._questionnaire_to_questions[questionnaire_id_and_version],
+            submission_time or self._now,
+            self._make_answer_map(False)
+        )
+
+    def submit_biobank_order(self, participant_id, start_time=None):
+        """Submits a biobank order with a random set of samples for an existing participant."""
+        return self._submit_biobank_order(participant_id, start_time or self._now)
+
     def add_pm_and_biospecimens_to_participants(self, participant_id):
         logging.info("Adding PM&B for %s", participant_id)
         _, last_qr_time, the_basics_submission_time = self._submit_questionnaire_responses(
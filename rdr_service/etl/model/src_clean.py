@@ -748,3 +748,16 @@ class WearConsent(CdmBase):
     authored = Column(DateTime)
     consent_status = Column(String(50))
     src_id = Column(String(50))
+
+class TempEtlParticipant(CdmBase):
+    """ Participants selected for the ETL run, numbered into the chunks that the ETL steps process """
+    __tablename__ = "temp_etl_participant"
+    participant_id = Column(BigInteger, primary_key=True, autoincrement=False)
+    chunk_number = Column(Integer, nullable=False, index=True)
+
+
+class TempEtlExcludedParticipant(CdmBase):
+    """ Participants that should be left out of the ETL run """
+    __tablename__ = "temp_etl_excluded_participant"
+    participant_id = Column(BigInteger, primary_key=True, autoincrement=False)
+    chunk_number = Column(Integer, nullable=False, index=True)
@@ -0,0 +1,83 @@
+from array import array
+from bisect import bisect_left
+from typing import Iterable, Iterator, Optional, Type, Union
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from rdr_service.etl.model.src_clean import TempEtlParticipant, TempEtlExcludedParticipant
+
+DEFAULT_CHUNK_SIZE = 1000
+INSERT_BATCH_SIZE = 10000
+
+
+class EtlParticipantSet:
+    """
+    Set of participant ids used by the Curation ETL.
+
+    The ids are held in memory as a sorted array of 64-bit integers and can be saved to an indexed
+    CDM table. ETL queries then filter by joining against that table (optionally limited to a single
+    chunk of the set) rather than embedding every participant id in the SQL text.
+    """
+
+    def __init__(self, participant_ids: Iterable[int] = (), chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 model: Union[Type[TempEtlParticipant], Type[TempEtlExcludedParticipant]] = TempEtlParticipant):
+        self.chunk_size = chunk_size
+        self.model = model
+        self._ids = array('q')
+        self.update(participant_ids)
+
+    def update(self, participant_ids: Iterable[int]):
+        self._ids = array('q', sorted(set(self._ids).union(participant_ids)))
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._ids)
+
+    def __contains__(self, participant_id) -> bool:
+        index = bisect_left(self._ids, participant_id)
+        return index < len(self._ids) and self._ids[index] == participant_id
+
+    def __bool__(self):
+        return len(self._ids) > 0
+
+    @property
+    def chunk_count(self) -> int:
+        return (len(self._ids) + self.chunk_size - 1) // self.chunk_size
+
+    def chunk_numbers(self) -> Iterable[int]:
+        return range(self.chunk_count)
+
+    def get_chunk(self, chunk_number: int) -> array:
+        start = chunk_number * self.chunk_size
+        return self._ids[start:start + self.chunk_size]
+
+    def save(self, session: Session):
+        """Replace the contents of the set's table with the participant ids of the set"""
+        table = self.model.__table__
+        session.execute(f'TRUNCATE TABLE {table.fullname}')
+        for batch_start in range(0, len(self._ids), INSERT_BATCH_SIZE):
+            session.execute(table.insert(), [
+                {'participant_id': participant_id, 'chunk_number': (batch_start + offset) // self.chunk_size}
+                for offset, participant_id in enumerate(self._ids[batch_start:batch_start + INSERT_BATCH_SIZE])
+            ])
+
+    def id_select(self, chunk_number: Optional[int] = None):
+        """Select of the ids saved to the set's table, limited to a single chunk if one is given"""
+        query = select([self.model.participant_id])
+        if chunk_number is not None:
+            query = query.where(self.model.chunk_number == chunk_number)
+        return query
+
+    def column_filter(self, column, chunk_number: Optional[int] = None):
+        """Expression that checks that the given column holds an id from the set"""
+        return column.in_(self.id_select(chunk_number))
+
+    def sql_filter(self, column_name: str, chunk_number: Optional[int] = None) -> str:
+        """Text version of column_filter for use in the ETL's raw SQL statements"""
+        subquery = f'SELECT participant_id FROM {self.model.__table__.fullname}'
+        if chunk_number is not None:
+            subquery += f' WHERE chunk_number = {int(chunk_number)}'
+        return f'{column_name} IN ({subquery})'
@@ -6,8 +6,10 @@ import json
 from typing import List
 
 import pytz
+import sqlalchemy
 
 from datetime import datetime, timedelta
+from sqlalchemy import and_, case, or_
 
 from rdr_service import clock, config
 from rdr_service.api_util import list_blobs
@@ -1666,109 +1668,101 @@ class GenomicJobController:
 
         logging.warning(message)
 
-    def update_members_blocklists(self):
+    @staticmethod
+    def _get_blocklist_rule_filter(rule):
+        """
+        Compile a blocklist rule from the config into a filter expression for the members it matches
+        :return: the filter, or None if the rule's attribute isn't a member field
+        """
+        attribute = rule.get('attribute')
+        if attribute not in sqlalchemy.inspect(GenomicSetMember).column_attrs.keys():
+            logging.warning(f'Skipping blocklist rule for unknown member attribute "{attribute}"')
+            return None
+
+        column, evaluate_value = getattr(GenomicSetMember, attribute), rule.get('value')
+        if isinstance(evaluate_value, list):
+            value_filters = []
+            non_null_values = [value for value in evaluate_value if value is not None]
+            if non_null_values:
+                value_filters.append(column.in_(non_null_values))
+            if len(non_null_values) < len(evaluate_value):
+                value_filters.append(column.is_(None))
+            if not value_filters:
+                return None
+            rule_filter = or_(*value_filters)
+        elif evaluate_value is None:
+            rule_filter = column.is_(None)
+        else:
+            rule_filter = column == evaluate_value
+
+        genome_type_filter = rule.get('genome_type')
+        if genome_type_filter:
+            rule_filter = and_(rule_filter, GenomicSetMember.genomeType == genome_type_filter)
 
-        def _get_blocklist_str_attributes(all_values, map_values):
-            attrs = []
-            for values in all_values:
-                for val in values:
-                    attrs.append(f'GenomicSetMember.{val.get("attribute")}')
-            for values in map_values:
-                for val in values:
-                    attrs.append(f'GenomicSetMember.{val.get("key")}')
-            return set(attrs)
+        return rule_filter
 
+    def update_members_blocklists(self):
+        """
+        Sets the block flags (and reasons) of newly added/modified members that match the rules in the config.
+        Each rule is compiled to a filter so that the database finds and updates the matching members.
+        :return: the ids of the members updated for each blocklist type
+        """
         member_blocklists_config = config.getSettingJson(GENOMIC_MEMBER_BLOCKLISTS, {})
 
         if not member_blocklists_config:
             self.job_result = GenomicSubProcessResult.MISSING_CONFIG
-            return
+            return None
 
         blocklists_map = {
-            'block_research': {
-                'block_attributes': [
-                    {
-                        'key': 'blockResearch',
-                        'value': 1
-                    },
-                    {
-                        'key': 'blockResearchReason',
-                        'value': None
-                    }
-                ],
-            },
-            'block_results': {
-                'block_attributes': [
-                    {
-                        'key': 'blockResults',
-                        'value': 1
-                    },
-                    {
-                        'key': 'blockResultsReason',
-                        'value': None
-                    }
-                ]
-            }
+            'block_research': (GenomicSetMember.blockResearch, GenomicSetMember.blockResearchReason),
+            'block_results': (GenomicSetMember.blockResults, GenomicSetMember.blockResultsReason)
         }
 
-        member_values = member_blocklists_config.values()
-        block_attr_values = [obj['block_attributes'] for obj in blocklists_map.values()]
-
-        members = self.member_dao.get_blocklist_members_from_date(
-            attributes=_get_blocklist_str_attributes(
-                member_values,
-                block_attr_values
-            )
-        )
-
-        if not members:
-            self.job_result = GenomicSubProcessResult.NO_RESULTS
-            return
+        try:
+            updated_member_ids = {}
+
+            for block_map_type, (flag_column, reason_column) in blocklists_map.items():
+                rule_filters = []
+                for rule in member_blocklists_config.get(block_map_type, []):
+                    rule_filter = self._get_blocklist_rule_filter(rule)
+                    if rule_filter is not None:
+                        rule_filters.append((rule_filter, rule.get('reason_string')))
+                if not rule_filters:
+                    continue
+
+                flag_unset = or_(flag_column.is_(None), flag_column == 0)
+                reason_unset = reason_column.is_(None)
+                member_ids = self.member_dao.get_blocklist_member_ids(
+                    or_(*[rule_filter for rule_filter, _ in rule_filters]),
+                    or_(flag_unset, reason_unset)
+                )
+                if not member_ids:
+                    continue
 
-        logging.info(f'Checking {len(members)} newly added/modified genomic member(s) for updating blocklists')
+                # The last matching rule in the config gives the reason when a member matches more than one
+                reason_value = case(
+                    [(rule_filter, reason) for rule_filter, reason in reversed(rule_filters)],
+                    else_=None
+                )
+                self.member_dao.update_members_by_ids(member_ids, {
+                    flag_column: case([(flag_unset, 1)], else_=flag_column),
+                    reason_column: case([(reason_unset, reason_value)], else_=reason_column)
+                })
+                updated_member_ids[block_map_type] = member_ids
+                logging.info(f'Updated {block_map_type} for {len(member_ids)} genomic member(s)')
 
-        try:
-            updated_members = []
-
-            for member in members:
-                member_dict = {'id': member.id}
-                for block_map_type, block_map_type_config in blocklists_map.items():
-                    blocklist_config_items = member_blocklists_config.get(block_map_type, [])
-                    for item in blocklist_config_items:
-                        # check attributes in member obj
-                        if not hasattr(member, item.get('attribute')):
-                            continue
-                        # check genome filter in config and matches attribute in member obj
-                        genome_type_filter = item.get('genome_type')
-                        if genome_type_filter and member.genomeType != genome_type_filter:
-                            continue
-                        current_attr_value, evaluate_value = getattr(member, item.get('attribute')), item.get('value')
-                        if (isinstance(item.get('value'), list) and
-                            current_attr_value in evaluate_value) or \
-                                current_attr_value == evaluate_value:
-
-                            for attr in block_map_type_config.get('block_attributes'):
-                                value = item.get('reason_string') if not attr['value'] else attr['value']
-
-                                if getattr(member, attr['key']) is None or getattr(member, attr['key']) == 0:
-                                    member_dict[attr['key']] = value
-
-                if len(member_dict) > 1:
-                    updated_members.append(member_dict)
-
-            if not updated_members:
+            if not updated_member_ids:
                 self.job_result = GenomicSubProcessResult.NO_RESULTS
-                return
-
-            logging.info(f'Updating {len(updated_members)} genomic member(s) blocklists')
-            self.member_dao.bulk_update(updated_members)
+                return updated_member_ids
 
             self.job_result = GenomicSubProcessResult.SUCCESS
+            return updated_member_ids
 
         # pylint: disable=broad-except
         except Exception as e:
             logging.error(e)
             self.job_result = GenomicSubProcessResult.ERROR
+            return None
 
     def process_research_manifest_record_updates(
         self,
@@ -77,9 +77,23 @@ class BaseMessageBroker:
         """Returns the request body that need to be sent to the destination. Must be overridden by subclasses."""
         raise NotImplementedError()
 
-    def send_request(self):
+    def validate_request(self):
+        """
+        Checks that the message could be sent to its destination, without sending it. Raises the same errors
+        that send_request would for a destination or event that isn't set up.
+        """
+        self._get_message_dest_url()
+        if not self.dest_auth_dao.get_auth_info(self.message.messageDest):
+            raise BadRequest(f'Can not find auth info for dest: {self.message.messageDest}')
+
+    def send_request(self, token=None):
+        """
+        Send the message to its destination
+        :param token: access token to use for the request, a token is retrieved for the destination if not provided
+        """
         dest_url = self._get_message_dest_url()
-        token = self.get_access_token()
+        if token is None:
+            token = self.get_access_token()
         request_body = self.make_request_body()
 
         response = self.send_request_with_retry_on_conn_error(dest_url, request_body, token)
@@ -0,0 +1,130 @@
+"""
+Sends the messages that were queued by the MessageBroker API. Messages for the destinations listed in the
+message_broker_queued_destinations config are stored and acknowledged right away, and are then delivered here
+(from a cron job) so that the time the destination takes to respond isn't spent handling the API request.
+"""
+
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+import logging
+from typing import Dict, List
+
+from rdr_service import clock
+from rdr_service.dao.message_broker_dao import MessageBrokerDao
+from rdr_service.message_broker.message_broker import MessageBrokerFactory
+from rdr_service.model.message_broker import MessageBrokerDeliveryStatus, MessageBrokerRecord
+
+MAX_DELIVERY_WORKERS = 8
+DISPATCH_BATCH_SIZE = 200
+MAX_DELIVERY_ATTEMPTS = 8
+RETRY_BASE_DELAY = timedelta(seconds=30)
+RETRY_MAX_DELAY = timedelta(hours=2)
+MAX_DISPATCH_RUN_TIME = timedelta(minutes=8)
+
+# Responses that may succeed if the message is sent again later
+RETRYABLE_STATUS_CODES = (401, 408, 429)
+
+
+class MessageBrokerDispatcher:
+    def __init__(
+        self,
+        max_workers=MAX_DELIVERY_WORKERS,
+        batch_size=DISPATCH_BATCH_SIZE,
+        max_attempts=MAX_DELIVERY_ATTEMPTS,
+        max_run_time=MAX_DISPATCH_RUN_TIME
+    ):
+        self._max_workers = max_workers
+        self._batch_size = batch_size
+        self._max_attempts = max_attempts
+        self._max_run_time = max_run_time
+        self.dao = MessageBrokerDao()
+
+    def dispatch_queued_messages(self) -> Dict[str, int]:
+        """
+        Send the messages that are due, a batch at a time, until there are none left (or the run has taken long
+        enough that the rest can be left for the next one).
+        :return: the number of messages that ended up with each delivery status
+        """
+        status_counts = defaultdict(int)
+        stop_time = clock.CLOCK.now() + self._max_run_time
+
+        while clock.CLOCK.now() < stop_time:
+            messages = self.dao.claim_queued_messages(limit=self._batch_size)
+            if not messages:
+                break
+
+            self._deliver_messages(messages)
+            self.dao.update_delivered_messages(messages)
+            for message in messages:
+                status_counts[str(message.deliveryStatus)] += 1
+
+        if status_counts:
+            logging.info(f'Dispatched queued message broker messages: {dict(status_counts)}')
+        return status_counts
+
+    def _deliver_messages(self, messages: List[MessageBrokerRecord]):
+        # Messages are grouped by destination so that each batch only needs one token for each destination,
+        # the stored token is reused for as long as it is valid
+        destination_messages_map = defaultdict(list)
+        for message in messages:
+            destination_messages_map[message.messageDest].append(message)
+
+        deliveries = []
+        for destination, destination_messages in destination_messages_map.items():
+            try:
+                token = MessageBrokerFactory.create(destination_messages[0]).get_access_token()
+            # pylint: disable=broad-except
+            except Exception as e:
+                logging.warning(f'Unable to get access token for {destination}: {e}')
+                for message in destination_messages:
+                    self._record_failed_attempt(message, error=str(e), can_retry=True)
+                continue
+
+            deliveries.extend((message, token) for message in destination_messages)
+
+        if self._max_workers > 1 and len(deliveries) > 1:
+            with ThreadPoolExecutor(max_workers=self._max_workers) as executor:
+                list(executor.map(lambda delivery: self._deliver_message(*delivery), deliveries))
+        else:
+            for message, token in deliveries:
+                self._deliver_message(message, token)
+
+    def _deliver_message(self, message: MessageBrokerRecord, token):
+        try:
+            response_code, response_body, response_error = MessageBrokerFactory.create(message).send_request(
+                token=token
+            )
+        # pylint: disable=broad-except
+        except Exception as e:
+            logging.warning(f'Error sending message broker record {message.id}: {e}')
+            self._record_failed_attempt(message, error=str(e), can_retry=True)
+            return
+
+        message.responseCode = response_code
+        message.responseBody = response_body
+        message.responseError = response_error
+        message.responseTime = clock.CLOCK.now()
+        if response_code == 200:
+            message.deliveryAttempts += 1
+            message.deliveryStatus = MessageBrokerDeliveryStatus.DELIVERED
+            message.nextAttemptTime = None
+        else:
+            self._record_failed_attempt(
+                message,
+                can_retry=response_code >= 500 or response_code in RETRYABLE_STATUS_CODES
+            )
+
+    def _record_failed_attempt(self, message: MessageBrokerRecord, error=None, can_retry=False):
+        if error is not None:
+            message.responseError = error[:2048]
+        message.deliveryAttempts += 1
+
+        if can_retry and message.deliveryAttempts < self._max_attempts:
+            # exponential backoff, so a destination that is down isn't sent everything again right away
+            retry_delay = min(RETRY_BASE_DELAY * (2 ** (message.deliveryAttempts - 1)), RETRY_MAX_DELAY)
+            message.deliveryStatus = MessageBrokerDeliveryStatus.PENDING
+            message.nextAttemptTime = clock.CLOCK.now() + retry_delay
+        else:
+            message.deliveryStatus = MessageBrokerDeliveryStatus.FAILED
+            message.nextAttemptTime = None
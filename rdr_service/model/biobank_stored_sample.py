@@ -85,7 +85,10 @@ class BiobankStoredSample(Base):
     modified = Column("modified", DateTime)
     """When that stored sample record was modified"""
 
-    __table_args__ = (Index("ix_boi_test", "biobank_order_identifier", "test"),)
+    __table_args__ = (
+        Index("ix_boi_test", "biobank_order_identifier", "test"),
+        Index("idx_bss_modified", "modified"),
+    )
 
 
 # pylint: disable=unused-argument
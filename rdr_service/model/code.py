@@ -1,5 +1,5 @@
 from protorpc import messages
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, UnicodeText, UniqueConstraint
+from sqlalchemy import Boolean, Column, ForeignKey, Index, Integer, String, UnicodeText, UniqueConstraint
 from sqlalchemy.ext.declarative import declared_attr
 from sqlalchemy.orm import backref, relationship
 
@@ -108,3 +108,20 @@ class CodeHistory(_CodeBase, Base):
     codeId = Column("code_id", Integer)
 
     __table_args__ = (UniqueConstraint("code_book_id", "system", "value"), UniqueConstraint("code_book_id", "code_id"))
+
+
+class CodeClosure(Base):
+    """Transitive closure of the code hierarchy.
+
+  There is a row for every pair of codes where one is an ancestor of the other (a module and the questions
+  and answers used in it, or a question and its answers), along with a row for each code paired with itself.
+  Rebuilt from code parents and survey structure whenever codes are imported.
+  """
+
+    __tablename__ = "code_closure"
+    ancestorCodeId = Column("ancestor_code_id", Integer, ForeignKey("code.code_id"), primary_key=True)
+    descendantCodeId = Column("descendant_code_id", Integer, ForeignKey("code.code_id"), primary_key=True)
+    depth = Column("depth", Integer, nullable=False)
+    """Number of levels between the codes (0 for a code paired with itself)"""
+
+    __table_args__ = (Index("idx_code_closure_descendant", "descendant_code_id", "ancestor_code_id"),)
@@ -24,19 +24,20 @@ from rdr_service.model.biobank_order import BiobankOrder, BiobankOrderIdentifier
     BiobankSpecimen, BiobankAliquot, BiobankAliquotDataset, BiobankAliquotDatasetItem, BiobankSpecimenAttribute, \
     BiobankQuestOrderSiteAddress
 from rdr_service.model.biobank_mail_kit_order import BiobankMailKitOrder
-from rdr_service.model.code import CodeBook, Code, CodeHistory
+from rdr_service.model.code import CodeBook, Code, CodeClosure, CodeHistory
 from rdr_service.model.calendar import Calendar
 from rdr_service.model.deceased_report import DeceasedReport
 from rdr_service.model.deceased_report_import_record import DeceasedReportImportRecord
-from rdr_service.model.duplicate_account import DuplicateAccount
+from rdr_service.model.duplicate_account import DuplicateAccount, DuplicateAccountBlockingKey
 from rdr_service.model.ehr import EhrReceipt, ParticipantEhrReceipt
 from rdr_service.model.enrollment_dependencies import EnrollmentDependencies
 from rdr_service.model.enrollment_status_history import EnrollmentStatusHistory
+from rdr_service.model.geocoded_address import GeocodedAddress
 from rdr_service.model.ghost_api_check import GhostApiCheck
 from rdr_service.model.hpo import HPO
 from rdr_service.model.hpro_consent_files import HealthProConsentFile
 from rdr_service.model.log_position import LogPosition
-from rdr_service.model.measurements import PhysicalMeasurements, Measurement
+from rdr_service.model.measurements import PhysicalMeasurements, Measurement, MeasurementConcept
 from rdr_service.model.metric_set import AggregateMetrics, MetricSet
 from rdr_service.model.metrics import MetricsVersion, MetricsBucket
 from rdr_service.model.metrics_cache import MetricsEnrollmentStatusCache, MetricsAgeCache, MetricsRaceCache, \
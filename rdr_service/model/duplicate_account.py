@@ -55,3 +55,26 @@ class DuplicateAccount(Base):
 
 sa.event.listen(DuplicateAccount, 'before_insert', model_insert_listener)
 sa.event.listen(DuplicateAccount, 'before_update', model_update_listener)
+
+
+class BlockingKeyType(Enum):
+    NAME_DOB = 1
+    EMAIL = 2
+    PHONE = 3
+
+
+class DuplicateAccountBlockingKey(Base):
+    """
+    Hashes of the (normalized) account data that duplicates are matched on. Any participants that have the same
+    key are potential duplicates, so they can be found with an indexed lookup rather than comparing every account.
+    """
+    __tablename__ = 'duplicate_account_blocking_key'
+    id = sa.Column(sa.Integer, primary_key=True, autoincrement=True, nullable=False)
+    participant_id = sa.Column(sa.Integer, sa.ForeignKey('participant.participant_id'), nullable=False)
+    key_type = sa.Column(sa.Enum(BlockingKeyType), nullable=False)
+    key_hash = sa.Column(sa.String(64), nullable=False)
+
+    __table_args__ = (
+        sa.UniqueConstraint('participant_id', 'key_type', name='uidx_blocking_key_participant_type'),
+        sa.Index('idx_blocking_key_type_hash', 'key_type', 'key_hash')
+    )
@@ -70,6 +70,11 @@ class EtmQuestionnaireResponse(Base):
     identifier = sa.Column(sa.String(64), nullable=True)
     """Vendor provided identifier"""
 
+    __table_args__ = (
+        sa.Index('idx_etm_response_hash', response_hash),
+        sa.Index('idx_etm_response_created', created),
+    )
+
 
 class EtmQuestionnaireResponseMetadata(Base):
     __tablename__ = 'etm_questionnaire_response_metadata'
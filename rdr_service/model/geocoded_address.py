@@ -0,0 +1,25 @@
+from sqlalchemy import Column, Float, Integer, String, event
+
+from rdr_service.model.base import Base, model_insert_listener, model_update_listener
+from rdr_service.model.utils import UTCDateTime6
+
+
+class GeocodedAddress(Base):
+    """
+    Cache of the locations found for site addresses, so that hierarchy syncs
+    only need to geocode addresses that haven't been seen before
+    """
+
+    __tablename__ = "geocoded_address"
+    id = Column("id", Integer, primary_key=True, autoincrement=True, nullable=False)
+    created = Column("created", UTCDateTime6, nullable=True)
+    modified = Column("modified", UTCDateTime6, nullable=True)
+    addressKey = Column("address_key", String(768), nullable=False, unique=True)
+    """Normalized form of the address (lowercase, with extra whitespace removed)"""
+    latitude = Column("latitude", Float, nullable=False)
+    longitude = Column("longitude", Float, nullable=False)
+    timeZoneId = Column("time_zone_id", String(1024), nullable=False)
+
+
+event.listen(GeocodedAddress, "before_insert", model_insert_listener)
+event.listen(GeocodedAddress, "before_update", model_update_listener)
@@ -1,11 +1,12 @@
 from typing import List
 
-from sqlalchemy import BIGINT, Boolean, Column, Float, ForeignKey, Integer, String, Table, Text, UnicodeText
+from sqlalchemy import BIGINT, Boolean, Column, Float, ForeignKey, Integer, String, Table, Text, UnicodeText, \
+    UniqueConstraint
 from sqlalchemy.dialects.mysql import JSON
 from sqlalchemy.orm import relationship
 
 from rdr_service.model.base import Base
-from rdr_service.model.utils import Enum, UTCDateTime
+from rdr_service.model.utils import Enum, UTCDateTime, UTCDateTime6
 from rdr_service.participant_enums import PhysicalMeasurementsStatus, PhysicalMeasurementsCollectType, \
     OriginMeasurementUnit
 
@@ -110,3 +111,26 @@ class Measurement(Base):
         primaryjoin=measurementId == measurement_to_qualifier.c.measurement_id,
         secondaryjoin=measurementId == measurement_to_qualifier.c.qualifier_id,
     )
+
+
+class MeasurementConcept(Base):
+    """
+    Catalog of the distinct measurement codes used in physical measurements, along with the body sites, units,
+    value types and ranges that have been seen for them. Updated as measurements are received so that reports
+    on the measurements in use don't need to parse every physical measurements resource.
+    """
+
+    __tablename__ = "measurement_concept"
+    id = Column("id", Integer, primary_key=True, autoincrement=True, nullable=False)
+    created = Column("created", UTCDateTime6, nullable=True)
+    modified = Column("modified", UTCDateTime6, nullable=True)
+    codeSystem = Column("code_system", String(255), nullable=False)
+    codeValue = Column("code_value", String(255), nullable=False)
+    details = Column("details", JSON, nullable=False)
+    """
+    Everything seen for the measurement code: lists of the body site, value code, submeasurement and
+    qualifier concepts (as [system, code] pairs), lists of the value types and units, and the min and max
+    decimal values
+    """
+
+    __table_args__ = (UniqueConstraint("code_system", "code_value", name="uidx_measurement_concept_code"),)
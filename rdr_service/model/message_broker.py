@@ -1,7 +1,17 @@
-from sqlalchemy import Column, ForeignKey, Integer, Boolean, String, JSON, event, UniqueConstraint
+from protorpc import messages
+from sqlalchemy import Column, ForeignKey, Index, Integer, Boolean, String, JSON, event, UniqueConstraint
 
 from rdr_service.model.base import Base, model_insert_listener, model_update_listener
-from rdr_service.model.utils import UTCDateTime6
+from rdr_service.model.utils import Enum, UTCDateTime6
+
+
+class MessageBrokerDeliveryStatus(messages.Enum):
+    """Where a queued message is in being delivered to its destination"""
+
+    PENDING = 1
+    SENDING = 2
+    DELIVERED = 3
+    FAILED = 4
 
 
 class MessageBrokerRecord(Base):
@@ -38,6 +48,17 @@ class MessageBrokerRecord(Base):
     """The time at which RDR received the response from the destination"""
     requestResource = Column("request_resource", JSON, nullable=True)
     """Original resource value; whole payload request that was sent from the requester"""
+    deliveryStatus = Column("delivery_status", Enum(MessageBrokerDeliveryStatus), nullable=True)
+    """
+    Delivery status for messages that are queued to be sent in the background,
+    NULL for messages that were sent while handling the request
+    """
+    deliveryAttempts = Column("delivery_attempts", Integer, nullable=False, default=0, server_default="0")
+    """The number of times RDR has tried to send a queued message"""
+    nextAttemptTime = Column("next_attempt_time", UTCDateTime6, nullable=True)
+    """The earliest time at which a queued message should be sent (or tried again)"""
+
+    __table_args__ = (Index('idx_message_broker_delivery', 'delivery_status', 'next_attempt_time'),)
 
 
 event.listen(MessageBrokerRecord, "before_insert", model_insert_listener)
@@ -1,6 +1,6 @@
 from rdr_service.model.utils import Enum, UTCDateTime6
 
-from sqlalchemy import Column, BigInteger, String, ForeignKey, event
+from sqlalchemy import Column, BigInteger, Integer, String, ForeignKey, event
 from sqlalchemy.dialects.mysql import TINYINT, JSON
 
 from rdr_service.model.base import model_insert_listener, model_update_listener, PPSCBase
@@ -37,6 +37,7 @@ class PPSCDataTransferEndpoint(PPSCBase):
     base_url = Column(String(512), nullable=False)
     endpoint = Column(String(512), nullable=False)
     data_sync_transfer_type = Column(Enum(DataSyncTransferType), nullable=False)
+    batch_size = Column(Integer)
     ignore_flag = Column(TINYINT, default=0)
 
 
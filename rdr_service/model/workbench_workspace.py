@@ -1,4 +1,4 @@
-from sqlalchemy import Column, ForeignKey, Integer, String, Boolean, UniqueConstraint, event, JSON, TEXT
+from sqlalchemy import Column, ForeignKey, Index, Integer, String, Boolean, UniqueConstraint, event, JSON, TEXT
 from sqlalchemy.orm import relationship
 from rdr_service.model.field_types import BlobUTF8
 from rdr_service.model.base import Base, model_insert_listener, model_update_listener
@@ -7,7 +7,8 @@ from rdr_service.participant_enums import WorkbenchWorkspaceStatus, WorkbenchWor
     WorkbenchWorkspaceSexAtBirth, WorkbenchWorkspaceGenderIdentity, WorkbenchWorkspaceSexualOrientation, \
     WorkbenchWorkspaceGeography, WorkbenchWorkspaceDisabilityStatus, WorkbenchWorkspaceAccessToCare, \
     WorkbenchWorkspaceEducationLevel, WorkbenchWorkspaceIncomeLevel, WorkbenchAuditReviewType, \
-    WorkbenchAuditWorkspaceDisplayDecision, WorkbenchAuditWorkspaceAccessDecision, WorkbenchWorkspaceAccessTier
+    WorkbenchAuditWorkspaceDisplayDecision, WorkbenchAuditWorkspaceAccessDecision, WorkbenchWorkspaceAccessTier, \
+    WorkbenchWorkspaceSearchField
 
 
 class WorkbenchWorkspaceBase(object):
@@ -170,6 +171,23 @@ class WorkbenchAudit(Base):
     resource = Column("resource", BlobUTF8, nullable=False)
 
 
+class WorkbenchWorkspaceSearchIndex(Base):
+    """
+    Inverted index of the searchable text of approved workspaces, used to narrow the research projects
+    directory before applying its LIKE filters. Each row holds one lowercase trigram of a workspace field.
+    """
+    __tablename__ = "workbench_workspace_search_index"
+
+    id = Column("id", Integer, primary_key=True, autoincrement=True, nullable=False)
+    workspaceSourceId = Column("workspace_source_id", Integer, nullable=False, index=True)
+    """The workspace ID in RW system."""
+    field = Column("field", Enum(WorkbenchWorkspaceSearchField), nullable=False)
+    """The workspace field the trigram was taken from"""
+    gram = Column("gram", String(3), nullable=False)
+
+    __table_args__ = (Index("idx_workspace_search_gram", "gram", "field", "workspace_source_id"),)
+
+
 event.listen(WorkbenchWorkspaceApproved, "before_insert", model_insert_listener)
 event.listen(WorkbenchWorkspaceApproved, "before_update", model_update_listener)
 event.listen(WorkbenchWorkspaceUser, "before_insert", model_insert_listener)
@@ -2,13 +2,15 @@ import json
 import logging
 import math
 import random
-from datetime import datetime
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Set
 
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 from sqlalchemy import func
 
-from rdr_service import config
+from rdr_service import clock, config
 from rdr_service.cloud_utils.bigquery import BigQueryJob
 from rdr_service.cloud_utils.gcp_cloud_tasks import GCPCloudTask
 from rdr_service.config import GAE_PROJECT
@@ -17,8 +19,13 @@ from rdr_service.dao.bq_code_dao import rebuild_bq_codebook_task
 from rdr_service.dao.bq_hpo_dao import bq_hpo_update_all
 from rdr_service.dao.bq_organization_dao import bq_organization_update_all
 from rdr_service.dao.bq_site_dao import bq_site_update_all
+from rdr_service.dao.metadata_dao import MetadataDao, PDR_CHANGE_FEED_BIOBANK_STORED_SAMPLE_KEY,\
+    PDR_CHANGE_FEED_PARTICIPANT_SUMMARY_KEY, PDR_CHANGE_FEED_QUESTIONNAIRE_RESPONSE_KEY
 from rdr_service.model.bigquery_sync import BigQuerySync
+from rdr_service.model.biobank_stored_sample import BiobankStoredSample
 from rdr_service.model.participant import Participant
+from rdr_service.model.participant_summary import ParticipantSummary
+from rdr_service.model.questionnaire_response import QuestionnaireResponse
 from rdr_service.resource.generators.code import rebuild_codebook_resources_task
 from rdr_service.resource.tasks import batch_rebuild_participants_task
 
@@ -176,6 +183,129 @@ def daily_rebuild_bigquery_handler():
         dispatch_participant_rebuild_tasks(pid_list, batch_size=100)
 
 
+@dataclass
+class PdrChangeFeedSource:
+    """A table that can signal that a participant's PDR data is out of date"""
+    name: str
+    watermark_key: str
+    timestamp_column: object
+    # Builds a query of (participant id, timestamp) for the source's records
+    build_query: Callable
+
+
+PDR_CHANGE_FEED_SOURCES = [
+    PdrChangeFeedSource(
+        name='participant_summary',
+        watermark_key=PDR_CHANGE_FEED_PARTICIPANT_SUMMARY_KEY,
+        timestamp_column=ParticipantSummary.lastModified,
+        build_query=lambda session: session.query(ParticipantSummary.participantId.label('participant_id'))
+    ),
+    PdrChangeFeedSource(
+        name='questionnaire_response',
+        watermark_key=PDR_CHANGE_FEED_QUESTIONNAIRE_RESPONSE_KEY,
+        timestamp_column=QuestionnaireResponse.created,
+        build_query=lambda session: session.query(QuestionnaireResponse.participantId.label('participant_id'))
+    ),
+    PdrChangeFeedSource(
+        name='biobank_stored_sample',
+        watermark_key=PDR_CHANGE_FEED_BIOBANK_STORED_SAMPLE_KEY,
+        timestamp_column=BiobankStoredSample.modified,
+        build_query=lambda session: session.query(
+            Participant.participantId.label('participant_id')
+        ).select_from(BiobankStoredSample).join(
+            Participant, Participant.biobankId == BiobankStoredSample.biobankId
+        )
+    )
+]
+
+# How far back the change feed looks for a source that doesn't have a watermark yet
+PDR_CHANGE_FEED_INITIAL_LOOKBACK = timedelta(days=1)
+# Timestamps are set by the application before the records are committed, so each run also re-checks
+# this long before the watermark to find records that became visible after the previous run had read them
+PDR_CHANGE_FEED_OVERLAP = timedelta(minutes=15)
+
+
+def _get_rebuild_batch_size(participant_count, min_batch_size=100, max_batch_size=500, max_task_count=500):
+    """
+    Use the default batch size for rebuild tasks unless that would create more than max_task_count tasks,
+    in which case the batches are made larger (up to max_batch_size participants per task).
+    """
+    return max(min_batch_size, min(max_batch_size, math.ceil(participant_count / max_task_count)))
+
+
+def incremental_rebuild_bigquery_handler(dryrun=False, project_id=GAE_PROJECT):
+    """
+    Cron job handler, queue rebuild tasks for only the participants that have had changes since the last run.
+    A high-watermark of the last change seen is stored in the metadata table for each of the change feed
+    sources. Records from a short overlap before the watermark are checked again on the next run, so changes
+    committed late (or with the same timestamp) are not missed. The sources are read from the primary database,
+    since the replica could be behind the watermarks that were saved there.
+    :param dryrun: Report the participants that would be rebuilt without queueing tasks or moving the watermarks
+    :param project_id: String identifier for the GAE project
+    :return: A report of the changes found for each source and the rebuild tasks needed for them
+    """
+    if config.GAE_PROJECT not in _bq_env:
+        logging.warning(f'BigQuery operations not supported in {config.GAE_PROJECT}, skipping.')
+        return None
+
+    metadata_dao = MetadataDao()
+    default_watermark = clock.CLOCK.now() - PDR_CHANGE_FEED_INITIAL_LOOKBACK
+
+    report = {'dryrun': dryrun, 'sources': {}}
+    stale_participant_ids: Set[int] = set()
+    new_watermarks: Dict[str, datetime] = {}
+    with metadata_dao.session() as session:
+        for source in PDR_CHANGE_FEED_SOURCES:
+            watermark_record = metadata_dao.get_by_key_with_session(session, source.watermark_key)
+            if watermark_record and watermark_record.dateValue:
+                watermark = watermark_record.dateValue
+            else:
+                logging.warning(f'No change feed watermark found for {source.name}, starting from {default_watermark}')
+                watermark = default_watermark
+
+            scan_start = watermark - PDR_CHANGE_FEED_OVERLAP
+            high_watermark = session.query(func.max(source.timestamp_column)).filter(
+                source.timestamp_column >= scan_start
+            ).scalar()
+            source_participant_ids = set()
+            if high_watermark is not None:
+                source_participant_ids = {
+                    row.participant_id for row in source.build_query(session).filter(
+                        source.timestamp_column >= scan_start,
+                        source.timestamp_column <= high_watermark
+                    ).distinct()
+                }
+                # Changes found only in the overlap shouldn't move the watermark back
+                new_watermarks[source.watermark_key] = max(high_watermark, watermark)
+
+            stale_participant_ids.update(source_participant_ids)
+            report['sources'][source.name] = {
+                'since': scan_start.isoformat(),
+                'until': high_watermark.isoformat() if high_watermark else None,
+                'participant_count': len(source_participant_ids)
+            }
+
+        batch_size = _get_rebuild_batch_size(len(stale_participant_ids))
+        report.update({
+            'participant_count': len(stale_participant_ids),
+            'batch_size': batch_size,
+            'task_count': math.ceil(len(stale_participant_ids) / batch_size)
+        })
+        logging.info(f'PDR change feed: {json.dumps(report)}')
+
+        if dryrun:
+            return report
+
+        if stale_participant_ids:
+            dispatch_participant_rebuild_tasks(
+                sorted(stale_participant_ids), batch_size=batch_size, project_id=project_id
+            )
+        for watermark_key, high_watermark in new_watermarks.items():
+            metadata_dao.upsert_with_session(session, watermark_key, date_value=high_watermark)
+
+    return report
+
+
 def insert_batch_into_bq(bq, project_id, dataset, table, batch, dryrun=False):
     """
     Bulk insert table rows into bigquery using the InsertAll api.
@@ -1,22 +1,116 @@
-from typing import List
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import List, Optional, Set, Tuple
 import os, logging
 
 from sqlalchemy.orm import aliased
 from sqlalchemy import update, or_
 
+from rdr_service import clock
 from rdr_service.config import GAE_PROJECT
 from rdr_service.cloud_utils.gcp_google_pubsub import submit_pipeline_pubsub_msg
 from rdr_service.dao.database_factory import get_database
+from rdr_service.dao.metadata_dao import MetadataDao, ETM_RESPONSE_DUPLICATION_WATERMARK_KEY
 from rdr_service.model.etm import EtmQuestionnaireResponse
 from rdr_service.participant_enums import QuestionnaireResponseClassificationType
+from rdr_service.services.system_utils import list_chunks
+
+# How far back the incremental check looks when it hasn't run before
+NEW_RESPONSE_INITIAL_LOOKBACK = timedelta(days=2)
+# Responses get their created time before they're committed, so each run also re-checks this long before the
+# watermark for responses that became visible after the previous run
+NEW_RESPONSE_OVERLAP = timedelta(minutes=15)
+RESPONSE_LOOKUP_BATCH_SIZE = 500
+DUPLICATE_UPDATE_BATCH_SIZE = 1000
 
 
 class EtmDuplicateDetector:
-    def run(self):
+    def run(self, incremental=True):
         with get_database().session() as session:
-            duplicate_ids = self.get_duplicate_ids(session)
+            if incremental:
+                self.run_incremental(session)
+            else:
+                duplicate_ids = self.get_duplicate_ids(session)
+                self.mark_responses_duplicate(duplicate_ids, session)
+                self.clean_pdr_module_data(duplicate_ids)
+
+    def run_incremental(self, session, project=GAE_PROJECT) -> List[int]:
+        """
+        Check the responses created since the last time this ran, marking them (and any other later responses
+        with the same hash) as duplicates. Only the responses that share a hash with a new response are loaded
+        (using the index on response_hash), so the work done depends on the number of new responses rather than
+        the size of the table.
+        :return: ids of the responses marked as duplicates
+        """
+        metadata_dao = MetadataDao()
+        watermark_record = metadata_dao.get_by_key_with_session(session, ETM_RESPONSE_DUPLICATION_WATERMARK_KEY)
+        if watermark_record and watermark_record.dateValue:
+            watermark = watermark_record.dateValue
+        else:
+            watermark = clock.CLOCK.now() - NEW_RESPONSE_INITIAL_LOOKBACK
+            logging.warning(f'No ETM duplication check watermark found, checking responses since {watermark}')
+
+        new_response_hashes, high_watermark = self._get_new_response_hashes(
+            session, watermark - NEW_RESPONSE_OVERLAP
+        )
+        duplicate_ids = self.get_duplicate_ids_for_hashes(session, new_response_hashes)
+        if duplicate_ids:
             self.mark_responses_duplicate(duplicate_ids, session)
-            self.clean_pdr_module_data(duplicate_ids)
+            self.clean_pdr_module_data(duplicate_ids, project=project)
+
+        if high_watermark:
+            # Responses found only in the overlap shouldn't move the watermark back
+            metadata_dao.upsert_with_session(
+                session, ETM_RESPONSE_DUPLICATION_WATERMARK_KEY, date_value=max(high_watermark, watermark)
+            )
+            session.commit()
+
+        return duplicate_ids
+
+    @staticmethod
+    def _get_new_response_hashes(session, watermark: datetime) -> Tuple[Set[str], Optional[datetime]]:
+        new_responses = session.query(
+            EtmQuestionnaireResponse.response_hash,
+            EtmQuestionnaireResponse.created
+        ).filter(
+            EtmQuestionnaireResponse.created >= watermark
+        ).all()
+
+        response_hashes = {response_hash for response_hash, _ in new_responses if response_hash is not None}
+        high_watermark = max((created for _, created in new_responses), default=None)
+        return response_hashes, high_watermark
+
+    @staticmethod
+    def get_duplicate_ids_for_hashes(session, response_hashes: Set[str]) -> List[int]:
+        """
+        Find the responses that duplicate an earlier one with any of the given hashes. Matches the full check
+        done by get_duplicate_ids: any complete response that has another complete response with the same hash
+        that was either created before it or has a lower id is a duplicate.
+        """
+        response_groups = defaultdict(list)
+        for hash_batch in list_chunks(sorted(response_hashes), RESPONSE_LOOKUP_BATCH_SIZE):
+            responses = session.query(
+                EtmQuestionnaireResponse.etm_questionnaire_response_id,
+                EtmQuestionnaireResponse.response_hash,
+                EtmQuestionnaireResponse.created
+            ).filter(
+                EtmQuestionnaireResponse.response_hash.in_(hash_batch),
+                EtmQuestionnaireResponse.classificationType == QuestionnaireResponseClassificationType.COMPLETE
+            ).all()
+            for response in responses:
+                response_groups[response.response_hash].append(response)
+
+        duplicate_ids = []
+        for responses in response_groups.values():
+            first_id = min(response.etm_questionnaire_response_id for response in responses)
+            first_created = min((response.created for response in responses if response.created), default=None)
+            duplicate_ids.extend(
+                response.etm_questionnaire_response_id for response in responses
+                if response.etm_questionnaire_response_id > first_id
+                or (response.created and first_created and response.created > first_created)
+            )
+
+        return sorted(duplicate_ids)
 
     @staticmethod
     def get_duplicate_ids(session) -> List[int]:
@@ -48,16 +142,17 @@ class EtmDuplicateDetector:
     @staticmethod
     def mark_responses_duplicate(duplicate_ids: List[int], session) -> None:
         """Sets the classification type for etm_questionnaire_response_ids in `duplicate_ids` as DUPLICATE"""
-        session.execute(
-            update(EtmQuestionnaireResponse)
-            .where(
-                EtmQuestionnaireResponse.etm_questionnaire_response_id.in_(duplicate_ids)
+        for id_batch in list_chunks(duplicate_ids, DUPLICATE_UPDATE_BATCH_SIZE):
+            session.execute(
+                update(EtmQuestionnaireResponse)
+                .where(
+                    EtmQuestionnaireResponse.etm_questionnaire_response_id.in_(id_batch)
+                )
+                .values({
+                        EtmQuestionnaireResponse.classificationType: QuestionnaireResponseClassificationType.DUPLICATE
+                        })
             )
-            .values({
-                    EtmQuestionnaireResponse.classificationType: QuestionnaireResponseClassificationType.DUPLICATE
-                    })
-        )
-        session.commit()
+            session.commit()
 
     @staticmethod
     def clean_pdr_module_data(duplicate_responses: List[int], project=GAE_PROJECT) -> None:
@@ -71,19 +166,20 @@ class EtmDuplicateDetector:
         # For new RDR-PDR pipeline:  generate PDR delete record events for the marked duplicates.  Allow calls
         # during unittests for mocks/param validation.  submit_pipeline_pubsub_msg() will enforce project restrictions
         if project != "localhost" or os.environ.get("UNITTEST_FLAG", "0") == "1":
-            submit_pipeline_pubsub_msg(
-                table="etm_questionnaire_response",
-                action="delete",
-                pk_columns=["etm_questionnaire_response_id"],
-                pk_values=duplicate_responses,
-                project=project,
-            )
+            for id_batch in list_chunks(duplicate_responses, DUPLICATE_UPDATE_BATCH_SIZE):
+                submit_pipeline_pubsub_msg(
+                    table="etm_questionnaire_response",
+                    action="delete",
+                    pk_columns=["etm_questionnaire_response_id"],
+                    pk_values=id_batch,
+                    project=project,
+                )
 
             logging.info(
                 f"Sent PubSub notifications to mark {len(duplicate_responses)} records for deletion."
             )
 
 
-def run_etm_duplicate_detector():
+def run_etm_duplicate_detector(incremental=True):
     duplicate_detector = EtmDuplicateDetector()
-    duplicate_detector.run()
+    duplicate_detector.run(incremental=incremental)
@@ -1,20 +1,28 @@
+from contextlib import ExitStack
 from datetime import datetime, timedelta
 from dateutil import parser
 import logging
+from typing import Dict, List, Optional
+from sqlalchemy import bindparam
 from sqlalchemy.exc import IntegrityError
-from werkzeug.exceptions import BadRequest, HTTPException
+from werkzeug.exceptions import BadRequest, Conflict, HTTPException, NotFound
 
+from rdr_service.api_util import dispatch_task
 from rdr_service.clock import CLOCK
 from rdr_service.dao.api_user_dao import ApiUserDao
 from rdr_service.dao.deceased_report_dao import DeceasedReportDao
 from rdr_service.model.deceased_report import DeceasedReport
 from rdr_service.model.deceased_report_import_record import DeceasedReportImportRecord
+from rdr_service.model.participant import Participant
+from rdr_service.model.participant_summary import ParticipantSummary
 from rdr_service.model.utils import from_client_participant_id
 from rdr_service.participant_enums import DeceasedNotification, DeceasedReportStatus
 from rdr_service.services.redcap_client import RedcapClient
+from rdr_service.services.system_utils import list_chunks
 
 PROJECT_TOKEN_CONFIG_KEY = 'dr_import_key'
 USER_SYSTEM = 'https://www.pmi-ops.org/redcap'
+IMPORT_BATCH_SIZE = 500
 
 
 class DeceasedReportImporter:
@@ -28,6 +36,13 @@ class DeceasedReportImporter:
 
         self.api_user_dao = ApiUserDao()
         self.deceased_report_dao = DeceasedReportDao()
+        self._api_user_cache = {}
+
+    def _load_or_init_user(self, username):
+        """Reports tend to share authors, so each author is only loaded once for an import"""
+        if username not in self._api_user_cache:
+            self._api_user_cache[username] = self.api_user_dao.load_or_init(USER_SYSTEM, username)
+        return self._api_user_cache[username]
 
     def _parse_other_type_report(self, record: dict, report: DeceasedReport):
         report.notification = DeceasedNotification.OTHER
@@ -36,10 +51,10 @@ class DeceasedReportImporter:
         reporter_email = record.get('reportperson_email')
         if not reporter_email:
             reporter_email = 'scstaff@pmi-ops.org'
-        report.author = self.api_user_dao.load_or_init(USER_SYSTEM, reporter_email)
+        report.author = self._load_or_init_user(reporter_email)
 
     def _parse_kin_type_report(self, record, report: DeceasedReport):
-        report.author = self.api_user_dao.load_or_init(USER_SYSTEM, 'scstaff@pmi-ops.org')
+        report.author = self._load_or_init_user('scstaff@pmi-ops.org')
 
         report.notification = DeceasedNotification.NEXT_KIN_SUPPORT
 
@@ -87,10 +102,42 @@ class DeceasedReportImporter:
 
         return import_record
 
-    def import_reports(self, since: datetime = None):
+    def _build_report(self, record: dict, participant_id) -> Optional[DeceasedReport]:
+        """
+        Parses the REDCap record into a new deceased report.
+        :return: the report, or None if the record doesn't have a recognized notification type
+        """
+        report = DeceasedReport(
+            status=DeceasedReportStatus.PENDING,  # auto-approved in DAO if needed
+            participantId=participant_id,
+            causeOfDeath=record.get('death_cause')
+        )
+
+        notification_type = record['reportperson_type']
+        if notification_type == '1':
+            self._parse_other_type_report(record, report)
+        elif notification_type == '2':
+            self._parse_kin_type_report(record, report)
+        else:
+            logging.error(
+                f'Record for {participant_id} has an unrecognized notification value: "{notification_type}"'
+            )
+            return None
+
+        date_of_death_str = record.get('death_date')
+        if date_of_death_str:
+            report.dateOfDeath = parser.parse(date_of_death_str)
+
+        report.authored = self._get_report_authored_data(record)
+
+        return report
+
+    def import_reports(self, since: datetime = None, batch_size: int = None):
         """
         :param since: DateTime to use as start of date range request. Will import all reports created or modified
             after the given date. Defaults to the start (midnight) of yesterday.
+        :param batch_size: If given, records are imported in batches of this size (see _import_batch) rather than
+            committing each one separately.
         """
         if since is None:
             now_yesterday = datetime.now() - timedelta(days=1)
@@ -100,54 +147,201 @@ class DeceasedReportImporter:
         records = redcap.get_records(self.redcap_api_key, since)
 
         with self.deceased_report_dao.session() as session:
-            for record in records:
-                participant_id = None
-                try:
-                    participant_id = from_client_participant_id(record['recordid'])
-                    import_record = self._retrieve_import_record(participant_id, session)
+            if batch_size:
+                for record_batch in list_chunks(records, batch_size):
+                    self._import_batch(record_batch, session)
+            else:
+                for record in records:
+                    self._import_record(record, session)
 
-                    if import_record.deceasedReport:
-                        logging.warning(
-                            f'Skipping record for {participant_id} since deceased report has already been generated"'
-                        )
-                        continue
+        logging.info('Deceased report import complete')
+
+    def _import_record(self, record: dict, session):
+        participant_id = None
+        try:
+            participant_id = from_client_participant_id(record['recordid'])
+            import_record = self._retrieve_import_record(participant_id, session)
+
+            if import_record.deceasedReport:
+                logging.warning(
+                    f'Skipping record for {participant_id} since deceased report has already been generated"'
+                )
+                return
+
+            if record['reportdeath_identityconfirm'] == 0:
+                # Skip any records that don't have the participant's identity confirmed
+                return
+
+            report = self._build_report(record, participant_id)
+            if report is None:
+                return
+
+            self.deceased_report_dao.insert_with_session(session, report)
+
+            # Need to set the deceased report on the record after inserting to avoid the sessions conflicting
+            import_record.deceasedReport = report
+            session.commit()
+        except IntegrityError:
+            session.rollback()
+            logging.error(f'Record for {participant_id} encountered a database error', exc_info=True)
+        except (HTTPException, KeyError, ValueError):
+            logging.error(f'Record for {participant_id} encountered an error', exc_info=True)
+
+    def _import_batch(self, records: List[dict], session):
+        """
+        Imports a batch of records without querying and committing for each of them. The import records,
+        participants, active reports and participant summaries for the batch are loaded with a query each, the
+        reports are built and validated in memory, and then everything is written with bulk statements and
+        committed together. If writing the batch fails, each participant's changes are written in their own
+        savepoint so that a database error only skips the record that caused it.
+        """
+        participant_records = []
+        for record in records:
+            try:
+                participant_records.append((from_client_participant_id(record['recordid']), record))
+            except (KeyError, ValueError):
+                logging.error(f'Record for {record.get("recordid")} encountered an error', exc_info=True)
+        participant_ids = list({participant_id for participant_id, _ in participant_records})
+        if not participant_ids:
+            return
+
+        # Reports for the batch's participants can't be created elsewhere until the batch is committed, since
+        # the locks are held (on a separate connection) from before checking for active reports. They're taken
+        # in order so that imports running at the same time can't deadlock.
+        with self.deceased_report_dao.session() as lock_session, ExitStack() as participant_locks:
+            for participant_id in sorted(participant_ids):
+                participant_locks.enter_context(
+                    self.deceased_report_dao.get_report_creation_lock(lock_session, participant_id)
+                )
+            stored_report_participant_ids = self._import_locked_batch(participant_records, participant_ids, session)
 
-                    if record['reportdeath_identityconfirm'] == 0:
-                        # Skip any records that don't have the participant's identity confirmed
-                        continue
+        for participant_id in stored_report_participant_ids:
+            dispatch_task(endpoint='update_retention_status', payload={'participant_id': participant_id})
 
-                    report = DeceasedReport(
-                        status=DeceasedReportStatus.PENDING,  # auto-approved in DAO if needed
-                        participantId=participant_id,
-                        causeOfDeath=record.get('death_cause')
+    def _import_locked_batch(self, participant_records, participant_ids: List[int], session) -> List[int]:
+        """
+        Imports the records of a batch once the participants have been locked.
+        :return: ids of the participants that had reports stored
+        """
+        import_record_map = {
+            import_record.participantId: import_record
+            for import_record in session.query(DeceasedReportImportRecord).filter(
+                DeceasedReportImportRecord.participantId.in_(participant_ids)
+            )
+        }
+        participant_hpo_map = dict(
+            session.query(Participant.participantId, Participant.hpoId).filter(
+                Participant.participantId.in_(participant_ids)
+            )
+        )
+        active_report_participant_ids = self.deceased_report_dao.get_participant_ids_with_active_reports(
+            session, participant_ids
+        )
+
+        seen_participant_ids = []
+        new_reports = {}
+        for participant_id, record in participant_records:
+            try:
+                if participant_id not in participant_hpo_map:
+                    raise NotFound(f'Participant P{participant_id} not found.')
+                if participant_id not in seen_participant_ids:
+                    seen_participant_ids.append(participant_id)
+
+                import_record = import_record_map.get(participant_id)
+                if (import_record and import_record.deceasedReportId) or participant_id in new_reports:
+                    logging.warning(
+                        f'Skipping record for {participant_id} since deceased report has already been generated"'
                     )
+                    continue
 
-                    notification_type = record['reportperson_type']
-                    if notification_type == '1':
-                        self._parse_other_type_report(record, report)
-                    elif notification_type == '2':
-                        self._parse_kin_type_report(record, report)
-                    else:
-                        logging.error(
-                            f'Record for {participant_id} has an unrecognized notification value: "{notification_type}"'
-                        )
-                        continue
+                if record['reportdeath_identityconfirm'] == 0:
+                    # Skip any records that don't have the participant's identity confirmed
+                    continue
+
+                report = self._build_report(record, participant_id)
+                if report is None:
+                    continue
 
-                    date_of_death_str = record.get('death_date')
-                    if date_of_death_str:
-                        report.dateOfDeath = parser.parse(date_of_death_str)
+                self.deceased_report_dao.auto_approve_if_unpaired(report, participant_hpo_map[participant_id])
+                self.deceased_report_dao.except_if_invalid(report)
+                if participant_id in active_report_participant_ids:
+                    raise Conflict(f'Participant P{participant_id} already has a preliminary or final deceased report')
 
-                    report.authored = self._get_report_authored_data(record)
+                new_reports[participant_id] = report
+            except (HTTPException, KeyError, ValueError):
+                logging.error(f'Record for {participant_id} encountered an error', exc_info=True)
 
-                    self.deceased_report_dao.insert_with_session(session, report)
+        summary_map = {}
+        if new_reports:
+            summary_map = {
+                summary.participantId: summary
+                for summary in session.query(ParticipantSummary).filter(
+                    ParticipantSummary.participantId.in_(new_reports.keys())
+                )
+            }
 
-                    # Need to set the deceased report on the record after inserting to avoid the sessions conflicting
-                    import_record.deceasedReport = report
-                    session.commit()
+        try:
+            with session.begin_nested():
+                self._write_batch(session, seen_participant_ids, import_record_map, new_reports, summary_map)
+            stored_report_participant_ids = list(new_reports.keys())
+        except IntegrityError:
+            logging.warning('Unable to store the batch of deceased report records, storing them individually')
+            stored_report_participant_ids = []
+            for participant_id in seen_participant_ids:
+                participant_report = {}
+                if participant_id in new_reports:
+                    participant_report[participant_id] = new_reports[participant_id]
+                try:
+                    with session.begin_nested():
+                        self._write_batch(
+                            session, [participant_id], import_record_map, participant_report, summary_map
+                        )
+                    stored_report_participant_ids.extend(participant_report.keys())
                 except IntegrityError:
-                    session.rollback()
                     logging.error(f'Record for {participant_id} encountered a database error', exc_info=True)
-                except (HTTPException, KeyError, ValueError):
-                    logging.error(f'Record for {participant_id} encountered an error', exc_info=True)
 
-        logging.info('Deceased report import complete')
+        session.commit()
+        return stored_report_participant_ids
+
+    def _write_batch(self, session, participant_ids: List[int],
+                     import_record_map: Dict[int, DeceasedReportImportRecord], reports: Dict[int, DeceasedReport],
+                     summary_map: Dict[int, ParticipantSummary]):
+        now = CLOCK.now()
+        import_record_table = DeceasedReportImportRecord.__table__
+
+        existing_record_ids = [
+            participant_id for participant_id in participant_ids if participant_id in import_record_map
+        ]
+        if existing_record_ids:
+            session.execute(
+                import_record_table.update().where(
+                    import_record_table.c.participant_id.in_(existing_record_ids)
+                ).values(last_seen=now)
+            )
+        new_record_ids = [
+            participant_id for participant_id in participant_ids if participant_id not in import_record_map
+        ]
+        if new_record_ids:
+            session.execute(import_record_table.insert(), [
+                {'participant_id': participant_id, 'created': now, 'last_seen': now}
+                for participant_id in new_record_ids
+            ])
+
+        if reports:
+            session.add_all(reports.values())
+            session.flush()
+            session.execute(
+                import_record_table.update().where(
+                    import_record_table.c.participant_id == bindparam('record_participant_id')
+                ).values(deceased_report_id=bindparam('report_id')),
+                [
+                    {'record_participant_id': participant_id, 'report_id': report.id}
+                    for participant_id, report in reports.items()
+                ]
+            )
+
+            for participant_id, report in reports.items():
+                participant_summary = summary_map.get(participant_id)
+                if participant_summary:
+                    self.deceased_report_dao.set_participant_summary_deceased_fields(participant_summary, report)
+            session.flush()
@@ -22,6 +22,7 @@ from rdr_service.dao.participant_dao import ParticipantDao
 from rdr_service.dao.participant_summary_dao import ParticipantSummaryDao
 from rdr_service.dao.ppi_validation_errors_dao import PpiValidationErrorsDao
 from rdr_service.genomic_enums import GenomicJob
+from rdr_service.message_broker.message_broker_dispatcher import MessageBrokerDispatcher
 from rdr_service.model.requests_log import RequestsLog
 from rdr_service.offline import biobank_samples_pipeline, sync_consent_files, update_ehr_status, \
     antibody_study_pipeline, export_va_workqueue
@@ -30,7 +31,7 @@ from rdr_service.offline.genomics import genomic_pipeline, genomic_cvl_pipeline,
 from rdr_service.offline.ce_health_data_reconciliation_pipeline import CeHealthDataReconciliationPipeline
 from rdr_service.offline.base_pipeline import send_failure_alert
 from rdr_service.offline.bigquery_sync import sync_bigquery_handler, \
-    daily_rebuild_bigquery_handler, rebuild_bigquery_handler
+    daily_rebuild_bigquery_handler, rebuild_bigquery_handler, incremental_rebuild_bigquery_handler
 from rdr_service.offline.import_deceased_reports import DeceasedReportImporter
 from rdr_service.offline.import_hpo_lite_pairing import HpoLitePairingImporter
 from rdr_service.offline.enrollment_check import check_enrollment
@@ -139,6 +140,9 @@ def run_ce_health_data_reconciliation():
 @app_util.auth_required_cron
 def run_biobank_samples_pipeline():
     job_runtime = CLOCK.now()
+    logging.info("Updating participant summaries from recently modified stored samples...")
+    updated_count = ParticipantSummaryDao().update_from_recent_biobank_stored_samples()
+    logging.info(f"Updated stored sample data for {updated_count} participants.")
     logging.info("Generating reconciliation reports...")
     biobank_samples_pipeline.write_reconciliation_report(job_runtime)
     logging.info("Generated reconciliation reports.")
@@ -399,6 +403,14 @@ def bigquery_daily_rebuild_cron():
     return '{"success": "true"}'
 
 
+@app_util.auth_required_cron
+@_alert_on_exceptions
+def bigquery_incremental_rebuild_cron():
+    dryrun = request.args.get('dryrun', 'false').lower() == 'true'
+    report = incremental_rebuild_bigquery_handler(dryrun=dryrun)
+    return json.dumps({"success": "true", "report": report})
+
+
 @app_util.auth_required_cron
 @_alert_on_exceptions
 def bigquery_sync():
@@ -428,7 +440,15 @@ def check_enrollment_status():
 @app_util.auth_required_cron
 def flag_response_duplication():
     detector = ResponseDuplicationDetector()
-    detector.flag_duplicate_responses()
+    detector.flag_new_duplicate_responses()
+    return '{ "success": "true" }'
+
+
+@app_util.auth_required_cron
+@_alert_on_exceptions
+def dispatch_message_broker_messages():
+    dispatcher = MessageBrokerDispatcher()
+    dispatcher.dispatch_queued_messages()
     return '{ "success": "true" }'
 
 
@@ -1002,6 +1022,13 @@ def _build_pipeline_app():
         methods=["GET"],
     )
 
+    offline_app.add_url_rule(
+        OFFLINE_PREFIX + "MessageBrokerDispatch",
+        endpoint="messageBrokerDispatch",
+        view_func=dispatch_message_broker_messages,
+        methods=["GET"],
+    )
+
     offline_app.add_url_rule(
         OFFLINE_PREFIX + "TactisBigQuerySync",
         endpoint="tactisBigQuerySync",
@@ -1459,6 +1486,12 @@ def _build_pipeline_app():
         methods=["GET"]
     )
 
+    offline_app.add_url_rule(
+        OFFLINE_PREFIX + "BigQueryIncrementalRebuild", endpoint="bigquery_incremental_rebuild",
+        view_func=bigquery_incremental_rebuild_cron,
+        methods=["GET"]
+    )
+
     offline_app.add_url_rule(
         OFFLINE_PREFIX + "BigQuerySync", endpoint="bigquery_sync", view_func=bigquery_sync, methods=["GET"]
     )
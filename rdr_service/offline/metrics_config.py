@@ -100,13 +100,15 @@ def _enrollment_status(summary):
     consent = summary.get(CONSENT_FOR_STUDY_ENROLLMENT_AND_EHR_METRIC) == SUBMITTED_VALUE
     num_completed_baseline_ppi_modules = summary.get(NUM_COMPLETED_BASELINE_PPI_MODULES_METRIC)
     physical_measurements = PhysicalMeasurementsStatus(summary.get(PHYSICAL_MEASUREMENTS_METRIC))
+    # Self-reported measurements aren't in the exported data, so they're UNSET unless a metric sets them
     self_reported_physical_measurements = SelfReportedPhysicalMeasurementsStatus(summary.get(
-        SELF_REPORTED_PHYSICAL_MEASUREMENTS_METRIC
+        SELF_REPORTED_PHYSICAL_MEASUREMENTS_METRIC, str(SelfReportedPhysicalMeasurementsStatus.UNSET)
     ))
     samples_to_isolate_dna = SampleStatus(summary.get(SAMPLES_TO_ISOLATE_DNA_METRIC))
+    # The consent cohort and GROR response aren't exported for metrics either
     return ps_dao.calculate_enrollment_status(
         consent, num_completed_baseline_ppi_modules, physical_measurements, self_reported_physical_measurements,
-        samples_to_isolate_dna
+        samples_to_isolate_dna, consent_cohort=None, gror_consent=None
     )
 
 
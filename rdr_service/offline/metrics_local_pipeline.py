@@ -0,0 +1,325 @@
+"""Runs the metrics pipeline on a single machine, without the App Engine MapReduce runtime.
+
+The same three MapReduces described in metrics_pipeline are run with the functions from
+metrics_calculation, using a pool of local processes:
+
+* Map tasks (one for each input file) stream their file from a StorageProvider and write their
+  output to one file per partition, choosing the partition by a hash of the key. Output is buffered
+  and spilled to the partition files (after running any combiner on the buffer) as the buffer fills.
+* Reduce tasks (one for each partition) sort the partition's records by key using sorted runs on
+  disk that are merged back together, and pass each key's values to the reducer.
+
+So the memory that is used depends on the buffer sizes rather than on the amount of input. The output
+of the last MapReduce is written to the metrics_bucket table in batches.
+"""
+
+from collections import defaultdict, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from functools import partial
+import glob
+import heapq
+from itertools import groupby
+import json
+import logging
+import multiprocessing
+from operator import itemgetter
+import os
+import shutil
+import tempfile
+from typing import Callable, Iterable, List, Optional, Tuple
+import zlib
+
+from rdr_service.dao import database_factory
+from rdr_service.dao.code_dao import CodeDao
+from rdr_service.dao.metrics_dao import MetricsBucketDao, MetricsVersionDao
+from rdr_service.model.metrics import MetricsBucket
+from rdr_service.offline.metrics_calculation import (
+    DATE_FORMAT,
+    combine_hpo_metric_date_deltas,
+    get_hpo_date_metrics,
+    map_csv_to_participant_and_date_metric,
+    map_hpo_metric_date_counts_to_hpo_date_key,
+    map_hpo_metric_date_deltas_to_hpo_metric_key,
+    reduce_hpo_metric_date_deltas_to_all_date_counts,
+    reduce_participant_data_to_hpo_metric_date_deltas,
+)
+from rdr_service.storage import StorageProvider
+
+DEFAULT_NUM_PARTITIONS = 16
+MAP_SPILL_SIZE = 100000
+REDUCE_SORT_BUFFER_SIZE = 500000
+BUCKET_UPSERT_BATCH_SIZE = 500
+
+# An input file for a map task. Files stored locally by the engine between stages don't have a storage provider.
+MapInput = namedtuple('MapInput', ['storage_provider', 'path'])
+
+
+def _get_partition(key: str, num_partitions: int) -> int:
+    # Python's hash() is randomized for each process, so a stable hash is used to partition keys
+    return zlib.crc32(key.encode('utf-8')) % num_partitions
+
+
+def _read_records(file_paths: Iterable[str]):
+    for file_path in file_paths:
+        with open(file_path) as file:
+            for line in file:
+                yield json.loads(line)
+
+
+def _write_records(file, records: Iterable[Tuple[str, str]]):
+    for key, value in records:
+        file.write(json.dumps([key, value]))
+        file.write('\n')
+
+
+class _PartitionWriter:
+    """Buffers the output of a map task, spilling it to a file for each partition when the buffer fills"""
+
+    def __init__(self, stage_dir: str, task_id: int, num_partitions: int, spill_size: int, combiner=None):
+        self._file_paths = [
+            os.path.join(stage_dir, f'partition_{partition}', f'map_{task_id}.jsonl')
+            for partition in range(num_partitions)
+        ]
+        self._num_partitions = num_partitions
+        self._spill_size = spill_size
+        self._combiner = combiner
+        self._buffers = [defaultdict(list) for _ in range(num_partitions)]
+        self._buffered_count = 0
+
+    def add(self, key: str, value: str):
+        self._buffers[_get_partition(key, self._num_partitions)][key].append(value)
+        self._buffered_count += 1
+        if self._buffered_count >= self._spill_size:
+            self.spill()
+
+    def spill(self):
+        for file_path, buffer in zip(self._file_paths, self._buffers):
+            if not buffer:
+                continue
+
+            with open(file_path, 'a') as file:
+                for key, values in buffer.items():
+                    if self._combiner:
+                        values = self._combiner(key, values, [])
+                    _write_records(file, ((key, value) for value in values))
+            buffer.clear()
+        self._buffered_count = 0
+
+
+def _run_map_task(task_id: int, map_input: MapInput, mapper: Callable, stage_dir: str, num_partitions: int,
+                  spill_size: int, combiner: Optional[Callable]):
+    writer = _PartitionWriter(stage_dir, task_id, num_partitions, spill_size, combiner)
+    if map_input.storage_provider:
+        input_file = map_input.storage_provider.open(map_input.path, 'r')
+    else:
+        input_file = open(map_input.path)
+
+    with input_file:
+        for key, value in mapper(input_file):
+            writer.add(key, value)
+    writer.spill()
+
+
+def _get_sorted_records(partition_dir: str, sort_buffer_size: int):
+    """Yields all the records of the partition ordered by key, sorting any that don't fit in the buffer on disk"""
+    run_paths = []
+    buffer = []
+    for record in _read_records(sorted(glob.glob(os.path.join(partition_dir, 'map_*.jsonl')))):
+        buffer.append(record)
+        if len(buffer) >= sort_buffer_size:
+            run_path = os.path.join(partition_dir, f'run_{len(run_paths)}.jsonl')
+            with open(run_path, 'w') as run_file:
+                _write_records(run_file, sorted(buffer, key=itemgetter(0)))
+            run_paths.append(run_path)
+            buffer = []
+
+    buffer.sort(key=itemgetter(0))
+    if not run_paths:
+        return iter(buffer)
+    return heapq.merge(*[_read_records([run_path]) for run_path in run_paths], buffer, key=itemgetter(0))
+
+
+def _run_reduce_task(partition_dir: str, reducer: Callable, output_path: str, sort_buffer_size: int):
+    with open(output_path, 'w') as output_file:
+        for key, records in groupby(_get_sorted_records(partition_dir, sort_buffer_size), key=itemgetter(0)):
+            for result in reducer(key, [value for _, value in records]) or []:
+                output_file.write(result)
+
+
+def reduce_hpo_date_metric_counts_to_bucket_rows(reducer_key, reducer_values):
+    """Emits the metrics bucket for a given hpoId + date as a line of JSON, to be written to SQL in batches"""
+    hpo_id, date, metrics_dict = get_hpo_date_metrics(reducer_key, reducer_values)
+    yield json.dumps({'hpo_id': hpo_id, 'date': date.strftime(DATE_FORMAT), 'metrics': metrics_dict}) + '\n'
+
+
+class LocalMapReduce:
+    def __init__(
+        self,
+        work_dir: str,
+        processes: int = None,
+        num_partitions: int = DEFAULT_NUM_PARTITIONS,
+        spill_size: int = MAP_SPILL_SIZE,
+        sort_buffer_size: int = REDUCE_SORT_BUFFER_SIZE
+    ):
+        """
+        :param work_dir: Directory for the files that are passed between stages
+        :param processes: Number of processes to run tasks with (defaults to the number of CPUs). Tasks are run
+            in the current process if this is 1.
+        :param num_partitions: Number of partitions (and reduce tasks) the map output is split into
+        :param spill_size: Number of records a map task holds in memory before writing them out
+        :param sort_buffer_size: Number of records a reduce task sorts in memory at once
+        """
+        self._work_dir = work_dir
+        self._processes = processes or os.cpu_count()
+        self._num_partitions = num_partitions
+        self._spill_size = spill_size
+        self._sort_buffer_size = sort_buffer_size
+
+    def run(self, name: str, inputs: List[MapInput], mapper: Callable, reducer: Callable,
+            combiner: Callable = None) -> List[MapInput]:
+        """
+        Runs a MapReduce over the input files.
+        :return: the output files of the reducers, to be used as the input of another MapReduce
+        """
+        stage_dir = os.path.join(self._work_dir, name)
+        partitions = range(self._num_partitions)
+        partition_dirs = [os.path.join(stage_dir, f'partition_{partition}') for partition in partitions]
+        for partition_dir in partition_dirs:
+            os.makedirs(partition_dir)
+        output_paths = [os.path.join(stage_dir, f'output_{partition}.txt') for partition in partitions]
+
+        logging.info(f'Mapping {len(inputs)} files for "{name}"')
+        self._run_tasks([
+            partial(
+                _run_map_task, task_id, map_input, mapper, stage_dir, self._num_partitions, self._spill_size, combiner
+            )
+            for task_id, map_input in enumerate(inputs)
+        ])
+
+        logging.info(f'Reducing {self._num_partitions} partitions for "{name}"')
+        self._run_tasks([
+            partial(_run_reduce_task, partition_dir, reducer, output_path, self._sort_buffer_size)
+            for partition_dir, output_path in zip(partition_dirs, output_paths)
+        ])
+
+        # The map output isn't needed once it has been reduced
+        for partition_dir in partition_dirs:
+            shutil.rmtree(partition_dir)
+        return [MapInput(storage_provider=None, path=output_path) for output_path in output_paths]
+
+    def _run_tasks(self, tasks: List[Callable]):
+        if self._processes > 1 and len(tasks) > 1:
+            # Forked processes would otherwise share the pooled database connections of this process
+            database_factory.get_database().get_engine().dispose()
+            with ProcessPoolExecutor(
+                max_workers=min(self._processes, len(tasks)),
+                mp_context=multiprocessing.get_context('fork')
+            ) as executor:
+                futures = [executor.submit(task) for task in tasks]
+                for future in futures:
+                    future.result()
+        else:
+            for task in tasks:
+                task()
+
+
+class LocalMetricsPipeline:
+    """Calculates metrics from the CSV files created by MetricsExport, storing them as a new metrics version"""
+
+    def __init__(
+        self,
+        storage_provider: StorageProvider,
+        input_files: List[str],
+        now,
+        work_dir: str = None,
+        delete_input_files: bool = True,
+        **map_reduce_kwargs
+    ):
+        """
+        :param storage_provider: Provider for reading (and afterwards deleting) the input files
+        :param input_files: Paths of the exported participant, hpo id and answer CSV files
+        :param now: Date and time the metrics are calculated up to
+        :param work_dir: Directory to create the temporary files in, defaults to the system's temp directory
+        :param map_reduce_kwargs: Any settings to pass on to LocalMapReduce
+        """
+        self._storage_provider = storage_provider
+        self._input_files = input_files
+        self._now = now
+        self._work_dir = work_dir
+        self._delete_input_files = delete_input_files
+        self._map_reduce_kwargs = map_reduce_kwargs
+        self._bucket_dao = MetricsBucketDao()
+
+    def run(self) -> int:
+        """
+        Runs the pipeline, setting the metrics version as complete (and deleting the old ones) if it succeeds.
+        :return: id of the new metrics version
+        """
+        metrics_version_dao = MetricsVersionDao()
+        version_id = metrics_version_dao.set_pipeline_in_progress()
+        try:
+            # Answers are mapped using the code cache. Loading it first means that any forked processes
+            # get a copy of it rather than each needing to load it from the database.
+            CodeDao().get_all()
+
+            with tempfile.TemporaryDirectory(dir=self._work_dir) as work_dir:
+                map_reduce = LocalMapReduce(work_dir, **self._map_reduce_kwargs)
+                participant_deltas = map_reduce.run(
+                    'process_input_csv',
+                    inputs=[MapInput(self._storage_provider, input_file) for input_file in self._input_files],
+                    mapper=map_csv_to_participant_and_date_metric,
+                    reducer=partial(reduce_participant_data_to_hpo_metric_date_deltas, now=self._now)
+                )
+                metric_counts = map_reduce.run(
+                    'calculate_counts',
+                    inputs=participant_deltas,
+                    mapper=map_hpo_metric_date_deltas_to_hpo_metric_key,
+                    combiner=combine_hpo_metric_date_deltas,
+                    reducer=partial(reduce_hpo_metric_date_deltas_to_all_date_counts, now=self._now)
+                )
+                bucket_rows = map_reduce.run(
+                    'group_buckets',
+                    inputs=metric_counts,
+                    mapper=map_hpo_metric_date_counts_to_hpo_date_key,
+                    reducer=reduce_hpo_date_metric_counts_to_bucket_rows
+                )
+                bucket_count = self._store_buckets(bucket_rows, version_id)
+        except Exception:
+            logging.info('Pipeline failed; setting current metrics version to incomplete.')
+            metrics_version_dao.set_pipeline_finished(False)
+            raise
+
+        logging.info(f'Stored {bucket_count} metrics buckets for version {version_id}')
+        metrics_version_dao.set_pipeline_finished(True)
+        metrics_version_dao.delete_old_versions()
+        if self._delete_input_files:
+            for input_file in self._input_files:
+                self._storage_provider.delete(input_file)
+
+        return version_id
+
+    def _store_buckets(self, bucket_row_files: List[MapInput], version_id: int) -> int:
+        bucket_count = 0
+        buckets = []
+        with self._bucket_dao.session() as session:
+            for bucket_row_file in bucket_row_files:
+                with open(bucket_row_file.path) as file:
+                    for line in file:
+                        row = json.loads(line)
+                        buckets.append(MetricsBucket(
+                            metricsVersionId=version_id,
+                            date=datetime.strptime(row['date'], DATE_FORMAT).date(),
+                            hpoId=row['hpo_id'],
+                            metrics=json.dumps(row['metrics'])
+                        ))
+                        if len(buckets) >= BUCKET_UPSERT_BATCH_SIZE:
+                            self._bucket_dao.upsert_all_with_session(session, buckets)
+                            session.commit()
+                            bucket_count += len(buckets)
+                            buckets = []
+
+            self._bucket_dao.upsert_all_with_session(session, buckets)
+            bucket_count += len(buckets)
+
+        return bucket_count
@@ -1,217 +1,160 @@
 import collections
 
-from sqlalchemy import text
-
 from rdr_service import clock
 from rdr_service.dao import database_factory
-from rdr_service.dao.database_utils import replace_years_old
+from rdr_service.dao.code_dao import CodeDao
 from rdr_service.dao.hpo_dao import HPODao
 from rdr_service.dao.metric_set_dao import AggregateMetricsDao, MetricSetDao
 from rdr_service.model.metric_set import AggregateMetrics, MetricSet
+from rdr_service.model.participant_summary import ParticipantSummary
 from rdr_service.participant_enums import (
     EnrollmentStatus,
     MetricSetType,
     MetricsKey,
     OrderStatus,
     PhysicalMeasurementsStatus,
-    QuestionnaireStatus,
     Race,
+    SelfReportedPhysicalMeasurementsStatus,
     TEST_EMAIL_PATTERN,
     TEST_HPO_NAME,
     WithdrawalStatus,
 )
 
 LIVE_METRIC_SET_ID = "public-agg.live"
+_SUMMARY_BATCH_SIZE = 1000
+
+
+def _questionnaire_metric(name, field_name):
+    """Returns a metrics aggregation tuple for the given key/questionnaire status field."""
+    return _SummaryAggregation(name, lambda summary, _: getattr(summary, field_name).name)
+
+
+def _get_enrollment_status_value(summary, _):
+    # Rewrite INTERESTED to CONSENTED, see note below.
+    if summary.enrollmentStatus == EnrollmentStatus.INTERESTED:
+        return "CONSENTED"
+    return summary.enrollmentStatus.name
+
+
+def _get_state_value(summary, aggregator):
+    state = aggregator.get_code_value(summary.stateId)
+    if state.startswith("PIIState_"):
+        return state[len("PIIState_"):]
+    return state
+
+
+def _get_age_range_value(summary, aggregator):
+    if summary.dateOfBirth is None:
+        return "UNSET"
+    # Matches the age calculated by the YEARS_OLD sql macro
+    years_old = (aggregator.today - summary.dateOfBirth).days // 365
+    if years_old < 0:
+        return "UNSET"
+    for max_age, age_range in _AGE_RANGES:
+        if years_old <= max_age:
+            return age_range
+    return "86+"
 
 
-def _questionnaire_metric(name, col):
-    """Returns a metrics SQL aggregation tuple for the given key/column."""
-    return _SqlAggregation(
-        name,
-        """
-      SELECT {col}, COUNT(*)
-      FROM participant_summary
-      WHERE {summary_filter_sql}
-      GROUP BY 1;
-      """.format(
-            col=col, summary_filter_sql=_SUMMARY_FILTER_SQL
-        ),
-        lambda v: QuestionnaireStatus.lookup_by_number(v).name,
-        None,
-    )
-
-
-_SUMMARY_FILTER_SQL = """
-(withdrawal_status = :not_withdrawn_status
- AND NOT participant_summary.email LIKE :test_email_pattern
- AND NOT participant_summary.hpo_id = :test_hpo_id)
-"""
-
-# Metrics SQL Aggregations. 4-tuples of:
+def _get_physical_measurements_value(summary, _):
+    if (
+        summary.clinicPhysicalMeasurementsStatus == PhysicalMeasurementsStatus.COMPLETED
+        or summary.selfReportedPhysicalMeasurementsStatus == SelfReportedPhysicalMeasurementsStatus.COMPLETED
+    ):
+        return PhysicalMeasurementsStatus.COMPLETED.name
+    return (summary.clinicPhysicalMeasurementsStatus or PhysicalMeasurementsStatus.UNSET).name
+
+
+def _get_biospecimen_value(summary, _):
+    if summary.biospecimenStatus in (None, OrderStatus.UNSET, OrderStatus.CREATED):
+        return "UNSET"
+    return "COLLECTED"
+
+
+_AGE_RANGES = [
+    (17, "0-17"),
+    (25, "18-25"),
+    (35, "26-35"),
+    (45, "36-45"),
+    (55, "46-55"),
+    (65, "56-65"),
+    (75, "66-75"),
+    (85, "76-85"),
+]
+
+# Participant summary fields needed to compute the aggregations
+_SUMMARY_FIELDS = [
+    ParticipantSummary.enrollmentStatus,
+    ParticipantSummary.genderIdentityId,
+    ParticipantSummary.race,
+    ParticipantSummary.stateId,
+    ParticipantSummary.dateOfBirth,
+    ParticipantSummary.clinicPhysicalMeasurementsStatus,
+    ParticipantSummary.selfReportedPhysicalMeasurementsStatus,
+    ParticipantSummary.biospecimenStatus,
+    ParticipantSummary.questionnaireOnOverallHealth,
+    ParticipantSummary.questionnaireOnLifestyle,
+    ParticipantSummary.questionnaireOnTheBasics,
+]
+
+# Metrics aggregations, computed from a single scan of participant_summary. 2-tuples of:
 # - (MetricsKey) key: aggregation key
-# - (str) sql: statement to select value, count for a metric (in that order)
-# - (func(str): str) valuef: optional function which takes the value from the
-#   above SQL output and converts it for presentation
-# - (dict) params: optional extra SQL parameters to bind
-_SqlAggregation = collections.namedtuple("_SqlAggregation", ["key", "sql", "valuef", "params"])
+# - (func(summary, _SummaryAggregator): str) valuef: function giving the value that the
+#   participant summary is counted under for the aggregation
+_SummaryAggregation = collections.namedtuple("_SummaryAggregation", ["key", "valuef"])
 
 
 # Note that we depend on the participant_summary table containing only consented
 # participants, by definition. Therefore these metrics only cover consented
 # individuals.
-_SQL_AGGREGATIONS = [
-    _SqlAggregation(
-        MetricsKey.ENROLLMENT_STATUS,
-        """
-      SELECT enrollment_status, COUNT(*)
-      FROM participant_summary
-      WHERE {summary_filter_sql}
-      GROUP BY 1;
-      """.format(
-            summary_filter_sql=_SUMMARY_FILTER_SQL
-        ),
-        # Rewrite INTERESTED to CONSENTED, see note above.
-        lambda v: (
-            "CONSENTED" if v is EnrollmentStatus.INTERESTED.number else EnrollmentStatus.lookup_by_number(v).name
-        ),
-        None,
-    ),
+_SUMMARY_AGGREGATIONS = [
+    _SummaryAggregation(MetricsKey.ENROLLMENT_STATUS, _get_enrollment_status_value),
     # TODO(calbach): Verify whether we need to be conditionally trimming these
     # prefixes or leaving them unmodified. Unclear if all codes will have prefix
     # "PMI_".
-    _SqlAggregation(
-        MetricsKey.GENDER,
-        """
-      SELECT
-        CASE
-         WHEN code.value IS NULL THEN 'UNSET'
-         ELSE code.value
-        END, ps.count
-      FROM (
-       SELECT gender_identity_id, COUNT(*) count
-       FROM participant_summary
-       WHERE {summary_filter_sql}
-       GROUP BY 1
-      ) ps LEFT JOIN code
-      ON ps.gender_identity_id = code.code_id;
-      """.format(
-            summary_filter_sql=_SUMMARY_FILTER_SQL
-        ),
-        None,
-        None,
-    ),
-    _SqlAggregation(
-        MetricsKey.RACE,
-        """
-      SELECT
-        CASE
-         WHEN race IS NULL THEN 0
-         ELSE race
-        END, COUNT(*)
-      FROM participant_summary
-      WHERE {summary_filter_sql}
-      GROUP BY 1
-      """.format(
-            summary_filter_sql=_SUMMARY_FILTER_SQL
-        ),
-        lambda v: Race.lookup_by_number(v).name,
-        None,
-    ),
-    _SqlAggregation(
-        MetricsKey.STATE,
-        """
-      SELECT
-        CASE
-         WHEN code.value IS NULL THEN 'UNSET'
-         WHEN code.value LIKE 'PIIState_%' THEN SUBSTR(code.value, LENGTH('PIIState_')+1)
-         ELSE code.value
-        END,
-        ps.count
-      FROM (
-       SELECT state_id, COUNT(*) count
-       FROM participant_summary
-       WHERE {summary_filter_sql}
-       GROUP BY 1
-      ) ps LEFT JOIN code
-      ON ps.state_id = code.code_id;
-      """.format(
-            summary_filter_sql=_SUMMARY_FILTER_SQL
-        ),
-        None,
-        None,
-    ),
-    _SqlAggregation(
-        MetricsKey.AGE_RANGE,
-        """
-      SELECT
-        CASE
-         WHEN date_of_birth IS NULL THEN 'UNSET'
-         WHEN YEARS_OLD[:now, date_of_birth] < 0 THEN 'UNSET'
-         WHEN YEARS_OLD[:now, date_of_birth] <= 17 THEN '0-17'
-         WHEN YEARS_OLD[:now, date_of_birth] <= 25 THEN '18-25'
-         WHEN YEARS_OLD[:now, date_of_birth] <= 35 THEN '26-35'
-         WHEN YEARS_OLD[:now, date_of_birth] <= 45 THEN '36-45'
-         WHEN YEARS_OLD[:now, date_of_birth] <= 55 THEN '46-55'
-         WHEN YEARS_OLD[:now, date_of_birth] <= 65 THEN '56-65'
-         WHEN YEARS_OLD[:now, date_of_birth] <= 75 THEN '66-75'
-         WHEN YEARS_OLD[:now, date_of_birth] <= 85 THEN '76-85'
-         ELSE '86+'
-        END age_range,
-        COUNT(*)
-      FROM participant_summary
-      WHERE {summary_filter_sql}
-      GROUP BY 1;
-      """.format(
-            summary_filter_sql=_SUMMARY_FILTER_SQL
-        ),
-        None,
-        None,
-    ),
-    _SqlAggregation(
-        MetricsKey.PHYSICAL_MEASUREMENTS,
-        """
-      SELECT
-        IF(clinic_physical_measurements_status = 1 OR self_reported_physical_measurements_status = 1, 1,
-        clinic_physical_measurements_status) physical_measurements_status,
-        COUNT(*)
-      FROM participant_summary
-      WHERE {summary_filter_sql}
-      GROUP BY 1;
-      """.format(
-            summary_filter_sql=_SUMMARY_FILTER_SQL
-        ),
-        lambda v: PhysicalMeasurementsStatus.lookup_by_number(v).name,
-        None,
-    ),
-    _SqlAggregation(
-        MetricsKey.BIOSPECIMEN_SAMPLES,
-        """
-      SELECT
-        CASE
-         WHEN biospecimen_status IS NULL THEN 'UNSET'
-         WHEN biospecimen_status = :unset_status THEN 'UNSET'
-         WHEN biospecimen_status = :created_status THEN 'UNSET'
-         ELSE 'COLLECTED'
-        END, COUNT(*)
-      FROM participant_summary
-      WHERE {summary_filter_sql}
-      GROUP BY 1;
-      """.format(
-            summary_filter_sql=_SUMMARY_FILTER_SQL
-        ),
-        None,
-        params={"unset_status": OrderStatus.UNSET.number, "created_status": OrderStatus.CREATED.number},
+    _SummaryAggregation(
+        MetricsKey.GENDER, lambda summary, aggregator: aggregator.get_code_value(summary.genderIdentityId)
     ),
+    _SummaryAggregation(MetricsKey.RACE, lambda summary, _: (summary.race or Race.UNSET).name),
+    _SummaryAggregation(MetricsKey.STATE, _get_state_value),
+    _SummaryAggregation(MetricsKey.AGE_RANGE, _get_age_range_value),
+    _SummaryAggregation(MetricsKey.PHYSICAL_MEASUREMENTS, _get_physical_measurements_value),
+    _SummaryAggregation(MetricsKey.BIOSPECIMEN_SAMPLES, _get_biospecimen_value),
     # TODO(calbach): Add healthcare_access, medical_history, medications,
     # family_health once available.
-    _questionnaire_metric(MetricsKey.QUESTIONNAIRE_ON_OVERALL_HEALTH, "questionnaire_on_overall_health"),
+    _questionnaire_metric(MetricsKey.QUESTIONNAIRE_ON_OVERALL_HEALTH, "questionnaireOnOverallHealth"),
     # Personal habits is a newer naming for lifestyle
-    _questionnaire_metric(MetricsKey.QUESTIONNAIRE_ON_PERSONAL_HABITS, "questionnaire_on_lifestyle"),
+    _questionnaire_metric(MetricsKey.QUESTIONNAIRE_ON_PERSONAL_HABITS, "questionnaireOnLifestyle"),
     # Sociodemographics is a newer naming for 'the basics'
-    _questionnaire_metric(MetricsKey.QUESTIONNAIRE_ON_SOCIODEMOGRAPHICS, "questionnaire_on_the_basics"),
+    _questionnaire_metric(MetricsKey.QUESTIONNAIRE_ON_SOCIODEMOGRAPHICS, "questionnaireOnTheBasics"),
 ]
 
 
+class _SummaryAggregator(object):
+    """Counts the values of every aggregation as participant summaries are added."""
+
+    def __init__(self, now):
+        self.today = now.date()
+        self._code_dao = CodeDao()
+        self._counts = collections.OrderedDict(
+            (aggregation.key, collections.Counter()) for aggregation in _SUMMARY_AGGREGATIONS
+        )
+
+    def get_code_value(self, code_id):
+        code = self._code_dao.get(code_id) if code_id is not None else None
+        return code.value if code else "UNSET"
+
+    def add(self, summary):
+        for aggregation in _SUMMARY_AGGREGATIONS:
+            self._counts[aggregation.key][aggregation.valuef(summary, self)] += 1
+
+    def get_results(self):
+        return {
+            key: [{"value": value, "count": count} for value, count in value_counts.items()]
+            for key, value_counts in self._counts.items()
+        }
+
+
 class PublicMetricsExport(object):
     """Exports data from the database needed to generate public registration metrics."""
 
@@ -221,31 +164,21 @@ class PublicMetricsExport(object):
 
     @staticmethod
     def _compute():
-        out = {}
+        now = clock.CLOCK.now()
+        test_hpo = HPODao().get_by_name(TEST_HPO_NAME)
+        aggregator = _SummaryAggregator(now)
         # Using a session here should put all following SQL invocations into a
         # non-locking read transaction per
         # https://dev.mysql.com/doc/refman/5.7/en/innodb-consistent-read.html
-        now = clock.CLOCK.now()
-        test_hpo = HPODao().get_by_name(TEST_HPO_NAME)
         with database_factory.make_server_cursor_database().session() as session:
-            for (key, sql, valuef, params) in _SQL_AGGREGATIONS:
-                sql = replace_years_old(sql)
-                out[key] = []
-                p = {
-                    "now": now,
-                    "test_hpo_id": test_hpo.hpoId,
-                    "test_email_pattern": TEST_EMAIL_PATTERN,
-                    "not_withdrawn_status": WithdrawalStatus.NOT_WITHDRAWN.number,
-                }
-                if params:
-                    p.update(params)
-                result = session.execute(text(sql), params=p)
-                for row in result:
-                    v = list(row.items())[0][1]
-                    if valuef:
-                        v = valuef(v)
-                    out[key].append({"value": v, "count": list(row.items())[1][1]})
-        return out
+            summaries = session.query(*_SUMMARY_FIELDS).filter(
+                ParticipantSummary.withdrawalStatus == WithdrawalStatus.NOT_WITHDRAWN,
+                ParticipantSummary.email.notlike(TEST_EMAIL_PATTERN),
+                ParticipantSummary.hpoId != test_hpo.hpoId
+            ).yield_per(_SUMMARY_BATCH_SIZE)
+            for summary in summaries:
+                aggregator.add(summary)
+        return aggregator.get_results()
 
     @staticmethod
     def _save(metric_set_id, metrics):
@@ -257,15 +190,20 @@ class PublicMetricsExport(object):
         db = database_factory.get_generic_database()
 
         def save(session):
-            aggs = []
             MetricSetDao().upsert_with_session(session, ms)
-            agg_dao = AggregateMetricsDao()
-            agg_dao.delete_all_for_metric_set_with_session(session, metric_set_id)
-            for (k, vals) in metrics.items():
-                for v in vals:
-                    agg = AggregateMetrics(metricSetId=metric_set_id, metricsKey=k, value=v["value"], count=v["count"])
-                    agg_dao.insert_with_session(session, agg)
-                    aggs.append(agg)
+            AggregateMetricsDao().delete_all_for_metric_set_with_session(session, metric_set_id)
+            aggs = [
+                AggregateMetrics(metricSetId=metric_set_id, metricsKey=k, value=v["value"], count=v["count"])
+                for (k, vals) in metrics.items()
+                for v in vals
+            ]
+            if aggs:
+                # All the aggregations are stored with a single multi-row insert
+                session.execute(AggregateMetrics.__table__.insert().values([
+                    {"metric_set_id": agg.metricSetId, "metrics_key": agg.metricsKey, "value": agg.value,
+                     "count": agg.count}
+                    for agg in aggs
+                ]))
             return aggs
 
         return db.autoretry(save)
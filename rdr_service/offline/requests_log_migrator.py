@@ -1,16 +1,131 @@
-from sqlalchemy import func
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import MetaData, func, select
 from sqlalchemy.engine.url import make_url
-from sqlalchemy.orm import make_transient
-from typing import List
+from typing import Any, Callable, Dict, List, Optional
 
 from rdr_service.config import get_db_config
 from rdr_service.dao import database_factory
+from rdr_service.dao.database_utils import NamedLock
 from rdr_service.model.database import Database
 from rdr_service.model.requests_log import RequestsLog
 
 
+ARCHIVE_BATCH_SIZE = 500
+ARCHIVE_LOCK_NAME = 'rdr.requests_log_archive'
+
+
+class RequestsLogArchiveTarget:
+    """A database that request logs are copied to, and the name of the table that holds them there"""
+
+    def __init__(self, instance_name, table_name, database: Database = None):
+        self.instance_name = instance_name
+        # Each target gets its own copy of the table definition, so the shared RequestsLog model is never changed
+        self.table = RequestsLog.__table__.tometadata(MetaData(), name=table_name)
+        self._database = database
+
+    @property
+    def database(self) -> Database:
+        if self._database is None:
+            self._database = RequestsLogMigrator.get_database_connection(self.instance_name)
+        return self._database
+
+    def get_high_watermark(self) -> Optional[int]:
+        """Returns the id of the newest request log that has been copied to the target"""
+        with self.database.session() as session:
+            return session.query(func.max(self.table.c.id)).scalar()
+
+    def has_log(self, log_id) -> bool:
+        with self.database.session() as session:
+            return session.query(self.table.c.id).filter(self.table.c.id == log_id).first() is not None
+
+    def store_logs(self, log_rows: List[dict]):
+        """Copy the request logs to the target, replacing any that it already has"""
+        if not log_rows:
+            return
+
+        with self.database.session() as session:
+            session.execute(self.table.delete().where(self.table.c.id.in_([row['id'] for row in log_rows])))
+            session.execute(self.table.insert().values(log_rows))
+
+
+class RequestsLogArchiver:
+    """Copies request logs to one or more archive databases, a batch at a time"""
+
+    def __init__(self, targets: List[RequestsLogArchiveTarget], source_database: Database = None,
+                 batch_size=ARCHIVE_BATCH_SIZE):
+        self.targets = targets
+        self.batch_size = batch_size
+        self._source_database = source_database or database_factory.get_database()
+        self._executor = None
+
+    def archive_log(self, log_id):
+        """
+        Make sure the request log has been copied to the targets. Any logs newer than what the targets have are
+        copied with it in batches, so most calls find that their log was already copied by an earlier one.
+        """
+        with self._source_database.session() as lock_session, NamedLock(ARCHIVE_LOCK_NAME, lock_session):
+            watermarks = self._map_targets(lambda target: target.get_high_watermark())
+            if any(watermark is None or watermark < log_id for watermark in watermarks.values()):
+                self.archive_logs(watermarks)
+
+            # Logs get their ids before they're committed, so a batch could have passed this log before it existed
+            has_log = self._map_targets(lambda target: target.has_log(log_id))
+            missing_targets = [target for target, target_has_log in has_log.items() if not target_has_log]
+            if missing_targets:
+                log_rows = self._load_log_rows(after_id=log_id - 1, through_id=log_id)
+                for target in missing_targets:
+                    target.store_logs(log_rows)
+
+    def archive_logs(self, watermarks: Dict[RequestsLogArchiveTarget, Optional[int]] = None):
+        """Copy the request logs that are newer than what each target already has"""
+        if watermarks is None:
+            watermarks = self._map_targets(lambda target: target.get_high_watermark())
+
+        last_archived_id = None
+        if all(watermark is not None for watermark in watermarks.values()):
+            last_archived_id = min(watermarks.values())
+
+        while True:  # Archive batches until caught up
+            log_rows = self._load_log_rows(after_id=last_archived_id)
+            self._map_targets(lambda target: target.store_logs([
+                row for row in log_rows
+                if watermarks[target] is None or row['id'] > watermarks[target]
+            ]))
+
+            if len(log_rows) < self.batch_size:
+                # End the loop if we didn't retrieve a full batch.
+                # Note: There's a chance that we could get stuck in an infinite loop of checking for
+                #       more if we only end when there's nothing
+                break
+            else:
+                last_archived_id = log_rows[-1]['id']
+
+    def _load_log_rows(self, after_id, through_id=None) -> List[dict]:
+        source_table = RequestsLog.__table__
+        query = select([source_table]).order_by(source_table.c.id).limit(self.batch_size)
+        if after_id is not None:
+            query = query.where(source_table.c.id > after_id)
+        if through_id is not None:
+            query = query.where(source_table.c.id <= through_id)
+
+        with self._source_database.session() as session:
+            return [dict(row) for row in session.execute(query)]
+
+    def _map_targets(self, function: Callable[[RequestsLogArchiveTarget], Any]) -> Dict[RequestsLogArchiveTarget, Any]:
+        """Runs the function for each of the targets at the same time"""
+        if len(self.targets) == 1:
+            return {self.targets[0]: function(self.targets[0])}
+
+        # The thread pool is kept for the life of the archiver rather than started for each call
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=len(self.targets))
+        return dict(zip(self.targets, self._executor.map(function, self.targets)))
+
+
 class RequestsLogMigrator:
-    def __init__(self, target_instance_name, batch_size=500):
+    _task_archiver = None
+
+    def __init__(self, target_instance_name, batch_size=ARCHIVE_BATCH_SIZE):
         self.target_instance_name = target_instance_name
         self.source_table_name = RequestsLog.__tablename__
         self.target_table_name = f'{self.source_table_name}_cron'
@@ -18,77 +133,27 @@ class RequestsLogMigrator:
 
     @classmethod
     def archive_log(cls, log_id):
-        source_table_name = RequestsLog.__tablename__
-        archive_table_name = f'{source_table_name}_task'
-
-        try:
-            # Get the request log that needs archived
-            database_connection = database_factory.get_database()
-            with database_connection.session() as source_session:
-                request_log = source_session.query(RequestsLog).filter(RequestsLog.id == log_id).one()
-
-            # Setting table name to what it is in the archive databases
-            RequestsLog.__table__.name = archive_table_name
-
-            make_transient(request_log)
-            postgresql_connection = cls._get_database_connection('rdrpostgresql')
-            with postgresql_connection.session() as postgresql_session:
-                postgresql_session.merge(request_log)
-
-            make_transient(request_log)
-            mysql8_connection = cls._get_database_connection('rdrmysql8')
-            with mysql8_connection.session() as mysql8_session:
-                mysql8_session.merge(request_log)
-
-        finally:
-            # Setting table name back to what it originally was
-            RequestsLog.__table__.name = source_table_name
+        """
+        Make sure the request log has been copied to the archive databases. The archiver is reused between
+        tasks so that the connections to the archive databases are only set up once for each instance.
+        """
+        if cls._task_archiver is None:
+            archive_table_name = f'{RequestsLog.__tablename__}_task'
+            cls._task_archiver = RequestsLogArchiver(targets=[
+                RequestsLogArchiveTarget('rdrpostgresql', archive_table_name),
+                RequestsLogArchiveTarget('rdrmysql8', archive_table_name)
+            ])
+        cls._task_archiver.archive_log(log_id)
 
     def migrate_latest_requests_logs(self):
-        migration_target_connection = self._get_database_connection(self.target_instance_name)
-
-        with migration_target_connection.session() as target_session:
-            # Find the last request log id that was migrated
-            RequestsLog.__table__.name = self.target_table_name
-            last_migrated_log_id = target_session.query(func.max(RequestsLog.id)).scalar()
-
-            # Get all the new request logs that need to be migrated
-            database_connection = database_factory.get_database()
-            with database_connection.session() as source_session:
-                while True:  # Migrate batches until caught up
-                    requests_logs = self._load_request_logs(
-                        last_migrated_id=last_migrated_log_id,
-                        session=source_session
-                    )
-                    self._migrate_request_logs(requests_logs, session=target_session)
-
-                    if len(requests_logs) < self.batch_size:
-                        # End the loop if we didn't retrieve a full batch.
-                        # Note: There's a chance that we could get stuck in an infinite loop of checking for
-                        #       more if we only end when there's nothing
-                        break
-                    else:
-                        last_migrated_log_id = requests_logs[-1].id
-
-    def _load_request_logs(self, last_migrated_id, session):
-        RequestsLog.__table__.name = self.source_table_name
-
-        query = session.query(RequestsLog).order_by(RequestsLog.id)
-        if last_migrated_id is not None:
-            query = query.filter(RequestsLog.id > last_migrated_id)
-
-        return query.limit(self.batch_size).all()
-
-    def _migrate_request_logs(self, request_logs: List[RequestsLog], session):
-        for log in request_logs:
-            # Get the request_logs objects ready to upload to the new database
-            make_transient(log)
-
-        RequestsLog.__table__.name = self.target_table_name
-        session.bulk_save_objects(request_logs)
+        archiver = RequestsLogArchiver(
+            targets=[RequestsLogArchiveTarget(self.target_instance_name, self.target_table_name)],
+            batch_size=self.batch_size
+        )
+        archiver.archive_logs()
 
     @classmethod
-    def _get_database_connection(cls, target_instance_name):
+    def get_database_connection(cls, target_instance_name):
         is_connecting_to_mysql = 'mysql' in target_instance_name
 
         db_config = get_db_config()
@@ -1,4 +1,5 @@
-from collections import defaultdict
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import logging
 from typing import Dict, List
@@ -6,15 +7,22 @@ from typing import Dict, List
 from sqlalchemy.orm import joinedload, Session
 
 from rdr_service import clock
-from rdr_service.domain_model.response import Response
+from rdr_service.dao.database_factory import get_database
+from rdr_service.domain_model.response import ParticipantResponses, Response
 from rdr_service.model.code import Code
 from rdr_service.model.ppi_validation_errors import PpiValidationErrors
 from rdr_service.model.ppi_validation_result import PpiValidationResults
+from rdr_service.model.questionnaire_response import QuestionnaireResponse
 from rdr_service.model.survey import Survey, SurveyQuestion, SurveyQuestionOption
 from rdr_service.repository.questionnaire_response_repository import QuestionnaireResponseRepository
 from rdr_service.services.response_validation.validation import BranchParsingError, ResponseValidator
 from rdr_service.services.slack_utils import SlackMessageHandler
 from rdr_service.dao.ppi_validation_errors_dao import PpiValidationErrorsDao
+from rdr_service.services.system_utils import list_chunks
+
+PARTICIPANT_CHUNK_SIZE = 500
+RESULT_INSERT_BATCH_SIZE = 1000
+MAX_LOADING_WORKERS = 4
 
 
 class ResponseValidationController:
@@ -23,33 +31,107 @@ class ResponseValidationController:
         session: Session,
         validation_errors_dao: PpiValidationErrorsDao,
         since_date: datetime,
-        slack_webhook=None
+        slack_webhook=None,
+        participant_chunk_size: int = PARTICIPANT_CHUNK_SIZE,
+        max_loading_workers: int = MAX_LOADING_WORKERS
     ):
+        """
+        :param participant_chunk_size: Number of participants to load responses for at a time
+        :param max_loading_workers: Number of threads loading chunks of responses while earlier chunks are
+            validated. Chunks are loaded with the controller's session if this is less than 2.
+        """
         self._session = session
         self._since_date = since_date
         self._result_list: List[PpiValidationResults] = []
         self._slack_webhook = slack_webhook
         self._summarize_results = slack_webhook is not None
+        self._participant_chunk_size = participant_chunk_size
+        self._max_loading_workers = max_loading_workers
 
         self._response_validator_map: Dict[str, ResponseValidator] = {}
         self.validation_errors_dao = validation_errors_dao
+        self._error_counts = defaultdict(lambda: 0)
+        self._error_list: List[PpiValidationErrors] = []
 
     def run_validation(self):
-        response_list = QuestionnaireResponseRepository.get_responses_to_surveys(
-            session=self._session,
+        """
+        Validate the responses received since the start date, a chunk of participants at a time. Loading
+        the responses (the slow part) is done by a pool of threads, while the chunks are validated in order
+        on this thread so that each survey's validator is only built once. Results are written to the
+        database in batches, so only a few chunks of responses and results are held in memory at once.
+        """
+        self._error_counts.clear()
+        self._error_list = []
+
+        participant_id_chunks = list_chunks(self._get_participant_ids(), self._participant_chunk_size)
+        for participant_response_map in self._load_response_chunks(participant_id_chunks):
+            for participant_id, participant_responses in participant_response_map.items():
+                for response in participant_responses.responses.values():
+                    try:
+                        self._check_response(response, participant_id=participant_id)
+                    except BranchParsingError:
+                        logging.error(f'Error parsing branching logic for {response.survey_code}', exc_info=True)
+
+            if len(self._result_list) >= RESULT_INSERT_BATCH_SIZE:
+                self._flush_results()
+        self._flush_results()
+
+        self._output_results()
+
+    def _get_participant_ids(self) -> List[int]:
+        query = self._session.query(
+            QuestionnaireResponse.participantId
+        ).with_hint(
+            QuestionnaireResponse,
+            'USE INDEX (idx_created_q_id)'
+        ).filter(
+            QuestionnaireResponse.created >= self._since_date,
+            # The Questionnaire id needs to be referenced to use the index that has the created date
+            QuestionnaireResponse.questionnaireId > 0
+        ).distinct()
+        return sorted(participant_id for participant_id, in query.all())
+
+    def _load_response_chunks(self, participant_id_chunks):
+        """Yield the responses for each chunk of participants, loading a few chunks ahead in other threads"""
+        if self._max_loading_workers < 2:
+            for participant_ids in participant_id_chunks:
+                yield self._load_responses(self._session, participant_ids)
+            return
+
+        with ThreadPoolExecutor(max_workers=self._max_loading_workers) as executor:
+            pending_chunks = deque()
+            for participant_ids in participant_id_chunks:
+                pending_chunks.append(executor.submit(self._load_responses_with_new_session, participant_ids))
+                if len(pending_chunks) >= self._max_loading_workers:
+                    yield pending_chunks.popleft().result()
+            while pending_chunks:
+                yield pending_chunks.popleft().result()
+
+    def _load_responses_with_new_session(self, participant_ids) -> Dict[int, ParticipantResponses]:
+        # Sessions can't be shared between threads
+        with get_database().session() as session:
+            return self._load_responses(session, participant_ids)
+
+    def _load_responses(self, session, participant_ids) -> Dict[int, ParticipantResponses]:
+        return QuestionnaireResponseRepository.get_responses_to_surveys(
+            session=session,
+            participant_ids=participant_ids,
             created_start_datetime=self._since_date
         )
-        for participant_id, participant_responses in response_list.items():
-            for response in participant_responses.responses.values():
-                try:
-                    self._check_response(response, participant_id=participant_id)
-                except BranchParsingError:
-                    logging.error(f'Error parsing branching logic for {response.survey_code}', exc_info=True)
 
+    def _flush_results(self):
         # Insert data into PPI validation table if offline job is running
-        if self._summarize_results:
+        if self._summarize_results and self._result_list:
             self._insert_data()
-        self._output_results()
+            self._session.flush()
+
+        for result in self._result_list:
+            for error in result.errors:
+                if self._summarize_results:
+                    self._error_counts[(error.survey_code_value, error.question_code, error.error_str)] += 1
+                else:
+                    self._error_list.append(error)
+        self._result_list = []
 
     def _check_response(self, response: Response, participant_id):
         # look at the response map, use validator if it's there, build it if it's not
@@ -109,34 +191,25 @@ class ResponseValidationController:
             return None
 
     def _output_results(self):
-        if not any(result.errors for result in self._result_list):
+        if not self._error_counts and not self._error_list:
             self._output_result(f'No validation errors were found since {self._since_date}')
             return
 
         result_text = f'Validation errors for survey responses received since {self._since_date.date()}\n'
         result_list = []
         if self._summarize_results:
-            error_counts = defaultdict(lambda: 0)
-
-            # Condense the list into the number of times a specific error string was seen for a question in a survey
-            for result in self._result_list:
-                for error in result.errors:
-                    error: PpiValidationErrors = error
-                    error_counts[(error.survey_code_value, error.question_code, error.error_str)] += 1
-
-            for error_info, count in error_counts.items():
+            # The number of times a specific error string was seen for a question in a survey
+            for error_info, count in self._error_counts.items():
                 survey_code, question_code, error_str = error_info
                 result_list.append(
                     f'{survey_code} "{question_code}" Error: {error_str}, number affected answers: {count}'
                 )
         else:
-            for error_list in self._error_list.values():
-                for error in error_list:
-                    result_list.append(error)
-                    result_list.append(
-                        f'{error.survey_code_value} - question "{error.question_code}" Error: {error.error_str} '
-                        f'(P{error.participant_id}, ansID {error.questionnaire_response_answer_id})'
-                    )
+            for error in self._error_list:
+                result_list.append(
+                    f'{error.survey_code_value} - question "{error.question_code}" Error: {error.error_str} '
+                    f'(P{error.participant_id}, ansID {error.questionnaire_response_answer_id})'
+                )
 
         result_text += '\n'.join(sorted(result_list))
         self._output_result(result_text)
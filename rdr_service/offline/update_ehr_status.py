@@ -1,4 +1,3 @@
-from datetime import datetime, timedelta
 import logging
 import math
 from typing import List
@@ -142,10 +141,8 @@ def _track_historical_participant_ehr_data(session, file_list: List[ParticipantE
 
 
 def update_participant_summaries_from_job(job, project_id=GAE_PROJECT):
-    job_start_time = datetime.utcnow()
-
     # record which participants have the current flags set,
-    # so we can update PDR with the ones that don't have it set later
+    # so we can clear the flags (and update PDR) for the ones that no longer have files in the view
     summary_dao = ParticipantSummaryDao()
     hpo_ehr_tracking = ParticipantEhrTracking(
         summary_dao.get_participant_ids_with_hpo_ehr_data_available()
@@ -154,13 +151,11 @@ def update_participant_summaries_from_job(job, project_id=GAE_PROJECT):
         summary_dao.get_participant_ids_with_mediated_ehr_data_available()
     )
 
-    # clear the current flags in the db (they'll get set again if they still have files, otherwise they'll remain unset)
-    summary_dao.prepare_for_ehr_status_update()
-
     batch_size = 100
     for i, page in enumerate(job):
         LOG.info("Processing page {} of results...".format(i))
         hpo_ehr_tracking.clear_batch_list()
+        ce_ehr_tracking.clear_batch_list()
         participant_ids_to_rebuild = set()
 
         with summary_dao.session() as session:
@@ -180,27 +175,16 @@ def update_participant_summaries_from_job(job, project_id=GAE_PROJECT):
             ce_files_in_batch = ce_ehr_tracking.get_batch_list()
             _track_historical_participant_ehr_data(session, hpo_files_in_batch + ce_files_in_batch)
 
-            hpo_update_count = summary_dao.bulk_update_hpo_ehr_status_with_session(session, hpo_files_in_batch)
-            ce_update_count = summary_dao.bulk_update_mediated_ehr_status_with_session(session, ce_files_in_batch)
+            # Only the participants that end up with different ehr data are updated
+            hpo_updated_ids = summary_dao.bulk_update_hpo_ehr_status_with_session(session, hpo_files_in_batch)
+            ce_updated_ids = summary_dao.bulk_update_mediated_ehr_status_with_session(session, ce_files_in_batch)
 
             session.commit()
 
-            total_rows = hpo_update_count + ce_update_count
-            LOG.info("Affected {} rows.".format(total_rows))
-
-            if total_rows > 0:
-                # Rebuild participants in the page that have new data available. Checking that the participant
-                #  ehr receipts were created since the job started (offsetting by an hour to account for any
-                #  difference between server times)
-                participant_ids_in_page = [record.participant_id for record in hpo_files_in_batch]
-                new_ehr_data_results = session.query(ParticipantEhrReceipt.participantId).filter(
-                    ParticipantEhrReceipt.firstSeen >= job_start_time - timedelta(hours=1),
-                    ParticipantEhrReceipt.participantId.in_(participant_ids_in_page)
-                ).all()
-                # TODO: only get the participants that actually changed
+            LOG.info("Affected {} rows.".format(len(hpo_updated_ids) + len(ce_updated_ids)))
 
-                participant_ids_with_new_ehr_data = [row.participantId for row in new_ehr_data_results]
-                participant_ids_to_rebuild.update(participant_ids_with_new_ehr_data)
+            # Rebuild participants in the page that have new data available
+            participant_ids_to_rebuild.update(hpo_updated_ids)
 
             participants_with_new_files = (
                 hpo_ehr_tracking.get_participants_with_new_files()
@@ -224,9 +208,14 @@ def update_participant_summaries_from_job(job, project_id=GAE_PROJECT):
             for participant_id in participant_ids_to_rebuild:
                 dispatch_task(endpoint='update_retention_status', payload={'participant_id': participant_id})
 
-    # Rebuild any participants that had the "current" flag set before, but don't now
-    # (because they didn't have a file today)
+    # Clear the "current" flags of any participants that had them set before, but don't have files in the view now
     participant_ids_that_previously_had_ehr = hpo_ehr_tracking.get_participants_no_longer_current()
+    summary_dao.clear_ehr_data_available(
+        participant_ids=participant_ids_that_previously_had_ehr,
+        mediated_participant_ids=ce_ehr_tracking.get_participants_no_longer_current()
+    )
+
+    # Rebuild the participants that no longer have hpo files
     LOG.info(f'Rebuilding {len(participant_ids_that_previously_had_ehr)} '
              f'participants that no longer appear in the view')
     create_rebuild_tasks_for_participants(participant_ids_that_previously_had_ehr, batch_size, project_id, summary_dao)
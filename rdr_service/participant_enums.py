@@ -781,6 +781,15 @@ class WorkbenchWorkspaceUserRole(messages.Enum):
     OWNER = 3
 
 
+class WorkbenchWorkspaceSearchField(messages.Enum):
+    """Text of a workspace that can be searched in the research projects directory"""
+
+    UNSET = 0
+    NAME = 1
+    INTEND_TO_STUDY = 2
+    OWNER_NAME = 3
+
+
 class WorkbenchInstitutionNonAcademic(messages.Enum):
     """Workbench Institution enum"""
 
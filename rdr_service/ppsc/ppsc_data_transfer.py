@@ -2,35 +2,56 @@ import logging
 import json
 import requests
 from abc import ABC, abstractmethod
-from typing import Union
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Union
+
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 from rdr_service import clock
 from rdr_service.dao.ppsc_dao import PPSCDataTransferEndpointDao, PPSCDataTransferBaseDao, PPSCDataTransferRecordDao
 from rdr_service.ppsc.ppsc_enums import DataSyncTransferType, AuthType
 from rdr_service.ppsc.ppsc_oauth import PPSCTransferOauth
 from rdr_service.model.ppsc_data_transfer import PPSCCore, PPSCBiobankSample, PPSCHealthData, PPSCEHR, PPSCDataBase
+from rdr_service.services.system_utils import list_chunks
+
+MAX_TRANSFER_WORKERS = 8
+RECORD_INSERT_BATCH_SIZE = 500
+MAX_SEND_RETRIES = 3
+RETRY_BACKOFF_FACTOR = 1
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
 
 
 class BaseDataTransfer(ABC):
 
-    def __init__(self):
+    def __init__(self, max_workers: int = MAX_TRANSFER_WORKERS, record_batch_size: int = RECORD_INSERT_BATCH_SIZE):
         self.endpoint_dao = PPSCDataTransferEndpointDao()
         self.transfer_record_dao = PPSCDataTransferRecordDao()
+        self.max_workers = max_workers
+        self.record_batch_size = record_batch_size
+        self.http_session = None
+        self.items_per_request = 1
+        # audit records that haven't been written to the database yet
         self.record_items = []
+        self.recorded_count = 0
+        self.failed_count = 0
 
     def __enter__(self):
         self.ppsc_oauth_data = PPSCTransferOauth(auth_type=AuthType.DATA_TRANSFER)
         self.transfer_url = self.get_endpoint_for_transfer()
         self.headers = self.get_headers()
+        self.http_session = self.build_http_session()
         self.transfer_items = self.get_transfer_items()
         logging.info(f"Starting PPSC data transfer {str(self.transfer_type)} for {len(self.transfer_items)}")
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        if self.record_items:
-            self.transfer_record_dao.insert_bulk(self.record_items)
+        self.insert_record_items()
+        if self.http_session:
+            self.http_session.close()
 
-        logging.info(f"Finished PPSC Data Transfer {str(self.transfer_type)} for {len(self.transfer_items)}")
+        logging.info(f"Finished PPSC Data Transfer {str(self.transfer_type)} for {len(self.transfer_items)}: "
+                     f"{self.recorded_count} recorded, {self.failed_count} failed to send")
 
     def run_data_transfer(self):
         if not self.transfer_items:
@@ -44,6 +65,8 @@ class BaseDataTransfer(ABC):
             endpoint = self.endpoint_dao.get_endpoint_by_type(self.transfer_type)
             if not endpoint:
                 raise RuntimeError(f'Endpoint record cannot be retrieved for {self.transfer_type}')
+            if endpoint.batch_size and endpoint.batch_size > 1:
+                self.items_per_request = endpoint.batch_size
             return f'{endpoint.base_url}{endpoint.endpoint}'
         raise RuntimeError(f'Transfer type {self.transfer_type}  not initiated on constructor')
 
@@ -56,11 +79,29 @@ class BaseDataTransfer(ABC):
             "Authorization": f'Bearer {self.ppsc_oauth_data.token}'
         }
 
-    def send_item(self, post_obj: dict):
-        response = requests.post(
+    def build_http_session(self) -> requests.Session:
+        """
+        Session shared by the transfer workers, keeping a connection open for each of them and
+        retrying with an increasing delay when PPSC is rate limiting or having server errors
+        """
+        retry = Retry(
+            total=MAX_SEND_RETRIES,
+            backoff_factor=RETRY_BACKOFF_FACTOR,
+            status_forcelist=RETRY_STATUS_CODES,
+            allowed_methods=frozenset(['POST']),
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_workers, max_retries=retry)
+        session = requests.Session()
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.headers.update(self.headers)
+        return session
+
+    def send_item(self, post_obj: Union[dict, List[dict]]):
+        response = self.http_session.post(
             self.transfer_url,
-            data=json.dumps(post_obj),
-            headers=self.headers
+            data=json.dumps(post_obj)
         )
         return response
 
@@ -74,17 +115,47 @@ class BaseDataTransfer(ABC):
         return updated_obj
 
     def send_items(self):
-        for item in self.transfer_items:
-            prepared_obj = self.prepare_obj(item)
-            response = self.send_item(prepared_obj)
-            self.record_items.append({
-                'created': clock.CLOCK.now(),
-                'modified': clock.CLOCK.now(),
-                'participant_id': item.participant_id,
-                'data_sync_transfer_type': self.transfer_type,
-                'request_payload': prepared_obj,
-                'response_code': response.status_code
-            })
+        """
+        Sends the transfer items using a pool of workers (in batches when the endpoint accepts them),
+        writing the audit records as the responses come back
+        """
+        request_batches = [
+            [(item.participant_id, self.prepare_obj(item)) for item in item_batch]
+            for item_batch in list_chunks(self.transfer_items, self.items_per_request)
+        ]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for request_batch, response in zip(request_batches, executor.map(self.send_request_batch, request_batches)):
+                if response is None:
+                    self.failed_count += len(request_batch)
+                    continue
+
+                for participant_id, prepared_obj in request_batch:
+                    self.record_items.append({
+                        'created': clock.CLOCK.now(),
+                        'modified': clock.CLOCK.now(),
+                        'participant_id': participant_id,
+                        'data_sync_transfer_type': self.transfer_type,
+                        'request_payload': prepared_obj,
+                        'response_code': response.status_code
+                    })
+                if len(self.record_items) >= self.record_batch_size:
+                    self.insert_record_items()
+
+    def send_request_batch(self, request_batch):
+        payload = [prepared_obj for _, prepared_obj in request_batch]
+        try:
+            return self.send_item(payload if self.items_per_request > 1 else payload[0])
+        except requests.RequestException as e:
+            # items without a record are picked up again by the next transfer
+            logging.warning(f'Error sending PPSC data transfer {str(self.transfer_type)} for '
+                            f'{len(payload)} item(s): {e}')
+            return None
+
+    def insert_record_items(self):
+        if self.record_items:
+            self.transfer_record_dao.insert_bulk(self.record_items)
+            self.recorded_count += len(self.record_items)
+            self.record_items = []
 
     @classmethod
     def format_timestamp(cls, timestamp) -> str:
@@ -97,8 +168,8 @@ class BaseDataTransfer(ABC):
 
 class PPSCDataTransferCore(BaseDataTransfer):
 
-    def __init__(self):
-        super().__init__()
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
         self.dao = PPSCDataTransferBaseDao(PPSCCore)
         self.transfer_type = DataSyncTransferType.CORE
 
@@ -111,8 +182,8 @@ class PPSCDataTransferCore(BaseDataTransfer):
 
 class PPSCDataTransferEHR(BaseDataTransfer):
 
-    def __init__(self):
-        super().__init__()
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
         self.dao = PPSCDataTransferBaseDao(PPSCEHR)
         self.transfer_type = DataSyncTransferType.EHR
 
@@ -125,8 +196,8 @@ class PPSCDataTransferEHR(BaseDataTransfer):
 
 class PPSCDataTransferBiobank(BaseDataTransfer):
 
-    def __init__(self):
-        super().__init__()
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
         self.dao = PPSCDataTransferBaseDao(PPSCBiobankSample)
         self.transfer_type = DataSyncTransferType.BIOBANK_SAMPLE
 
@@ -139,8 +210,8 @@ class PPSCDataTransferBiobank(BaseDataTransfer):
 
 class PPSCDataTransferHealthData(BaseDataTransfer):
 
-    def __init__(self):
-        super().__init__()
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
         self.dao = PPSCDataTransferBaseDao(PPSCHealthData)
         self.transfer_type = DataSyncTransferType.HEALTH_DATA
 
@@ -1,48 +1,14 @@
-from collections import defaultdict
 from datetime import datetime
-from typing import List
+import logging
 
 from sqlalchemy.orm import Session
 
+from rdr_service.clock import CLOCK
 from rdr_service.dao.base_dao import with_session
-from rdr_service.dao.duplicate_account_dao import DuplicateAccountDao, DuplicationSource, DuplicateExistsException
-from rdr_service.model.participant_summary import ParticipantSummary
-
-
-class _SummaryCache:
-    def __init__(self, session: Session):
-        self._session = session
-        self._name_dob_cache = defaultdict(         # top level dict for keying by first name
-            lambda: defaultdict(                    # next level dict for keying by last name
-                lambda: defaultdict(                # next level dict for keying by dob
-                    list                            # list to hold any participant ids that have the above data
-                )
-            )
-        )
-        self._email_cache = defaultdict(list)
-        self._phone_cache = defaultdict(list)
-        self._load_data()
-
-    def _load_data(self):
-        for summary in DuplicateAccountDao.query_participant_duplication_data(self._session):
-            self._name_dob_cache[summary.firstName][summary.lastName][summary.dateOfBirth].append(summary.participantId)
-            if summary.email:
-                self._email_cache[summary.email].append(summary.participantId)
-            if summary.loginPhoneNumber:
-                self._phone_cache[summary.loginPhoneNumber].append(summary.participantId)
-
-    def get_matching_participant_ids(self, summary: ParticipantSummary) -> List[int]:
-        result = set()
-        name_dob_matches = (
-            self._name_dob_cache
-            .get(summary.firstName, {})
-            .get(summary.lastName, {})
-            .get(summary.dateOfBirth, [])
-        )
-        result.update(name_dob_matches)
-        result.update(self._email_cache[summary.email])
-        result.update(self._phone_cache[summary.loginPhoneNumber])
-        return [participant_id for participant_id in result if participant_id != summary.participantId]
+from rdr_service.dao.duplicate_account_dao import DuplicateAccountDao, DuplicationSource
+from rdr_service.dao.metadata_dao import (
+    DUPLICATE_BLOCKING_KEYS_BUILD_PROGRESS_KEY, DUPLICATE_BLOCKING_KEYS_BUILT_KEY, MetadataDao
+)
 
 
 class DuplicateDetection:
@@ -51,30 +17,52 @@ class DuplicateDetection:
     def find_duplicates(cls, since: datetime, session: Session):
         """
         Find and record duplicate accounts since the provided timestamp.
-        Will load any participants modified since the timestamp and compare
-        them to all other participants to find and record any new duplicates.
+        Will refresh the blocking keys of any participants modified since the timestamp and then
+        look up any other participants sharing a key with them to find and record any new duplicates.
         """
+        if not MetadataDao().get_by_key_with_session(session, DUPLICATE_BLOCKING_KEYS_BUILT_KEY):
+            cls.build_blocking_keys(session=session)
 
-        cache = _SummaryCache(session)
         recently_modified_summaries = DuplicateAccountDao.query_participants_to_check(session=session, since=since)
-        for summary in recently_modified_summaries:
-            duplicate_id_list = cache.get_matching_participant_ids(summary)
-            for duplicate_id in duplicate_id_list:
-                cls._record_as_duplicate(
-                    participant_a_id=summary.participantId,
-                    participant_b_id=duplicate_id,
-                    session=session
-                )
+        DuplicateAccountDao.update_blocking_keys(recently_modified_summaries, session=session)
+
+        candidate_pairs = DuplicateAccountDao.query_candidate_pairs(
+            [summary.participantId for summary in recently_modified_summaries],
+            session=session
+        )
+        new_duplicate_count = DuplicateAccountDao.store_potential_duplications(
+            candidate_pairs,
+            authored=datetime.utcnow(),
+            source=DuplicationSource.RDR,
+            session=session
+        )
+        logging.info(f'Found {new_duplicate_count} new potential duplicate accounts')
 
     @classmethod
-    def _record_as_duplicate(cls, participant_a_id: int, participant_b_id: int, session: Session):
-        try:
-            DuplicateAccountDao.store_duplication(
-                participant_a_id=participant_a_id,
-                participant_b_id=participant_b_id,
-                authored=datetime.utcnow(),
-                source=DuplicationSource.RDR,
-                session=session
+    @with_session
+    def build_blocking_keys(cls, session: Session):
+        """
+        Generate the blocking keys for every participant, a page of participants at a time.
+        The last participant with keys is stored with each page, so an interrupted build carries on from where
+        it stopped the next time it runs. The build is recorded as complete once every participant has keys.
+        """
+        metadata_dao = MetadataDao()
+        progress = metadata_dao.get_by_key_with_session(session, DUPLICATE_BLOCKING_KEYS_BUILD_PROGRESS_KEY)
+        last_participant_id = progress.intValue if progress and progress.intValue else 0
+        while True:
+            summaries = DuplicateAccountDao.query_participant_duplication_data(
+                session=session,
+                after_participant_id=last_participant_id
+            )
+            if not summaries:
+                break
+
+            DuplicateAccountDao.update_blocking_keys(summaries, session=session)
+            last_participant_id = summaries[-1].participantId
+            metadata_dao.upsert_with_session(
+                session, DUPLICATE_BLOCKING_KEYS_BUILD_PROGRESS_KEY, int_value=last_participant_id
             )
-        except DuplicateExistsException:
-            pass  # ignore any that are already flagged as duplicates
+            session.commit()
+
+        metadata_dao.upsert_with_session(session, DUPLICATE_BLOCKING_KEYS_BUILT_KEY, date_value=CLOCK.now())
+        session.commit()
@@ -0,0 +1,139 @@
+from abc import ABC, abstractmethod
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import logging
+from typing import Callable, Collection, Dict, Optional, Tuple
+
+import googlemaps
+
+from rdr_service import config
+from rdr_service.dao.geocoded_address_dao import GeocodedAddressDao
+from rdr_service.model.geocoded_address import GeocodedAddress
+
+MAX_GEOCODE_WORKERS = 4
+
+SiteAddress = namedtuple('SiteAddress', ['address_1', 'city', 'state'])
+SiteLocation = namedtuple('SiteLocation', ['latitude', 'longitude', 'time_zone_id'])
+
+
+def get_address_key(address: SiteAddress) -> str:
+    """Normalized form of the address, so that formatting changes don't cause it to be geocoded again"""
+    return '|'.join(' '.join(part.lower().split()) for part in address)
+
+
+class Geocoder(ABC):
+    """Looks up the location of addresses"""
+
+    @abstractmethod
+    def get_lat_long(self, address: SiteAddress) -> Tuple[Optional[float], Optional[float]]:
+        ...
+
+    @abstractmethod
+    def get_time_zone(self, latitude: float, longitude: float) -> Optional[str]:
+        ...
+
+    def geocode(self, address: SiteAddress) -> SiteLocation:
+        latitude, longitude = self.get_lat_long(address)
+        time_zone_id = None
+        if latitude and longitude:
+            time_zone_id = self.get_time_zone(latitude, longitude)
+        return SiteLocation(latitude=latitude, longitude=longitude, time_zone_id=time_zone_id)
+
+
+class GoogleMapsGeocoder(Geocoder):
+    def __init__(self):
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            api_key = config.getSetting('geocode_api_key', None)
+            if not api_key:
+                raise ValueError('Geocode key not set')
+            self._client = googlemaps.Client(key=api_key)
+        return self._client
+
+    def get_lat_long(self, address: SiteAddress):
+        full_address = ' '.join(address)
+        try:
+            geocode_results = self.client.geocode(full_address)
+        except ValueError as e:
+            logging.exception(f'Unable to geocode with the configured key. ERROR: {e}')
+            return None, None
+        if not geocode_results:
+            logging.warning(f'Bad address for {full_address}, could not geocode.')
+            return None, None
+
+        location = (geocode_results[0].get('geometry') or {}).get('location')
+        if not location:
+            logging.warning(f'Can not find lat/long for {full_address}')
+            return None, None
+        return location.get('lat'), location.get('lng')
+
+    def get_time_zone(self, latitude, longitude):
+        time_zone = self.client.timezone(location=(latitude, longitude))
+        if time_zone['status'] == 'OK':
+            return time_zone['timeZoneId']
+        else:
+            logging.info(f'can not retrieve time zone for {latitude}, {longitude}')
+            return None
+
+
+class GeocodeCache:
+    """
+    Finds the locations of addresses, only geocoding the ones that haven't been found before.
+    Any addresses that need to be geocoded are looked up a few at a time in separate threads.
+    """
+
+    def __init__(
+        self,
+        geocode_function: Callable[[SiteAddress], SiteLocation],
+        max_workers: int = MAX_GEOCODE_WORKERS
+    ):
+        """
+        :param geocode_function: Called to find the location of any address that isn't cached
+        """
+        self._geocode_function = geocode_function
+        self._max_workers = max_workers
+        self._dao = GeocodedAddressDao()
+
+    def get_locations(self, addresses: Collection[SiteAddress]) -> Dict[SiteAddress, SiteLocation]:
+        address_key_map = {address: get_address_key(address) for address in addresses}
+        cached_map = self._dao.get_by_address_keys(address_key_map.values())
+
+        result = {}
+        uncached_addresses = []
+        for address, address_key in address_key_map.items():
+            cached_address = cached_map.get(address_key)
+            if cached_address:
+                result[address] = SiteLocation(
+                    latitude=cached_address.latitude,
+                    longitude=cached_address.longitude,
+                    time_zone_id=cached_address.timeZoneId
+                )
+            else:
+                uncached_addresses.append(address)
+        if not uncached_addresses:
+            return result
+
+        if self._max_workers > 1 and len(uncached_addresses) > 1:
+            with ThreadPoolExecutor(max_workers=self._max_workers) as executor:
+                locations = list(executor.map(self._geocode_function, uncached_addresses))
+        else:
+            locations = [self._geocode_function(address) for address in uncached_addresses]
+
+        new_geocoded_addresses = []
+        for address, location in zip(uncached_addresses, locations):
+            result[address] = location
+            # Only complete locations are cached, anything else is tried again the next time it's needed
+            if location.latitude is not None and location.longitude is not None and location.time_zone_id:
+                new_geocoded_addresses.append(GeocodedAddress(
+                    addressKey=address_key_map[address],
+                    latitude=location.latitude,
+                    longitude=location.longitude,
+                    timeZoneId=location.time_zone_id
+                ))
+        if new_geocoded_addresses:
+            self._dao.upsert_all(new_geocoded_addresses)
+
+        return result
@@ -1,27 +1,43 @@
-from datetime import date
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
 from logging import Logger
+from typing import Collection, Dict, List, Optional, Tuple
 
 from sqlalchemy.orm import Session
 
+from rdr_service.clock import CLOCK
 from rdr_service.config import GAE_PROJECT
 from rdr_service.dao.ghost_check_dao import GhostCheckDao, GhostFlagModification
+from rdr_service.dao.metadata_dao import MetadataDao, GHOST_CHECK_CHECKPOINT_KEY
 from rdr_service.dao.participant_dao import ParticipantDao
 from rdr_service.model.participant import Participant
 from rdr_service.model.utils import from_client_participant_id
 from rdr_service.offline.bigquery_sync import dispatch_participant_rebuild_tasks
 from rdr_service.services.ptsc_client import PtscClient
+from rdr_service.services.system_utils import list_chunks
+
+GHOST_CHECK_BATCH_SIZE = 500
+MAX_LOOKUP_WORKERS = 8
+
 
 class GhostCheckService:
-    def __init__(self, session: Session, logger: Logger, ptsc_config: dict):
+    def __init__(self, session: Session, logger: Logger, ptsc_config: dict, batch_size=GHOST_CHECK_BATCH_SIZE,
+                 max_lookup_workers=MAX_LOOKUP_WORKERS):
         self._session = session
         self._logger = logger
         self._config = ptsc_config
+        self._batch_size = batch_size
+        self._max_lookup_workers = max_lookup_workers
         self._participant_dao = ParticipantDao()
+        self._metadata_dao = MetadataDao()
 
     def run_ghost_check(self, start_date: date, end_date: date = None, project=GAE_PROJECT):
         """
         Finds all the participants that need to be checked to see if they're ghosts and calls out to Vibrent's API
         to check them, recording the result.
+
+        Results are saved a batch of participants at a time. If a run fails part way through, then the next
+        run for the same dates will skip the participants that were already checked.
         """
         # PDR-855:  Need to rebuild the PDR participant summary data for pids whose ghost status has changed
         pdr_rebuild_list = list()
@@ -30,6 +46,23 @@ class GhostCheckService:
             earliest_signup_time=start_date,
             latest_signup_time=end_date
         )
+
+        known_participant_ids = {participant.participantId for participant in db_participants}
+
+        resuming_from = self._start_checkpoint(start_date, end_date)
+        if resuming_from:
+            previous_checks = GhostCheckDao.get_checks_since(session=self._session, timestamp=resuming_from)
+            self._logger.info(f'Resuming ghost check, skipping {len(previous_checks)} participants already checked')
+            already_checked_ids = set()
+            for participant_id, modification_performed in previous_checks:
+                already_checked_ids.add(participant_id)
+                if modification_performed:
+                    pdr_rebuild_list.append(participant_id)
+            db_participants = [
+                participant for participant in db_participants
+                if participant.participantId not in already_checked_ids
+            ]
+
         participant_map = {participant.participantId: participant for participant in db_participants}
         ids_not_found = {participant.participantId for participant in db_participants}
 
@@ -39,6 +72,7 @@ class GhostCheckService:
             client_id=self._config['client_id'],
             client_secret=self._config['client_secret']
         )
+        ghost_results = []
         response = client.get_participant_lookup(start_date=start_date, end_date=end_date)
         while response:  # Keep checking until no more pages are left
             for participant_data in response['participants']:
@@ -48,56 +82,109 @@ class GhostCheckService:
                 else:
                     participant_id = from_client_participant_id(participant_id_str)
                     if participant_id in ids_not_found:
-                        ghost_change = self._record_ghost_result(
-                            is_ghost_response=False,
-                            participant=participant_map[participant_id]
-                        )
+                        ghost_results.append((participant_map[participant_id], False))
                         ids_not_found.remove(participant_id)
-                        if ghost_change:
-                            pdr_rebuild_list.append(participant_id)
-                    else:
+                    elif participant_id not in known_participant_ids:
                         self._logger.error(f'Vibrent had unknown id: {participant_id}')
 
+            if len(ghost_results) >= self._batch_size:
+                pdr_rebuild_list.extend(self._record_ghost_results(ghost_results))
+                ghost_results = []
+
             response = client.request_next_page(response)
 
-        for participant_id in ids_not_found:
-            # Individually check each participant not seen in the API data yet (their date might be a little off).
-            response = client.get_participant_lookup(participant_id=participant_id)
-            is_ghost_response = response is None
-            ghost_change = self._record_ghost_result(
-                is_ghost_response=is_ghost_response,
-                participant=participant_map[participant_id]
-            )
-            if ghost_change:
-                pdr_rebuild_list.append(participant_id)
+        pdr_rebuild_list.extend(self._record_ghost_results(ghost_results))
+
+        # Check each participant not seen in the API data yet (their date might be a little off).
+        for participant_id_batch in list_chunks(sorted(ids_not_found), self._batch_size):
+            lookup_responses = self._lookup_participants(client, participant_id_batch)
+            pdr_rebuild_list.extend(self._record_ghost_results([
+                (participant_map[participant_id], lookup_responses[participant_id] is None)
+                for participant_id in participant_id_batch
+            ]))
+
+        self._clear_checkpoint()
 
         if len(pdr_rebuild_list):
             # PDR BQ module views select the test/ghost flag from participant data; don't need to rebuild module data
             dispatch_participant_rebuild_tasks(pdr_rebuild_list, project_id=project, build_modules=False)
 
-    def _record_ghost_result(self, is_ghost_response: bool, participant: Participant) -> bool:
-        """ Update the participant isGhostId status if needed.  Returns true if update was performed """
-        ghost_flag_change_made = None
-        is_ghost_database = bool(participant.isGhostId)
-        if is_ghost_database and not is_ghost_response:
-            ghost_flag_change_made = GhostFlagModification.GHOST_FLAG_REMOVED
-        elif is_ghost_response and not is_ghost_database:
-            ghost_flag_change_made = GhostFlagModification.GHOST_FLAG_SET
-
-        if ghost_flag_change_made:
-            self._logger.info(f'{str(ghost_flag_change_made)} for {participant.participantId}')
-            self._participant_dao.update_ghost_participant(
-                session=self._session,
-                pid=participant.participantId,
-                is_ghost=ghost_flag_change_made == GhostFlagModification.GHOST_FLAG_SET
-            )
-
-        GhostCheckDao.record_ghost_check(
-            session=self._session,
-            participant_id=participant.participantId,
-            modification_performed=ghost_flag_change_made
-        )
+    def _lookup_participants(self, client: PtscClient, participant_ids: Collection[int]) -> Dict[int, Optional[dict]]:
+        """Looks up each of the participants individually, a few at a time"""
+        def lookup(participant_id):
+            return client.get_participant_lookup(participant_id=participant_id)
+
+        if self._max_lookup_workers > 1 and len(participant_ids) > 1:
+            with ThreadPoolExecutor(max_workers=self._max_lookup_workers) as executor:
+                return dict(zip(participant_ids, executor.map(lookup, participant_ids)))
+        else:
+            return {participant_id: lookup(participant_id) for participant_id in participant_ids}
+
+    def _record_ghost_results(self, ghost_results: List[Tuple[Participant, bool]]) -> List[int]:
+        """
+        Update the isGhostId status of any participants that need it, and record that all of them were checked.
+        :param ghost_results: participants paired with whether Vibrent's API indicates that they're a ghost
+        :return: ids of the participants that had their ghost status changed
+        """
+        if not ghost_results:
+            return []
+
+        changed_participant_ids = []
+        check_results = []
+        for participant, is_ghost_response in ghost_results:
+            ghost_flag_change_made = None
+            is_ghost_database = bool(participant.isGhostId)
+            if is_ghost_database and not is_ghost_response:
+                ghost_flag_change_made = GhostFlagModification.GHOST_FLAG_REMOVED
+            elif is_ghost_response and not is_ghost_database:
+                ghost_flag_change_made = GhostFlagModification.GHOST_FLAG_SET
+
+            if ghost_flag_change_made:
+                self._logger.info(f'{str(ghost_flag_change_made)} for {participant.participantId}')
+                # Changes are rare, and go through the dao so that the participant history is kept
+                self._participant_dao.update_ghost_participant(
+                    session=self._session,
+                    pid=participant.participantId,
+                    is_ghost=ghost_flag_change_made == GhostFlagModification.GHOST_FLAG_SET
+                )
+                changed_participant_ids.append(participant.participantId)
+
+            check_results.append((participant.participantId, ghost_flag_change_made))
+
+        GhostCheckDao.record_ghost_checks(session=self._session, check_results=check_results)
         self._session.commit()
 
-        return True if ghost_flag_change_made else False
+        return changed_participant_ids
+
+    @classmethod
+    def _get_checkpoint_str(cls, start_date: date, end_date: Optional[date]):
+        # The cron job's start date is a time relative to when it runs, so only the dates are used for the key
+        # to let a retry of the job resume the check
+        start_date, end_date = (
+            value.date() if isinstance(value, datetime) else value for value in (start_date, end_date)
+        )
+        return f'{start_date.isoformat()}|{end_date.isoformat() if end_date else ""}'
+
+    def _start_checkpoint(self, start_date: date, end_date: Optional[date]) -> Optional[datetime]:
+        """
+        Records that a check has started for the dates, unless a previous check for them didn't finish.
+        :return: the time the unfinished check started, if there is one
+        """
+        checkpoint_str = self._get_checkpoint_str(start_date, end_date)
+        checkpoint = self._metadata_dao.get_by_key_with_session(self._session, GHOST_CHECK_CHECKPOINT_KEY)
+        if checkpoint and checkpoint.strValue == checkpoint_str and checkpoint.dateValue:
+            return checkpoint.dateValue
 
+        self._metadata_dao.upsert_with_session(
+            self._session,
+            GHOST_CHECK_CHECKPOINT_KEY,
+            str_value=checkpoint_str,
+            # Ghost check timestamps are stored without fractional seconds
+            date_value=CLOCK.now().replace(microsecond=0)
+        )
+        self._session.commit()
+        return None
+
+    def _clear_checkpoint(self):
+        self._metadata_dao.upsert_with_session(self._session, GHOST_CHECK_CHECKPOINT_KEY)
+        self._session.commit()
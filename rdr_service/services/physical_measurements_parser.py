@@ -0,0 +1,168 @@
+"""
+Parses the Observation resources of physical measurements documents directly from their JSON. Building the
+fhirclient model for every observation is most of the cost of processing a measurements document, and the
+documents sent by HealthPro all share one simple layout. Anything that doesn't match that layout raises an
+UnsupportedLayoutError so that the caller can fall back to the (stricter and slower) fhirclient model.
+
+The parsed elements expose the same attributes as the fhirclient model classes that the
+PhysicalMeasurementsDao reads, so both can be used by the same code.
+"""
+
+from rdr_service.lib_fhir.fhirclient_1_0_6.models.fhirdate import FHIRDate
+
+
+class UnsupportedLayoutError(Exception):
+    """Raised when a resource has something the parser doesn't know how to check"""
+
+
+class ParsedElement:
+    def __init__(self, json_dict, **attributes):
+        self._json = json_dict
+        self.__dict__.update(attributes)
+
+    def as_json(self):
+        return self._json
+
+
+def _check(is_valid):
+    if not is_valid:
+        raise UnsupportedLayoutError()
+
+
+def _check_keys(json_dict, allowed_keys):
+    _check(isinstance(json_dict, dict) and json_dict.keys() <= allowed_keys)
+
+
+def _optional_string(json_dict, key):
+    value = json_dict.get(key)
+    _check(value is None or isinstance(value, str))
+    return value
+
+
+def _parse_date(json_dict, key):
+    value = _optional_string(json_dict, key)
+    if value is None:
+        return None
+    date = FHIRDate(value)
+    # Let fhirclient deal with (and log) dates that it can't parse
+    _check(date.date is not None)
+    return date
+
+
+def _parse_coding(json_dict):
+    _check_keys(json_dict, {'system', 'code', 'display'})
+    system = json_dict.get('system')
+    _check(isinstance(system, str))
+    return ParsedElement(
+        json_dict,
+        system=system,
+        code=_optional_string(json_dict, 'code'),
+        display=_optional_string(json_dict, 'display')
+    )
+
+
+def _parse_codeable_concept(json_dict):
+    if json_dict is None:
+        return None
+    _check_keys(json_dict, {'coding', 'text'})
+    coding_list = json_dict.get('coding', [])
+    _check(isinstance(coding_list, list))
+    return ParsedElement(
+        json_dict,
+        coding=[_parse_coding(coding) for coding in coding_list],
+        text=_optional_string(json_dict, 'text')
+    )
+
+
+def _parse_quantity(json_dict):
+    if json_dict is None:
+        return None
+    _check_keys(json_dict, {'value', 'unit', 'system', 'code'})
+    value = json_dict.get('value')
+    _check(value is None or (isinstance(value, (int, float)) and not isinstance(value, bool)))
+    return ParsedElement(
+        json_dict,
+        value=value,
+        unit=_optional_string(json_dict, 'unit'),
+        system=_optional_string(json_dict, 'system'),
+        code=_optional_string(json_dict, 'code')
+    )
+
+
+def _parse_reference(json_dict):
+    if json_dict is None:
+        return None
+    _check_keys(json_dict, {'reference', 'display'})
+    return ParsedElement(
+        json_dict,
+        reference=_optional_string(json_dict, 'reference'),
+        display=_optional_string(json_dict, 'display')
+    )
+
+
+def _parse_list(json_dict, key, parse_function):
+    value_list = json_dict.get(key)
+    if value_list is None:
+        return None
+    _check(isinstance(value_list, list))
+    return [parse_function(value) for value in value_list]
+
+
+def _parse_value_fields(json_dict):
+    value_codeable_concept = _parse_codeable_concept(json_dict.get('valueCodeableConcept'))
+    if value_codeable_concept and value_codeable_concept.coding:
+        # The codeable concept's text is used as the description of the value
+        _check(value_codeable_concept.text is not None)
+    return {
+        'valueQuantity': _parse_quantity(json_dict.get('valueQuantity')),
+        'valueDateTime': _parse_date(json_dict, 'valueDateTime'),
+        'valueString': _optional_string(json_dict, 'valueString'),
+        'valueCodeableConcept': value_codeable_concept
+    }
+
+
+def _parse_component(json_dict):
+    _check_keys(json_dict, {'code', 'valueQuantity', 'valueDateTime', 'valueString', 'valueCodeableConcept'})
+    _check(json_dict.get('code') is not None)
+    return ParsedElement(
+        json_dict,
+        code=_parse_codeable_concept(json_dict['code']),
+        **_parse_value_fields(json_dict)
+    )
+
+
+def _parse_related(json_dict):
+    _check_keys(json_dict, {'type', 'target'})
+    return ParsedElement(
+        json_dict,
+        type=_optional_string(json_dict, 'type'),
+        target=_parse_reference(json_dict.get('target'))
+    )
+
+
+_OBSERVATION_KEYS = {
+    'resourceType', 'id', 'status', 'code', 'subject', 'effectiveDateTime', 'bodySite', 'component', 'related',
+    'valueQuantity', 'valueDateTime', 'valueString', 'valueCodeableConcept'
+}
+
+
+def parse_observation(json_dict) -> ParsedElement:
+    """
+    Parse an Observation resource from a physical measurements document.
+    :raises UnsupportedLayoutError: if the resource isn't laid out the way HealthPro sends them
+    """
+    _check_keys(json_dict, _OBSERVATION_KEYS)
+    # These are the elements that fhirclient requires
+    _check(json_dict.get('code') is not None and isinstance(json_dict.get('status'), str))
+    return ParsedElement(
+        json_dict,
+        id=_optional_string(json_dict, 'id'),
+        status=json_dict['status'],
+        code=_parse_codeable_concept(json_dict['code']),
+        subject=_parse_reference(json_dict.get('subject')),
+        effectiveDateTime=_parse_date(json_dict, 'effectiveDateTime'),
+        bodySite=_parse_codeable_concept(json_dict.get('bodySite')),
+        component=_parse_list(json_dict, 'component', _parse_component),
+        related=_parse_list(json_dict, 'related', _parse_related),
+        **_parse_value_fields(json_dict)
+    )
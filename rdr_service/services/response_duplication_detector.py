@@ -1,20 +1,34 @@
+from collections import defaultdict
 from datetime import datetime, timedelta
 from time import sleep
 import logging, os
 from sqlalchemy import and_, func, update
 from sqlalchemy.orm import aliased
-from typing import Type
+from typing import Dict, List, Optional, Set, Tuple, Type
 
+from rdr_service import clock
 from rdr_service.config import GAE_PROJECT
 from rdr_service.cloud_utils.gcp_google_pubsub import submit_pipeline_pubsub_msg
 from rdr_service.cloud_utils.gcp_cloud_tasks import GCPCloudTask
 from rdr_service.dao.database_factory import get_database
+from rdr_service.dao.metadata_dao import MetadataDao, RESPONSE_DUPLICATION_WATERMARK_KEY
 from rdr_service.model.questionnaire_response import QuestionnaireResponse, QuestionnaireResponseClassificationType
 from rdr_service.model.bigquery_sync import BigQuerySync
 from rdr_service.model.bq_base import BQTable
 from rdr_service.resource.tasks import batch_rebuild_participants_task
 from rdr_service.services.system_utils import list_chunks
 
+# Responses are duplicates of each other when they have the same participant id, external id and answer hash
+ResponseKey = Tuple[int, str, str]
+
+# How far back the incremental check looks when it hasn't run before
+NEW_RESPONSE_INITIAL_LOOKBACK = timedelta(days=2)
+# Responses get their created time before they're committed, so each run also re-checks this long before the
+# watermark for responses that became visible after the previous run
+NEW_RESPONSE_OVERLAP = timedelta(minutes=15)
+RESPONSE_LOOKUP_BATCH_SIZE = 500
+DUPLICATE_UPDATE_BATCH_SIZE = 1000
+
 
 class ResponseDuplicationDetector:
     def __init__(self, duplication_threshold: int = 2):
@@ -148,11 +162,121 @@ class ResponseDuplicationDetector:
                     questionnaire_ids_to_mark_as_duplicates.extend(previous_duplicate_ids)
 
             if questionnaire_ids_to_mark_as_duplicates:
-                session.execute(
-                    update(QuestionnaireResponse)
-                    .where(QuestionnaireResponse.questionnaireResponseId.in_(questionnaire_ids_to_mark_as_duplicates))
-                    .values({
-                        QuestionnaireResponse.classificationType: QuestionnaireResponseClassificationType.DUPLICATE
-                    })
-                )
+                self._mark_as_duplicates(session, questionnaire_ids_to_mark_as_duplicates)
                 self.clean_pdr_module_data(questionnaire_ids_to_mark_as_duplicates, session=session, project=project)
+
+    def flag_new_duplicate_responses(self, project=GAE_PROJECT) -> int:
+        """
+        Check the responses created since the last time this ran, marking any of the earlier responses they
+        duplicate. Only the response groups that have new responses are loaded (using the index on external id
+        and answer hash), so the work done depends on the number of new responses rather than a date range.
+        :param project: A project name, if overriding (e.g., when running a tool on localhost)
+        :return: The number of responses marked as duplicates
+        """
+        metadata_dao = MetadataDao()
+        with get_database().session() as session:
+            watermark_record = metadata_dao.get_by_key_with_session(session, RESPONSE_DUPLICATION_WATERMARK_KEY)
+            if watermark_record and watermark_record.dateValue:
+                watermark = watermark_record.dateValue
+            else:
+                watermark = clock.CLOCK.now() - NEW_RESPONSE_INITIAL_LOOKBACK
+                logging.warning(f'No duplication check watermark found, checking responses since {watermark}')
+
+            new_response_keys, high_watermark = self._get_new_response_keys(session, watermark - NEW_RESPONSE_OVERLAP)
+            duplicate_ids = []
+            if new_response_keys:
+                response_groups = self._get_response_groups(session, new_response_keys)
+                duplicate_ids = self._get_ids_to_mark_as_duplicates(response_groups)
+            if duplicate_ids:
+                self._mark_as_duplicates(session, duplicate_ids)
+                self.clean_pdr_module_data(duplicate_ids, session=session, project=project)
+
+            # The watermark moves past every response that was read, including any that have no key to check.
+            # Responses found only in the overlap shouldn't move the watermark back
+            if high_watermark:
+                metadata_dao.upsert_with_session(
+                    session, RESPONSE_DUPLICATION_WATERMARK_KEY, date_value=max(high_watermark, watermark)
+                )
+
+        return len(duplicate_ids)
+
+    @staticmethod
+    def _get_new_response_keys(session, watermark: datetime) -> Tuple[Set[ResponseKey], Optional[datetime]]:
+        new_responses = session.query(
+            QuestionnaireResponse.participantId,
+            QuestionnaireResponse.externalId,
+            QuestionnaireResponse.answerHash,
+            QuestionnaireResponse.created
+        ).with_hint(
+            QuestionnaireResponse,
+            'USE INDEX (idx_created_q_id)'
+        ).filter(
+            QuestionnaireResponse.created >= watermark,
+            # The Questionnaire id needs to be referenced to use the index that has the created date
+            QuestionnaireResponse.questionnaireId > 0
+        ).all()
+
+        response_keys = {
+            (participant_id, external_id, answer_hash)
+            for participant_id, external_id, answer_hash, _ in new_responses
+            # Responses missing either identifier can't be matched to others
+            if external_id is not None and answer_hash is not None
+        }
+        high_watermark = max((created for *_, created in new_responses), default=None)
+        return response_keys, high_watermark
+
+    @staticmethod
+    def _get_response_groups(session, response_keys: Set[ResponseKey]) -> Dict[ResponseKey, List]:
+        """Load every response that shares a key with the given ones, grouped by key"""
+        response_groups = defaultdict(list)
+        external_ids = sorted({external_id for _, external_id, _ in response_keys})
+        for external_id_batch in list_chunks(external_ids, RESPONSE_LOOKUP_BATCH_SIZE):
+            responses = session.query(
+                QuestionnaireResponse.questionnaireResponseId,
+                QuestionnaireResponse.participantId,
+                QuestionnaireResponse.externalId,
+                QuestionnaireResponse.answerHash,
+                QuestionnaireResponse.created,
+                QuestionnaireResponse.classificationType
+            ).filter(
+                QuestionnaireResponse.externalId.in_(external_id_batch)
+            ).all()
+            for response in responses:
+                response_key = (response.participantId, response.externalId, response.answerHash)
+                if response_key in response_keys:
+                    response_groups[response_key].append(response)
+
+        return response_groups
+
+    def _get_ids_to_mark_as_duplicates(self, response_groups: Dict[ResponseKey, List]) -> List[int]:
+        duplicate_ids = []
+        for responses in response_groups.values():
+            latest_response = max(responses, key=lambda response: (response.created, response.questionnaireResponseId))
+            older_responses = [response for response in responses if response.created < latest_response.created]
+
+            # The number of older responses is compared since the threshold includes the latest response
+            if len(older_responses) < self.duplication_threshold - 1:
+                continue
+
+            new_duplicate_ids = [
+                response.questionnaireResponseId for response in older_responses
+                if response.classificationType != QuestionnaireResponseClassificationType.DUPLICATE
+            ]
+            if new_duplicate_ids:
+                logging.warning(
+                    f'{new_duplicate_ids} found as duplicates of {latest_response.questionnaireResponseId}'
+                )
+                duplicate_ids.extend(new_duplicate_ids)
+
+        return duplicate_ids
+
+    @staticmethod
+    def _mark_as_duplicates(session, questionnaire_response_ids):
+        for id_batch in list_chunks(questionnaire_response_ids, DUPLICATE_UPDATE_BATCH_SIZE):
+            session.execute(
+                update(QuestionnaireResponse)
+                .where(QuestionnaireResponse.questionnaireResponseId.in_(id_batch))
+                .values({
+                    QuestionnaireResponse.classificationType: QuestionnaireResponseClassificationType.DUPLICATE
+                })
+            )
@@ -17,6 +17,9 @@ DB_CONFIG_INDEX = 7
 BACKUP_SQL_DATABASE_INDEX = 8
 ALEMBIC_SQL_DATABASE_INDEX = 9
 READ_UNCOMMITTED_DATABASE_INDEX = 10
+NPH_PARTICIPANT_COUNT_CACHE_INDEX = 11
+CODE_HIERARCHY_CACHE_INDEX = 12
+MEASUREMENT_CATALOG_CACHE_INDEX = 13
 
 
 def reset_for_tests():
@@ -3,6 +3,7 @@ import logging
 from datetime import datetime
 
 from rdr_service.api_util import dispatch_task
+from rdr_service.dao.participant_summary_dao import ParticipantSummaryDao
 from rdr_service.model.participant_summary import ParticipantSummary
 from rdr_service.tools.tool_libs.tool_base import cli_run, ToolBase
 
@@ -28,6 +29,21 @@ class BackfillEnrollment(ToolBase):
                     ParticipantSummary.participantId
                 ).order_by(ParticipantSummary.participantId).all()
 
+            if self.args.in_process:
+                participant_id_list = [
+                    participant_id if isinstance(participant_id, int) else participant_id.participantId
+                    for participant_id in participant_id_list
+                ]
+                changed_ids = ParticipantSummaryDao().update_enrollment_status_for_participants(
+                    participant_id_list,
+                    session=session,
+                    allow_downgrade=self.args.allow_downgrade,
+                    batch_size=self.args.batch_size
+                )
+                logging.info(f'{datetime.now()}: enrollment status changed for {len(changed_ids)} '
+                             f'of {len(participant_id_list)} participants')
+                return 0
+
             count = 0
             last_id = None
 
@@ -56,5 +72,9 @@ def add_additional_arguments(parser):
                         help="file of integer participant id values to backfill")
     parser.add_argument('--allow-downgrade', default=False, action="store_true",
                         help='Force recalculation of enrollment status, and allow status to revert to a lower status')
+    parser.add_argument('--in-process', default=False, action="store_true",
+                        help='Recalculate in batches from this process rather than dispatching a task per participant')
+    parser.add_argument('--batch-size', default=500, type=int,
+                        help='Number of participants to recalculate at a time when using --in-process')
 def run():
     return cli_run(tool_cmd, tool_desc, BackfillEnrollment, add_additional_arguments)
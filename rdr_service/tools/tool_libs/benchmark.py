@@ -0,0 +1,130 @@
+from rdr_service.data_gen.benchmark import BenchmarkWorkload, DEFAULT_WORKLOAD_WEIGHTS, compare_to_baseline,\
+    generate_cohort, get_cohort_participant_ids, load_results, save_results
+from rdr_service.tools.tool_libs.tool_base import cli_run, logger, ToolBase
+
+tool_cmd = 'benchmark'
+tool_desc = 'Measure API performance in-process against a synthetic cohort in the local database'
+
+
+class BenchmarkTool(ToolBase):
+    """
+    Generates a seeded cohort of fake participants in the local database and then replays a weighted mix
+    of API calls against them, reporting latency percentiles and SQL statement counts for each operation.
+
+    benchmark --cohort-size 200 --requests 1000 --threads 4 --save results.json
+    benchmark --skip-cohort --requests 1000 --threads 4 --baseline results.json
+
+    "--skip-cohort" benchmarks against the participants already in the database rather than creating more.
+    "--weights" sets the mix of operations, eg "summary_search=10,pdr_rebuild=1".
+    "--rows-examined" measures the rows MySQL reads for each call. This adds queries around every statement,
+        so latencies from these runs shouldn't be compared with runs that don't use it.
+    "--baseline" compares the results to those saved by a previous run, and exits with an error code if
+        anything got worse by more than the tolerances.
+    """
+
+    def run(self):
+        if self.gcp_env.project != 'localhost':
+            logger.error('Benchmarks can only be run against the local database')
+            return 1
+
+        if super().run() is not None:
+            return 1
+
+        if self.args.skip_cohort:
+            participant_ids = get_cohort_participant_ids(limit=self.args.cohort_size)
+        else:
+            logger.info(f'Generating a cohort of {self.args.cohort_size} participants')
+            participant_ids = generate_cohort(self.args.cohort_size, seed=self.args.seed)
+
+        workload = BenchmarkWorkload(
+            participant_ids,
+            weights=self._parse_weights(self.args.weights),
+            seed=self.args.seed,
+            measure_rows_examined=self.args.rows_examined
+        )
+        logger.info(f'Making {self.args.requests} requests with {self.args.threads} threads')
+        results = workload.run(self.args.requests, threads=self.args.threads)
+        summary = results.summary()
+        self._log_summary(summary, results.elapsed_seconds)
+
+        settings = {
+            'cohort_size': len(participant_ids),
+            'requests': self.args.requests,
+            'rows_examined': self.args.rows_examined,
+            'seed': self.args.seed,
+            'threads': self.args.threads,
+            'weights': workload.weights
+        }
+        if self.args.save:
+            save_results(self.args.save, summary, settings)
+            logger.info(f'Results saved to {self.args.save}')
+
+        if self.args.baseline:
+            baseline = load_results(self.args.baseline)
+            if baseline['settings'] != settings:
+                logger.warning(f'Baseline was run with different settings: {baseline["settings"]}')
+
+            regressions = compare_to_baseline(
+                summary,
+                baseline['operations'],
+                latency_tolerance=self.args.latency_tolerance,
+                count_tolerance=self.args.count_tolerance
+            )
+            for regression in regressions:
+                logger.error(
+                    f'{regression.operation} {regression.metric} went from {regression.baseline:.2f} '
+                    f'to {regression.current:.2f}'
+                )
+            if regressions:
+                return 1
+            logger.info('No regressions found compared to the baseline')
+
+        return 0
+
+    @staticmethod
+    def _parse_weights(weights_str):
+        if not weights_str:
+            return None
+        weights = {}
+        for weight_str in weights_str.split(','):
+            operation, weight = weight_str.split('=')
+            weights[operation.strip()] = int(weight)
+        return weights
+
+    @staticmethod
+    def _log_summary(summary, elapsed_seconds):
+        total_count = sum(operation_summary['count'] for operation_summary in summary.values())
+        logger.info(f'{total_count} requests in {elapsed_seconds:.1f}s ({total_count / elapsed_seconds:.1f}/s)')
+        for operation, operation_summary in summary.items():
+            logger.info(
+                f'{operation}: {operation_summary["count"]} calls, {operation_summary["errors"]} errors, '
+                f'p50 {operation_summary["p50_ms"]:.1f}ms, p95 {operation_summary["p95_ms"]:.1f}ms, '
+                f'p99 {operation_summary["p99_ms"]:.1f}ms, '
+                f'{operation_summary["sql_statements_per_call"]:.1f} statements/call, '
+                f'{operation_summary["rows_per_call"]:.1f} rows/call'
+            )
+            if 'rows_examined_per_call' in operation_summary:
+                logger.info(f'{operation}: {operation_summary["rows_examined_per_call"]:.1f} rows examined/call')
+
+
+def add_additional_arguments(parser):
+    parser.add_argument('--cohort-size', help='number of participants to benchmark with', type=int, default=100)
+    parser.add_argument('--skip-cohort', help='use participants already in the database', default=False,
+                        action='store_true')
+    parser.add_argument('--seed', help='random seed for the cohort and workload', type=int, default=1)
+    parser.add_argument('--requests', help='number of calls to make', type=int, default=500)
+    parser.add_argument('--threads', help='number of threads making calls', type=int, default=4)
+    parser.add_argument('--weights', help=f'operation weights, defaults to {DEFAULT_WORKLOAD_WEIGHTS}',
+                        default=None)
+    parser.add_argument('--rows-examined', help='measure rows read by MySQL for each call', default=False,
+                        action='store_true')
+    parser.add_argument('--save', help='file to save the results to', default=None)
+    parser.add_argument('--baseline', help='file of previous results to compare to', default=None)
+    parser.add_argument('--latency-tolerance', help='allowed fractional increase in latencies', type=float,
+                        default=0.25)
+    parser.add_argument('--count-tolerance', help='allowed fractional increase in statement and row counts',
+                        type=float, default=0.1)
+
+
+def run():
+    return cli_run(tool_cmd, tool_desc, BenchmarkTool, add_additional_arguments)
@@ -218,9 +218,13 @@ class CodesSyncClass(ToolBase):
             if not self.args.dry_run:
                 if exit_code == 1:
                     session.rollback()
-                elif 'prod' in self.gcp_env.project:
-                    # We only want to write the export file for prod
-                    self.write_export_file(session)
+                else:
+                    if not self.args.export_only:
+                        session.flush()
+                        CodeDao().rebuild_closure_with_session(session)
+                    if 'prod' in self.gcp_env.project:
+                        # We only want to write the export file for prod
+                        self.write_export_file(session)
 
         return exit_code
 
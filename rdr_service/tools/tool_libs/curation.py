@@ -27,7 +27,8 @@ from rdr_service.etl.model.src_clean import QuestionnaireAnswersByModule, SrcCle
     DoseEra, Metadata, NoteNlp, VisitDetail, SrcParticipant, SrcMapped, SrcPersonLocation, SrcGender, SrcRace, \
     SrcEthnicity, SrcMeas, MeasurementCodeMap, MeasurementValueCodeMap, SrcMeasMapped, SrcVisits, TempObsTarget, \
     TempObsEndUnion, TempObsEndUnionPart, TempObsEnd, TempObs, TempFactRelSd, PidRidMapping, \
-    QuestionnaireResponseAdditionalInfo, EHRConsentStatus, WearConsent
+    QuestionnaireResponseAdditionalInfo, EHRConsentStatus, WearConsent, TempEtlParticipant, TempEtlExcludedParticipant
+from rdr_service.etl.participant_set import EtlParticipantSet
 from rdr_service.model.code import Code
 from rdr_service.model.consent_file import ConsentFile, ConsentSyncStatus
 from rdr_service.model.consent_response import ConsentResponse
@@ -45,7 +46,6 @@ from rdr_service.participant_enums import QuestionnaireResponseStatus, Withdrawa
 from rdr_service.services.gcp_utils import gcp_sql_export_csv
 from rdr_service.tools.tool_libs.tool_base import cli_run, ToolBase
 from rdr_service.dao.curation_etl_dao import CdrEtlRunHistoryDao, CdrEtlSurveyHistoryDao, CdrExcludedCodeDao
-from rdr_service.services.system_utils import list_chunks
 
 _logger = logging.getLogger("rdr_logger")
 
@@ -82,10 +82,10 @@ class CurationExportClass(ToolBase):
         self.db_conn = None
         self.cdr_etl_run_history_dao = CdrEtlRunHistoryDao()
         self.cdr_etl_survey_history_dao = CdrEtlSurveyHistoryDao()
-        self.pid_list: List[int] = []
+        self.participant_set = EtlParticipantSet(chunk_size=CHUNK_SIZE)
         self.include_surveys: List[str] = []
         self.exclude_surveys: List[str] = []
-        self.exclude_pid_list: List[int] = []
+        self.exclude_participant_set = EtlParticipantSet(chunk_size=CHUNK_SIZE, model=TempEtlExcludedParticipant)
         self.cutoff_date = None
         self.include_in_person_pm: bool = True
         self.include_remote_pm: bool = True
@@ -359,7 +359,7 @@ class CurationExportClass(ToolBase):
             else_=code_reference.value
         )
 
-    def _populate_questionnaire_answers_by_module(self, session, pid_list:List[int], cutoff_date=None):
+    def _populate_questionnaire_answers_by_module(self, session, chunk_number: int, cutoff_date=None):
         session.execute("TRUNCATE TABLE questionnaire_answers_by_module")
         self._set_rdr_model_schema([Code, QuestionnaireResponse, QuestionnaireConcept, QuestionnaireHistory,
                                     QuestionnaireQuestion, QuestionnaireResponseAnswer, CdrExcludedCode])
@@ -398,7 +398,7 @@ class CurationExportClass(ToolBase):
             QuestionnaireResponse.classificationType != QuestionnaireResponseClassificationType.DUPLICATE,
             QuestionnaireResponse.classificationType != QuestionnaireResponseClassificationType.INVALID,
             QuestionnaireResponse.classificationType != QuestionnaireResponseClassificationType.PROFILE_UPDATE,
-            QuestionnaireResponse.participantId.in_(pid_list)
+            self.participant_set.column_filter(QuestionnaireResponse.participantId, chunk_number)
         )
         if cutoff_date:
             answers_by_module_select = answers_by_module_select.filter(
@@ -426,7 +426,7 @@ class CurationExportClass(ToolBase):
         )
 
     @classmethod
-    def _get_base_src_clean_answers_select(cls, session, pid_list:List[int], cutoff_date=None, include_surveys=None,
+    def _get_base_src_clean_answers_select(cls, session, participant_filter, cutoff_date=None, include_surveys=None,
                                            exclude_surveys=None):
         module_code = aliased(Code)
         question_code = aliased(Code)
@@ -555,7 +555,7 @@ class CurationExportClass(ToolBase):
                     session.query(CdrExcludedCode.codeId).filter(
                         CdrExcludedCode.codeType == CdrEtlCodeType.ANSWER).subquery()))
             ),
-            QuestionnaireResponse.participantId.in_(pid_list)
+            participant_filter
         )
 
         if cutoff_date is not None:
@@ -574,7 +574,7 @@ class CurationExportClass(ToolBase):
 
         return column_map, questionnaire_answers_select, module_code, question_code
 
-    def _populate_src_clean(self, session, pid_list:List[int], cutoff_date=None):
+    def _populate_src_clean(self, session, chunk_number: int, cutoff_date=None):
 
         self._set_rdr_model_schema([Code, HPO, Participant, QuestionnaireQuestion, ParticipantSummary,
                                     QuestionnaireResponse, QuestionnaireResponseAnswer])
@@ -592,8 +592,13 @@ class CurationExportClass(ToolBase):
         ).distinct().subquery()
 
         column_map, questionnaire_answers_select, module_code, question_code \
-            = self._get_base_src_clean_answers_select(session, pid_list, cutoff_date, self.include_surveys,
-                                                      self.exclude_surveys)
+            = self._get_base_src_clean_answers_select(
+                session,
+                self.participant_set.column_filter(QuestionnaireResponse.participantId, chunk_number),
+                cutoff_date,
+                self.include_surveys,
+                self.exclude_surveys
+            )
 
         latest_responses_select = questionnaire_answers_select.outerjoin(
             responses_by_module_subquery,
@@ -709,12 +714,11 @@ class CurationExportClass(ToolBase):
             query = query.filter(
                 Participant.participantOrigin == 'careevolution'
             )
-        if self.exclude_pid_list:
+        if self.exclude_participant_set:
             query = query.filter(
-                Participant.participantId.notin_(self.exclude_pid_list)
+                not_(self.exclude_participant_set.column_filter(Participant.participantId))
             )
-        result = query.order_by(Participant.participantId).all()
-        self.pid_list = [pid[0] for pid in result]
+        self.participant_set.update(pid for pid, in query.all())
 
     def _populate_death_table(self, session: sqlalchemy.orm.session):
         # Populates death table from deceased_report
@@ -799,7 +803,7 @@ class CurationExportClass(ToolBase):
             answer_code.value is not None,
             Code.value == WEAR_CONSENT_MODULE,
             question_code.value == WEAR_CONSENT_QUESTION_CODE,
-            Participant.participantId.in_(self.pid_list)
+            self.participant_set.column_filter(Participant.participantId)
         ).order_by(
             Participant.participantId,
             QuestionnaireResponse.authored
@@ -840,8 +844,7 @@ class CurationExportClass(ToolBase):
                 raise NameError(f'File {self.args.participant_list_file} was not found.')
             with open(self.args.participant_list_file, encoding='utf-8-sig') as pid_file:
                 lines = pid_file.readlines()
-                for line in lines:
-                    self.pid_list.append(int(line.strip()))
+                self.participant_set.update(int(line.strip()) for line in lines)
             filter_options["participant_list_file"] = self.args.participant_list_file
         else:
             filter_options["participant_origin"] = self.args.participant_origin
@@ -851,8 +854,7 @@ class CurationExportClass(ToolBase):
                 raise NameError(f'File {self.args.exclude_participants} was not found.')
             with open(self.args.exclude_participants, encoding='utf-8-sig') as pid_file:
                 lines = pid_file.readlines()
-                for line in lines:
-                    self.exclude_pid_list.append(int(line.strip()))
+                self.exclude_participant_set.update(int(line.strip()) for line in lines)
             filter_options["participant_exclude_file"] = self.args.exclude_participants
 
         if self.args.include_surveys:
@@ -909,9 +911,11 @@ class CurationExportClass(ToolBase):
         with self.get_session(database_name='cdm', alembic=True, isolation_level='READ UNCOMMITTED') as session:
             if not self.args.participant_list_file:
                 _logger.debug("Selecting participant IDs")
+                self.exclude_participant_set.save(session)
                 self._select_participant_ids(session, self.args.participant_origin, self.cutoff_date)
+            self.participant_set.save(session)
 
-            _logger.debug(f"Populating with {len(self.pid_list)} PIDs")
+            _logger.debug(f"Populating with {len(self.participant_set)} PIDs")
             _logger.debug("Populating src_clean")
             self.run_function_on_pids(self._build_src_clean, session, "src_clean")
             if not self.args.omit_measurements:
@@ -950,19 +954,19 @@ class CurationExportClass(ToolBase):
 
         return 0
 
-    def _build_src_clean(self, session:sqlalchemy.orm.session.Session, participant_id_subset:List[int]):
-        self._populate_questionnaire_answers_by_module(session, participant_id_subset, self.cutoff_date)
-        self._populate_src_clean(session, participant_id_subset, self.cutoff_date)
+    def _build_src_clean(self, session:sqlalchemy.orm.session.Session, chunk_number: int):
+        self._populate_questionnaire_answers_by_module(session, chunk_number, self.cutoff_date)
+        self._populate_src_clean(session, chunk_number, self.cutoff_date)
 
-    def run_function_on_pids(self, _func: Callable, session: sqlalchemy.orm.session.Session, description: str,
-                             chunk_size=1000):
-        chunk = 1
-        full_pid_list_len = len(self.pid_list)
-        chunks = int(full_pid_list_len / chunk_size) + 1
-        for participant_id_subset in list_chunks(lst=self.pid_list, chunk_size=chunk_size):
-            _logger.debug(f"{description}: Chunk {chunk} of {chunks}")
-            chunk += 1
-            _func(session, participant_id_subset)
+    def run_function_on_pids(self, _func: Callable, session: sqlalchemy.orm.session.Session, description: str):
+        """
+        Calls the function once for each chunk of the participant set. The function is given the chunk number
+        and is expected to filter its queries using the participant set table.
+        """
+        chunks = self.participant_set.chunk_count
+        for chunk_number in self.participant_set.chunk_numbers():
+            _logger.debug(f"{description}: Chunk {chunk_number + 1} of {chunks}")
+            _func(session, chunk_number)
 
     def manage_etl_exclude_code(self):
         if not self.args.operation or self.args.operation not in ['add', 'remove']:
@@ -1056,7 +1060,9 @@ class CurationExportClass(ToolBase):
                 QuestionnaireResponseAdditionalInfo,
                 EHRConsentStatus,
                 QuestionnaireResponseAdditionalInfo,
-                WearConsent
+                WearConsent,
+                TempEtlParticipant,
+                TempEtlExcludedParticipant
             ])
 
     def _finalize_cdm(self, session, drop_tables: bool = False, drop_columns: bool = True):
@@ -1328,6 +1334,9 @@ class CurationExportClass(ToolBase):
             session.execute("""DROP TABLE IF EXISTS cdm.tmp_cv_concept_lk;
                                DROP TABLE IF EXISTS cdm.tmp_vcv_concept_lk;
                             """)
+            session.execute("""DROP TABLE IF EXISTS cdm.temp_etl_participant;
+                               DROP TABLE IF EXISTS cdm.temp_etl_excluded_participant;
+                            """)
 
         if drop_columns:
             # Drop columns only used for ETL purposes
@@ -1373,16 +1382,14 @@ class CurationExportClass(ToolBase):
         session.execute("""CREATE INDEX src_cln_p_id ON cdm.src_clean (participant_id);
                            CREATE INDEX src_cln_filter ON cdm.src_clean (filter)""")
 
-    @staticmethod
-    def _filter_question(session, pid_list):
+    def _filter_question(self, session, chunk_number: int):
         session.execute(f"""UPDATE cdm.src_clean
                             INNER JOIN cdm.combined_question_filter ON
                                 cdm.src_clean.question_ppi_code = cdm.combined_question_filter.question_ppi_code
                             SET cdm.src_clean.filter = 1
-                            WHERE cdm.src_clean.participant_id IN ({",".join([str(pid) for pid in pid_list])})""")
+                            WHERE {self.participant_set.sql_filter('cdm.src_clean.participant_id', chunk_number)}""")
 
-    @staticmethod
-    def _populate_src_participant(session, pid_list):
+    def _populate_src_participant(self, session, chunk_number: int):
         session.execute(f"""INSERT INTO cdm.src_participant
                             SELECT
                                 f1.participant_id,
@@ -1405,7 +1412,7 @@ class CurationExportClass(ToolBase):
                                     WHERE
                                         src_c.question_ppi_code = 'PIIBirthInformation_BirthDate'
                                         AND src_c.value_date IS NOT NULL
-                                        AND src_c.participant_id IN ({",".join([str(pid) for pid in pid_list])})
+                                        AND {self.participant_set.sql_filter('src_c.participant_id', chunk_number)}
                                     GROUP BY
                                         src_c.participant_id,
                                         src_c.src_id
@@ -1420,8 +1427,7 @@ class CurationExportClass(ToolBase):
                                     t1.src_id
                                 ) f1""")
 
-    @staticmethod
-    def _populate_src_mapped(session, pid_list):
+    def _populate_src_mapped(self, session, chunk_number: int):
         session.execute(f"""INSERT INTO cdm.src_mapped
                             SELECT
                                 0                                   AS id,
@@ -1467,7 +1473,7 @@ class CurationExportClass(ToolBase):
                                 ON  vc3.concept_id = vcr2.concept_id_1
                             LEFT JOIN voc.tmp_voc_concept_s vc4
                                 ON  vcr2.concept_id_2 = vc4.concept_id
-                            WHERE src_c.participant_id IN ({",".join([str(pid) for pid in pid_list])})
+                            WHERE {self.participant_set.sql_filter('src_c.participant_id', chunk_number)}
                             AND src_c.filter = 0
                             """)
 
@@ -1758,7 +1764,7 @@ class CurationExportClass(ToolBase):
                                 AND pm.final = 1
                                 {collect_type_filter}
                                 AND (pm.status <> 2 OR pm.status IS NULL) {cutoff_filter}
-                            WHERE pm.participant_id IN ({",".join([str(pid) for pid in self.pid_list])})
+                            WHERE {self.participant_set.sql_filter('pm.participant_id')}
                             ;
                             """)
 
@@ -2172,7 +2178,7 @@ class CurationExportClass(ToolBase):
                              WHERE cdm_meas.parent_id IS NOT NULL
                                      """)
 
-    def _populate_observation_surveys(self, session, pid_list:List[int]):
+    def _populate_observation_surveys(self, session, chunk_number: int):
         # -- units: observ.code, observ.str, observ.num, observ.bool
         # -- 'observation' table consists of 2 parts:
         # -- 1) patient's questionnaires
@@ -2225,7 +2231,7 @@ class CurationExportClass(ToolBase):
                                 src_m.src_id                                AS src_id
                             FROM cdm.src_mapped src_m
                             WHERE src_m.question_ppi_code is not null
-                            AND src_m.participant_id IN ({",".join([str(pid) for pid in pid_list])})
+                            AND {self.participant_set.sql_filter('src_m.participant_id', chunk_number)}
                                     """)
 
         # remove special character
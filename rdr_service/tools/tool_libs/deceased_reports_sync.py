@@ -1,6 +1,6 @@
 from dateutil import parser
 
-from rdr_service.offline.import_deceased_reports import DeceasedReportImporter
+from rdr_service.offline.import_deceased_reports import DeceasedReportImporter, IMPORT_BATCH_SIZE
 from rdr_service.tools.tool_libs.tool_base import cli_run, ToolBase
 
 tool_cmd = 'deceased-sync'
@@ -17,11 +17,14 @@ class DeceasedSyncTool(ToolBase):
 
         server_config = self.get_server_config()
         importer = DeceasedReportImporter(server_config)
-        importer.import_reports(parsed_since_date)
+        importer.import_reports(parsed_since_date, batch_size=self.args.batch_size)
 
 
 def add_additional_arguments(arg_parser):
     arg_parser.add_argument('--since-date', help='Request all records sync the given date/time', default=None)
+    arg_parser.add_argument(
+        '--batch-size', help='Number of records to import at a time', type=int, default=IMPORT_BATCH_SIZE
+    )
 
 
 def run():
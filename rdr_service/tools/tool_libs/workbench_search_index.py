@@ -0,0 +1,17 @@
+from rdr_service.dao.workbench_search_dao import WorkbenchWorkspaceSearchIndexDao
+from rdr_service.tools.tool_libs.tool_base import cli_run, logger, ToolBase
+
+tool_cmd = 'workbench-search-index'
+tool_desc = 'Rebuild the search index used by the research projects directory'
+
+
+class WorkbenchSearchIndexTool(ToolBase):
+    def run(self):
+        super(WorkbenchSearchIndexTool, self).run()
+
+        workspace_count = WorkbenchWorkspaceSearchIndexDao().rebuild_index()
+        logger.info(f'Indexed {workspace_count} workspaces')
+
+
+def run():
+    return cli_run(tool_cmd, tool_desc, WorkbenchSearchIndexTool)
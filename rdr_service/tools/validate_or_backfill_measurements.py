@@ -1,4 +1,5 @@
 """Tool used to retrieve metadata about all physical measurements in use for participants,
+(when run with --rebuild_catalog) to rebuild that metadata from all of the original resources,
 or (when run with --run_backfill) to update all existing physical measurements rows to reflect
 all information that can be parsed from the original resources."""
 
@@ -13,6 +14,9 @@ def main(args):
     if args.run_backfill:
         num_updated = PhysicalMeasurementsDao().backfill_measurements()
         logging.info("%d measurements updated." % num_updated)
+    elif args.rebuild_catalog:
+        num_concepts = PhysicalMeasurementsDao().rebuild_measurement_catalog()
+        logging.info("%d distinct measurements found." % num_concepts)
     else:
         pprint(PhysicalMeasurementsDao().get_distinct_measurements_json(), indent=2)
 
@@ -21,5 +25,8 @@ if __name__ == "__main__":
     configure_logging()
     parser = get_parser()
     parser.add_argument("--run_backfill", help="Backfill existing physical measurements", action="store_true")
+    parser.add_argument(
+        "--rebuild_catalog", help="Rebuild the catalog of distinct measurements from all resources", action="store_true"
+    )
 
     main(parser.parse_args())
@@ -1,8 +1,10 @@
 import csv
+import itertools
 import logging
 
 from protorpc import messages
 
+from rdr_service import clock
 from rdr_service.api_util import open_cloud_file
 from rdr_service.cloud_utils.gcp_cloud_tasks import GCPCloudTask
 from rdr_service.dao.study_nph_sms_dao import SmsJobRunDao, SmsSampleDao, SmsN0Dao, SmsN1Mc1Dao
@@ -11,6 +13,9 @@ from rdr_service.workflow_management.general_job_controller import JobController
 from rdr_service.services.ancillary_studies.nph_incident import NphIncidentDao
 from rdr_service.workflow_management.nph.sms_validation import SmsValidator
 
+# Number of manifest rows stored with each multi-row insert
+MANIFEST_INSERT_BATCH_SIZE = 1000
+
 
 class SmsJobId(messages.Enum):
     UNSET = 0
@@ -46,6 +51,7 @@ class SmsWorkflow:
         self.file_dao = None
         self.env = workflow_def.get('env')
         self.validator = SmsValidator(self.file_path, self.recipient)
+        self.batch_size = workflow_def.get('batch_size', MANIFEST_INSERT_BATCH_SIZE)
 
         # Job Map
         self.process_map = {
@@ -54,30 +60,20 @@ class SmsWorkflow:
         }
 
     @staticmethod
-    def read_data_from_cloud_manifest(path: str) -> dict:
+    def clean_file_header(header: str) -> str:
+        return header.strip().lower()
+
+    @staticmethod
+    def iter_manifest_rows(csv_reader: csv.DictReader):
         """
-        Opens a cloud manifest file at `path`
-        Converts headers of file to lowercase since partners choose to capitalize arbitrarily
-        returns dictionary
-        :param path:
-        :return: dict
+        Yields the rows of a manifest one at a time, without any values for blank headers
+        and with empty strings converted to None
         """
-
-        with open_cloud_file(path, 'r') as csv_file:
-
-            def clean_file_header(header: str) -> str:
-                return header.strip().lower()
-
-            data_to_ingest = {'rows': []}
-            csv_reader = csv.DictReader(csv_file, delimiter=",")
-            csv_reader.fieldnames = list(map(clean_file_header, csv_reader.fieldnames))
-            data_to_ingest['fieldnames'] = csv_reader.fieldnames
-            for row in csv_reader:
-                for key in row.copy():
-                    if not key:
-                        del row[key]
-                data_to_ingest['rows'].append(row)
-            return data_to_ingest
+        for row in csv_reader:
+            yield {
+                key: value if value != "" else None
+                for key, value in row.items() if key
+            }
 
     def validate_columns(self, fieldnames, dao):
         """ Simple check for column names in the model """
@@ -98,25 +94,45 @@ class SmsWorkflow:
             writer.write_header(source_data[0].keys())
             writer.write_rows(source_data)
 
-    def write_data_to_manifest_table(self, data_to_write):
-        for record in data_to_write:
-            if not isinstance(record, dict):
-                record = record._asdict()
-
-            additional_columns = {
-                "file_path": self.file_path,
-                "job_run_id": self.job_run.id
-            }
-            record.update(additional_columns)
-            model_obj = self.file_dao.get_model_obj_from_items(record.items())
-            self.file_dao.insert(model_obj)
+    def write_data_to_manifest_table(self, data_to_write, validate_batch=None):
+        """
+        Stores the records in the manifest table with multi-row inserts, a batch at a time.
+        All the batches are inserted in one transaction, so if anything fails none of the records are stored.
+        :param data_to_write: iterable of dictionaries or query result rows
+        :param validate_batch: optionally called with each batch of records before it is stored. If it raises
+            a ValueError the failure is logged and none of the records are stored.
+        """
+        column_names = set(self.file_dao.model_type.__table__.columns.keys())
+        now = clock.CLOCK.now()
+        additional_columns = {
+            "file_path": self.file_path,
+            "job_run_id": self.job_run.id,
+            "created": now,
+            "modified": now
+        }
 
-    def convert_empty_string_to_none(self, rows):
-        for row in rows:
-            for key, value in row.items():
-                if value == "":
-                    row[key] = None
-        return rows
+        records = iter(data_to_write)
+        with self.file_dao.session() as session:
+            while True:
+                batch = list(itertools.islice(records, self.batch_size))
+                if not batch:
+                    break
+                batch = [record if isinstance(record, dict) else record._asdict() for record in batch]
+                if validate_batch:
+                    try:
+                        validate_batch(batch)
+                    except ValueError as e:
+                        logging.error(f"Validation failed: {e}")
+                        session.rollback()
+                        return
+
+                self.file_dao.insert_bulk_with_session(session, [
+                    {
+                        key: value
+                        for key, value in {**record, **additional_columns}.items() if key in column_names
+                    }
+                    for record in batch
+                ])
 
     def execute_workflow(self):
         """
@@ -179,18 +195,20 @@ class SmsWorkflow:
                 logging.warning(f'File already ingested: {self.file_path}')
                 return
 
-            data_to_ingest = self.read_data_from_cloud_manifest(self.file_path)
-            self.validate_columns(data_to_ingest["fieldnames"], self.file_dao)
-            cleaned_rows = self.convert_empty_string_to_none(data_to_ingest["rows"])
-
+            validate_batch = None
             if self.file_type == SmsFileTypes.SAMPLE_LIST:
-                try:
-                    self.validator.validate_pull_list(cleaned_rows)
-                except ValueError as e:
-                    logging.error(f"Validation failed: {e}")
-                    return
+                validate_batch = self.validator.validate_pull_list
 
-            self.write_data_to_manifest_table(cleaned_rows)
+            # Rows are read from the file as they are stored, rather than loading the whole file first
+            with open_cloud_file(self.file_path, 'r') as csv_file:
+                csv_reader = csv.DictReader(csv_file, delimiter=",")
+                csv_reader.fieldnames = list(map(self.clean_file_header, csv_reader.fieldnames))
+                self.validate_columns(csv_reader.fieldnames, self.file_dao)
+
+                self.write_data_to_manifest_table(
+                    self.iter_manifest_rows(csv_reader),
+                    validate_batch=validate_batch
+                )
 
     def job_generation(self):
         """
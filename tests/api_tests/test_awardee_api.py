@@ -344,10 +344,8 @@ class AwardeeApiTest(BaseTestCase):
             )
         )
 
-    @mock.patch('rdr_service.dao.organization_hierarchy_sync_dao.OrganizationHierarchySyncDao.'
-                '_get_lat_long_for_site')
-    @mock.patch('rdr_service.dao.organization_hierarchy_sync_dao.OrganizationHierarchySyncDao.'
-                '_get_time_zone')
+    @mock.patch('rdr_service.services.geocoding.GoogleMapsGeocoder.get_lat_long')
+    @mock.patch('rdr_service.services.geocoding.GoogleMapsGeocoder.get_time_zone')
     def _update_hierarchy_item(self, item, time_zone, lat_long, obsolete=True, in_person=None):
         active_status = not obsolete
         if item == 'org':
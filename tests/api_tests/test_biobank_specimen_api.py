@@ -1,5 +1,6 @@
 import datetime
 import http.client
+import mock
 
 from rdr_service import clock
 from rdr_service.dao.biobank_specimen_dao import BiobankSpecimen, BiobankSpecimenDao, BiobankSpecimenAttributeDao,\
@@ -1268,3 +1269,105 @@ class BiobankOrderApiTest(BaseTestCase):
                 f"sampleStatus1PS4ATime",
             ),
         )
+
+    def test_migration_updates_stored_samples_and_summaries(self):
+        """Stored samples and participant summaries should be updated for all specimens of a migration request"""
+        other_participant = self.data_generator.create_database_participant(biobankId=556)
+        self.data_generator.create_database_participant_summary(participant=other_participant)
+        self.data_generator.create_database_biobank_stored_sample(
+            biobankStoredSampleId='existing',
+            biobankId=other_participant.biobankId,
+            test='1SAL2',
+            status=SampleStatus.RECEIVED
+        )
+        confirmation_date = datetime.datetime(2023, 1, 7, 18, 12)
+
+        specimens = []
+        for rlims_id, biobank_id, test_code in [
+            ('first', self.participant.biobankId, '1PS4A'),
+            ('second', other_participant.biobankId, '1PS4A'),
+            ('existing', other_participant.biobankId, '1SAL2')
+        ]:
+            specimen_json = self.get_minimal_specimen_json(rlims_id)
+            specimen_json.update({
+                'participantID': config_utils.to_client_biobank_id(biobank_id),
+                'testcode': test_code,
+                'confirmationDate': confirmation_date.isoformat(),
+                'status': {'status': 'In Circulation'}
+            })
+            specimens.append(specimen_json)
+
+        result = self.send_put('Biobank/specimens', request_data=specimens)
+        self.assertJsonResponseMatches(result, {
+            'summary': {
+                'total_received': 3,
+                'success_count': 3
+            }
+        })
+
+        stored_samples = self.session.query(BiobankStoredSample).order_by(
+            BiobankStoredSample.biobankStoredSampleId
+        ).all()
+        self.assertEqual(['existing', 'first', 'second'], [sample.biobankStoredSampleId for sample in stored_samples])
+        self.assertEqual(confirmation_date, stored_samples[0].confirmed)
+        self.assertIsNotNone(stored_samples[1].rdrCreated)
+
+        for participant_id in [self.participant.participantId, other_participant.participantId]:
+            summary = self.summary_dao.get(participant_id)
+            self.assertEqual(SampleStatus.RECEIVED, summary.sampleStatus1PS4A)
+            self.assertEqual(confirmation_date, summary.sampleStatus1PS4ATime)
+
+    def test_participant_update_failure_still_returns_result(self):
+        """The migration result should be returned once the specimens are stored, even if updating summaries fails"""
+        specimens = [self.get_minimal_specimen_json(rlims_id) for rlims_id in ['first', 'second']]
+
+        with mock.patch.object(BiobankSpecimenDao, 'update_participant_sample_data',
+                               side_effect=Exception('summary update failure')):
+            result = self.send_put('Biobank/specimens', request_data=specimens)
+
+        self.assertJsonResponseMatches(result, {
+            'summary': {
+                'total_received': 2,
+                'success_count': 2
+            }
+        })
+        self.assertEqual(2, self.session.query(BiobankStoredSample).count())
+
+    def test_failed_bulk_migration_is_rolled_back(self):
+        """Nothing from a failed bulk attempt should be committed before the specimens are processed individually"""
+        confirmation_date = datetime.datetime(2023, 1, 7, 18, 12)
+        specimens = []
+        for rlims_id in ['first', 'second']:
+            specimen_json = self.get_minimal_specimen_json(rlims_id)
+            specimen_json.update({
+                'testcode': '1PS4A',
+                'confirmationDate': confirmation_date.isoformat(),
+                'status': {'status': 'In Circulation'}
+            })
+            specimens.append(specimen_json)
+
+        upsert_stored_samples = BiobankSpecimenDao.upsert_stored_samples_with_session
+        committed_sample_counts = []
+
+        def fail_after_upsert(dao, session, *args):
+            upsert_stored_samples(dao, session, *args)
+            with self.dao.session() as other_session:
+                committed_sample_counts.append(other_session.query(BiobankStoredSample).count())
+            raise Exception('bulk processing failure')
+
+        with mock.patch.object(BiobankSpecimenDao, 'upsert_stored_samples_with_session', autospec=True,
+                               side_effect=fail_after_upsert), \
+                mock.patch.object(BiobankSpecimenDao, 'update_participant_sample_data') as bulk_update_mock:
+            result = self.send_put('Biobank/specimens', request_data=specimens)
+
+        self.assertEqual([0], committed_sample_counts)
+        bulk_update_mock.assert_not_called()
+        self.assertJsonResponseMatches(result, {
+            'summary': {
+                'total_received': 2,
+                'success_count': 2
+            }
+        })
+        self.assertEqual(2, self.session.query(BiobankStoredSample).count())
+        summary = self.summary_dao.get(self.participant.participantId)
+        self.assertEqual(SampleStatus.RECEIVED, summary.sampleStatus1PS4A)
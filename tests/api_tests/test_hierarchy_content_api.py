@@ -250,10 +250,8 @@ class HierarchyContentApiTest(BaseTestCase):
         self.assertIn({'displayName': 'Test update organization display name', 'id': 'AARDVARK_ORG'},
                       result_after['organizations'])
 
-    @mock.patch('rdr_service.dao.organization_hierarchy_sync_dao.OrganizationHierarchySyncDao.'
-                '_get_lat_long_for_site')
-    @mock.patch('rdr_service.dao.organization_hierarchy_sync_dao.OrganizationHierarchySyncDao.'
-                '_get_time_zone')
+    @mock.patch('rdr_service.services.geocoding.GoogleMapsGeocoder.get_lat_long')
+    @mock.patch('rdr_service.services.geocoding.GoogleMapsGeocoder.get_time_zone')
     def test_create_hpo_org_site(self, time_zone, lat_long):
         # NOTE: These payloads received direct from PTC on 11-19-19
         hpo_json = {
@@ -467,10 +465,8 @@ class HierarchyContentApiTest(BaseTestCase):
                                 }]
         }, result)
 
-    @mock.patch('rdr_service.dao.organization_hierarchy_sync_dao.OrganizationHierarchySyncDao.'
-                '_get_lat_long_for_site')
-    @mock.patch('rdr_service.dao.organization_hierarchy_sync_dao.OrganizationHierarchySyncDao.'
-                '_get_time_zone')
+    @mock.patch('rdr_service.services.geocoding.GoogleMapsGeocoder.get_lat_long')
+    @mock.patch('rdr_service.services.geocoding.GoogleMapsGeocoder.get_time_zone')
     def test_create_new_site(self, time_zone, lat_long):
         lat_long.return_value = 100, 110
         time_zone.return_value = 'America/Los_Angeles'
@@ -604,10 +600,8 @@ class HierarchyContentApiTest(BaseTestCase):
         self.assertEqual(existing_entity.launchDate, datetime.date(2019, 7, 22))
         self.assertEqual(existing_entity.phoneNumber, '7031234567')
 
-    @mock.patch('rdr_service.dao.organization_hierarchy_sync_dao.OrganizationHierarchySyncDao.'
-                '_get_lat_long_for_site')
-    @mock.patch('rdr_service.dao.organization_hierarchy_sync_dao.OrganizationHierarchySyncDao.'
-                '_get_time_zone')
+    @mock.patch('rdr_service.services.geocoding.GoogleMapsGeocoder.get_lat_long')
+    @mock.patch('rdr_service.services.geocoding.GoogleMapsGeocoder.get_time_zone')
     def test_update_existing_site(self, time_zone, lat_long):
         lat_long.return_value = 100, 110
         time_zone.return_value = 'America/Los_Angeles'
@@ -741,10 +735,8 @@ class HierarchyContentApiTest(BaseTestCase):
         self.assertEqual(existing_entity.launchDate, datetime.date(2010, 7, 2))
         self.assertEqual(existing_entity.phoneNumber, '7031234567')
 
-    @mock.patch('rdr_service.dao.organization_hierarchy_sync_dao.OrganizationHierarchySyncDao.'
-                '_get_lat_long_for_site')
-    @mock.patch('rdr_service.dao.organization_hierarchy_sync_dao.OrganizationHierarchySyncDao.'
-                '_get_time_zone')
+    @mock.patch('rdr_service.services.geocoding.GoogleMapsGeocoder.get_lat_long')
+    @mock.patch('rdr_service.services.geocoding.GoogleMapsGeocoder.get_time_zone')
     def test_update_existing_site_new_payload(self, time_zone, lat_long):
         lat_long.return_value = 100, 110
         time_zone.return_value = 'America/Los_Angeles'
@@ -849,10 +841,8 @@ class HierarchyContentApiTest(BaseTestCase):
         self.assertEqual(existing_entity.mayolinkClientNumber, 7035772)
         self.assertEqual(existing_entity.notes_ES, "<p>Addisu Testing update&nbsp;</p>\n")
 
-    @mock.patch('rdr_service.dao.organization_hierarchy_sync_dao.OrganizationHierarchySyncDao.'
-                '_get_lat_long_for_site')
-    @mock.patch('rdr_service.dao.organization_hierarchy_sync_dao.OrganizationHierarchySyncDao.'
-                '_get_time_zone')
+    @mock.patch('rdr_service.services.geocoding.GoogleMapsGeocoder.get_lat_long')
+    @mock.patch('rdr_service.services.geocoding.GoogleMapsGeocoder.get_time_zone')
     def test_insert_new_site_new_payload(self, time_zone, lat_long):
         lat_long.return_value = 100, 110
         time_zone.return_value = 'America/Los_Angeles'
@@ -971,7 +961,7 @@ class HierarchyContentApiTest(BaseTestCase):
         self.assertEqual(existing_entity.resourceId, '7d011d52-5de1-43e6-afa8-0943b15dc639')
         self.assertEqual(existing_entity.siteName, 'Banner Baywood Medical Center')
 
-    @mock.patch('rdr_service.dao.organization_hierarchy_sync_dao.OrganizationHierarchySyncDao._get_time_zone')
+    @mock.patch('rdr_service.services.geocoding.GoogleMapsGeocoder.get_time_zone')
     def test_insert_site_no_address_inactive(self, time_zone):
         time_zone.return_value = 'America/Los_Angeles'
         request_json = {
@@ -1159,10 +1149,8 @@ class HierarchyContentApiTest(BaseTestCase):
         self.assertEqual({'displayName': 'Banner Health', 'id': 'AZ_TUCSON_BANNER_HEALTH'},
                          result_after['organizations'][0])
 
-    @mock.patch('rdr_service.dao.organization_hierarchy_sync_dao.OrganizationHierarchySyncDao.'
-                '_get_lat_long_for_site')
-    @mock.patch('rdr_service.dao.organization_hierarchy_sync_dao.OrganizationHierarchySyncDao.'
-                '_get_time_zone')
+    @mock.patch('rdr_service.services.geocoding.GoogleMapsGeocoder.get_lat_long')
+    @mock.patch('rdr_service.services.geocoding.GoogleMapsGeocoder.get_time_zone')
     def test_create_new_popup_site_without_pmb(self, time_zone, lat_long):
         lat_long.return_value = 100, 110
         time_zone.return_value = 'America/Los_Angeles'
@@ -1287,10 +1275,8 @@ class HierarchyContentApiTest(BaseTestCase):
         result = self.send_get('Awardee')
         self.assertIn('hpo-site-awesome-testing', str(result))
 
-    @mock.patch('rdr_service.dao.organization_hierarchy_sync_dao.OrganizationHierarchySyncDao.'
-                '_get_lat_long_for_site')
-    @mock.patch('rdr_service.dao.organization_hierarchy_sync_dao.OrganizationHierarchySyncDao.'
-                '_get_time_zone')
+    @mock.patch('rdr_service.services.geocoding.GoogleMapsGeocoder.get_lat_long')
+    @mock.patch('rdr_service.services.geocoding.GoogleMapsGeocoder.get_time_zone')
     def test_setup_instructions_length(self, time_zone, lat_long):
         lat_long.return_value = 100, 110
         time_zone.return_value = 'America/Los_Angeles'
@@ -8,8 +8,11 @@ from rdr_service import clock
 from rdr_service.model.utils import to_client_participant_id
 from rdr_service.dao.database_utils import format_datetime
 from tests.helpers.unittest_base import BaseTestCase
+from rdr_service.config import MESSAGE_BROKER_QUEUED_DESTINATIONS
 from rdr_service.message_broker.message_broker import MessageBrokerFactory
-from rdr_service.model.message_broker import MessageBrokerRecord, MessageBrokerDestAuthInfo
+from rdr_service.message_broker.message_broker_dispatcher import MessageBrokerDispatcher
+from rdr_service.model.message_broker import MessageBrokerRecord, MessageBrokerDestAuthInfo, \
+    MessageBrokerDeliveryStatus, MessageBrokerMetadata
 from rdr_service.dao.message_broker_dest_auth_info_dao import MessageBrokerDestAuthInfoDao
 from rdr_service.dao.message_broker_dao import MessageBrokerDao, MessageBrokenEventDataDao
 
@@ -50,6 +53,12 @@ class MessageBrokerApiTest(BaseTestCase):
         auth_info_dao = MessageBrokerDestAuthInfoDao()
         auth_info_dao.insert(auth_info_record)
 
+    def _set_up_queued_destination(self, dest='vibrent', event='result_viewed'):
+        self.temporarily_override_config_setting(MESSAGE_BROKER_QUEUED_DESTINATIONS, [dest])
+        self._create_auth_info_record(dest, 'current_token', clock.CLOCK.now() + timedelta(hours=1))
+        with self.record_dao.session() as session:
+            session.add(MessageBrokerMetadata(eventType=event, destination=dest, url='http://ptsc.example.com/'))
+
     def test_exist_token_not_expired(self):
         message = MessageBrokerRecord(messageDest='vibrent')
         message_broker = MessageBrokerFactory.create(message)
@@ -626,3 +635,88 @@ class MessageBrokerApiTest(BaseTestCase):
         self.assertEqual(status_code, 200)
         self.assertEqual(response_json, {'result': 'mocked result'})
         self.assertEqual(error, '')
+
+    @mock.patch('rdr_service.dao.participant_dao.get_account_origin_id')
+    @mock.patch('rdr_service.message_broker.message_broker.PtscMessageBroker.get_access_token')
+    @mock.patch('rdr_service.message_broker.message_broker.PtscMessageBroker.send_request')
+    def test_queued_message_delivery(self, send_request, get_access_token, request_origin):
+        self._set_up_queued_destination()
+        request_origin.return_value = 'color'
+        get_access_token.return_value = 'current_token'
+        participant = self.data_generator.create_database_participant(participantOrigin='vibrent')
+        request_json = {
+            "event": "result_viewed",
+            "eventAuthoredTime": "2021-05-19T21:05:41Z",
+            "participantId": to_client_participant_id(participant.participantId),
+            "messageBody": {"test_str": "str"}
+        }
+
+        # the message should be acknowledged without being sent
+        result = self.send_post("MessageBroker", request_json)
+        send_request.assert_not_called()
+        self.assertEqual('PENDING', result['deliveryStatus'])
+        self.assertIsNone(result['responseCode'])
+
+        # the dispatcher should try again later if the destination has an error
+        send_request.return_value = 503, 'unavailable', 'unavailable'
+        dispatcher = MessageBrokerDispatcher(max_workers=1)
+        dispatcher.dispatch_queued_messages()
+        record = self.record_dao.get_all()[0]
+        self.assertEqual(MessageBrokerDeliveryStatus.PENDING, record.deliveryStatus)
+        self.assertEqual(1, record.deliveryAttempts)
+        self.assertGreater(record.nextAttemptTime, clock.CLOCK.now())
+        send_request.assert_called_with(token='current_token')
+
+        # the message isn't due to be sent again yet
+        send_request.reset_mock()
+        dispatcher.dispatch_queued_messages()
+        send_request.assert_not_called()
+
+        send_request.return_value = 200, {'result': 'mocked result'}, ''
+        with clock.FakeClock(clock.CLOCK.now() + timedelta(hours=1)):
+            dispatcher.dispatch_queued_messages()
+        record = self.record_dao.get_all()[0]
+        self.assertEqual(MessageBrokerDeliveryStatus.DELIVERED, record.deliveryStatus)
+        self.assertEqual(2, record.deliveryAttempts)
+        self.assertEqual('200', record.responseCode)
+        self.assertEqual({'result': 'mocked result'}, record.responseBody)
+
+    @mock.patch('rdr_service.message_broker.message_broker.PtscMessageBroker.get_access_token')
+    @mock.patch('rdr_service.message_broker.message_broker.PtscMessageBroker.send_request')
+    def test_queued_message_rejected(self, send_request, get_access_token):
+        self._set_up_queued_destination()
+        get_access_token.return_value = 'current_token'
+        send_request.return_value = 400, 'invalid message', 'invalid message'
+        participant = self.data_generator.create_database_participant(participantOrigin='vibrent')
+        message = MessageBrokerRecord(
+            participantId=participant.participantId,
+            messageDest='vibrent',
+            eventType='result_viewed',
+            requestTime=clock.CLOCK.now()
+        )
+        self.record_dao.insert(message)
+
+        # a message that the destination rejects shouldn't be tried again
+        MessageBrokerDispatcher().dispatch_queued_messages()
+        record = self.record_dao.get(message.id)
+        self.assertEqual(MessageBrokerDeliveryStatus.FAILED, record.deliveryStatus)
+        self.assertEqual(1, record.deliveryAttempts)
+        self.assertEqual('invalid message', record.responseError)
+
+    @mock.patch('rdr_service.dao.participant_dao.get_account_origin_id')
+    @mock.patch('rdr_service.message_broker.message_broker.PtscMessageBroker.send_request')
+    def test_queued_message_validated_before_queueing(self, send_request, request_origin):
+        """A message that can't be sent should be rejected rather than queued"""
+        self._set_up_queued_destination(event='result_viewed')
+        request_origin.return_value = 'color'
+        participant = self.data_generator.create_database_participant(participantOrigin='vibrent')
+        request_json = {
+            "event": "informing_loop_decision",
+            "eventAuthoredTime": "2021-05-19T21:05:41Z",
+            "participantId": to_client_participant_id(participant.participantId),
+            "messageBody": {"module_type": "gem", "decision_value": "yes"}
+        }
+
+        self.send_post("MessageBroker", request_json, expected_status=http.client.BAD_REQUEST)
+        send_request.assert_not_called()
+        self.assertEqual([], self.record_dao.get_all())
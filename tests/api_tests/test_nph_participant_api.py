@@ -16,6 +16,7 @@ from rdr_service.model.study_nph import (
     ConsentEventType, WithdrawalEvent,
     DeactivationEvent
 )
+from rdr_service.api.nph_participant_api_schemas.util import KeysetCursor
 from rdr_service.participant_enums import QuestionnaireStatus
 from rdr_service.main import app
 from tests.helpers.unittest_base import BaseTestCase
@@ -51,6 +52,12 @@ def simple_query_with_pagination(value: str, limit: int, offset: int):
            { startCursor  endCursor hasNextPage }  edges { node { participantNphId %s } } } }''' % (limit, offset, value)
 
 
+def simple_query_with_cursor(value: str, limit: int, cursor: str = None):
+    cursor_param = f', pageCursor: "{cursor}"' if cursor else ''
+    return ''' { participant (limit: %s%s) {totalCount resultCount nextCursor
+           edges { node { participantNphId %s } } } }''' % (limit, cursor_param, value)
+
+
 def simple_query(value):
     return ''' { participant  {totalCount resultCount pageInfo
            { startCursor  endCursor hasNextPage }  edges { node { participantNphId %s } } } }''' % value
@@ -997,6 +1004,35 @@ class NphParticipantAPITest(BaseTestCase):
         result = json.loads(executed.data.decode('utf-8'))
         self.assertEqual(2, result['participant']['totalCount'])  # assuming the two consented participants are returned
 
+    def test_cursor_pagination(self):
+        """Pages requested with the cursor from the previous page should continue where that page left off"""
+        self.add_consents(nph_participant_ids=self.base_participant_ids)
+
+        first_page = json.loads(app.test_client().post(
+            '/rdr/v1/nph_participant', data=simple_query_with_cursor(value='', limit=1)
+        ).data.decode('utf-8'))['participant']
+        self.assertEqual(2, first_page['totalCount'])
+        self.assertIsNotNone(first_page['nextCursor'])
+
+        second_page = json.loads(app.test_client().post(
+            '/rdr/v1/nph_participant',
+            data=simple_query_with_cursor(value='', limit=1, cursor=first_page['nextCursor'])
+        ).data.decode('utf-8'))['participant']
+        self.assertEqual(2, second_page['totalCount'])
+
+        page_ids = [page['edges'][0]['node']['participantNphId'] for page in [first_page, second_page]]
+        self.assertEqual([str(participant_id) for participant_id in sorted(self.base_participant_ids)], page_ids)
+
+    def test_keyset_cursor_encoding(self):
+        cursor = KeysetCursor(sort_value=datetime(2023, 5, 1, 12, 30), last_id=100000001)
+        self.assertEqual(cursor, KeysetCursor.decode(cursor.encode()))
+
+        enum_cursor = KeysetCursor(sort_value=QuestionnaireStatus.SUBMITTED, last_id=100000002).encode()
+        self.assertEqual(int(QuestionnaireStatus.SUBMITTED), KeysetCursor.decode(enum_cursor).sort_value)
+
+        with self.assertRaises(ValueError):
+            KeysetCursor.decode('not a cursor')
+
     def tearDown(self):
         super().tearDown()
         self.clear_table_after_test("rdr.code")
@@ -1,3 +1,4 @@
+from rdr_service.dao.workbench_search_dao import WorkbenchWorkspaceSearchIndexDao
 from tests.helpers.unittest_base import BaseTestCase
 
 
@@ -777,6 +778,33 @@ class ResearchProjectsDirectoryApiTest(BaseTestCase):
         result = self.send_get('researchHub/projectDirectory?page=1&pageSize=2')
         self.assertEqual(result['totalMatchedRecords'], 2)
         self.assertEqual(len(result['data']), 2)
+        # test paging with a cursor
+        result = self.send_get('researchHub/projectDirectory?pageSize=1')
+        self.assertEqual(result['data'][0]['workspaceId'], 1)
+        result = self.send_get(f'researchHub/projectDirectory?pageSize=1&cursor={result["nextCursor"]}')
+        self.assertEqual(result['totalMatchedRecords'], 2)
+        self.assertEqual(result['data'][0]['workspaceId'], 0)
+        result = self.send_get(f'researchHub/projectDirectory?pageSize=1&cursor={result["nextCursor"]}')
+        self.assertEqual(len(result['data']), 0)
+        self.assertIsNone(result['nextCursor'])
+        result = self.send_get('researchHub/projectDirectory?userId=1&userRole=all&pageSize=1')
+        result = self.send_get(
+            f'researchHub/projectDirectory?userId=1&userRole=all&pageSize=1&cursor={result["nextCursor"]}'
+        )
+        self.assertEqual(result['totalMatchedRecords'], 2)
+        self.assertEqual(result['data'][0]['workspaceId'], 0)
+        self.send_get('researchHub/projectDirectory?cursor=invalid', expected_status=400)
+
+        # test the search index gives the same results after being rebuilt
+        # (the searches above used the LIKE filters alone since the index hadn't been built)
+        search_index_dao = WorkbenchWorkspaceSearchIndexDao()
+        self.assertFalse(search_index_dao.is_index_built())
+        self.assertEqual(search_index_dao.rebuild_index(), 2)
+        self.assertTrue(search_index_dao.is_index_built())
+        result = self.send_get('researchHub/projectDirectory?ownerName=nname1%20fami')
+        self.assertEqual(len(result['data']), 1)
+        result = self.send_get('researchHub/projectDirectory?workspaceLike=string2')
+        self.assertEqual(len(result['data']), 1)
 
     def test_workspace_audit_sync_api(self):
         # create researchers
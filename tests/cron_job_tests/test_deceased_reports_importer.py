@@ -1,12 +1,14 @@
 from datetime import date, datetime, timedelta
 import mock
+from sqlalchemy.exc import IntegrityError
 
 from rdr_service.clock import FakeClock
 from rdr_service.offline.import_deceased_reports import DeceasedReportImporter, PROJECT_TOKEN_CONFIG_KEY
 from rdr_service.model.deceased_report import DeceasedReport
 from rdr_service.model.deceased_report_import_record import DeceasedReportImportRecord
+from rdr_service.model.participant_summary import ParticipantSummary
 from rdr_service.model.utils import to_client_participant_id
-from rdr_service.participant_enums import DeceasedNotification, DeceasedReportStatus
+from rdr_service.participant_enums import DeceasedNotification, DeceasedReportStatus, DeceasedStatus
 from tests.helpers.unittest_base import BaseTestCase
 
 
@@ -301,3 +303,150 @@ class DeceasedReportImporterTest(BaseTestCase):
         for record in import_records:
             self.assertEqual(first_import_time, record.created)
             self.assertEqual(second_import_time, record.lastSeen)
+
+    def test_batched_import(self, redcap_class):
+        """Checking that the batched import creates the same data, and doesn't import records again"""
+        unpaired_participant = self.data_generator.create_database_participant()
+        self.data_generator.create_database_participant_summary(participant=unpaired_participant)
+        paired_participant = self.data_generator.create_database_participant(
+            hpoId=self.data_generator.create_database_hpo().hpoId
+        )
+        unidentified_participant = self.data_generator.create_database_participant()
+
+        redcap_class.return_value.get_records.return_value = [
+            self._redcap_deceased_report_record(
+                participant_id=unpaired_participant.participantId,
+                notification='1',                       # OTHER notification
+                date_of_death='2020-01-01',
+                reporter_email='reportauthor@test.com'
+            ),
+            self._redcap_deceased_report_record(
+                participant_id=paired_participant.participantId,
+                notification='2',                       # NEXT_KIN_SUPPORT notification
+                reporter_first_name='Jane',
+                reporter_last_name='Doe',
+                reporter_relationship='2'               # CHILD
+            ),
+            self._redcap_deceased_report_record(
+                participant_id=unidentified_participant.participantId,
+                notification='1',                       # OTHER notification
+                identity_confirmed=False
+            ),
+            self._redcap_deceased_report_record(        # Unknown participant
+                participant_id=1234,
+                notification='1'                        # OTHER notification
+            )
+        ]
+
+        first_import_time = datetime(2020, 10, 8)
+        with FakeClock(first_import_time):
+            self.importer.import_reports(batch_size=2)
+
+        reports = {report.participantId: report for report in self.session.query(DeceasedReport).all()}
+        self.assertEqual({unpaired_participant.participantId, paired_participant.participantId}, set(reports))
+        self.assertEqual(DeceasedReportStatus.APPROVED, reports[unpaired_participant.participantId].status)
+        self.assertEqual('reportauthor@test.com', reports[unpaired_participant.participantId].reviewer.username)
+        self.assertEqual(DeceasedReportStatus.PENDING, reports[paired_participant.participantId].status)
+        self.assertEqual('Jane Doe', reports[paired_participant.participantId].reporterName)
+
+        summary = self.session.query(ParticipantSummary).filter(
+            ParticipantSummary.participantId == unpaired_participant.participantId
+        ).one()
+        self.assertEqual(DeceasedStatus.APPROVED, summary.deceasedStatus)
+        self.assertEqual(date(2020, 1, 1), summary.dateOfDeath)
+
+        import_records = {record.participantId: record for record in self.session.query(DeceasedReportImportRecord)}
+        self.assertEqual(
+            {
+                unpaired_participant.participantId: reports[unpaired_participant.participantId].id,
+                paired_participant.participantId: reports[paired_participant.participantId].id,
+                unidentified_participant.participantId: None
+            },
+            {participant_id: record.deceasedReportId for participant_id, record in import_records.items()}
+        )
+
+        second_import_time = datetime(2020, 10, 10)
+        with FakeClock(second_import_time):
+            self.importer.import_reports(batch_size=2)
+
+        self.session.expire_all()
+        self.assertEqual(2, self.session.query(DeceasedReport).count())
+        for record in self.session.query(DeceasedReportImportRecord):
+            self.assertEqual(first_import_time, record.created)
+            self.assertEqual(second_import_time, record.lastSeen)
+
+    @mock.patch('rdr_service.offline.import_deceased_reports.logging')
+    def test_batched_import_isolates_database_errors(self, mock_logging, redcap_class):
+        participants = [self.data_generator.create_database_participant() for _ in range(3)]
+        failing_participant_id = participants[1].participantId
+        redcap_class.return_value.get_records.return_value = [
+            self._redcap_deceased_report_record(participant_id=participant.participantId, notification='1')
+            for participant in participants
+        ]
+
+        write_batch = self.importer._write_batch
+
+        def write_batch_failing_for_participant(session, participant_ids, *args):
+            if failing_participant_id in participant_ids:
+                raise IntegrityError('insert', {}, Exception('test error'))
+            return write_batch(session, participant_ids, *args)
+
+        with mock.patch.object(self.importer, '_write_batch', side_effect=write_batch_failing_for_participant):
+            self.importer.import_reports(batch_size=10)
+
+        self.assertEqual(
+            {participants[0].participantId, participants[2].participantId},
+            {report.participantId for report in self.session.query(DeceasedReport).all()}
+        )
+        mock_logging.error.assert_called_with(
+            f'Record for {failing_participant_id} encountered a database error', exc_info=True
+        )
+
+    @mock.patch('rdr_service.offline.import_deceased_reports.logging')
+    def test_batched_import_retries_flushed_reports(self, mock_logging, redcap_class):
+        """Reports flushed before the batch failed should be stored when the participants are retried"""
+        participants = [self.data_generator.create_database_participant() for _ in range(3)]
+        for participant in participants:
+            self.data_generator.create_database_participant_summary(participant=participant)
+        failing_participant_id = participants[1].participantId
+        redcap_class.return_value.get_records.return_value = [
+            self._redcap_deceased_report_record(
+                participant_id=participant.participantId,
+                notification='1',
+                date_of_death='2020-01-01'
+            )
+            for participant in participants
+        ]
+
+        set_summary_fields = self.importer.deceased_report_dao.set_participant_summary_deceased_fields
+
+        def set_summary_fields_failing_for_participant(participant_summary, report):
+            set_summary_fields(participant_summary, report)
+            if participant_summary.participantId == failing_participant_id:
+                # An unknown hpo makes the summary fail to flush, after the batch's reports have been flushed
+                participant_summary.hpoId = 9999
+
+        with mock.patch.object(
+            self.importer.deceased_report_dao,
+            'set_participant_summary_deceased_fields',
+            side_effect=set_summary_fields_failing_for_participant
+        ):
+            self.importer.import_reports(batch_size=10)
+
+        self.session.expire_all()
+        stored_participant_ids = {participants[0].participantId, participants[2].participantId}
+        reports = {report.participantId: report for report in self.session.query(DeceasedReport).all()}
+        self.assertEqual(stored_participant_ids, set(reports))
+        self.assertEqual(
+            {participant_id: reports[participant_id].id for participant_id in stored_participant_ids},
+            {record.participantId: record.deceasedReportId for record in self.session.query(DeceasedReportImportRecord)}
+        )
+        for summary in self.session.query(ParticipantSummary):
+            if summary.participantId in stored_participant_ids:
+                self.assertEqual(DeceasedStatus.APPROVED, summary.deceasedStatus)
+                self.assertEqual(date(2020, 1, 1), summary.dateOfDeath)
+            else:
+                self.assertEqual(DeceasedStatus.UNSET, summary.deceasedStatus)
+        mock_logging.error.assert_called_with(
+            f'Record for {failing_participant_id} encountered a database error', exc_info=True
+        )
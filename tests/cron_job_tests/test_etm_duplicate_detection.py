@@ -1,7 +1,11 @@
 from tests.helpers.unittest_base import BaseTestCase
 from tests.test_data import data_path
+from datetime import timedelta
 import json
 
+from sqlalchemy import func
+
+from rdr_service.dao.metadata_dao import MetadataDao, ETM_RESPONSE_DUPLICATION_WATERMARK_KEY
 from rdr_service.offline.etm_duplicate_detector import EtmDuplicateDetector
 from rdr_service.model.etm import EtmQuestionnaireResponse
 from rdr_service.participant_enums import QuestionnaireResponseClassificationType
@@ -18,6 +22,8 @@ class EtmDuplicateDetectionTestCase(BaseTestCase):
         participant2 = self.data_generator.create_database_participant_summary()
         with open(data_path("etm_questionnaire_response.json")) as file:
             questionnaire_response_json = json.load(file)
+        self.participant2 = participant2
+        self.questionnaire_response_json = questionnaire_response_json
         questionnaire_response_json["subject"][
             "reference"
         ] = f"Patient/P{participant.participantId}"
@@ -65,3 +71,41 @@ class EtmDuplicateDetectionTestCase(BaseTestCase):
 
         second_duplicate_id = etm_duplicate_detector.get_duplicate_ids(self.session)
         self.assertEqual(second_duplicate_id, [])
+
+    def test_incremental_duplicate_detection(self):
+        pubsub_mock = self.mock('rdr_service.offline.etm_duplicate_detector.submit_pipeline_pubsub_msg')
+        etm_duplicate_detector = EtmDuplicateDetector()
+        expected_duplicate_ids = etm_duplicate_detector.get_duplicate_ids(self.session)
+
+        duplicate_ids = etm_duplicate_detector.run_incremental(self.session)
+        self.assertCountEqual(expected_duplicate_ids, duplicate_ids)
+        self.assertEqual(duplicate_ids, pubsub_mock.call_args.kwargs['pk_values'])
+        watermark = MetadataDao().get_by_key_with_session(self.session, ETM_RESPONSE_DUPLICATION_WATERMARK_KEY)
+        self.assertIsNotNone(watermark.dateValue)
+
+        # Only the new response should be found on the next run
+        self.send_post(
+            f"Participant/P{self.participant2.participantId}/QuestionnaireResponse",
+            self.questionnaire_response_json,
+        )
+        latest_response_id = self.session.query(EtmQuestionnaireResponse.etm_questionnaire_response_id).order_by(
+            EtmQuestionnaireResponse.etm_questionnaire_response_id.desc()
+        ).first()[0]
+        self.assertEqual([latest_response_id], etm_duplicate_detector.run_incremental(self.session))
+        self.assertEqual([], etm_duplicate_detector.run_incremental(self.session))
+
+    def test_incremental_detection_rechecks_before_watermark(self):
+        """Responses created shortly before the watermark may have been committed after the last run"""
+        self.mock('rdr_service.offline.etm_duplicate_detector.submit_pipeline_pubsub_msg')
+        etm_duplicate_detector = EtmDuplicateDetector()
+        expected_duplicate_ids = etm_duplicate_detector.get_duplicate_ids(self.session)
+
+        latest_created = self.session.query(func.max(EtmQuestionnaireResponse.created)).scalar()
+        watermark = latest_created + timedelta(minutes=5)
+        MetadataDao().upsert_with_session(self.session, ETM_RESPONSE_DUPLICATION_WATERMARK_KEY, date_value=watermark)
+
+        self.assertCountEqual(expected_duplicate_ids, etm_duplicate_detector.run_incremental(self.session))
+        self.assertEqual(
+            watermark,
+            MetadataDao().get_by_key_with_session(self.session, ETM_RESPONSE_DUPLICATION_WATERMARK_KEY).dateValue
+        )
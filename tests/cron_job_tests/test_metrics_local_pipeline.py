@@ -0,0 +1,65 @@
+import csv
+from datetime import date, datetime
+import json
+
+from rdr_service.model.metrics import MetricsBucket, MetricsVersion
+from rdr_service.offline.metrics_config import HPO_ID_FIELDS
+from rdr_service.offline.metrics_local_pipeline import LocalMetricsPipeline
+from rdr_service.storage import LocalFilesystemStorageProvider
+from tests.helpers.unittest_base import BaseTestCase
+
+
+class LocalMetricsPipelineTest(BaseTestCase):
+    def setUp(self, *args, **kwargs):
+        super().setUp(*args, **kwargs)
+        self.storage_provider = LocalFilesystemStorageProvider()
+
+    def _write_hpo_ids_file(self, path, rows):
+        with self.storage_provider.open(path, 'w') as file:
+            writer = csv.writer(file)
+            writer.writerow(HPO_ID_FIELDS)
+            writer.writerows(rows)
+
+    def test_calculating_metrics(self):
+        # Each file holds a shard of the participants, the way they're exported
+        input_files = ['metrics_bucket/hpo_ids_0.csv', 'metrics_bucket/hpo_ids_1.csv']
+        participant_count = 0
+        for shard, input_file in enumerate(input_files):
+            rows = []
+            for participant_id in range(shard, 40, len(input_files)):
+                hpo = 'PITT' if participant_id % 4 else 'AZ_TUCSON'
+                rows.append([str(participant_id), hpo, f'2017-01-0{participant_id % 3 + 1}T10:00:00Z'])
+                participant_count += 1
+            self._write_hpo_ids_file(input_file, rows)
+
+        # Use small buffers so that map output is spilled and reducers sort on disk
+        version_id = LocalMetricsPipeline(
+            self.storage_provider,
+            input_files,
+            now=datetime(2017, 1, 5),
+            processes=2,
+            num_partitions=3,
+            spill_size=5,
+            sort_buffer_size=7
+        ).run()
+
+        metrics_version = self.session.query(MetricsVersion).filter(
+            MetricsVersion.metricsVersionId == version_id
+        ).one()
+        self.assertTrue(metrics_version.complete)
+        self.assertFalse(metrics_version.inProgress)
+
+        buckets = {
+            (bucket.hpoId, bucket.date): json.loads(bucket.metrics)
+            for bucket in self.session.query(MetricsBucket).filter(MetricsBucket.metricsVersionId == version_id)
+        }
+        # A bucket for each day through the run date, for each HPO and for all of them together
+        self.assertEqual(15, len(buckets))
+        self.assertEqual(participant_count, buckets[('', date(2017, 1, 5))]['Participant'])
+        self.assertEqual(30, buckets[('PITT', date(2017, 1, 5))]['Participant'])
+        self.assertEqual(10, buckets[('AZ_TUCSON', date(2017, 1, 5))]['Participant'])
+        self.assertEqual(14, buckets[('', date(2017, 1, 1))]['Participant'])
+        self.assertEqual(30, buckets[('PITT', date(2017, 1, 5))]['Participant.hpoId.PITT'])
+
+        for input_file in input_files:
+            self.assertFalse(self.storage_provider.exists(input_file))
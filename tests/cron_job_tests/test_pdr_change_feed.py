@@ -0,0 +1,112 @@
+from datetime import datetime, timedelta
+
+import mock
+
+from rdr_service.clock import FakeClock
+from rdr_service.dao.metadata_dao import MetadataDao, PDR_CHANGE_FEED_BIOBANK_STORED_SAMPLE_KEY,\
+    PDR_CHANGE_FEED_PARTICIPANT_SUMMARY_KEY, PDR_CHANGE_FEED_QUESTIONNAIRE_RESPONSE_KEY
+from rdr_service.offline.bigquery_sync import incremental_rebuild_bigquery_handler
+from tests.helpers.unittest_base import BaseTestCase
+
+WATERMARK_KEYS = [
+    PDR_CHANGE_FEED_PARTICIPANT_SUMMARY_KEY,
+    PDR_CHANGE_FEED_QUESTIONNAIRE_RESPONSE_KEY,
+    PDR_CHANGE_FEED_BIOBANK_STORED_SAMPLE_KEY
+]
+
+
+@mock.patch('rdr_service.offline.bigquery_sync.dispatch_participant_rebuild_tasks')
+class PdrChangeFeedTest(BaseTestCase):
+    def setUp(self, *args, **kwargs) -> None:
+        super().setUp(*args, **kwargs)
+        self.watermark = datetime(2023, 4, 1)
+        self.metadata_dao = MetadataDao()
+        with self.metadata_dao.session() as session:
+            for key in WATERMARK_KEYS:
+                self.metadata_dao.upsert_with_session(session, key, date_value=self.watermark)
+
+        self.unchanged_participant = self.data_generator.create_database_participant()
+        self.data_generator.create_database_participant_summary(
+            participant=self.unchanged_participant,
+            lastModified=self.watermark - timedelta(days=3)
+        )
+
+        changed_time = self.watermark + timedelta(hours=2)
+        self.summary_participant = self.data_generator.create_database_participant()
+        self.data_generator.create_database_participant_summary(
+            participant=self.summary_participant,
+            lastModified=changed_time
+        )
+        self.response_participant = self.data_generator.create_database_participant()
+        self.data_generator.create_database_questionnaire_response(
+            participantId=self.response_participant.participantId,
+            created=changed_time
+        )
+        self.sample_participant = self.data_generator.create_database_participant()
+        with FakeClock(changed_time):
+            self.data_generator.create_database_biobank_stored_sample(
+                biobankId=self.sample_participant.biobankId
+            )
+        self.changed_time = changed_time
+
+    def test_dry_run_report(self, dispatch_mock):
+        report = incremental_rebuild_bigquery_handler(dryrun=True)
+
+        self.assertEqual(3, report['participant_count'])
+        self.assertEqual(1, report['task_count'])
+        self.assertEqual(1, report['sources']['participant_summary']['participant_count'])
+        self.assertEqual(1, report['sources']['questionnaire_response']['participant_count'])
+        self.assertEqual(1, report['sources']['biobank_stored_sample']['participant_count'])
+        dispatch_mock.assert_not_called()
+        for key in WATERMARK_KEYS:
+            self.assertEqual(self.watermark, self._get_watermark(key))
+
+    def test_only_changed_participants_are_rebuilt(self, dispatch_mock):
+        incremental_rebuild_bigquery_handler()
+
+        rebuilt_ids = dispatch_mock.call_args.args[0]
+        self.assertEqual(
+            sorted([
+                self.summary_participant.participantId,
+                self.response_participant.participantId,
+                self.sample_participant.participantId
+            ]),
+            rebuilt_ids
+        )
+        for key in WATERMARK_KEYS:
+            self.assertEqual(self.changed_time, self._get_watermark(key))
+
+    def test_late_commits_before_watermark_are_rebuilt(self, dispatch_mock):
+        """Records timestamped just before the watermark may have been committed after the last run read them"""
+        late_participant = self.data_generator.create_database_participant()
+        self.data_generator.create_database_questionnaire_response(
+            participantId=late_participant.participantId,
+            created=self.watermark - timedelta(minutes=5)
+        )
+
+        incremental_rebuild_bigquery_handler()
+
+        rebuilt_ids = dispatch_mock.call_args.args[0]
+        self.assertIn(late_participant.participantId, rebuilt_ids)
+        self.assertNotIn(self.unchanged_participant.participantId, rebuilt_ids)
+        self.assertEqual(self.changed_time, self._get_watermark(PDR_CHANGE_FEED_QUESTIONNAIRE_RESPONSE_KEY))
+
+    def test_watermark_not_moved_back_by_overlap(self, dispatch_mock):
+        with self.metadata_dao.session() as session:
+            self.metadata_dao.upsert_with_session(
+                session,
+                PDR_CHANGE_FEED_QUESTIONNAIRE_RESPONSE_KEY,
+                date_value=self.changed_time + timedelta(minutes=5)
+            )
+
+        incremental_rebuild_bigquery_handler()
+
+        self.assertIn(self.response_participant.participantId, dispatch_mock.call_args.args[0])
+        self.assertEqual(
+            self.changed_time + timedelta(minutes=5),
+            self._get_watermark(PDR_CHANGE_FEED_QUESTIONNAIRE_RESPONSE_KEY)
+        )
+
+    def _get_watermark(self, key):
+        with self.metadata_dao.session() as session:
+            return self.metadata_dao.get_by_key_with_session(session, key).dateValue
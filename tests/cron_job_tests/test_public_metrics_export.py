@@ -0,0 +1,132 @@
+from datetime import date, datetime
+
+from rdr_service.clock import FakeClock
+from rdr_service.dao.metric_set_dao import AggregateMetricsDao, MetricSetDao
+from rdr_service.model.metric_set import AggregateMetrics, MetricSet
+from rdr_service.offline.public_metrics_export import LIVE_METRIC_SET_ID, PublicMetricsExport
+from rdr_service.participant_enums import (
+    EnrollmentStatus,
+    MetricSetType,
+    MetricsKey,
+    OrderStatus,
+    PhysicalMeasurementsStatus,
+    QuestionnaireStatus,
+    Race,
+    SelfReportedPhysicalMeasurementsStatus,
+    TEST_HPO_ID,
+    TEST_HPO_NAME,
+    WithdrawalStatus,
+)
+from tests.helpers.unittest_base import BaseTestCase
+
+EXPORT_TIME = datetime(2020, 6, 15, 12)
+
+
+class PublicMetricsExportTest(BaseTestCase):
+    def setUp(self, *args, **kwargs):
+        super().setUp(*args, **kwargs)
+        self.test_hpo = self.data_generator.create_database_hpo(hpoId=TEST_HPO_ID, name=TEST_HPO_NAME)
+        self.woman_code = self.data_generator.create_database_code(value='GenderIdentity_Woman')
+        self.tennessee_code = self.data_generator.create_database_code(value='PIIState_TN')
+        self.california_code = self.data_generator.create_database_code(value='CA')
+
+        self.data_generator.create_database_participant_summary(
+            email='first@test.org',
+            enrollmentStatus=EnrollmentStatus.INTERESTED,
+            genderIdentityId=self.woman_code.codeId,
+            race=Race.WHITE,
+            stateId=self.tennessee_code.codeId,
+            # Turns 26 on 2020-06-20, but with the leap days it's been more than 26 * 365 days since they were born
+            dateOfBirth=date(1994, 6, 20),
+            clinicPhysicalMeasurementsStatus=PhysicalMeasurementsStatus.COMPLETED,
+            biospecimenStatus=OrderStatus.FINALIZED,
+            questionnaireOnOverallHealth=QuestionnaireStatus.SUBMITTED,
+            questionnaireOnLifestyle=QuestionnaireStatus.SUBMITTED,
+            questionnaireOnTheBasics=QuestionnaireStatus.SUBMITTED
+        )
+        self.data_generator.create_database_participant_summary(
+            email='second@test.org',
+            enrollmentStatus=EnrollmentStatus.MEMBER,
+            stateId=self.california_code.codeId,
+            dateOfBirth=None,
+            clinicPhysicalMeasurementsStatus=PhysicalMeasurementsStatus.UNSET,
+            selfReportedPhysicalMeasurementsStatus=SelfReportedPhysicalMeasurementsStatus.COMPLETED,
+            biospecimenStatus=OrderStatus.CREATED,
+            questionnaireOnTheBasics=QuestionnaireStatus.SUBMITTED
+        )
+        self.data_generator.create_database_participant_summary(
+            email='third@test.org',
+            enrollmentStatus=EnrollmentStatus.FULL_PARTICIPANT,
+            genderIdentityId=self.woman_code.codeId,
+            race=Race.ASIAN,
+            dateOfBirth=date(1930, 1, 1),
+            clinicPhysicalMeasurementsStatus=PhysicalMeasurementsStatus.CANCELLED
+        )
+        self.data_generator.create_database_participant_summary(
+            email='fourth@test.org',
+            dateOfBirth=date(2021, 1, 1)
+        )
+
+        # None of these participants should be counted
+        self.data_generator.create_database_participant_summary(
+            email='withdrawn@test.org',
+            withdrawalStatus=WithdrawalStatus.NO_USE
+        )
+        self.data_generator.create_database_participant_summary(email='test@example.com')
+        self.data_generator.create_database_participant_summary(
+            participant=self.data_generator.create_database_participant(hpoId=self.test_hpo.hpoId),
+            email='test_hpo@test.org'
+        )
+        self.data_generator.create_database_participant_summary(email=None, loginPhoneNumber='1234567890')
+
+    def _assert_values_match(self, expected_metrics, metrics):
+        self.assertEqual(set(expected_metrics.keys()), set(metrics.keys()))
+        for key, expected_value_counts in expected_metrics.items():
+            self.assertEqual(
+                expected_value_counts,
+                {value_count['value']: value_count['count'] for value_count in metrics[key]},
+                f'Unexpected values for {key}'
+            )
+
+    def test_export(self):
+        expected_metrics = {
+            MetricsKey.ENROLLMENT_STATUS: {'CONSENTED': 2, 'MEMBER': 1, 'FULL_PARTICIPANT': 1},
+            MetricsKey.GENDER: {'GenderIdentity_Woman': 2, 'UNSET': 2},
+            MetricsKey.RACE: {'WHITE': 1, 'ASIAN': 1, 'UNSET': 2},
+            MetricsKey.STATE: {'TN': 1, 'CA': 1, 'UNSET': 2},
+            MetricsKey.AGE_RANGE: {'26-35': 1, '86+': 1, 'UNSET': 2},
+            MetricsKey.PHYSICAL_MEASUREMENTS: {'COMPLETED': 2, 'CANCELLED': 1, 'UNSET': 1},
+            MetricsKey.BIOSPECIMEN_SAMPLES: {'COLLECTED': 1, 'UNSET': 3},
+            MetricsKey.QUESTIONNAIRE_ON_OVERALL_HEALTH: {'SUBMITTED': 1, 'UNSET': 3},
+            MetricsKey.QUESTIONNAIRE_ON_PERSONAL_HABITS: {'SUBMITTED': 1, 'UNSET': 3},
+            MetricsKey.QUESTIONNAIRE_ON_SOCIODEMOGRAPHICS: {'SUBMITTED': 2, 'UNSET': 2}
+        }
+
+        with FakeClock(EXPORT_TIME):
+            metrics = PublicMetricsExport._compute()
+        self._assert_values_match(expected_metrics, metrics)
+
+        # Saving replaces any aggregations the metric set already had
+        with MetricSetDao().session() as session:
+            session.add(MetricSet(
+                metricSetId=LIVE_METRIC_SET_ID,
+                metricSetType=MetricSetType.PUBLIC_PARTICIPANT_AGGREGATIONS,
+                lastModified=datetime(2020, 1, 1)
+            ))
+            session.flush()
+            session.add(AggregateMetrics(
+                metricSetId=LIVE_METRIC_SET_ID, metricsKey=MetricsKey.RACE, value='PMI_Skip', count=10
+            ))
+
+        with FakeClock(EXPORT_TIME):
+            PublicMetricsExport._save(LIVE_METRIC_SET_ID, metrics)
+
+        metric_set = MetricSetDao().get(LIVE_METRIC_SET_ID)
+        self.assertEqual(EXPORT_TIME, metric_set.lastModified)
+
+        saved_metrics = {}
+        for aggregation in AggregateMetricsDao().get_all_for_metric_set(LIVE_METRIC_SET_ID):
+            saved_metrics.setdefault(aggregation.metricsKey, []).append(
+                {'value': aggregation.value, 'count': aggregation.count}
+            )
+        self._assert_values_match(expected_metrics, saved_metrics)
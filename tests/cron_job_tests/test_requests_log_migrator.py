@@ -0,0 +1,69 @@
+import mock
+
+from rdr_service.dao import database_factory
+from rdr_service.model.requests_log import RequestsLog
+from rdr_service.offline.requests_log_migrator import RequestsLogArchiver, RequestsLogArchiveTarget
+from tests.helpers.unittest_base import BaseTestCase
+
+
+class RequestsLogArchiverTest(BaseTestCase):
+    def setUp(self, *args, **kwargs):
+        super().setUp(*args, **kwargs)
+        database = database_factory.get_database()
+        self.targets = [
+            RequestsLogArchiveTarget('first', 'requests_log_first_archive', database=database),
+            RequestsLogArchiveTarget('second', 'requests_log_second_archive', database=database)
+        ]
+        for target in self.targets:
+            target.table.create(database.get_engine())
+        self.archiver = RequestsLogArchiver(targets=self.targets, batch_size=2)
+
+    def tearDown(self):
+        for target in self.targets:
+            target.table.drop(database_factory.get_database().get_engine())
+        super().tearDown()
+
+    def _create_logs(self, count):
+        logs = []
+        for index in range(count):
+            log = RequestsLog(endpoint='test', version=1, method='POST', url='/test', resource={'index': index})
+            self.session.add(log)
+            logs.append(log)
+        self.session.commit()
+        return logs
+
+    def _get_archived_logs(self, target):
+        with target.database.session() as session:
+            return session.execute(target.table.select().order_by(target.table.c.id)).fetchall()
+
+    def test_archiving_logs(self):
+        logs = self._create_logs(5)
+
+        # Archiving a log copies it along with the rest of the logs the targets don't have yet
+        self.archiver.archive_log(logs[1].id)
+        for target in self.targets:
+            self.assertEqual([log.id for log in logs], [row.id for row in self._get_archived_logs(target)])
+            self.assertEqual(logs[4].id, target.get_high_watermark())
+
+        # Logs that were already copied aren't copied again
+        with mock.patch.object(self.archiver, 'archive_logs') as mock_archive_logs:
+            self.archiver.archive_log(logs[4].id)
+        mock_archive_logs.assert_not_called()
+
+        # A log that was committed after a batch passed its id is still copied
+        with self.targets[0].database.session() as session:
+            session.execute(self.targets[0].table.delete().where(self.targets[0].table.c.id == logs[2].id))
+        self.archiver.archive_log(logs[2].id)
+        for target in self.targets:
+            self.assertEqual([log.id for log in logs], [row.id for row in self._get_archived_logs(target)])
+
+        self.assertEqual('requests_log', RequestsLog.__table__.name)
+
+    def test_archiving_all_logs(self):
+        logs = self._create_logs(5)
+        self.archiver.archive_logs()
+        for target in self.targets:
+            self.assertEqual(
+                [(log.id, log.resource) for log in logs],
+                [(row.id, row.resource) for row in self._get_archived_logs(target)]
+            )
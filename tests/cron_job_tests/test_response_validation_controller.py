@@ -98,6 +98,45 @@ class ResponseValidationControllerTest(BaseTestCase):
         self.assertIsNone(newer_result.obsoletion_timestamp)
         self.assertIsNone(newer_result.obsoletion_reason)
 
+    def test_validating_in_chunks(self):
+        start_date = datetime(2024, 9, 1)
+        questionnaire, question = self._generate_questionnaire('first')
+        invalid_answers = [
+            self._generate_response(
+                created=start_date + timedelta(days=index + 1),
+                questionnaire=questionnaire,
+                question=question,
+                answer=index
+            )
+            for index in range(5)
+        ]
+        self._generate_response(
+            created=start_date - timedelta(days=1),
+            questionnaire=questionnaire,
+            question=question,
+            answer=3
+        )
+
+        controller = ResponseValidationController(
+            session=self.session,
+            validation_errors_dao=mock.MagicMock(),
+            since_date=start_date,
+            slack_webhook={},
+            participant_chunk_size=2,
+            max_loading_workers=3
+        )
+        with mock.patch.object(controller, '_output_result') as output_mock:
+            controller.run_validation()
+        self.session.commit()
+
+        results = self.session.query(PpiValidationResults).all()
+        self.assertEqual(
+            sorted(answer.questionnaireResponseId for answer in invalid_answers),
+            sorted(result.questionnaire_response_id for result in results)
+        )
+        self.assertTrue(all(len(result.errors) == 1 for result in results))
+        self.assertIn('number affected answers: 5', output_mock.call_args.args[0])
+
     def _generate_questionnaire(self, code_value_str):
         questionnaire = self.data_generator.create_database_questionnaire_history(
             version='1'
@@ -13,6 +13,7 @@ from rdr_service.dao.hpo_dao import HPODao
 from rdr_service.dao.organization_dao import OrganizationDao
 from rdr_service.dao.participant_dao import ParticipantDao
 from rdr_service.dao.participant_summary_dao import ParticipantSummaryDao
+from rdr_service.domain_model.ehr import ParticipantEhrFile
 from rdr_service.model.ehr import ParticipantEhrReceipt
 from rdr_service.model.hpo import HPO
 from rdr_service.model.organization import Organization
@@ -437,6 +438,223 @@ class UpdateEhrStatusUpdatesTestCase(BaseTestCase):
             )
         ], mock_rebuild_tasks)
 
+    def test_bulk_update_returns_changed_participants(self):
+        """Only participants whose ehr data is different after recording the files should be updated"""
+        upload_time = datetime.datetime(2020, 3, 12, 8)
+        unchanged_pid = self.data_generator.create_database_participant_summary(
+            ehrStatus=EhrStatus.PRESENT,
+            isEhrDataAvailable=True,
+            ehrReceiptTime=upload_time,
+            ehrUpdateTime=upload_time
+        ).participantId
+        updated_pid = self.data_generator.create_database_participant_summary(
+            ehrStatus=EhrStatus.PRESENT,
+            isEhrDataAvailable=True,
+            ehrReceiptTime=upload_time,
+            ehrUpdateTime=upload_time
+        ).participantId
+        new_pid = self.data_generator.create_database_participant_summary().participantId
+        mediated_pid = self.data_generator.create_database_participant_summary(
+            wasParticipantMediatedEhrAvailable=True,
+            isParticipantMediatedEhrDataAvailable=True,
+            firstParticipantMediatedEhrReceiptTime=upload_time,
+            latestParticipantMediatedEhrReceiptTime=upload_time
+        ).participantId
+
+        new_upload_time = datetime.datetime(2020, 4, 2, 10)
+        with self.summary_dao.session() as session:
+            hpo_updated_ids = ParticipantSummaryDao.bulk_update_hpo_ehr_status_with_session(session, [
+                ParticipantEhrFile(participant_id=unchanged_pid, receipt_time=upload_time, hpo_id=''),
+                ParticipantEhrFile(participant_id=updated_pid, receipt_time=new_upload_time, hpo_id=''),
+                ParticipantEhrFile(participant_id=new_pid, receipt_time=new_upload_time, hpo_id='')
+            ])
+            mediated_updated_ids = ParticipantSummaryDao.bulk_update_mediated_ehr_status_with_session(session, [
+                ParticipantEhrFile(participant_id=mediated_pid, receipt_time=upload_time, hpo_id='')
+            ])
+
+        self.assertEqual({updated_pid, new_pid}, hpo_updated_ids)
+        self.assertEqual(set(), mediated_updated_ids)
+        self.assert_ehr_data_matches(
+            participant_id=unchanged_pid,
+            had_ehr_status=EhrStatus.PRESENT,
+            currently_has_ehr=True,
+            first_ehr_time=upload_time,
+            latest_ehr_time=upload_time
+        )
+        self.assert_ehr_data_matches(
+            participant_id=updated_pid,
+            had_ehr_status=EhrStatus.PRESENT,
+            currently_has_ehr=True,
+            first_ehr_time=upload_time,
+            latest_ehr_time=new_upload_time
+        )
+        self.assert_ehr_data_matches(
+            participant_id=new_pid,
+            had_ehr_status=EhrStatus.PRESENT,
+            currently_has_ehr=True,
+            first_ehr_time=new_upload_time,
+            latest_ehr_time=new_upload_time
+        )
+        self.assert_mediated_data_matches(
+            participant_id=mediated_pid,
+            had_ehr_status=True,
+            currently_has_ehr=True,
+            first_ehr_time=upload_time,
+            latest_ehr_time=upload_time
+        )
+
+    def test_bulk_update_ignores_sub_second_receipt_times(self):
+        """Receipt times are stored without microseconds, so files with them shouldn't look like changes"""
+        upload_time = datetime.datetime(2020, 3, 12, 8)
+        participant_id = self.data_generator.create_database_participant_summary(
+            ehrStatus=EhrStatus.PRESENT,
+            isEhrDataAvailable=True,
+            ehrReceiptTime=upload_time,
+            ehrUpdateTime=upload_time
+        ).participantId
+
+        with self.summary_dao.session() as session:
+            updated_ids = ParticipantSummaryDao.bulk_update_hpo_ehr_status_with_session(session, [
+                ParticipantEhrFile(
+                    participant_id=participant_id,
+                    receipt_time=upload_time.replace(microsecond=123456),
+                    hpo_id=''
+                )
+            ])
+
+        self.assertEqual(set(), updated_ids)
+        self.assert_ehr_data_matches(
+            participant_id=participant_id,
+            had_ehr_status=EhrStatus.PRESENT,
+            currently_has_ehr=True,
+            first_ehr_time=upload_time,
+            latest_ehr_time=upload_time
+        )
+
+    def test_clear_ehr_data_available(self):
+        """Only the given participants should have their current flags cleared, keeping their history"""
+        upload_time = datetime.datetime(2020, 3, 12, 8)
+        summary_fields = {
+            'ehrStatus': EhrStatus.PRESENT,
+            'isEhrDataAvailable': True,
+            'ehrReceiptTime': upload_time,
+            'ehrUpdateTime': upload_time,
+            'wasParticipantMediatedEhrAvailable': True,
+            'isParticipantMediatedEhrDataAvailable': True,
+            'firstParticipantMediatedEhrReceiptTime': upload_time,
+            'latestParticipantMediatedEhrReceiptTime': upload_time
+        }
+        hpo_dropped_pid = self.data_generator.create_database_participant_summary(**summary_fields).participantId
+        mediated_dropped_pid = self.data_generator.create_database_participant_summary(**summary_fields).participantId
+        current_pid = self.data_generator.create_database_participant_summary(**summary_fields).participantId
+
+        self.summary_dao.clear_ehr_data_available(
+            participant_ids=[hpo_dropped_pid],
+            mediated_participant_ids=[mediated_dropped_pid]
+        )
+
+        self.assert_ehr_data_matches(
+            participant_id=hpo_dropped_pid,
+            had_ehr_status=EhrStatus.PRESENT,
+            currently_has_ehr=False,
+            first_ehr_time=upload_time,
+            latest_ehr_time=upload_time
+        )
+        self.assert_mediated_data_matches(
+            participant_id=hpo_dropped_pid,
+            had_ehr_status=True,
+            currently_has_ehr=True,
+            first_ehr_time=upload_time,
+            latest_ehr_time=upload_time
+        )
+        self.assert_ehr_data_matches(
+            participant_id=mediated_dropped_pid,
+            had_ehr_status=EhrStatus.PRESENT,
+            currently_has_ehr=True,
+            first_ehr_time=upload_time,
+            latest_ehr_time=upload_time
+        )
+        self.assert_mediated_data_matches(
+            participant_id=mediated_dropped_pid,
+            had_ehr_status=True,
+            currently_has_ehr=False,
+            first_ehr_time=upload_time,
+            latest_ehr_time=upload_time
+        )
+        for ids_with_data in [
+            self.summary_dao.get_participant_ids_with_hpo_ehr_data_available(),
+            self.summary_dao.get_participant_ids_with_mediated_ehr_data_available()
+        ]:
+            self.assertIn(current_pid, ids_with_data)
+
+    @mock.patch('rdr_service.offline.update_ehr_status.dispatch_task')
+    @mock.patch('rdr_service.offline.update_ehr_status.dispatch_participant_rebuild_tasks')
+    @mock.patch('rdr_service.offline.update_ehr_status.make_update_participant_summaries_job')
+    @mock.patch('rdr_service.dao.participant_summary_dao.ParticipantSummaryDao.update_enrollment_status')
+    def test_only_changed_participants_are_processed(self, update_status_mock, mock_summary_job,
+                                                     mock_rebuild_tasks, mock_dispatch_task):
+        """Participants that are unchanged by the view shouldn't have any updates or rebuilds made for them"""
+        upload_time = datetime.datetime(2020, 3, 12, 8)
+        unchanged_pid = self.data_generator.create_database_participant_summary(
+            ehrStatus=EhrStatus.PRESENT,
+            isEhrDataAvailable=True,
+            ehrReceiptTime=upload_time,
+            ehrUpdateTime=upload_time
+        ).participantId
+        self.data_generator.create_database_participant_ehr_receipt(
+            participantId=unchanged_pid,
+            fileTimestamp=upload_time,
+            firstSeen=upload_time
+        )
+        new_pid = self.data_generator.create_database_participant_summary().participantId
+        dropped_pid = self.data_generator.create_database_participant_summary(
+            ehrStatus=EhrStatus.PRESENT,
+            isEhrDataAvailable=True,
+            ehrReceiptTime=upload_time,
+            ehrUpdateTime=upload_time
+        ).participantId
+
+        new_upload_time = datetime.datetime(2020, 4, 2, 10)
+        mock_summary_job.return_value.__iter__.return_value = [[
+            EhrUpdatePidRow(unchanged_pid, upload_time),
+            EhrUpdatePidRow(new_pid, new_upload_time)
+        ]]
+        update_ehr_status.update_ehr_status_participant()
+
+        # Only the participant that newly appeared has their enrollment status and retention data updated
+        self.assertEqual(
+            [new_pid],
+            [call.kwargs['summary'].participantId for call in update_status_mock.call_args_list]
+        )
+        self.assertEqual(
+            [{'participant_id': new_pid}],
+            [call.kwargs['payload'] for call in mock_dispatch_task.call_args_list]
+        )
+
+        # The new participant and the one that dropped out of the view are rebuilt
+        rebuilt_ids = []
+        for call_args in mock_rebuild_tasks.call_args_list:
+            call_patch_data, *_ = call_args.args
+            rebuilt_ids.extend(patch_data['pid'] for patch_data in call_patch_data)
+        self.assertCountEqual([new_pid, dropped_pid], rebuilt_ids)
+
+        self.assert_ehr_data_matches(
+            participant_id=dropped_pid,
+            had_ehr_status=EhrStatus.PRESENT,
+            currently_has_ehr=False,
+            first_ehr_time=upload_time,
+            latest_ehr_time=upload_time
+        )
+        self.assert_ehr_data_matches(
+            participant_id=new_pid,
+            had_ehr_status=EhrStatus.PRESENT,
+            currently_has_ehr=True,
+            first_ehr_time=new_upload_time,
+            latest_ehr_time=new_upload_time
+        )
+
+        self.clear_table_after_test(ParticipantEhrReceipt.__tablename__)
+
     @mock.patch('rdr_service.offline.update_ehr_status.make_update_participant_summaries_job')
     @mock.patch('rdr_service.dao.participant_summary_dao.ParticipantSummaryDao.update_enrollment_status')
     def test_ehr_receipt_updates_enrollment_status(self, update_status_mock, mock_summary_job):
@@ -3,7 +3,7 @@ import datetime
 from werkzeug.exceptions import BadRequest
 
 from rdr_service.clock import FakeClock
-from rdr_service.dao.code_dao import CodeBookDao, CodeDao, CodeHistoryDao
+from rdr_service.dao.code_dao import CodeBookDao, CodeDao, CodeHierarchy, CodeHistoryDao
 from rdr_service.model.code import Code, CodeBook, CodeHistory, CodeType
 from tests.helpers.unittest_base import BaseTestCase
 
@@ -415,6 +415,47 @@ class CodeDaoTest(BaseTestCase):
         #  but will be loaded from the database. So case differences will always cause a miss
         #  until the caching mechanism can be refactored.
 
+    def test_hierarchy_sets(self):
+        # 1 -> 2 -> 3, and 3 is also used under 4
+        hierarchy = CodeHierarchy([1, 2, 3, 4, 5], {2: {1}, 3: {2, 4}})
+        self.assertEqual({1, 2, 4}, hierarchy.get_ancestor_ids(3))
+        self.assertEqual({2, 3}, hierarchy.get_descendant_ids(1))
+        self.assertEqual({3}, hierarchy.get_descendant_ids(4))
+        self.assertEqual(set(), hierarchy.get_ancestor_ids(5))
+        self.assertTrue(hierarchy.is_descendant(3, 1))
+        self.assertFalse(hierarchy.is_descendant(1, 3))
+        self.assertIn(
+            {'ancestor_code_id': 1, 'descendant_code_id': 3, 'depth': 2},
+            list(hierarchy.get_closure_rows())
+        )
+
+    def test_closure_table_from_surveys(self):
+        module_code = self.data_generator.create_database_code(value='module')
+        question_code = self.data_generator.create_database_code(value='question')
+        answer_code = self.data_generator.create_database_code(value='answer')
+        unrelated_code = self.data_generator.create_database_code(value='unrelated')
+        survey = self.data_generator.create_database_survey(code=module_code)
+        question = self.data_generator.create_database_survey_question(survey=survey, code=question_code)
+        self.data_generator.create_database_survey_question_option(question=question, code=answer_code)
+
+        self.code_dao.rebuild_closure_with_session(self.session)
+        self.session.commit()
+
+        self.assertEqual({module_code.codeId, question_code.codeId}, self.code_dao.get_ancestor_ids(answer_code.codeId))
+        self.assertEqual(
+            {question_code.codeId, answer_code.codeId},
+            self.code_dao.get_descendant_ids(module_code.codeId)
+        )
+
+        module_code_ids = self.session.query(Code.codeId).filter(
+            self.code_dao.get_descendant_filter(Code.codeId, [module_code.codeId])
+        ).all()
+        self.assertCountEqual(
+            [module_code.codeId, question_code.codeId, answer_code.codeId],
+            [code_id for code_id, in module_code_ids]
+        )
+        self.assertNotIn(unrelated_code.codeId, [code_id for code_id, in module_code_ids])
+
 
 def _make_concept(concept_topic, concept_type, code, display, child_concepts=None):
     concept = {
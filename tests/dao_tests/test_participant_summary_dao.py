@@ -409,6 +409,52 @@ class ParticipantSummaryDaoTest(BaseTestCase):
         self.assertNotEqual(M_first_update.lastModified, M_second_update.lastModified)
         self.assertEqual(get_p_baseline_last_modified(), p_baseline_last_modified2)
 
+    def test_update_from_recent_samples(self):
+        """Only participants with stored samples modified since the last run should be updated"""
+        baseline_tests = ["1PST8", "2PST8"]
+        self.temporarily_override_config_setting(config.BASELINE_SAMPLE_TEST_CODES, baseline_tests)
+
+        recent_participant = self._insert(Participant(participantId=1, biobankId=11))
+        old_participant = self._insert(Participant(participantId=2, biobankId=22))
+        sample_dao = BiobankStoredSampleDao()
+
+        def add_sample(participant, sample_id):
+            sample_dao.insert(
+                BiobankStoredSample(
+                    biobankStoredSampleId=sample_id,
+                    biobankId=participant.biobankId,
+                    biobankOrderIdentifier="KIT",
+                    test=baseline_tests[0],
+                    confirmed=datetime.datetime(2018, 3, 2),
+                )
+            )
+
+        with FakeClock(TIME_1):
+            add_sample(old_participant, "22222")
+        with FakeClock(TIME_2):
+            # Without a previous run, everything gets updated
+            self.assertEqual(0, self.dao.update_from_recent_biobank_stored_samples())
+        self.assertEqual(1, self.dao.get(old_participant.participantId).numBaselineSamplesArrived)
+
+        # Remove the sample directly so that only a later run would notice it missing
+        self.session.query(BiobankStoredSample).filter(BiobankStoredSample.biobankStoredSampleId == "22222").delete()
+        self.session.commit()
+        with FakeClock(TIME_3):
+            add_sample(recent_participant, "11111")
+            self.assertEqual(1, self.dao.update_from_recent_biobank_stored_samples(batch_size=1))
+
+        self.assertEqual(1, self.dao.get(recent_participant.participantId).numBaselineSamplesArrived)
+        self.assertEqual(1, self.dao.get(old_participant.participantId).numBaselineSamplesArrived)
+
+        # A sample modified just before the last run, but committed after it started, is still found
+        late_participant = self._insert(Participant(participantId=3, biobankId=33))
+        with FakeClock(TIME_3 - datetime.timedelta(minutes=5)):
+            add_sample(late_participant, "33333")
+        with FakeClock(TIME_3 + datetime.timedelta(days=1)):
+            # The recent participant's sample is within the overlap too
+            self.assertEqual(2, self.dao.update_from_recent_biobank_stored_samples())
+        self.assertEqual(1, self.dao.get(late_participant.participantId).numBaselineSamplesArrived)
+
     def test_update_from_samples_changed_tests(self):
         baseline_tests = ["1PST8", "2PST8"]
         self.temporarily_override_config_setting(
@@ -796,6 +842,36 @@ class ParticipantSummaryDaoTest(BaseTestCase):
         )
         self.assertNotEqual(test_dt, summary.lastModified)
 
+    def test_update_enrollment_status_for_participants(self):
+        """Enrollment status should be recalculated for a group of participants, returning the ones that changed"""
+        self.mock_enrollment_data.intent_to_share_ehr_time = datetime.datetime(2018, 10, 3)
+        summary_list = [
+            self.data_generator.create_database_participant_summary(
+                consentForStudyEnrollment=QuestionnaireStatus.SUBMITTED,
+                consentForElectronicHealthRecords=QuestionnaireStatus.SUBMITTED,
+                enrollmentStatusV3_2=EnrollmentStatusV32.PARTICIPANT
+            )
+            for _ in range(3)
+        ]
+        participant_ids = [summary.participantId for summary in summary_list]
+
+        changed_ids = self.dao.update_enrollment_status_for_participants(
+            participant_ids + [123],  # An id without a summary should be ignored
+            session=self.session,
+            pdr_pubsub=False,
+            batch_size=2
+        )
+
+        self.assertCountEqual(participant_ids, changed_ids)
+        for participant_id in participant_ids:
+            summary = self.dao.get(participant_id)
+            self.assertEqual(EnrollmentStatusV32.PARTICIPANT_PLUS_EHR, summary.enrollmentStatusV3_2)
+
+        # Nothing should change when recalculating with the same data
+        self.assertEqual([], self.dao.update_enrollment_status_for_participants(
+            participant_ids, session=self.session, pdr_pubsub=False
+        ))
+
     def testNumberDistinctVisitsCounts(self):
         self.participant = self._insert(Participant(participantId=7, biobankId=77))
         # insert biobank order
@@ -9,11 +9,13 @@ from rdr_service.dao.biobank_order_dao import BiobankOrderDao
 from rdr_service.dao.participant_dao import ParticipantDao
 from rdr_service.dao.participant_summary_dao import ParticipantSummaryDao
 from rdr_service.dao.physical_measurements_dao import PhysicalMeasurementsDao
-from rdr_service.model.measurements import Measurement, PhysicalMeasurements
+from rdr_service.lib_fhir.fhirclient_1_0_6.models.observation import Observation
+from rdr_service.model.measurements import Measurement, MeasurementConcept, PhysicalMeasurements
 from rdr_service.model.participant import Participant
 from rdr_service.participant_enums import PhysicalMeasurementsStatus, WithdrawalStatus, \
     PhysicalMeasurementsCollectType, OriginMeasurementUnit
 from rdr_service.query import FieldFilter, Operator, Query
+from rdr_service.services.physical_measurements_parser import parse_observation, UnsupportedLayoutError
 from tests.helpers.unittest_base import BaseTestCase
 from tests.test_data import data_path
 
@@ -82,6 +84,56 @@ class PhysicalMeasurementsDaoTest(BaseTestCase):
         self.assertIsNotNone(measurement.finalizedSiteId)
 
 
+    def test_parsed_observations_match_fhir_model(self):
+        resource = json.loads(self.measurement_json)
+        observations = [
+            entry['resource'] for entry in resource['entry']
+            if entry['resource']['resourceType'] == 'Observation'
+        ]
+        for observation_json in observations:
+            fhir_observation = Observation(observation_json)
+            parsed_observation = parse_observation(observation_json)
+            self.assertEqual(
+                self.dao.get_preferred_coding(fhir_observation.code).as_json(),
+                self.dao.get_preferred_coding(parsed_observation.code).as_json()
+            )
+            self.assertEqual(fhir_observation.effectiveDateTime.date, parsed_observation.effectiveDateTime.date)
+            if fhir_observation.valueQuantity:
+                self.assertEqual(fhir_observation.valueQuantity.value, parsed_observation.valueQuantity.value)
+                self.assertEqual(fhir_observation.valueQuantity.code, parsed_observation.valueQuantity.code)
+
+        # Anything that isn't laid out the way it's expected is left for the FHIR model to parse
+        unexpected_observation = dict(observations[0], performer=[{'reference': 'Practitioner/1'}])
+        with self.assertRaises(UnsupportedLayoutError):
+            parse_observation(unexpected_observation)
+        self.assertIsInstance(self.dao.parse_observation(unexpected_observation), Observation)
+
+    def test_measurement_catalog(self):
+        self._make_summary()
+        resource = json.loads(self.measurement_json)
+        measurements = self.dao.from_client_json(resource, participant_id=self.participant.participantId)
+        measurements.physicalMeasurementsId = 1
+        self.dao.insert(measurements)
+
+        expected_measurement_map = {}
+        for measurement in self.dao.parse_measurements(resource):
+            self.dao.handle_measurement(expected_measurement_map, measurement)
+        self.assertEqual(len(expected_measurement_map), self.session.query(MeasurementConcept).count())
+        # Until the catalog is built, the distinct measurements are found from the resources
+        self.assertEqual(expected_measurement_map, self.dao.get_distinct_measurements())
+
+        self.assertEqual(len(expected_measurement_map), self.dao.rebuild_measurement_catalog())
+        with mock.patch.object(self.dao, '_get_measurement_map_from_resources') as resource_scan_mock:
+            self.assertEqual(expected_measurement_map, self.dao.get_distinct_measurements())
+        resource_scan_mock.assert_not_called()
+
+        # Measurements that have already been seen in the catalog don't need to check it again
+        measurements = self.dao.from_client_json(resource, participant_id=self.participant.participantId)
+        measurements.physicalMeasurementsId = 2
+        with mock.patch.object(PhysicalMeasurementsDao, '_get_catalog_concepts') as catalog_query_mock:
+            self.dao.insert(measurements)
+        catalog_query_mock.assert_not_called()
+
     def test_authored_object(self):
         """
         DA-1435 Test PM document parse supports older incorrect author extension object usage.
@@ -294,7 +294,11 @@ class GenomicJobControllerTest(BaseTestCase):
             )
 
         with GenomicJobController(GenomicJob.UPDATE_MEMBERS_BLOCKLISTS) as controller:
-            controller.update_members_blocklists()
+            updated_member_ids = controller.update_members_blocklists()
+
+        # the ids of the updated members are reported for each blocklist type
+        self.assertCountEqual(ids_should_be_updated, updated_member_ids['block_research'])
+        self.assertCountEqual(ids_should_be_updated[2:], updated_member_ids['block_results'])
 
         # current config json in base_config.json
         created_members = self.member_dao.get_all()
@@ -1,4 +1,7 @@
+import json
+import threading
 from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from unittest import mock
 
 from faker import Faker
@@ -9,6 +12,7 @@ from rdr_service.dao.ppsc_dao import PPSCDataTransferAuthDao, PPSCDataTransferEn
 from rdr_service.data_gen.generators.ppsc import PPSCDataGenerator
 from rdr_service.ppsc.ppsc_data_transfer import PPSCDataTransferCore, PPSCDataTransferEHR, PPSCDataTransferHealthData, \
     PPSCDataTransferBiobank
+from rdr_service.model.ppsc_data_transfer import PPSCDataTransferEndpoint
 from rdr_service.ppsc.ppsc_enums import DataSyncTransferType, AuthType
 from tests.helpers.unittest_base import BaseTestCase
 
@@ -18,6 +22,40 @@ class MockedTransferResponse:
     status_code: int = 200
 
 
+class FakePPSCTransferHandler(BaseHTTPRequestHandler):
+    """
+    Accepts transfer requests, failing the first few to check that requests are retried.
+    The server creates a handler for each request, so the state is kept on a class made for each test.
+    """
+    lock = None
+    received_payloads = None
+    failures_remaining = 0
+
+    @classmethod
+    def for_test(cls, failure_count=1):
+        return type('FakePPSCTransferTestHandler', (cls,), {
+            'lock': threading.Lock(),
+            'received_payloads': [],
+            'failures_remaining': failure_count
+        })
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        handler_class = type(self)
+        with handler_class.lock:
+            fail_request = handler_class.failures_remaining > 0
+            if fail_request:
+                handler_class.failures_remaining -= 1
+            else:
+                handler_class.received_payloads.append(payload)
+        self.send_response(503 if fail_request else 200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *_):
+        pass
+
+
 class PPSCDataTransferTest(BaseTestCase):
     def setUp(self):
         super().setUp()
@@ -253,6 +291,50 @@ class PPSCDataTransferTest(BaseTestCase):
 
         self.assertEqual(len(biobank_transfer.transfer_items), 0)
 
+    @mock.patch('rdr_service.ppsc.ppsc_oauth.PPSCTransferOauth.generate_token')
+    def test_send_batches_to_server_with_retries(self, oauth_service) -> None:
+        oauth_service.return_value = 'wqwqwqwqqwqqwqwqwqwqw'
+
+        handler_class = FakePPSCTransferHandler.for_test(failure_count=1)
+        server = ThreadingHTTPServer(('127.0.0.1', 0), handler_class)
+        server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+        server_thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        with self.endpoint_dao.session() as session:
+            session.query(PPSCDataTransferEndpoint).filter(
+                PPSCDataTransferEndpoint.data_sync_transfer_type == DataSyncTransferType.CORE
+            ).update({
+                'base_url': f'http://127.0.0.1:{server.server_port}/',
+                'endpoint': 'core',
+                'batch_size': 2
+            })
+
+        for _ in range(0, 5):
+            participant = self.ppsc_data_gen.create_database_participant()
+            self.ppsc_data_gen.create_database_ppsc_data_core(
+                participant_id=participant.id,
+                has_core_data=1,
+                has_core_data_date_time=clock.CLOCK.now()
+            )
+
+        with PPSCDataTransferCore(max_workers=2, record_batch_size=2) as core_transfer:
+            core_transfer.run_data_transfer()
+
+        # the failed request is retried, and each batch is sent as a list of items
+        self.assertEqual(handler_class.failures_remaining, 0)
+        self.assertEqual([1, 2, 2], sorted(len(payload) for payload in handler_class.received_payloads))
+        self.assertEqual(
+            sorted(f'P{item.participant_id}' for item in core_transfer.transfer_items),
+            sorted(item['participantId'] for payload in handler_class.received_payloads for item in payload)
+        )
+
+        current_transfer_records = self.transfer_record_dao.get_all()
+        self.assertEqual(len(current_transfer_records), 5)
+        self.assertEqual(core_transfer.recorded_count, 5)
+        self.assertTrue(all(obj.response_code == '200' for obj in current_transfer_records))
+
     def tearDown(self):
         super().tearDown()
         self.clear_table_after_test("ppsc.participant")
@@ -1,147 +1,169 @@
 from datetime import date, datetime
+
 import mock
 
-from rdr_service.dao.duplicate_account_dao import DuplicateExistsException
-from rdr_service.model.duplicate_account import DuplicationSource
-from rdr_service.model.participant_summary import ParticipantSummary
+from rdr_service.dao.duplicate_account_dao import DuplicateAccountDao
+from rdr_service.dao.metadata_dao import (
+    DUPLICATE_BLOCKING_KEYS_BUILD_PROGRESS_KEY, DUPLICATE_BLOCKING_KEYS_BUILT_KEY, MetadataDao
+)
+from rdr_service.model.duplicate_account import (
+    DuplicateAccount, DuplicateAccountBlockingKey, DuplicationSource, DuplicationStatus
+)
 from rdr_service.services.duplicate_detection import DuplicateDetection
 from tests.helpers.unittest_base import BaseTestCase
 
 
 class DuplicateDetectionTest(BaseTestCase):
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.uses_database = False
-
     def setUp(self, *args, **kwargs) -> None:
         super().setUp(*args, **kwargs)
-        self.all_participants_mock = self.mock(
-            'rdr_service.dao.duplicate_account_dao.DuplicateAccountDao.query_participant_duplication_data'
-        )
-        self.participants_to_check_mock = self.mock(
-            'rdr_service.dao.duplicate_account_dao.DuplicateAccountDao.query_participants_to_check'
-        )
-        self.save_duplicate_mock = self.mock(
-            'rdr_service.dao.duplicate_account_dao.DuplicateAccountDao.store_duplication'
-        )
+        self.check_since = datetime(2022, 1, 1)
 
-    def test_detecting_name_and_dob(self):
-        first_sam = ParticipantSummary(
-            firstName='Sam', lastName='Smith', dateOfBirth=date(2020, 3, 2),
-            email="firstsam@msn.com", participantId=1
-        )
-        second_sam = ParticipantSummary(
-            firstName='Sam', lastName='Smith', dateOfBirth=date(2020, 3, 2),
-            email="secondsam@gmail.com", participantId=2
+    def _create_summary(self, recently_modified=False, **kwargs):
+        return self.data_generator.create_database_participant_summary(
+            lastModified=datetime(2022, 3, 1) if recently_modified else datetime(2021, 5, 1),
+            **kwargs
         )
 
-        self.all_participants_mock.return_value = [
-            first_sam,
-            second_sam,
-            # more that shouldn't match
-            ParticipantSummary(
-                firstName='Sam', lastName='Smith', dateOfBirth=date(1991, 3, 2), participantId=3
-            ),
-            ParticipantSummary(
-                firstName='Alice', lastName='Smith', dateOfBirth=date(2020, 3, 2), participantId=4
-            ),
-            ParticipantSummary(
-                firstName='Sam', lastName='Smyth', dateOfBirth=date(1991, 3, 2), participantId=5
-            )
-        ]
-        self.participants_to_check_mock.return_value = [second_sam]
-
-        DuplicateDetection.find_duplicates(datetime.now(), session=mock.MagicMock())
-        self.assertEqual(1, self.save_duplicate_mock.call_count)
+    def _find_duplicates(self):
+        DuplicateDetection.find_duplicates(since=self.check_since, session=self.session)
+        self.session.commit()
 
-        saved_record = self.save_duplicate_mock.call_args_list[0].kwargs
-        self.assertEqual(second_sam.participantId, saved_record['participant_a_id'])
-        self.assertEqual(first_sam.participantId, saved_record['participant_b_id'])
-        self.assertEqual(DuplicationSource.RDR, saved_record['source'])
+    def _get_duplicate_pairs(self):
+        return [
+            (record.participant_a_id, record.participant_b_id)
+            for record in self.session.query(DuplicateAccount).order_by(DuplicateAccount.id)
+        ]
 
-    def test_detecting_email(self):
-        johnson_account = ParticipantSummary(
-            firstName='Fred', lastName='Johnson', dateOfBirth=date(2020, 3, 2),
-            email="tycho@belt.net", participantId=1
-        )
-        drummer_account = ParticipantSummary(
-            firstName='Karina', lastName='Drummer', dateOfBirth=date(2020, 3, 2),
-            email="tycho@belt.net", participantId=2
-        )
-        sam_account = ParticipantSummary(
-            firstName='Sam', lastName='Test', dateOfBirth=date(2020, 3, 2),
-            email="another@email.org", participantId=3
+    def test_detecting_name_and_dob(self):
+        first_sam = self._create_summary(
+            firstName='Sam', lastName='Smith', dateOfBirth=date(2020, 3, 2), email="firstsam@msn.com"
         )
-        foo_account = ParticipantSummary(
-            firstName='Foo', lastName='Bar', dateOfBirth=date(2020, 3, 2),
-            email="another@email.org", participantId=4
+        second_sam = self._create_summary(
+            firstName='sam ', lastName='SMITH', dateOfBirth=date(2020, 3, 2), email="secondsam@gmail.com",
+            recently_modified=True
         )
+        # more that shouldn't match
+        self._create_summary(firstName='Sam', lastName='Smith', dateOfBirth=date(1991, 3, 2))
+        self._create_summary(firstName='Alice', lastName='Smith', dateOfBirth=date(2020, 3, 2))
+        self._create_summary(firstName='Sam', lastName='Smyth', dateOfBirth=date(1991, 3, 2))
 
-        self.all_participants_mock.return_value = [
-            johnson_account, drummer_account, sam_account, foo_account
-        ]
-        self.participants_to_check_mock.return_value = [johnson_account, foo_account]
-
-        DuplicateDetection.find_duplicates(datetime.now(), session=mock.MagicMock())
-        self.assertEqual(2, self.save_duplicate_mock.call_count)
+        self._find_duplicates()
 
-        saved_record = self.save_duplicate_mock.call_args_list[0].kwargs
-        self.assertEqual(johnson_account.participantId, saved_record['participant_a_id'])
-        self.assertEqual(drummer_account.participantId, saved_record['participant_b_id'])
+        self.assertEqual([(second_sam.participantId, first_sam.participantId)], self._get_duplicate_pairs())
+        saved_record = self.session.query(DuplicateAccount).one()
+        self.assertEqual(DuplicationSource.RDR, saved_record.source)
+        self.assertEqual(DuplicationStatus.POTENTIAL, saved_record.status)
+        self.assertIsNotNone(saved_record.created)
 
-        saved_record = self.save_duplicate_mock.call_args_list[1].kwargs
-        self.assertEqual(foo_account.participantId, saved_record['participant_a_id'])
-        self.assertEqual(sam_account.participantId, saved_record['participant_b_id'])
+    def test_detecting_email(self):
+        johnson_account = self._create_summary(email="tycho@belt.net", recently_modified=True)
+        drummer_account = self._create_summary(email="Tycho@Belt.net")
+        sam_account = self._create_summary(email="another@email.org")
+        foo_account = self._create_summary(email="another@email.org", recently_modified=True)
+
+        self._find_duplicates()
+
+        self.assertEqual(
+            [
+                (johnson_account.participantId, drummer_account.participantId),
+                (foo_account.participantId, sam_account.participantId)
+            ],
+            self._get_duplicate_pairs()
+        )
 
     def test_detecting_login_phone(self):
-        johnson_account = ParticipantSummary(
-            firstName='Fred', lastName='Johnson', dateOfBirth=date(2020, 3, 2),
-            loginPhoneNumber='(123) 456-7890', participantId=1
-        )
-        drummer_account = ParticipantSummary(
-            firstName='Karina', lastName='Drummer', dateOfBirth=date(2020, 3, 2),
-            loginPhoneNumber='(123) 456-7890', participantId=2
-        )
-        sam_account = ParticipantSummary(
-            firstName='Sam', lastName='Test', dateOfBirth=date(2020, 3, 2),
-            loginPhoneNumber='0987654321', participantId=3
-        )
-        foo_account = ParticipantSummary(
-            firstName='Foo', lastName='Bar', dateOfBirth=date(2020, 3, 2),
-            loginPhoneNumber='0987654321', participantId=4
+        johnson_account = self._create_summary(loginPhoneNumber='(123) 456-7890', recently_modified=True)
+        drummer_account = self._create_summary(loginPhoneNumber='123-456-7890')
+        sam_account = self._create_summary(loginPhoneNumber='0987654321')
+        foo_account = self._create_summary(loginPhoneNumber='0987654321', recently_modified=True)
+
+        self._find_duplicates()
+
+        self.assertEqual(
+            [
+                (johnson_account.participantId, drummer_account.participantId),
+                (foo_account.participantId, sam_account.participantId)
+            ],
+            self._get_duplicate_pairs()
         )
 
-        self.all_participants_mock.return_value = [
-            johnson_account, drummer_account, sam_account, foo_account
-        ]
-        self.participants_to_check_mock.return_value = [johnson_account, foo_account]
-
-        DuplicateDetection.find_duplicates(datetime.now(), session=mock.MagicMock())
-        self.assertEqual(2, self.save_duplicate_mock.call_count)
+    def test_pairs_recorded_once(self):
+        """Two recently modified duplicates of each other should only be stored as one pair"""
+        first_account = self._create_summary(email='shared@test.com', recently_modified=True)
+        second_account = self._create_summary(email='shared@test.com', recently_modified=True)
 
-        saved_record = self.save_duplicate_mock.call_args_list[0].kwargs
-        self.assertEqual(johnson_account.participantId, saved_record['participant_a_id'])
-        self.assertEqual(drummer_account.participantId, saved_record['participant_b_id'])
+        self._find_duplicates()
 
-        saved_record = self.save_duplicate_mock.call_args_list[1].kwargs
-        self.assertEqual(foo_account.participantId, saved_record['participant_a_id'])
-        self.assertEqual(sam_account.participantId, saved_record['participant_b_id'])
+        self.assertEqual([(first_account.participantId, second_account.participantId)], self._get_duplicate_pairs())
 
     def test_existing_duplicate_is_ignored(self):
-        """DAO throws exception to notify a duplicate is already known, making sure it doesn't crash anything"""
-        first_sam = ParticipantSummary(
-            firstName='Sam', lastName='Smith', dateOfBirth=date(2020, 3, 2),
-            email="firstsam@msn.com", participantId=1
+        first_sam = self._create_summary(
+            firstName='Sam', lastName='Smith', dateOfBirth=date(2020, 3, 2)
+        )
+        second_sam = self._create_summary(
+            firstName='Sam', lastName='Smith', dateOfBirth=date(2020, 3, 2), recently_modified=True
+        )
+        DuplicateAccountDao.store_duplication(
+            participant_a_id=first_sam.participantId,
+            participant_b_id=second_sam.participantId,
+            authored=datetime(2021, 8, 1),
+            source=DuplicationSource.SUPPORT_TICKET,
+            session=self.session
         )
-        second_sam = ParticipantSummary(
-            firstName='Sam', lastName='Smith', dateOfBirth=date(2020, 3, 2),
-            email="secondsam@gmail.com", participantId=2
+        self.session.commit()
+
+        self._find_duplicates()
+
+        self.assertEqual([(first_sam.participantId, second_sam.participantId)], self._get_duplicate_pairs())
+
+    def test_blocking_keys_updated_for_modified_participants(self):
+        first_account = self._create_summary(email='first@test.com')
+        second_account = self._create_summary(email='second@test.com')
+        self._find_duplicates()
+        self.assertEqual([], self._get_duplicate_pairs())
+        self.assertEqual(2, self.session.query(DuplicateAccountBlockingKey).count())
+
+        # Changing the email of the second account should replace its key and find it as a duplicate
+        second_account.email = 'FIRST@test.com'
+        second_account.lastModified = datetime(2022, 3, 1)
+        self.session.merge(second_account)
+        self.session.commit()
+        self._find_duplicates()
+
+        self.assertEqual([(second_account.participantId, first_account.participantId)], self._get_duplicate_pairs())
+        self.assertEqual(2, self.session.query(DuplicateAccountBlockingKey).count())
+
+    def test_interrupted_key_build_is_resumed(self):
+        first_account = self._create_summary(email='shared@test.com')
+        second_account = self._create_summary(email='other@test.com')
+        third_account = self._create_summary(email='shared@test.com', recently_modified=True)
+
+        # A build that stopped after the first participant leaves the table partly filled
+        DuplicateAccountDao.update_blocking_keys([first_account], session=self.session)
+        MetadataDao().upsert_with_session(
+            self.session, DUPLICATE_BLOCKING_KEYS_BUILD_PROGRESS_KEY, int_value=first_account.participantId
         )
+        self.session.commit()
+
+        with mock.patch.object(
+            DuplicateAccountDao,
+            'query_participant_duplication_data',
+            wraps=DuplicateAccountDao.query_participant_duplication_data
+        ) as query_page_mock:
+            self._find_duplicates()
+            self.assertEqual(
+                first_account.participantId,
+                query_page_mock.call_args_list[0].kwargs['after_participant_id']
+            )
 
-        self.all_participants_mock.return_value = [
-            first_sam, second_sam
-        ]
-        self.participants_to_check_mock.return_value = [second_sam]
+        self.assertEqual([(third_account.participantId, first_account.participantId)], self._get_duplicate_pairs())
+        self.assertEqual(
+            {first_account.participantId, second_account.participantId, third_account.participantId},
+            {key.participant_id for key in self.session.query(DuplicateAccountBlockingKey)}
+        )
+        self.assertIsNotNone(MetadataDao().get_by_key_with_session(self.session, DUPLICATE_BLOCKING_KEYS_BUILT_KEY))
 
-        self.save_duplicate_mock.side_effect = mock.Mock(side_effect=DuplicateExistsException(None))
-        DuplicateDetection.find_duplicates(datetime.now(), session=mock.MagicMock())
+        # Once the build is complete, later runs don't page through the participants again
+        with mock.patch.object(DuplicateAccountDao, 'query_participant_duplication_data') as query_page_mock:
+            self._find_duplicates()
+            query_page_mock.assert_not_called()
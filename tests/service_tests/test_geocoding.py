@@ -0,0 +1,48 @@
+from rdr_service.model.geocoded_address import GeocodedAddress
+from rdr_service.services.geocoding import GeocodeCache, Geocoder, SiteAddress, SiteLocation, get_address_key
+from tests.helpers.unittest_base import BaseTestCase
+
+
+class FakeGeocoder(Geocoder):
+    def __init__(self):
+        self.geocoded_addresses = []
+
+    def get_lat_long(self, address):
+        self.geocoded_addresses.append(address)
+        if address.address_1 == 'nowhere':
+            return None, None
+        return 40.0, -75.0
+
+    def get_time_zone(self, latitude, longitude):
+        return 'America/New_York'
+
+
+class GeocodeCacheTest(BaseTestCase):
+    def setUp(self, *args, **kwargs) -> None:
+        super().setUp(*args, **kwargs)
+        self.geocoder = FakeGeocoder()
+        self.cache = GeocodeCache(self.geocoder.geocode)
+
+    def test_address_key_normalization(self):
+        self.assertEqual(
+            get_address_key(SiteAddress('123 Main St', 'Springfield', 'IL')),
+            get_address_key(SiteAddress(' 123  main st', 'SPRINGFIELD ', 'il'))
+        )
+
+    def test_only_new_addresses_are_geocoded(self):
+        first_address = SiteAddress('123 Main St', 'Springfield', 'IL')
+        second_address = SiteAddress('456 Elm St', 'Springfield', 'IL')
+        missing_address = SiteAddress('nowhere', 'Springfield', 'IL')
+
+        locations = self.cache.get_locations([first_address, missing_address])
+        self.assertEqual(SiteLocation(40.0, -75.0, 'America/New_York'), locations[first_address])
+        self.assertEqual(SiteLocation(None, None, None), locations[missing_address])
+        self.assertEqual(1, self.session.query(GeocodedAddress).count())
+
+        # The first address is cached (even with different formatting), but the others need to be geocoded
+        self.geocoder.geocoded_addresses = []
+        reformatted_first_address = SiteAddress('123 MAIN ST', 'Springfield', 'IL')
+        locations = self.cache.get_locations([reformatted_first_address, second_address, missing_address])
+        self.assertEqual(SiteLocation(40.0, -75.0, 'America/New_York'), locations[reformatted_first_address])
+        self.assertCountEqual([second_address, missing_address], self.geocoder.geocoded_addresses)
+        self.assertEqual(2, self.session.query(GeocodedAddress).count())
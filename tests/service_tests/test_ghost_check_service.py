@@ -28,6 +28,11 @@ class GhostCheckServiceTest(BaseTestCase):
         self.ghost_dao_mock = dao_patch.start()
         self.addCleanup(dao_patch.stop)
 
+        metadata_dao_class_patch = mock.patch('rdr_service.services.ghost_check_service.MetadataDao')
+        self.metadata_dao_mock = metadata_dao_class_patch.start().return_value
+        self.metadata_dao_mock.get_by_key_with_session.return_value = None
+        self.addCleanup(metadata_dao_class_patch.stop)
+
         pdr_rebuild_patch = mock.patch('rdr_service.services.ghost_check_service.dispatch_participant_rebuild_tasks')
         self.pdr_rebuild_mock = pdr_rebuild_patch.start()
         self.addCleanup(pdr_rebuild_patch.stop)
@@ -52,10 +57,10 @@ class GhostCheckServiceTest(BaseTestCase):
         }
 
         self.service.run_ghost_check(start_date=datetime.now())
-        self.ghost_dao_mock.record_ghost_check.assert_has_calls([
-            mock.call(participant_id=participant.participantId, modification_performed=None, session=mock.ANY)
-            for participant in test_participants
-        ])
+        self.ghost_dao_mock.record_ghost_checks.assert_called_once_with(
+            check_results=[(participant.participantId, None) for participant in test_participants],
+            session=mock.ANY
+        )
 
         self.participant_dao_mock.update_ghost_participant.assert_not_called()
         self.assertEqual(self.pdr_rebuild_mock.call_count, 0)
@@ -94,15 +99,13 @@ class GhostCheckServiceTest(BaseTestCase):
         self.client_mock.get_participant_lookup.side_effect = api_response
 
         self.service.run_ghost_check(start_date=datetime.now())
-        self.ghost_dao_mock.record_ghost_check.assert_has_calls([
+        self.ghost_dao_mock.record_ghost_checks.assert_has_calls([
             mock.call(
-                participant_id=1123,
-                modification_performed=GhostFlagModification.GHOST_FLAG_REMOVED,
+                check_results=[(1123, GhostFlagModification.GHOST_FLAG_REMOVED)],
                 session=mock.ANY
             ),
             mock.call(
-                participant_id=4567,
-                modification_performed=GhostFlagModification.GHOST_FLAG_SET,
+                check_results=[(4567, GhostFlagModification.GHOST_FLAG_SET)],
                 session=mock.ANY
             )
         ])
@@ -122,3 +125,86 @@ class GhostCheckServiceTest(BaseTestCase):
         self.assertEqual(1, self.pdr_rebuild_mock.call_count)
         self.assertListEqual(self.pdr_rebuild_mock.call_args[0][0], [1123, 4567])
 
+    def test_looking_up_missing_participants_in_batches(self):
+        """Participants missing from the paged listing are looked up individually, and saved a batch at a time"""
+        test_participants = [
+            Participant(participantId=participant_id, isGhostId=False) for participant_id in range(1, 8)
+        ]
+        self.ghost_dao_mock.get_participants_needing_checked.return_value = test_participants
+        ghost_ids = {2, 5}
+
+        def api_response(participant_id=None, **_):
+            if participant_id is None:
+                return {'participants': []}
+            return None if participant_id in ghost_ids else {'drcId': f'P{participant_id}'}
+        self.client_mock.get_participant_lookup.side_effect = api_response
+
+        service = GhostCheckService(
+            session=mock.MagicMock(),
+            ptsc_config=mock.MagicMock(),
+            logger=self.logger_mock,
+            batch_size=3,
+            max_lookup_workers=4
+        )
+        service.run_ghost_check(start_date=datetime.now())
+
+        self.client_mock.get_participant_lookup.assert_has_calls([
+            mock.call(participant_id=participant.participantId) for participant in test_participants
+        ], any_order=True)
+        self.assertEqual(3, self.ghost_dao_mock.record_ghost_checks.call_count)
+        recorded_results = [
+            result
+            for call in self.ghost_dao_mock.record_ghost_checks.call_args_list
+            for result in call.kwargs['check_results']
+        ]
+        self.assertListEqual([
+            (participant.participantId,
+             GhostFlagModification.GHOST_FLAG_SET if participant.participantId in ghost_ids else None)
+            for participant in test_participants
+        ], recorded_results)
+        self.assertListEqual([2, 5], self.pdr_rebuild_mock.call_args[0][0])
+
+    def test_resuming_failed_check(self):
+        """A check for the same dates as one that didn't finish should skip the participants already checked"""
+        start_date = datetime(2022, 3, 1).date()
+        checkpoint_time = datetime(2022, 4, 5, 10)
+        self.metadata_dao_mock.get_by_key_with_session.return_value = mock.MagicMock(
+            strValue='2022-03-01|',
+            dateValue=checkpoint_time
+        )
+        self.ghost_dao_mock.get_participants_needing_checked.return_value = [
+            Participant(participantId=1, isGhostId=False),
+            Participant(participantId=2, isGhostId=True),
+            Participant(participantId=3, isGhostId=False)
+        ]
+        self.ghost_dao_mock.get_checks_since.return_value = [
+            (1, None),
+            (2, GhostFlagModification.GHOST_FLAG_REMOVED)
+        ]
+        self.client_mock.get_participant_lookup.return_value = {
+            'participants': [{'drcId': 'P1'}, {'drcId': 'P2'}, {'drcId': 'P3'}]
+        }
+
+        self.service.run_ghost_check(start_date=start_date)
+
+        self.ghost_dao_mock.get_checks_since.assert_called_with(session=mock.ANY, timestamp=checkpoint_time)
+        self.ghost_dao_mock.record_ghost_checks.assert_called_once_with(check_results=[(3, None)], session=mock.ANY)
+        self.logger_mock.error.assert_not_called()
+        # Participants changed by the previous run still need to be rebuilt
+        self.assertListEqual([2], self.pdr_rebuild_mock.call_args[0][0])
+        # The checkpoint is cleared once the check finishes
+        self.metadata_dao_mock.upsert_with_session.assert_called_once_with(mock.ANY, 'GHOST_CHECK_CHECKPOINT')
+
+    def test_resuming_check_started_at_a_different_time(self):
+        """A retry of the cron job starts from a later time on the same date and should still resume the check"""
+        checkpoint_time = datetime(2022, 4, 5, 10)
+        self.metadata_dao_mock.get_by_key_with_session.return_value = mock.MagicMock(
+            strValue='2022-03-01|',
+            dateValue=checkpoint_time
+        )
+        self.ghost_dao_mock.get_participants_needing_checked.return_value = []
+        self.ghost_dao_mock.get_checks_since.return_value = []
+
+        self.service.run_ghost_check(start_date=datetime(2022, 3, 1, 10, 42, 17, 1234))
+
+        self.ghost_dao_mock.get_checks_since.assert_called_with(session=mock.ANY, timestamp=checkpoint_time)
@@ -1,6 +1,7 @@
 from datetime import datetime, timedelta
 import mock
 
+from rdr_service.dao.metadata_dao import MetadataDao, RESPONSE_DUPLICATION_WATERMARK_KEY
 from rdr_service.model.questionnaire_response import QuestionnaireResponse, QuestionnaireResponseClassificationType
 from rdr_service.services.response_duplication_detector import ResponseDuplicationDetector
 from tests.helpers.unittest_base import BaseTestCase
@@ -169,3 +170,103 @@ class ResponseDuplicationDetectorTests(BaseTestCase):
         responses_detected = detector._get_duplicate_responses(self.session, datetime(2021, 1, 1))
 
         self.assertEmpty(responses_detected)
+
+    @mock.patch('rdr_service.services.response_duplication_detector.ResponseDuplicationDetector.clean_pdr_module_data')
+    def test_incremental_check_uses_new_responses(self, mock_clean_pdr_data):
+        """Only the groups of responses created since the last check should be looked at"""
+        watermark = datetime.now() - timedelta(days=1)
+        metadata_dao = MetadataDao()
+        metadata_dao.upsert(RESPONSE_DUPLICATION_WATERMARK_KEY, date_value=watermark)
+
+        participant = self.data_generator.create_database_participant()
+        # A duplicate pair that was created before the watermark (and isn't checked again)
+        old_response = self.data_generator.create_database_questionnaire_response(
+            participantId=participant.participantId,
+            externalId='old',
+            answerHash='badbeef',
+            created=watermark - timedelta(days=3)
+        )
+        self._make_duplicate_of(response=old_response, created=watermark - timedelta(days=2))
+        # An older response that a new one duplicates
+        first_response = self.data_generator.create_database_questionnaire_response(
+            participantId=participant.participantId,
+            externalId='one',
+            answerHash='badbeef',
+            created=watermark - timedelta(days=30)
+        )
+        new_response = self._make_duplicate_of(response=first_response, created=watermark + timedelta(hours=1))
+        # A new response that shares the external id but has different answers
+        different_answers = self._make_duplicate_of(
+            response=first_response,
+            answerHash='0ddba11',
+            created=watermark + timedelta(hours=2)
+        )
+
+        detector = ResponseDuplicationDetector()
+        self.assertEqual(1, detector.flag_new_duplicate_responses())
+
+        self.session.refresh(old_response)
+        self.session.refresh(first_response)
+        self.session.refresh(new_response)
+        self.session.refresh(different_answers)
+        self.assertNotEqual(old_response.classificationType, QuestionnaireResponseClassificationType.DUPLICATE)
+        self.assertEqual(first_response.classificationType, QuestionnaireResponseClassificationType.DUPLICATE)
+        self.assertNotEqual(new_response.classificationType, QuestionnaireResponseClassificationType.DUPLICATE)
+        self.assertNotEqual(different_answers.classificationType, QuestionnaireResponseClassificationType.DUPLICATE)
+        self.assertEqual([first_response.questionnaireResponseId], mock_clean_pdr_data.call_args.args[0])
+
+        # The watermark moves to the latest response, so the next check doesn't mark anything again
+        with metadata_dao.session() as session:
+            saved_watermark = metadata_dao.get_by_key_with_session(session, RESPONSE_DUPLICATION_WATERMARK_KEY)
+            self.assertEqual(different_answers.created, saved_watermark.dateValue)
+        self.assertEqual(0, detector.flag_new_duplicate_responses())
+
+    def test_watermark_moves_past_responses_without_keys(self):
+        """Responses that can't be matched to others should still not be read again by the next check"""
+        watermark = datetime.now() - timedelta(days=1)
+        metadata_dao = MetadataDao()
+        metadata_dao.upsert(RESPONSE_DUPLICATION_WATERMARK_KEY, date_value=watermark)
+
+        participant = self.data_generator.create_database_participant()
+        response = self.data_generator.create_database_questionnaire_response(
+            participantId=participant.participantId,
+            externalId=None,
+            answerHash=None,
+            created=watermark + timedelta(hours=1)
+        )
+
+        self.assertEqual(0, ResponseDuplicationDetector().flag_new_duplicate_responses())
+        with metadata_dao.session() as session:
+            saved_watermark = metadata_dao.get_by_key_with_session(session, RESPONSE_DUPLICATION_WATERMARK_KEY)
+            self.assertEqual(response.created, saved_watermark.dateValue)
+
+    @mock.patch('rdr_service.services.response_duplication_detector.ResponseDuplicationDetector.clean_pdr_module_data')
+    def test_responses_just_before_watermark_are_checked(self, _):
+        """Responses committed after the last check but created before its watermark should still be checked"""
+        watermark = datetime.now() - timedelta(days=1)
+        metadata_dao = MetadataDao()
+        metadata_dao.upsert(RESPONSE_DUPLICATION_WATERMARK_KEY, date_value=watermark)
+        with metadata_dao.session() as session:
+            stored_watermark = metadata_dao.get_by_key_with_session(
+                session, RESPONSE_DUPLICATION_WATERMARK_KEY
+            ).dateValue
+
+        participant = self.data_generator.create_database_participant()
+        first_response = self.data_generator.create_database_questionnaire_response(
+            participantId=participant.participantId,
+            externalId='one',
+            answerHash='badbeef',
+            created=watermark - timedelta(days=30)
+        )
+        self._make_duplicate_of(response=first_response, created=watermark - timedelta(minutes=5))
+
+        detector = ResponseDuplicationDetector()
+        self.assertEqual(1, detector.flag_new_duplicate_responses())
+        self.session.refresh(first_response)
+        self.assertEqual(first_response.classificationType, QuestionnaireResponseClassificationType.DUPLICATE)
+
+        # Responses found in the overlap don't move the watermark back, and aren't marked again
+        with metadata_dao.session() as session:
+            saved_watermark = metadata_dao.get_by_key_with_session(session, RESPONSE_DUPLICATION_WATERMARK_KEY)
+            self.assertEqual(stored_watermark, saved_watermark.dateValue)
+        self.assertEqual(0, detector.flag_new_duplicate_responses())
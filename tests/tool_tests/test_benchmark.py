@@ -0,0 +1,62 @@
+from sqlalchemy import create_engine
+
+from rdr_service.data_gen.benchmark import BenchmarkResults, SqlStatementTracker, compare_to_baseline, percentile
+from tests.helpers.unittest_base import BaseTestCase
+
+
+class BenchmarkTest(BaseTestCase):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.uses_database = False
+
+    def test_percentile(self):
+        values = [10, 20, 30, 40, 50]
+        self.assertEqual(10, percentile(values, 0))
+        self.assertEqual(30, percentile(values, 50))
+        self.assertEqual(48, percentile(values, 95))
+        self.assertEqual(50, percentile(values, 100))
+        self.assertIsNone(percentile([], 50))
+
+    def test_statements_counted_for_tracked_calls(self):
+        engine = create_engine('sqlite://')
+        results = BenchmarkResults()
+        with SqlStatementTracker() as tracker:
+            metrics = tracker.start_call()
+            engine.execute('select 1')
+            engine.execute('select 2')
+            tracker.end_call()
+            results.record('search', 0.01, metrics)
+
+            # Statements made outside of a call aren't counted
+            engine.execute('select 3')
+
+            metrics = tracker.start_call()
+            engine.execute('select 4')
+            tracker.end_call()
+            results.record('search', 0.03, metrics, error=True)
+
+        summary = results.summary()['search']
+        self.assertEqual(2, summary['count'])
+        self.assertEqual(1, summary['errors'])
+        self.assertEqual(20, summary['mean_ms'])
+        self.assertEqual(1.5, summary['sql_statements_per_call'])
+        self.assertNotIn('rows_examined_per_call', summary)
+
+    def test_baseline_comparison(self):
+        baseline = {
+            'search': {'p50_ms': 10, 'p95_ms': 20, 'sql_statements_per_call': 4, 'rows_per_call': 100},
+            'rebuild': {'p50_ms': 10, 'p95_ms': 20, 'sql_statements_per_call': 4, 'rows_per_call': 100}
+        }
+        summary = {
+            # Within the tolerances
+            'search': {'p50_ms': 12, 'p95_ms': 24, 'sql_statements_per_call': 4, 'rows_per_call': 105},
+            'rebuild': {'p50_ms': 10, 'p95_ms': 30, 'sql_statements_per_call': 5, 'rows_per_call': 100},
+            # Not in the baseline
+            'participant': {'p50_ms': 100, 'p95_ms': 200, 'sql_statements_per_call': 40, 'rows_per_call': 10}
+        }
+
+        regressions = compare_to_baseline(summary, baseline, latency_tolerance=0.25, count_tolerance=0.1)
+        self.assertEqual(
+            [('rebuild', 'p95_ms', 20, 30), ('rebuild', 'sql_statements_per_call', 4, 5)],
+            [tuple(regression) for regression in regressions]
+        )
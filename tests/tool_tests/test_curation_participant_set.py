@@ -0,0 +1,63 @@
+
+from sqlalchemy import select
+from sqlalchemy.dialects import mysql
+
+from rdr_service.etl.model.src_clean import TempEtlExcludedParticipant
+from rdr_service.etl.participant_set import EtlParticipantSet
+from rdr_service.model.participant import Participant
+from tests.helpers.unittest_base import BaseTestCase
+
+
+class EtlParticipantSetTest(BaseTestCase):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.uses_database = False
+
+    def test_ids_are_sorted_and_unique(self):
+        participant_set = EtlParticipantSet([30, 10, 20, 10])
+        participant_set.update([5, 20])
+
+        self.assertEqual([5, 10, 20, 30], list(participant_set))
+        self.assertIn(20, participant_set)
+        self.assertNotIn(15, participant_set)
+        self.assertFalse(EtlParticipantSet())
+
+    def test_chunking(self):
+        participant_set = EtlParticipantSet(range(1, 26), chunk_size=10)
+
+        self.assertEqual(3, participant_set.chunk_count)
+        self.assertEqual(list(range(11, 21)), list(participant_set.get_chunk(1)))
+        self.assertEqual([21, 22, 23, 24, 25], list(participant_set.get_chunk(2)))
+
+    def test_sql_filter(self):
+        participant_set = EtlParticipantSet([1, 2])
+        self.assertEqual(
+            'src_c.participant_id IN (SELECT participant_id FROM cdm.temp_etl_participant WHERE chunk_number = 3)',
+            participant_set.sql_filter('src_c.participant_id', 3)
+        )
+
+        excluded_set = EtlParticipantSet([1, 2], model=TempEtlExcludedParticipant)
+        self.assertEqual(
+            'pm.participant_id IN (SELECT participant_id FROM cdm.temp_etl_excluded_participant)',
+            excluded_set.sql_filter('pm.participant_id')
+        )
+
+    def test_statement_size_benchmark(self):
+        """Compare the statement sent for 500k participant ids using an IN list and using the participant set"""
+        participant_ids = range(100000000, 100500000)
+
+        in_list_sql = self._compile(
+            select([Participant.participantId]).where(Participant.participantId.notin_(list(participant_ids)))
+        )
+
+        participant_set = EtlParticipantSet(participant_ids, model=TempEtlExcludedParticipant)
+        participant_set_sql = self._compile(
+            select([Participant.participantId]).where(~participant_set.column_filter(Participant.participantId))
+        )
+
+        self.assertGreater(len(in_list_sql), 5000000)
+        self.assertLess(len(participant_set_sql), 500)
+
+    @staticmethod
+    def _compile(query) -> str:
+        return str(query.compile(dialect=mysql.dialect(), compile_kwargs={'literal_binds': True}))
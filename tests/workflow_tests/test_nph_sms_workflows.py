@@ -138,6 +138,28 @@ class NphSmsWorkflowsTest(BaseTestCase):
             )
             self.assertIn('Validation failed', cm.output[0])
 
+    @mock.patch("rdr_service.services.ancillary_studies.nph_incident.SlackMessageHandler.send_message_to_webhook")
+    def test_sample_list_validation_failure_stores_no_batches(self, mock_send_message_to_webhook):
+        mock_send_message_to_webhook.return_value = True
+
+        self.create_cloud_csv("test_sample_list.csv", "test_sample_list.csv")
+        with open_cloud_file(f'/{self.test_bucket}/test_sample_list.csv', mode="a") as cf:
+            cf.write("10004,7013747927,1,C2,Matrix96_Blue,NA,C_S_7013747927_M1_L_TP5,LMT,Intersex,39.888,21,"
+                     "Asian,Asian,UNC_META")
+
+        # The invalid row is in the last batch, after the others have been inserted
+        workflow = SmsWorkflow({
+            "job": "FILE_INGESTION",
+            "file_type": "SAMPLE_LIST",
+            "file_path": f"{self.test_bucket}/test_sample_list.csv",
+            "batch_size": 2
+        })
+        with self.assertLogs(level="ERROR") as cm:
+            workflow.execute_workflow()
+            self.assertIn('Validation failed', cm.output[0])
+
+        self.assertEqual([], SmsSampleDao().get_all())
+
     def test_n0_ingestion(self):
 
         # Ingestion Test File - Biobank N0 manifest